@@ -0,0 +1,228 @@
+"""
+Agregaty zarządcze: wydatki (USD/PLN), cło i VAT, CBM oraz etapy kontenerów
+w podziale na miesiąc zamówienia i status.
+
+Wkład każdego kontenera liczony jest raz (app.costing – te same wzory co
+calculateContainerTotals w UI) i zapamiętywany. Zmiana kontenera odejmuje
+jego poprzedni wkład od kubełków i dodaje nowy, więc koszt aktualizacji nie
+zależy od liczby kontenerów. Kubełki utrzymywane są na kilku poziomach
+(miesiąc × status, miesiąc, status, całość) – odczyt miesiąca albo statusu
+to jedno wyszukanie w słowniku, zakres miesięcy – suma po miesiącach zakresu.
+
+Status kontenera to pierwszy niezakończony etap:
+production (nieodebrany w Chinach) → customs (bez odprawy) → delivery
+(niedostarczony do magazynu) → documents (bez dokumentów w systemie) → done.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app import costing
+from app.storage import ChangeTracker
+
+STATUSES = ("production", "customs", "delivery", "documents", "done")
+FLAGS = ("pickedUpInChina", "customsClearanceDone", "deliveredToWarehouse", "documentsInSystem")
+METRICS = (
+    "containers", "products", "cbm",
+    "nettoUsd", "bruttoUsd", "dutyUsd", "vatUsd",
+    "nettoPln", "bruttoPln", "dutyPln", "vatPln",
+)
+NO_MONTH = "unknown"
+
+Vector = Dict[str, float]
+
+
+def flag(value: Any) -> bool:
+    """Flaga statusu z API (bool) lub z arkusza/importu ("TRUE", "1", "tak")."""
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes", "tak", "x")
+    return bool(value)
+
+
+def status_of(container: Dict[str, Any]) -> str:
+    for f, stage in zip(FLAGS, STATUSES):
+        if not flag(container.get(f)):
+            return stage
+    return "done"
+
+
+def month_of(container: Dict[str, Any]) -> str:
+    d = str(container.get("orderDate") or "").strip()
+    return d[:7] if len(d) >= 7 and d[4] == "-" else NO_MONTH
+
+
+def contribution(container: Dict[str, Any]) -> Vector:
+    """Wkład kontenera do kubełków: metryki, flagi i wydatki w walucie pozycji (spend.<waluta>)."""
+    base = costing.container_cost_base(container)
+    er = base["exchangeRate"]
+    products = container.get("products") or []
+    out: Vector = {"containers": 1.0, "products": float(len(products))}
+    netto = brutto = duty = vat = cbm = 0.0
+    for p in products:
+        c = costing.product_costs(p, container, base)
+        netto += c["nettoTotal"]
+        brutto += c["bruttoTotal"]
+        duty += c["dutyAmount"]
+        vat += c["vatAmount"]
+        cbm += max(0.0, costing.num(p.get("productCbm"), 0.0))
+        currency = f"spend.{p.get('totalPriceCurrency') or 'USD'}"
+        out[currency] = out.get(currency, 0.0) + costing.num(p.get("totalPrice"), 0.0)
+    out.update({
+        "cbm": cbm,
+        "nettoUsd": netto, "bruttoUsd": brutto, "dutyUsd": duty, "vatUsd": vat,
+        "nettoPln": netto * er, "bruttoPln": brutto * er, "dutyPln": duty * er, "vatPln": vat * er,
+    })
+    for f in FLAGS:
+        if flag(container.get(f)):
+            out[f"flag.{f}"] = 1.0
+    return out
+
+
+def _apply(bucket: Vector, vec: Vector, sign: float) -> None:
+    for k, v in vec.items():
+        n = bucket.get(k, 0.0) + sign * v
+        # Zero po odjęciu (z dokładnością float) – usuń klucz, by puste waluty/flagi nie zostawały
+        if abs(n) < 1e-9:
+            bucket.pop(k, None)
+        else:
+            bucket[k] = n
+
+
+def render(bucket: Optional[Vector]) -> Dict[str, Any]:
+    """Kubełek w kształcie odpowiedzi API (kwoty zaokrąglone do groszy/centów)."""
+    b = bucket or {}
+    out: Dict[str, Any] = {m: round(b.get(m, 0.0), 2) for m in METRICS}
+    out["containers"] = int(round(b.get("containers", 0.0)))
+    out["products"] = int(round(b.get("products", 0.0)))
+    out["spendByCurrency"] = {k[6:]: round(v, 2) for k, v in sorted(b.items()) if k.startswith("spend.")}
+    out["flags"] = {f: int(round(b.get(f"flag.{f}", 0.0))) for f in FLAGS}
+    return out
+
+
+class Rollups:
+    """Agregaty utrzymywane przyrostowo; `refresh()` nanosi zmiany zgłoszone przez magazyn."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._changes = ChangeTracker()
+        self._entries: Dict[str, Tuple[str, str, Vector]] = {}  # id kontenera → (miesiąc, status, wkład)
+        self._cells: Dict[Tuple[str, str], Vector] = {}
+        self._months: Dict[str, Vector] = {}
+        self._statuses: Dict[str, Vector] = {}
+        self._total: Vector = {}
+        self.builds = 0
+        self.updates = 0
+
+    def invalidate(self, container_id: Optional[str] = None) -> None:
+        self._changes.invalidate(container_id)
+
+    def refresh(self, list_containers: Callable[[], List[Dict[str, Any]]],
+                get_container: Callable[[str], Optional[Dict[str, Any]]]) -> None:
+        stale, dirty = self._changes.take()
+        if stale:
+            self.rebuild(list_containers())
+            return
+        for cid in dirty:
+            self.update(get_container(cid), cid)
+
+    def rebuild(self, containers: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._cells.clear()
+            self._months.clear()
+            self._statuses.clear()
+            self._total = {}
+            for c in containers:
+                self._add(str(c.get("id")), c)
+            self.builds += 1
+
+    def update(self, container: Optional[Dict[str, Any]], container_id: Optional[str] = None) -> None:
+        """Zastąp wkład kontenera (None – kontener usunięty)."""
+        cid = str(container.get("id")) if container is not None else str(container_id)
+        with self._lock:
+            self._remove(cid)
+            if container is not None:
+                self._add(cid, container)
+            self.updates += 1
+
+    def _buckets(self, month: str, status: str) -> List[Vector]:
+        return [
+            self._cells.setdefault((month, status), {}),
+            self._months.setdefault(month, {}),
+            self._statuses.setdefault(status, {}),
+            self._total,
+        ]
+
+    def _add(self, cid: str, container: Dict[str, Any]) -> None:
+        month, status, vec = month_of(container), status_of(container), contribution(container)
+        for bucket in self._buckets(month, status):
+            _apply(bucket, vec, 1.0)
+        self._entries[cid] = (month, status, vec)
+
+    def _remove(self, cid: str) -> None:
+        entry = self._entries.pop(cid, None)
+        if entry is None:
+            return
+        month, status, vec = entry
+        for bucket in self._buckets(month, status):
+            _apply(bucket, vec, -1.0)
+        # Kubełki bez kontenerów znikają z wyników (resztki float po odejmowaniu nie mają znaczenia)
+        for store, key in ((self._cells, (month, status)), (self._months, month), (self._statuses, status)):
+            if store.get(key, {}).get("containers", 0.0) < 0.5:
+                store.pop(key, None)
+        if self._total.get("containers", 0.0) < 0.5:
+            self._total = {}
+
+    # --- Odczyty ---
+    def month(self, month: str, status: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            return render(self._cells.get((month, status)) if status else self._months.get(month))
+
+    def summary(self, start: Optional[str] = None, end: Optional[str] = None,
+                status: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Całość, miesiące i statusy. Zakres miesięcy (YYYY-MM, włącznie) zawęża wszystkie sekcje,
+        status – całość i miesiące. Bez filtrów odczyt to gotowe kubełki.
+        Kontenery bez daty (NO_MONTH) należą do zakresu tylko, gdy `from` lub `to` to wprost NO_MONTH
+        („unknown” sortuje się za każdym YYYY-MM, więc samo porównanie tekstów by je dołączało).
+        """
+        undated = NO_MONTH in (start, end)
+        lo = start if start != NO_MONTH else None
+        hi = end if end != NO_MONTH else None
+
+        def in_range(m: str) -> bool:
+            if m == NO_MONTH:
+                return undated or not (start or end)
+            if undated and not (lo or hi):
+                return False  # from/to tylko „unknown” – same kontenery bez daty
+            return (not lo or m >= lo) and (not hi or m <= hi)
+
+        with self._lock:
+            months = sorted(m for m in self._months if in_range(m))
+            by_month = []
+            total: Vector = {}
+            for m in months:
+                bucket = self._cells.get((m, status)) if status else self._months.get(m)
+                if bucket:
+                    by_month.append({"month": m, **render(bucket)})
+                    _apply(total, bucket, 1.0)
+            if not (start or end or status):
+                total = self._total
+            if start or end:
+                by_status: Dict[str, Vector] = {}
+                for m in months:
+                    for s in STATUSES:
+                        cell = self._cells.get((m, s))
+                        if cell:
+                            _apply(by_status.setdefault(s, {}), cell, 1.0)
+            else:
+                by_status = self._statuses
+            return {
+                "total": render(total),
+                "byMonth": by_month,
+                "byStatus": {s: render(by_status.get(s)) for s in STATUSES},
+                "builds": self.builds,
+                "updates": self.updates,
+                "pending": self._changes.pending(),
+            }
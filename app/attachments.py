@@ -0,0 +1,136 @@
+"""
+Metadane załączników produktów z Google Drive.
+
+`Product.files` pozostaje listą URL-i (arkusz, formularz w UI), a obok niej produkt
+przechowuje `attachments` – rekordy {id, name, mimeType, size, modifiedTime, folderId, url}
+zebrane przy uploadzie i imporcie z Drive. Lista kontenerów renderuje dzięki temu nazwy
+i typy plików bez odpytywania Drive po każdym linku.
+
+Upload (`/api/files/upload`) dzieje się przed zapisem produktu – rekord trafia wtedy
+do rejestru (id pliku Drive → rekord) i jest dołączany do produktu, gdy jego `files`
+zawierają link do tego pliku. Rejestr zasilają też skan i listowanie folderów Drive.
+"""
+from __future__ import annotations
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# Pola plików pobierane z Drive API (files.list / files.get / files.create)
+DRIVE_FILE_FIELDS = "id,name,mimeType,size,modifiedTime,parents,webViewLink,webContentLink"
+RECORD_FIELDS = ("id", "name", "mimeType", "size", "modifiedTime", "folderId", "url")
+
+_PATH_ID = re.compile(r"/(?:file/)?d/([A-Za-z0-9_-]{10,})")
+
+
+def drive_file_id(url: Any) -> Optional[str]:
+    """Id pliku z linku Drive (uc?id=…, open?id=…, /file/d/<id>/view); None dla innych URL-i."""
+    href = str(url or "")
+    if "google.com" not in href:
+        return None
+    try:
+        parsed = urlparse(href)
+    except ValueError:
+        return None
+    ids = parse_qs(parsed.query).get("id")
+    if ids and ids[0]:
+        return ids[0]
+    m = _PATH_ID.search(parsed.path)
+    return m.group(1) if m else None
+
+
+def download_url(file_id: Optional[str], web_content: Optional[str] = None, web_view: Optional[str] = None) -> str:
+    """URL do pobrania pliku (jak zapisywany w Product.files)."""
+    if web_content:
+        return web_content
+    if file_id:
+        return f"https://drive.google.com/uc?export=download&id={file_id}"
+    return web_view or ""
+
+
+def record(meta: Dict[str, Any], folder_id: Optional[str] = None, url: Optional[str] = None) -> Dict[str, Any]:
+    """Rekord załącznika z odpowiedzi Drive API (size przychodzi jako tekst, foldery bez size)."""
+    parents = meta.get("parents") or []
+    try:
+        size: Optional[int] = int(meta["size"]) if meta.get("size") is not None else None
+    except (TypeError, ValueError):
+        size = None
+    return {
+        "id": meta.get("id"),
+        "name": meta.get("name"),
+        "mimeType": meta.get("mimeType"),
+        "size": size,
+        "modifiedTime": meta.get("modifiedTime"),
+        "folderId": folder_id or (parents[0] if parents else None),
+        "url": url or download_url(meta.get("id"), meta.get("webContentLink"), meta.get("webViewLink")),
+    }
+
+
+def merge(existing: Iterable[Dict[str, Any]], new: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Scal rekordy po id pliku (nowsze wygrywają, kolejność pierwszego wystąpienia)."""
+    out: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    for r in list(existing or []) + list(new or []):
+        key = str(r.get("id") or r.get("url") or "")
+        if key:
+            out[key] = dict(out.get(key, {}), **{k: v for k, v in r.items() if v is not None})
+    return list(out.values())
+
+
+def for_files(files: Iterable[Any], known: Iterable[Dict[str, Any]] = (),
+              registry: Optional["Registry"] = None) -> List[Dict[str, Any]]:
+    """
+    Rekordy dla linków `files` (w ich kolejności): z dotychczasowych rekordów produktu,
+    a gdy brak – z rejestru. Linki bez metadanych są pomijane; rekordy plików usuniętych
+    z `files` odpadają.
+    """
+    by_id: Dict[str, Dict[str, Any]] = {}
+    by_url: Dict[str, Dict[str, Any]] = {}
+    for r in known or []:
+        if r.get("id"):
+            by_id[str(r["id"])] = r
+        if r.get("url"):
+            by_url[str(r["url"])] = r
+    out = []
+    for f in files or []:
+        url = f.get("url") if isinstance(f, dict) else str(f or "")
+        fid = drive_file_id(url)
+        rec = by_url.get(url) or (by_id.get(fid) if fid else None) or (registry.get(fid) if registry and fid else None)
+        if rec is not None:
+            out.append(dict(rec, url=url))
+    return out
+
+
+def resolved(product: Dict[str, Any]) -> List[Any]:
+    """Pliki produktu: rekord, jeśli znany, w przeciwnym razie sam URL."""
+    recs = {str(r.get("url")): r for r in product.get("attachments") or [] if r.get("url")}
+    return [recs.get(str(f), f) for f in product.get("files") or []]
+
+
+class Registry:
+    """Rekordy plików Drive widziane przez serwer (id → rekord), ograniczone LRU."""
+
+    def __init__(self, max_entries: int = 50_000) -> None:
+        self._lock = threading.Lock()
+        self._records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.max_entries = max_entries
+
+    def remember(self, records: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            for r in records:
+                fid = r.get("id")
+                if not fid:
+                    continue
+                self._records[str(fid)] = dict(r)
+                self._records.move_to_end(str(fid))
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            r = self._records.get(str(file_id))
+            return dict(r) if r is not None else None
+
+    def __len__(self) -> int:
+        return len(self._records)
@@ -0,0 +1,184 @@
+"""
+Basic Auth jako czysty middleware ASGI ze skompilowaną polityką tras.
+
+Wcześniej middleware `@app.middleware("http")` (BaseHTTPMiddleware – dodatkowy
+task i kolejka na każde żądanie, buforowanie odpowiedzi strumieniowych) przy
+każdym żądaniu budował od nowa zbiory wykluczeń, dzielił BASIC_AUTH_EXCLUDE,
+przeglądał liniowo listę prefiksów i dekodował base64 nagłówka Authorization.
+Teraz:
+- AuthPolicy kompilowana jest raz na snapshot Settings: tablica dokładnych
+  ścieżek oraz drzewo prefiksów (trie) per metoda, plus reguła importu
+  z arkusza (`source=sheet` dla mutacji /api/containers*),
+- decyzja o ścieżce publicznej to jedno przejście po znakach ścieżki,
+- poprawnie zweryfikowane nagłówki Authorization trafiają do krótkotrwałego
+  cache po skrócie SHA-256 (bez przechowywania hasła), więc kolejne żądania
+  tego samego klienta nie dekodują i nie porównują poświadczeń.
+Zmiana `.env` (nowy snapshot) kompiluje politykę od nowa i czyści cache.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import secrets
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+from urllib.parse import parse_qsl
+
+from app import settings
+
+# Zawsze publiczne
+PUBLIC_EXACT = ("/", "/api/health", "/api/version", "/api/oauth/callback", "/api/oauth/url")
+PUBLIC_PREFIX = ("/static",)
+# Publiczne wyłącznie dla GET (odczyt w UI)
+PUBLIC_GET_PREFIX = ("/api/containers", "/api/sheets/containers", "/api/sheets/products", "/api/drive/product-files",
+                     "/api/search")
+# Proxy załączników – publiczne tylko, gdy pliki i tak są publiczne w Drive (DRIVE_PUBLIC=1);
+# inaczej ominęłoby uprawnienia Drive przez konto serwisowe
+PUBLIC_FILES_PREFIX = ("/api/files/",)
+# Import z arkusza (source=sheet) – mutacje bez auth dla UI automatycznego importu
+SHEET_IMPORT_METHODS = ("POST", "PUT", "DELETE")
+SHEET_IMPORT_PREFIX = ("/api/containers",)
+
+_END = ""  # znacznik końca prefiksu w węźle trie (klucze węzłów to pojedyncze znaki)
+_CHALLENGE = [(b"www-authenticate", b'Basic realm="Restricted"'), (b"content-length", b"0")]
+
+
+class PrefixTrie:
+    """Drzewo prefiksów po znakach; match() = czy któryś prefiks jest początkiem ścieżki."""
+
+    def __init__(self, prefixes: Iterable[str] = ()) -> None:
+        self.root: Dict[str, Any] = {}
+        for p in prefixes:
+            self.add(p)
+
+    def add(self, prefix: str) -> None:
+        node = self.root
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node[_END] = True
+
+    def match(self, path: str) -> bool:
+        node = self.root
+        if _END in node:
+            return True
+        for ch in path:
+            node = node.get(ch)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
+
+
+class AuthPolicy:
+    """Polityka skompilowana z jednego snapshotu Settings wraz z cache zweryfikowanych poświadczeń."""
+
+    def __init__(self, cfg: settings.Settings, cache_size: int = 1024) -> None:
+        self.cfg = cfg
+        self.enabled = cfg.basic_auth_enabled
+        self.cache_ttl = cfg.basic_auth_cache_ttl
+        self.cache_size = cache_size
+        self.hits = 0
+        self._verified: Dict[bytes, float] = {}
+        self._lock = threading.Lock()
+
+        exact = set(PUBLIC_EXACT)
+        prefixes = list(PUBLIC_PREFIX)
+        # BASIC_AUTH_EXCLUDE: wpisy zakończone "*" – prefiks, pozostałe – dopasowanie dokładne
+        for p in cfg.basic_auth_exclude:
+            if p.endswith("*"):
+                prefixes.append(p[:-1])
+            else:
+                exact.add(p)
+        self._exact = frozenset(exact)
+        any_method = PrefixTrie(prefixes)
+        get_only = PrefixTrie(prefixes + list(PUBLIC_GET_PREFIX) + (list(PUBLIC_FILES_PREFIX) if cfg.drive_public else []))
+        sheet = PrefixTrie(prefixes + list(SHEET_IMPORT_PREFIX))
+        self._tries: Dict[str, PrefixTrie] = {"GET": get_only}
+        self._default = any_method
+        self._sheet = {m: sheet for m in SHEET_IMPORT_METHODS}
+
+    def is_public(self, method: str, path: str, query_string: bytes = b"") -> bool:
+        if path in self._exact:
+            return True
+        method = method.upper()
+        if method in self._sheet and b"source=" in query_string and _source(query_string) == "sheet":
+            return self._sheet[method].match(path)
+        return self._tries.get(method, self._default).match(path)
+
+    def check(self, authorization: Optional[bytes]) -> bool:
+        """Czy nagłówek Authorization zawiera poprawne poświadczenia (cache po skrócie nagłówka)."""
+        if not authorization or not authorization.startswith(b"Basic "):
+            return False
+        key = hashlib.sha256(authorization).digest()
+        now = time.monotonic()
+        with self._lock:
+            expires = self._verified.get(key)
+            if expires is not None:
+                if expires > now:
+                    self.hits += 1
+                    return True
+                del self._verified[key]
+        try:
+            username, password = base64.b64decode(authorization[6:].strip()).decode("utf-8").split(":", 1)
+        except Exception:
+            return False
+        if not (secrets.compare_digest(username, self.cfg.basic_auth_username)
+                and secrets.compare_digest(password, self.cfg.basic_auth_password)):
+            return False
+        if self.cache_ttl > 0:
+            with self._lock:
+                if len(self._verified) >= self.cache_size:
+                    self._verified.clear()
+                self._verified[key] = now + self.cache_ttl
+        return True
+
+
+def _source(query_string: bytes) -> str:
+    # Jak request.query_params.get("source") – pierwsza wartość parametru
+    for k, v in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True):
+        if k == "source":
+            return v.strip().lower()
+    return ""
+
+
+class BasicAuthMiddleware:
+    """Czysty middleware ASGI; `get_settings` zwraca bieżący snapshot (nowy obiekt → nowa polityka)."""
+
+    def __init__(self, app, get_settings: Callable[[], settings.Settings]) -> None:
+        self.app = app
+        self.get_settings = get_settings
+        self._policy: Optional[AuthPolicy] = None
+
+    def policy(self) -> AuthPolicy:
+        cfg = self.get_settings()
+        policy = self._policy
+        if policy is None or policy.cfg is not cfg:
+            policy = self._policy = AuthPolicy(cfg)
+        return policy
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            policy = self.policy()
+            allowed = (not policy.enabled
+                       or policy.is_public(scope.get("method", "GET"), scope.get("path", ""), scope.get("query_string", b""))
+                       or policy.check(_header(scope, b"authorization")))
+        except Exception:
+            # W razie problemów w middleware nie blokuj ruchu
+            allowed = True
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+        await send({"type": "http.response.start", "status": 401, "headers": _CHALLENGE})
+        await send({"type": "http.response.body", "body": b""})
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for k, v in scope.get("headers") or ():
+        if k.lower() == name:
+            return v
+    return None
@@ -0,0 +1,142 @@
+"""
+Eksport zbiorczy raportów PDF kontenerów jako strumieniowany ZIP.
+
+PDF-y renderowane są w puli procesów (generate_container_pdf jest CPU-bound),
+a każdy gotowy plik trafia od razu do archiwum i jest wysyłany klientowi.
+Liczba zadań "w locie" jest ograniczona, więc zużycie pamięci nie rośnie
+wraz z liczbą wybranych kontenerów. Odpowiedź jest już wysłana (200), zanim
+wiadomo, czy wszystkie PDF-y się udały, dlatego nieudane raporty opisuje
+plik errors.txt na końcu archiwum.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from app.pdf_generator import generate_container_pdf
+
+logger = logging.getLogger(__name__)
+
+ERRORS_ENTRY = "errors.txt"
+STATUS_FLAGS = ("pickedUpInChina", "customsClearanceDone", "deliveredToWarehouse", "documentsInSystem")
+
+
+def filter_containers(
+    data: Iterable[Dict[str, Any]],
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    flags: Optional[Dict[str, bool]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Filtruj kontenery po zakresie orderDate (YYYY-MM-DD, włącznie) i flagach statusu."""
+    flags = {k: v for k, v in (flags or {}).items() if k in STATUS_FLAGS and v is not None}
+    for c in data:
+        order_date = str(c.get("orderDate") or "")
+        if date_from and (not order_date or order_date < date_from):
+            continue
+        if date_to and (not order_date or order_date > date_to):
+            continue
+        if any(bool(c.get(k)) != v for k, v in flags.items()):
+            continue
+        yield c
+
+
+def _sanitize(s: str) -> str:
+    s = re.sub(r"[^\w\-. ]", "_", s)
+    s = s.strip().replace(" ", "_")
+    return s[:80] or "kontener"
+
+
+def _render(container: Dict[str, Any]) -> bytes:
+    # Funkcja modułowa – musi być picklowalna dla ProcessPoolExecutor
+    return generate_container_pdf(container)
+
+
+class _ZipStream:
+    """Nieprzewijalny bufor zapisu dla zipfile – zwraca zapisane bajty przez pop()."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def pop(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def iter_pdf_zip(containers: Iterable[Dict[str, Any]], workers: int = 2, max_in_flight: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Generator bajtów archiwum ZIP z raportami PDF.
+    - workers <= 0: renderowanie w bieżącym procesie (np. środowiska bez fork/spawn),
+    - max_in_flight: limit zleconych, jeszcze nieodebranych PDF-ów (domyślnie 2 × workers).
+    Kontenery, których raport się nie wygenerował, wymienia errors.txt (ERRORS_ENTRY).
+    """
+    stream = _ZipStream()
+    used_names: Set[str] = set()
+    failed: List[str] = []
+
+    def record_failure(c: Dict[str, Any], e: Exception) -> None:
+        logger.error(f"[Reports] PDF for container '{c.get('id')}' failed: {e}")
+        failed.append(f"{c.get('id', '')}\t{c.get('name') or ''}\t{type(e).__name__}: {e}")
+
+    def entry_name(c: Dict[str, Any]) -> str:
+        base = f"raport_{_sanitize(str(c.get('name') or ''))}_{c.get('id', '')}"
+        name, n = f"{base}.pdf", 1
+        while name in used_names:
+            n += 1
+            name = f"{base}_{n}.pdf"
+        used_names.add(name)
+        return name
+
+    with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        if workers <= 0:
+            for c in containers:
+                try:
+                    pdf = _render(c)
+                except Exception as e:
+                    record_failure(c, e)
+                    continue
+                zf.writestr(entry_name(c), pdf)
+                yield stream.pop()
+        else:
+            limit = max_in_flight or workers * 2
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending: Dict[Future, Dict[str, Any]] = {}
+                source = iter(containers)
+                exhausted = False
+                while pending or not exhausted:
+                    while not exhausted and len(pending) < limit:
+                        try:
+                            c = next(source)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        pending[pool.submit(_render, c)] = c
+                    if not pending:
+                        break
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        c = pending.pop(fut)
+                        try:
+                            zf.writestr(entry_name(c), fut.result())
+                        except Exception as e:
+                            record_failure(c, e)
+                            continue
+                        yield stream.pop()
+        if failed:
+            zf.writestr(ERRORS_ENTRY, "\n".join(["id\tname\terror", *failed]) + "\n")
+    yield stream.pop()
@@ -0,0 +1,145 @@
+"""
+Import zbiorczy kontenerów/produktów z plików CSV/XLSX.
+
+Plik czytany jest strumieniowo (csv.DictReader / openpyxl read_only) do
+układu kolumnowego, po czym każda kolumna walidowana jest jednym przebiegiem
+(zamiast walidatorów pydantic wiersz po wierszu). Wynik zawiera wszystkie
+błędne komórki naraz oraz indeksy wierszy poprawnych.
+"""
+from __future__ import annotations
+
+import codecs
+import csv
+import re
+from typing import Any, Dict, IO, Iterator, List, Optional, Set
+
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+CONTAINER_SPEC = {
+    "required": ["name", "orderDate", "productionDays"],
+    "numeric": [
+        "productionDays", "exchangeRate", "containerCost", "customsClearanceCost", "transportChinaCost",
+        "transportPolandCost", "insuranceCost", "totalTransportCbm", "additionalCosts",
+    ],
+    "date": ["orderDate", "paymentDate", "deliveryDate"],
+    "bool": ["pickedUpInChina", "customsClearanceDone", "deliveredToWarehouse", "documentsInSystem"],
+}
+PRODUCT_SPEC = {
+    "required": ["name", "quantity", "totalPrice"],
+    "numeric": ["quantity", "totalPrice", "productCbm", "customsDutyPercent"],
+    "date": [],
+    "bool": [],
+}
+
+_TRUTHY = {"1", "true", "yes", "y", "t", "x", "✓"}
+
+
+def iter_file_rows(fh: IO[bytes], filename: str) -> Iterator[Dict[str, Any]]:
+    """Strumieniowo czytaj wiersze (dict nagłówek → wartość) z CSV lub XLSX."""
+    name = (filename or "").lower()
+    if name.endswith(".xlsx") or name.endswith(".xlsm"):
+        from openpyxl import load_workbook  # type: ignore
+
+        wb = load_workbook(fh, read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[0]
+            rows = ws.iter_rows(values_only=True)
+            header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+            for values in rows:
+                if not any(v not in (None, "") for v in values):
+                    continue
+                yield {h: ("" if v is None else v) for h, v in zip(header, values) if h}
+        finally:
+            wb.close()
+        return
+    text = codecs.getreader("utf-8-sig")(fh)
+    sample = text.readline()
+    delimiter = ";" if sample.count(";") > sample.count(",") else ","
+    reader = csv.DictReader(_prepend(sample, text), delimiter=delimiter)
+    for rec in reader:
+        if not any(str(v or "").strip() for v in rec.values()):
+            continue
+        yield {str(k).strip(): (v if v is not None else "") for k, v in rec.items() if k}
+
+
+def _prepend(first: str, rest) -> Iterator[str]:
+    yield first
+    yield from rest
+
+
+def to_columns(rows: Iterator[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Zbierz wiersze w kolumny; brakujące komórki jako ''."""
+    cols: Dict[str, List[Any]] = {}
+    n = 0
+    for rec in rows:
+        for k in rec:
+            if k not in cols:
+                cols[k] = [""] * n
+        for k, col in cols.items():
+            col.append(rec.get(k, ""))
+        n += 1
+    return cols
+
+
+def _normalize(v: Any) -> str:
+    if v is None:
+        return ""
+    if hasattr(v, "strftime"):
+        return v.strftime("%Y-%m-%d")
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v).strip()
+
+
+def _is_number(s: str) -> bool:
+    try:
+        float(s)
+        return True
+    except ValueError:
+        return False
+
+
+def validate_columns(cols: Dict[str, List[Any]], spec: Dict[str, List[str]]) -> Dict[str, Any]:
+    """
+    Waliduj kolumny hurtowo. Zwraca:
+    - columns: kolumny znormalizowane do stringów (bool jako True/False),
+    - errors: lista {row, column, value, error} (row = numer wiersza w pliku, nagłówek = 1),
+    - valid_rows: indeksy (0-based) wierszy bez błędów,
+    - missing_columns: wymagane kolumny nieobecne w pliku.
+    """
+    n = max((len(c) for c in cols.values()), default=0)
+    missing = [c for c in spec["required"] if c not in cols]
+    norm: Dict[str, List[Any]] = {k: [_normalize(v) for v in col] for k, col in cols.items()}
+    errors: List[Dict[str, Any]] = []
+    bad: Set[int] = set()
+
+    def flag(col: str, idxs: List[int], message: str) -> None:
+        for i in idxs:
+            errors.append({"row": i + 2, "column": col, "value": norm[col][i], "error": message})
+            bad.add(i)
+
+    if "name" in norm:
+        flag("name", [i for i, v in enumerate(norm["name"]) if not v], "Nazwa jest wymagana")
+    for col in spec["numeric"]:
+        if col in norm:
+            flag(col, [i for i, v in enumerate(norm[col]) if v and not _is_number(v)], "Wartość musi być liczbą")
+    for col in spec["date"]:
+        if col in norm:
+            flag(col, [i for i, v in enumerate(norm[col]) if v and not DATE_RE.match(v)], "Data musi być w formacie YYYY-MM-DD")
+    for col in spec["bool"]:
+        if col in cols:
+            norm[col] = [v is True or str(v).strip().lower() in _TRUTHY for v in cols[col]]
+
+    errors.sort(key=lambda e: (e["row"], e["column"]))
+    return {
+        "columns": norm,
+        "errors": errors,
+        "valid_rows": [] if missing else [i for i in range(n) if i not in bad],
+        "missing_columns": missing,
+        "total_rows": n,
+    }
+
+
+def row_at(columns: Dict[str, List[Any]], i: int, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    keys = fields if fields is not None else list(columns)
+    return {k: columns[k][i] for k in keys if k in columns}
@@ -0,0 +1,185 @@
+"""
+Tryb wielu workerów (uvicorn --workers N) na jednej maszynie.
+
+- LeaderLock: wybór lidera przez blokadę pliku (flock). Lider wykonuje
+  import startowy z arkusza i okresową synchronizację z Sheets; blokada
+  zwalnia się automatycznie, gdy proces lidera kończy działanie. Pozostałe
+  workery ponawiają próbę przejęcia z wątku InvalidationBus.
+- RevisionCounter: licznik rewizji w pliku, podbijany po każdym zapisie
+  do magazynu. Pozostałe workery porównują go z ostatnio widzianą wartością
+  i unieważniają lokalne cache (InvalidationBus).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl  # type: ignore
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+try:
+    import msvcrt  # type: ignore
+except ImportError:
+    msvcrt = None  # type: ignore
+
+
+def _lock_fd(fd: int, blocking: bool) -> bool:
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except OSError:
+            return False
+    if msvcrt is not None:
+        try:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    return True
+
+
+def _unlock_fd(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class LeaderLock:
+    """Nieblokująca próba przejęcia roli lidera; blokada trzymana do release() lub końca procesu."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if not _lock_fd(fd, blocking=False):
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            _unlock_fd(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class RevisionCounter:
+    """64-bitowy licznik w pliku; bump() atomowy między procesami (blokada pliku) i wątkami."""
+
+    _FMT = "<Q"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        # flock na wspólnym deskryptorze nie wyklucza wątków tego samego procesu
+        self._lock = threading.Lock()
+
+    def read(self) -> int:
+        data = os.pread(self._fd, 8, 0) if hasattr(os, "pread") else self._read_seek()
+        return struct.unpack(self._FMT, data)[0] if len(data) == 8 else 0
+
+    def _read_seek(self) -> bytes:
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        return os.read(self._fd, 8)
+
+    def bump(self) -> int:
+        with self._lock:
+            _lock_fd(self._fd, blocking=True)
+            try:
+                value = self.read() + 1
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.write(self._fd, struct.pack(self._FMT, value))
+                return value
+            finally:
+                _unlock_fd(self._fd)
+
+
+class InvalidationBus:
+    """Powiadamia subskrybentów, gdy licznik rewizji zmienił się od ostatniego sprawdzenia."""
+
+    def __init__(self, counter: RevisionCounter, interval: float = 1.0) -> None:
+        self.counter = counter
+        self.interval = interval
+        self._seen = counter.read()
+        self._subscribers: List[Callable[[int], None]] = []
+        self._periodic: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def revision(self) -> int:
+        return self.counter.read()
+
+    def subscribe(self, callback: Callable[[int], None]) -> None:
+        self._subscribers.append(callback)
+
+    def every_tick(self, callback: Callable[[], None]) -> None:
+        """Zadanie wykonywane w wątku magistrali co `interval` (np. próba przejęcia roli lidera)."""
+        self._periodic.append(callback)
+
+    def publish(self) -> int:
+        """Zgłoś lokalny zapis – inne workery zobaczą nową rewizję."""
+        return self.counter.bump()
+
+    def check(self) -> bool:
+        current = self.counter.read()
+        with self._lock:
+            if current == self._seen:
+                return False
+            self._seen = current
+        for cb in list(self._subscribers):
+            try:
+                cb(current)
+            except Exception as e:
+                logger.error(f"[Cluster] Invalidation callback failed: {e}")
+        return True
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cluster-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check()
+            for task in list(self._periodic):
+                try:
+                    task()
+                except Exception as e:
+                    logger.error(f"[Cluster] Periodic task failed: {e}")
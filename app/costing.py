@@ -0,0 +1,104 @@
+"""
+Kalkulacje kosztów produktów i kontenerów (port calculateProductCosts /
+calculateContainerTotals ze static/utils.js). Wszystkie kwoty w USD.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+VAT_RATE = 0.23
+
+COST_COLUMNS = [
+    "pricePerUnit", "transportPerUnit", "dutyAmount", "vatAmount", "totalCustoms",
+    "additionalPerUnit", "nettoPerUnit", "totalCostPerUnit", "nettoTotal", "bruttoTotal",
+]
+CONTAINER_TOTAL_COLUMNS = ["totalProducts", "nettoTotal", "bruttoTotal"]
+
+
+def num(v: Any, default: float = 0.0) -> float:
+    """Odpowiednik num() z frontendu: liczba lub wartość domyślna."""
+    try:
+        n = float(v)
+    except (TypeError, ValueError):
+        return default
+    return n if n == n and n not in (float("inf"), float("-inf")) else default
+
+
+def to_usd(amount: Any, currency: Optional[str], exchange_rate: float) -> float:
+    a = num(amount, 0.0)
+    if currency == "USD":
+        return a
+    return a / exchange_rate if exchange_rate else 0.0
+
+
+def container_cost_base(container: Dict[str, Any], exchange_rate: Optional[float] = None) -> Dict[str, float]:
+    """Koszty kontenera w USD, wspólne dla wszystkich produktów."""
+    er = num(container.get("exchangeRate"), 4.0) if exchange_rate is None else exchange_rate
+
+    def usd(field: str) -> float:
+        return to_usd(container.get(field), container.get(f"{field}Currency") or "USD", er)
+
+    base = {
+        "exchangeRate": er,
+        "containerCost": usd("containerCost"),
+        "customsClearanceCost": usd("customsClearanceCost"),
+        "transportChinaCost": usd("transportChinaCost"),
+        "transportPolandCost": usd("transportPolandCost"),
+        "insuranceCost": usd("insuranceCost"),
+        "additionalCosts": usd("additionalCosts"),
+        "totalCbm": max(1.0, num(container.get("totalTransportCbm"), 1.0)),
+        "totalProductCbm": sum(max(0.0, num(p.get("productCbm"), 0.0)) for p in (container.get("products") or [])) or 1.0,
+    }
+    base["totalTransport"] = (
+        base["containerCost"] + base["customsClearanceCost"] + base["transportChinaCost"]
+        + base["transportPolandCost"] + base["insuranceCost"]
+    )
+    return base
+
+
+def product_costs(product: Dict[str, Any], container: Dict[str, Any], base: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """Koszty jednostkowe i łączne produktu (USD) – jak calculateProductCosts w UI."""
+    b = base or container_cost_base(container)
+    er = b["exchangeRate"]
+    total_price = to_usd(product.get("totalPrice"), product.get("totalPriceCurrency") or "USD", er)
+    quantity = max(1.0, num(product.get("quantity"), 1.0))
+    price_per_unit = total_price / quantity
+
+    cbm = max(0.0, num(product.get("productCbm"), 0.0))
+    share = cbm / b["totalCbm"]
+    transport_per_unit = (b["totalTransport"] / b["totalCbm"] * cbm) / quantity
+
+    transport_to_eu = (b["containerCost"] + b["transportChinaCost"] + b["insuranceCost"]) * share
+    customs_value = total_price + transport_to_eu
+    duty_percent = max(0.0, num(product.get("customsDutyPercent"), 0.0))
+    duty = customs_value * (duty_percent / 100)
+    vat = (customs_value + duty + b["transportPolandCost"] * share) * VAT_RATE
+    additional_per_unit = (b["additionalCosts"] * (cbm / b["totalProductCbm"])) / quantity
+
+    netto_per_unit = price_per_unit + transport_per_unit + duty / quantity + additional_per_unit
+    total_per_unit = price_per_unit + transport_per_unit + (duty + vat) / quantity + additional_per_unit
+    return {
+        "quantity": quantity,
+        "pricePerUnit": price_per_unit,
+        "transportPerUnit": transport_per_unit,
+        "dutyAmount": duty,
+        "vatAmount": vat,
+        "totalCustoms": duty + vat,
+        "additionalPerUnit": additional_per_unit,
+        "nettoPerUnit": netto_per_unit,
+        "totalCostPerUnit": total_per_unit,
+        "nettoTotal": netto_per_unit * quantity,
+        "bruttoTotal": total_per_unit * quantity,
+    }
+
+
+def container_totals(container: Dict[str, Any], exchange_rate: Optional[float] = None) -> Dict[str, float]:
+    """Sumy netto/brutto (USD) kontenera – jak calculateContainerTotals w UI."""
+    products = container.get("products") or []
+    base = container_cost_base(container, exchange_rate)
+    netto = brutto = 0.0
+    for p in products:
+        costs = product_costs(p, container, base)
+        netto += costs["nettoTotal"]
+        brutto += costs["bruttoTotal"]
+    return {"totalProducts": len(products), "nettoTotal": netto, "bruttoTotal": brutto}
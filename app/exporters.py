@@ -0,0 +1,159 @@
+"""
+Strumieniowy eksport kontenerów i produktów (CSV / XLSX / Parquet).
+
+Wiersze produkowane są przez generatory bezpośrednio z magazynu, a zapis
+odbywa się partiami – pełny zbiór danych nigdy nie jest budowany w pamięci.
+XLSX i Parquet wymagają pliku z możliwością przewijania, więc trafiają do
+SpooledTemporaryFile (dysk powyżej progu) i są odczytywane kawałkami.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List
+
+from app.costing import CONTAINER_TOTAL_COLUMNS, COST_COLUMNS, container_cost_base, container_totals, product_costs
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+PARQUET_BATCH_ROWS = 1000
+
+
+def container_columns(headers: List[str]) -> List[str]:
+    return list(headers) + ["pickupDate"] + CONTAINER_TOTAL_COLUMNS
+
+
+def product_columns(headers: List[str]) -> List[str]:
+    return list(headers) + ["exchangeRate"] + COST_COLUMNS + ["totalCostPerUnitPLN"]
+
+
+def iter_container_rows(data: Iterable[Dict[str, Any]], headers: List[str]) -> Iterator[Dict[str, Any]]:
+    """Wiersze kontenerów w kolejności HEADERS_CONTAINERS + sumy kosztów (USD)."""
+    for c in data:
+        row = {h: c.get(h, "") for h in headers}
+        row["pickupDate"] = c.get("pickupDate") or ""
+        row.update(container_totals(c))
+        yield row
+
+
+def iter_product_rows(data: Iterable[Dict[str, Any]], headers: List[str]) -> Iterator[Dict[str, Any]]:
+    """Wiersze produktów w kolejności HEADERS_PRODUCTS + koszty wyliczone (USD, plus koszt/szt. w PLN)."""
+    for c in data:
+        base = container_cost_base(c)
+        for p in c.get("products") or []:
+            rec = {**p, "containerId": c.get("id"), "containerName": c.get("name", "")}
+            row = {h: rec.get(h, "") for h in headers}
+            row["exchangeRate"] = base["exchangeRate"]
+            costs = product_costs(p, c, base)
+            row.update({k: costs[k] for k in COST_COLUMNS})
+            row["totalCostPerUnitPLN"] = costs["totalCostPerUnit"] * base["exchangeRate"]
+            yield row
+
+
+def _cell(v: Any) -> Any:
+    if v is None:
+        return ""
+    if isinstance(v, (list, tuple)):
+        return ", ".join(str(x) for x in v)
+    return v
+
+
+def _drain(fh) -> Iterator[bytes]:
+    fh.seek(0)
+    while True:
+        chunk = fh.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+    fh.close()
+
+
+def stream_csv(columns: List[str], rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_cell(row.get(col)) for col in columns])
+        if buf.tell() >= CHUNK_SIZE:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+def stream_xlsx(columns: List[str], rows: Iterable[Dict[str, Any]], title: str = "export") -> Iterator[bytes]:
+    from openpyxl import Workbook  # type: ignore
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=title[:31])
+    ws.append(columns)
+    for row in rows:
+        ws.append([_cell(row.get(col)) for col in columns])
+    fh = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    wb.save(fh)
+    yield from _drain(fh)
+
+
+def stream_parquet(columns: List[str], rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+
+    # Kolumny kosztów są liczbowe, pozostałe jako tekst (arkusz trzyma wszystko jako string)
+    numeric = set(COST_COLUMNS) | set(CONTAINER_TOTAL_COLUMNS) | {"exchangeRate", "totalCostPerUnitPLN"}
+    schema = pa.schema([(col, pa.float64() if col in numeric else pa.string()) for col in columns])
+
+    def batch_of(buffered: List[Dict[str, Any]]):
+        arrays = []
+        for col in columns:
+            if col in numeric:
+                arrays.append(pa.array([_to_float(r.get(col)) for r in buffered], type=pa.float64()))
+            else:
+                arrays.append(pa.array([str(_cell(r.get(col))) for r in buffered], type=pa.string()))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    fh = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    with pq.ParquetWriter(fh, schema) as writer:
+        buffered: List[Dict[str, Any]] = []
+        for row in rows:
+            buffered.append(row)
+            if len(buffered) >= PARQUET_BATCH_ROWS:
+                writer.write_batch(batch_of(buffered))
+                buffered.clear()
+        if buffered:
+            writer.write_batch(batch_of(buffered))
+    yield from _drain(fh)
+
+
+def _to_float(v: Any):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def check_format_available(fmt: str) -> None:
+    """ValueError dla nieznanego formatu, RuntimeError przy braku biblioteki – sprawdzane przed startem strumienia."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Nieobsługiwany format: {fmt} (dostępne: {', '.join(EXPORT_FORMATS)})")
+    try:
+        if fmt == "xlsx":
+            import openpyxl  # type: ignore  # noqa: F401
+        elif fmt == "parquet":
+            import pyarrow  # type: ignore  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(f"Biblioteka dla formatu {fmt} niedostępna: {e}")
+
+
+def stream_export(fmt: str, columns: List[str], rows: Iterable[Dict[str, Any]], title: str = "export") -> Iterator[bytes]:
+    if fmt == "xlsx":
+        return stream_xlsx(columns, rows, title)
+    if fmt == "parquet":
+        return stream_parquet(columns, rows)
+    return stream_csv(columns, rows)
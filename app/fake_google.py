@@ -0,0 +1,494 @@
+"""
+Atrapy Google Sheets (gspread) i Google Drive (googleapiclient) w pamięci procesu.
+
+Implementują wyłącznie podzbiór API używany przez aplikację:
+- gspread: open_by_key, worksheet/add_worksheet, row_values, col_values,
+  get_all_values, get_all_records, append_row(s) (z odpowiedzią updatedRange),
+  update, delete_rows,
+  get_file_drive_metadata, http_client.values_batch_get,
+- Drive v3: files().list/get/create/get_media, permissions().create
+  (obiekty żądań z .execute(), zapytania `q` w składni Drive).
+
+Simulator wstrzykuje opóźnienia, błędy limitów (429) i awarie (500) –
+do benchmarków i testów obciążeniowych bez zużywania limitów Google.
+
+GOOGLE_FAKE=1 w .env: fabryki klientów w app.main (_get_gspread_client,
+_drive_build_service) zwracają wspólną parę atrap z shared_services();
+warunki symulacji z GOOGLE_FAKE_LATENCY / _JITTER / _RATE_LIMIT /
+_QUOTA_RATE / _FAILURE_RATE / _SEED.
+"""
+from __future__ import annotations
+
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+
+
+class FakeResponse:
+    def __init__(self, status_code: int) -> None:
+        self.status_code = status_code
+        self.status = status_code
+
+
+class FakeAPIError(Exception):
+    """Kształt zgodny z gspread.APIError / HttpError: atrybuty response/resp ze statusem."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"APIError [{status}]: {message}")
+        self.response = FakeResponse(status)
+        self.resp = self.response
+
+
+class WorksheetNotFound(Exception):
+    pass
+
+
+class Simulator:
+    """
+    Wspólne warunki dla wszystkich wywołań atrapy:
+    - latency + losowy jitter (sekundy),
+    - rate_limit: maks. wywołań na sekundę (okno 1 s) – nadmiar kończy się 429,
+    - quota_error_rate / failure_rate: losowe 429 / 500 (deterministyczne dla danego seed).
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, quota_error_rate: float = 0.0,
+                 failure_rate: float = 0.0, rate_limit: float = 0.0, seed: int = 0) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_error_rate = quota_error_rate
+        self.failure_rate = failure_rate
+        self.rate_limit = rate_limit
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window: List[float] = []
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+
+    def call(self, op: str) -> None:
+        with self._lock:
+            self.calls[op] += 1
+            r_quota, r_fail, r_jit = self._rnd.random(), self._rnd.random(), self._rnd.random()
+            limited = False
+            if self.rate_limit > 0:
+                now = time.monotonic()
+                self._window = [t for t in self._window if now - t < 1.0]
+                limited = len(self._window) >= self.rate_limit
+                if not limited:
+                    self._window.append(now)
+        delay = self.latency + self.jitter * r_jit
+        if delay > 0:
+            time.sleep(delay)
+        if limited or r_quota < self.quota_error_rate:
+            with self._lock:
+                self.errors[(op, 429)] += 1
+            raise FakeAPIError(429, f"Quota exceeded for quota metric 'Requests' ({op}) RESOURCE_EXHAUSTED")
+        if r_fail < self.failure_rate:
+            with self._lock:
+                self.errors[(op, 500)] += 1
+            raise FakeAPIError(500, f"Internal error encountered ({op})")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "errors": {f"{op}:{status}": n for (op, status), n in self.errors.items()},
+            }
+
+
+def _now_rfc3339() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def _col_index(letters: str) -> int:
+    n = 0
+    for ch in letters.upper():
+        n = n * 26 + (ord(ch) - 64)
+    return n
+
+
+def _col_letter(n: int) -> str:
+    letters = ""
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters or "A"
+
+
+_CELL_RE = re.compile(r"^([A-Za-z]+)(\d+)$")
+
+
+# --- Sheets ---
+
+class FakeCell:
+    """Jak gspread.cell.Cell: row, col, value."""
+
+    def __init__(self, row: int, col: int, value: str) -> None:
+        self.row, self.col, self.value = row, col, value
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet: "FakeSpreadsheet", title: str, rows: Optional[List[List[Any]]] = None) -> None:
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = secrets.randbelow(1 << 30)
+        self._rows: List[List[str]] = [[self._cell(v) for v in r] for r in (rows or [])]
+
+    @staticmethod
+    def _cell(v: Any) -> str:
+        if v is None:
+            return ""
+        if isinstance(v, bool):
+            return "TRUE" if v else "FALSE"
+        return str(v)
+
+    def _sim(self, op: str) -> None:
+        self.spreadsheet.client.sim.call(op)
+
+    def _changed(self) -> None:
+        self.spreadsheet.modified_time = _now_rfc3339()
+
+    def get_all_values(self) -> List[List[str]]:
+        self._sim("get_all_values")
+        with self.spreadsheet.lock:
+            return [list(r) for r in self._rows]
+
+    def row_values(self, row: int) -> List[str]:
+        self._sim("row_values")
+        with self.spreadsheet.lock:
+            values = list(self._rows[row - 1]) if 0 < row <= len(self._rows) else []
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def col_values(self, col: int) -> List[str]:
+        self._sim("col_values")
+        with self.spreadsheet.lock:
+            values = [r[col - 1] if len(r) >= col else "" for r in self._rows]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def cell(self, row: int, col: int) -> FakeCell:
+        self._sim("cell")
+        with self.spreadsheet.lock:
+            r = self._rows[row - 1] if 0 < row <= len(self._rows) else []
+            return FakeCell(row, col, r[col - 1] if len(r) >= col else "")
+
+    def get_all_records(self) -> List[Dict[str, str]]:
+        self._sim("get_all_records")
+        with self.spreadsheet.lock:
+            if not self._rows:
+                return []
+            header = self._rows[0]
+            return [{h: (r[i] if i < len(r) else "") for i, h in enumerate(header)} for r in self._rows[1:]]
+
+    def peek_records(self) -> List[Dict[str, str]]:
+        """get_all_records bez symulacji – dla obserwatorów testów obciążeniowych."""
+        with self.spreadsheet.lock:
+            if not self._rows:
+                return []
+            header = self._rows[0]
+            return [{h: (r[i] if i < len(r) else "") for i, h in enumerate(header)} for r in self._rows[1:]]
+
+    def _append(self, rows: List[List[Any]]) -> Dict[str, Any]:
+        """Dopisz wiersze; odpowiedź jak values.append (updates.updatedRange z numerami wierszy)."""
+        with self.spreadsheet.lock:
+            start = len(self._rows) + 1
+            self._rows.extend([self._cell(v) for v in row] for row in rows)
+            self._changed()
+        width = max((len(r) for r in rows), default=1)
+        rng = f"'{self.title}'!A{start}:{_col_letter(width)}{start + len(rows) - 1}"
+        return {"spreadsheetId": self.spreadsheet.id, "updates": {"updatedRange": rng, "updatedRows": len(rows)}}
+
+    def append_row(self, values: List[Any], value_input_option: Optional[str] = None, **_: Any) -> Dict[str, Any]:
+        self._sim("append_row")
+        return self._append([values])
+
+    def append_rows(self, values: List[List[Any]], value_input_option: Optional[str] = None, **_: Any) -> Dict[str, Any]:
+        self._sim("append_rows")
+        return self._append(values)
+
+    def update(self, a: Any = None, b: Any = None, value_input_option: Optional[str] = None, **kwargs: Any) -> None:
+        # gspread 6: update(values, range_name); starsze wywołania: update(range_name, values)
+        values, range_name = (b, a) if isinstance(a, str) else (a, b)
+        values = kwargs.get("values", values)
+        range_name = kwargs.get("range_name", range_name) or "A1"
+        self._sim("update")
+        m = _CELL_RE.match(range_name.split(":")[0])
+        if not m:
+            raise FakeAPIError(400, f"Unable to parse range: {range_name}")
+        col0, row0 = _col_index(m.group(1)), int(m.group(2))
+        with self.spreadsheet.lock:
+            for dr, row in enumerate(values or []):
+                r = row0 + dr
+                while len(self._rows) < r:
+                    self._rows.append([])
+                target = self._rows[r - 1]
+                for dc, v in enumerate(row):
+                    c = col0 + dc
+                    while len(target) < c:
+                        target.append("")
+                    target[c - 1] = self._cell(v)
+            self._changed()
+
+    def delete_rows(self, start_index: int, end_index: Optional[int] = None) -> None:
+        self._sim("delete_rows")
+        end = end_index or start_index
+        with self.spreadsheet.lock:
+            del self._rows[start_index - 1:end]
+            self._changed()
+
+
+class FakeSpreadsheet:
+    def __init__(self, client: "FakeGspreadClient", key: str) -> None:
+        self.client = client
+        self.id = key
+        self.lock = threading.RLock()
+        self.worksheets: Dict[str, FakeWorksheet] = {}
+        self.modified_time = _now_rfc3339()
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self.client.sim.call("worksheet")
+        ws = self.worksheets.get(title)
+        if ws is None:
+            raise WorksheetNotFound(title)
+        return ws
+
+    def add_worksheet(self, title: str, rows: int = 100, cols: int = 26, **_: Any) -> FakeWorksheet:
+        self.client.sim.call("add_worksheet")
+        with self.lock:
+            ws = self.worksheets.setdefault(title, FakeWorksheet(self, title))
+            self.modified_time = _now_rfc3339()
+        return ws
+
+    def seed(self, title: str, headers: List[str], records: Iterable[Dict[str, Any]]) -> FakeWorksheet:
+        """Wypełnij zakładkę bez symulacji (przygotowanie danych)."""
+        rows = [list(headers)] + [[rec.get(h, "") for h in headers] for rec in records]
+        with self.lock:
+            # istniejąca zakładka zachowuje obiekt – uchwyty z cache aplikacji pozostają ważne
+            fresh = FakeWorksheet(self, title, rows)
+            ws = self.worksheets.setdefault(title, fresh)
+            ws._rows = fresh._rows
+            self.modified_time = _now_rfc3339()
+        return ws
+
+
+class _FakeHttpClient:
+    def __init__(self, client: "FakeGspreadClient") -> None:
+        self._client = client
+
+    def values_batch_get(self, key: str, ranges: List[str], params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._client.sim.call("values_batch_get")
+        sh = self._client.spreadsheets[key]
+        out = []
+        with sh.lock:
+            for title in ranges:
+                ws = sh.worksheets.get(title)
+                out.append({"range": title, "values": [list(r) for r in ws._rows] if ws else []})
+        return {"spreadsheetId": key, "valueRanges": out}
+
+
+class FakeGspreadClient:
+    def __init__(self, sim: Optional[Simulator] = None) -> None:
+        self.sim = sim or Simulator()
+        self.spreadsheets: Dict[str, FakeSpreadsheet] = {}
+        self.http_client = _FakeHttpClient(self)
+
+    def spreadsheet(self, key: str) -> FakeSpreadsheet:
+        """Arkusz o danym kluczu (utworzony, jeśli nie istnieje) – bez symulacji."""
+        return self.spreadsheets.setdefault(key, FakeSpreadsheet(self, key))
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        self.sim.call("open_by_key")
+        sh = self.spreadsheets.get(key)
+        if sh is None:
+            raise FakeAPIError(404, f"Requested entity was not found: {key}")
+        return sh
+
+    def get_file_drive_metadata(self, key: str) -> Dict[str, Any]:
+        self.sim.call("get_file_drive_metadata")
+        sh = self.spreadsheets[key]
+        return {"id": key, "modifiedTime": sh.modified_time}
+
+
+# --- Drive ---
+
+class _Request:
+    def __init__(self, drive: "FakeDriveService", op: str, fn: Callable[[], Any]) -> None:
+        self._drive, self._op, self._fn = drive, op, fn
+        self.methodId = f"drive.{op}"
+
+    def _run(self) -> Any:
+        self._drive.sim.call(self._op)
+        return self._fn()
+
+    def execute(self, *_: Any, **__: Any) -> Any:
+        # odpowiednik requestBuilder w build(): opakowanie każdego execute() (np. app.quota.call)
+        wrapper = self._drive.request_wrapper
+        return wrapper(self._op, self._run) if wrapper is not None else self._run()
+
+
+_Q_CLAUSE = re.compile(r"^\s*(?:'(?P<parent>[^']*)'\s+in\s+parents|(?P<field>mimeType|name|trashed)\s*(?P<op>!=|=)\s*(?P<value>'[^']*'|true|false))\s*$")
+
+
+def _match_query(f: Dict[str, Any], q: str) -> bool:
+    for clause in filter(None, (c.strip() for c in re.split(r"\s+and\s+", q or ""))):
+        m = _Q_CLAUSE.match(clause)
+        if not m:
+            raise FakeAPIError(400, f"Invalid Value: q ({clause})")
+        if m.group("parent") is not None:
+            if m.group("parent") not in (f.get("parents") or []):
+                return False
+            continue
+        field, op, value = m.group("field"), m.group("op"), m.group("value").strip("'")
+        actual = str(f.get(field, False)).lower() if field == "trashed" else str(f.get(field) or "")
+        if (actual == value) != (op == "="):
+            return False
+    return True
+
+
+class _Files:
+    def __init__(self, drive: "FakeDriveService") -> None:
+        self._d = drive
+
+    def list(self, q: str = "", fields: Optional[str] = None, pageSize: int = 100, **_: Any) -> _Request:
+        def run() -> Dict[str, Any]:
+            with self._d.lock:
+                found = [dict(f) for f in self._d.items.values() if _match_query(f, q)]
+            return {"files": [_public(f) for f in found[:pageSize]]}
+        return _Request(self._d, "files.list", run)
+
+    def get(self, fileId: str, fields: Optional[str] = None, **_: Any) -> _Request:
+        def run() -> Dict[str, Any]:
+            f = self._d.items.get(fileId)
+            if f is None:
+                raise FakeAPIError(404, f"File not found: {fileId}")
+            return _public(f)
+        return _Request(self._d, "files.get", run)
+
+    def get_media(self, fileId: str, **_: Any) -> _Request:
+        def run() -> bytes:
+            f = self._d.items.get(fileId)
+            if f is None:
+                raise FakeAPIError(404, f"File not found: {fileId}")
+            return f.get("content") or b""
+        return _Request(self._d, "files.get_media", run)
+
+    def create(self, body: Optional[Dict[str, Any]] = None, media_body: Any = None, fields: Optional[str] = None, **_: Any) -> _Request:
+        def run() -> Dict[str, Any]:
+            content = b""
+            if media_body is not None:
+                fh = getattr(media_body, "_fd", None) or getattr(media_body, "stream", lambda: None)()
+                if fh is not None and hasattr(fh, "read"):
+                    fh.seek(0)
+                    content = fh.read()
+            b = dict(body or {})
+            mime = b.get("mimeType") or getattr(media_body, "mimetype", lambda: None)() or "application/octet-stream"
+            return _public(self._d.add(b.get("name") or "untitled", (b.get("parents") or [None])[0], mime, content))
+        return _Request(self._d, "files.create", run)
+
+
+class _Permissions:
+    def __init__(self, drive: "FakeDriveService") -> None:
+        self._d = drive
+
+    def create(self, fileId: str, body: Optional[Dict[str, Any]] = None, **_: Any) -> _Request:
+        return _Request(self._d, "permissions.create", lambda: {"id": "anyoneWithLink", **(body or {})})
+
+
+def _public(f: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in f.items() if k != "content"}
+
+
+class FakeDriveService:
+    def __init__(self, sim: Optional[Simulator] = None,
+                 request_wrapper: Optional[Callable[[str, Callable[[], Any]], Any]] = None) -> None:
+        self.sim = sim or Simulator()
+        self.request_wrapper = request_wrapper
+        self.lock = threading.RLock()
+        self.items: Dict[str, Dict[str, Any]] = {}  # id → metadane (+ "content")
+
+    def files(self) -> _Files:
+        return _Files(self)
+
+    def permissions(self) -> _Permissions:
+        return _Permissions(self)
+
+    def add(self, name: str, parent: Optional[str], mime_type: str = "application/octet-stream",
+            content: bytes = b"", file_id: Optional[str] = None) -> Dict[str, Any]:
+        fid = file_id or secrets.token_urlsafe(12)
+        f = {
+            "id": fid,
+            "name": name,
+            "mimeType": mime_type,
+            "parents": [parent] if parent else [],
+            "size": str(len(content)),
+            "modifiedTime": _now_rfc3339(),
+            "webViewLink": f"https://drive.google.com/file/d/{fid}/view",
+            "webContentLink": f"https://drive.google.com/uc?id={fid}&export=download",
+            "content": content,
+        }
+        with self.lock:
+            self.items[fid] = f
+        return f
+
+    def add_folder(self, name: str, parent: Optional[str], file_id: Optional[str] = None) -> Dict[str, Any]:
+        return self.add(name, parent, FOLDER_MIME, file_id=file_id)
+
+
+# --- Wspólne atrapy procesu (GOOGLE_FAKE=1) ---
+
+_shared: Optional[Tuple[FakeGspreadClient, FakeDriveService]] = None
+_shared_lock = threading.Lock()
+
+
+def _env_num(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def simulator_from_env() -> Simulator:
+    return Simulator(
+        latency=_env_num("GOOGLE_FAKE_LATENCY", 0.0),
+        jitter=_env_num("GOOGLE_FAKE_JITTER", 0.0),
+        quota_error_rate=_env_num("GOOGLE_FAKE_QUOTA_RATE", 0.0),
+        failure_rate=_env_num("GOOGLE_FAKE_FAILURE_RATE", 0.0),
+        rate_limit=_env_num("GOOGLE_FAKE_RATE_LIMIT", 0.0),
+        seed=int(_env_num("GOOGLE_FAKE_SEED", 0)),
+    )
+
+
+def shared_services(spreadsheet_key: Optional[str] = None, root_folder_id: Optional[str] = None,
+                    request_wrapper: Optional[Callable[[str, Callable[[], Any]], Any]] = None) -> Tuple[FakeGspreadClient, FakeDriveService]:
+    """
+    Jedna para atrap Sheets/Drive na proces, ze wspólnym Simulatorem z env.
+    Przy pierwszym wywołaniu tworzy pusty arkusz spreadsheet_key (zakładki doda
+    aplikacja przez add_worksheet) i folder root_folder_id w Drive.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            sim = simulator_from_env()
+            sheets, drive = FakeGspreadClient(sim), FakeDriveService(sim, request_wrapper)
+            if spreadsheet_key:
+                sheets.spreadsheet(spreadsheet_key)
+            if root_folder_id and root_folder_id != "root":
+                drive.add_folder("Import Tracker", None, file_id=root_folder_id)
+            _shared = (sheets, drive)
+        return _shared
+
+
+def reset_shared() -> None:
+    global _shared
+    with _shared_lock:
+        _shared = None
@@ -0,0 +1,275 @@
+"""
+Lokalny cache plików Google Drive dla proxy `/api/files/{driveFileId}`.
+
+Pobrany plik trafia na dysk (`<katalog>/<sha1(id)>.bin` + metadane w `.json` obok),
+więc kolejne pobrania tej samej faktury czy specyfikacji serwowane są z dysku
+(FileResponse – zakresy bajtów, If-Range, a przy serwerze ASGI z rozszerzeniem
+pathsend – wysyłka bez kopiowania przez Pythona).
+
+- Budżet rozmiaru z usuwaniem najdawniej używanych plików (LRU). Plik większy niż
+  cały budżet jest pobierany do pliku tymczasowego i usuwany po wysłaniu.
+- Rewalidacja z Drive: wpis młodszy niż `revalidate_after` sekund jest serwowany bez
+  pytania Drive; starszy – jedno zapytanie o metadane (md5Checksum/modifiedTime) i
+  ponowne pobranie tylko, gdy plik się zmienił. Gdy Drive nie odpowiada, serwowana
+  jest ostatnia pobrana wersja.
+- Jeden plik pobierany jest naraz (blokada per id) – równoległe żądania czekają na ten
+  sam wpis zamiast pobierać go kilka razy.
+- Plik wysyłany w odpowiedzi jest przypięty (pin/release) – eviction go nie usunie.
+
+Proxy udostępnia wyłącznie pliki będące załącznikami produktów (FileIndex – id pliku
+z linków Product.files), nie dowolne pliki widoczne dla konta serwisowego.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, Optional
+
+from app import attachments
+from app.storage import ChangeTracker
+
+GOOGLE_APPS_MIME = "application/vnd.google-apps."
+DRIVE_META_FIELDS = "id,name,mimeType,size,modifiedTime,md5Checksum"
+
+
+class UnsupportedFile(ValueError):
+    """Plik bez treści binarnej do pobrania (np. dokument Google – wymagałby eksportu)."""
+
+
+def version_of(meta: Dict[str, Any]) -> str:
+    """Wersja treści pliku: md5 z Drive, a gdy go brak – data modyfikacji i rozmiar."""
+    return str(meta.get("md5Checksum") or f"{meta.get('modifiedTime')}:{meta.get('size')}")
+
+
+def etag_of(file_id: str, version: str) -> str:
+    return '"' + hashlib.sha1(f"{file_id}:{version}".encode("utf-8")).hexdigest() + '"'
+
+
+class FileCache:
+    """Cache plików na dysku z budżetem rozmiaru (LRU) i rewalidacją względem Drive."""
+
+    def __init__(self, root: str, max_bytes: int, revalidate_after: float = 300.0) -> None:
+        self.root = Path(root)
+        self.max_bytes = max(0, int(max_bytes))
+        self.revalidate_after = revalidate_after
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # id → metadane (LRU: najstarsze pierwsze)
+        self._fetch_locks: Dict[str, List[Any]] = {}  # id → [lock, liczba oczekujących]; usuwane po ostatnim
+        self._pins: Dict[str, int] = {}
+        self.bytes = 0
+        self.hits = self.misses = self.revalidations = self.evictions = 0
+        self._loaded = False
+
+    # --- Indeks na dysku ---
+    def _path(self, file_id: str, suffix: str) -> Path:
+        return self.root / (hashlib.sha1(file_id.encode("utf-8")).hexdigest() + suffix)
+
+    def _load(self) -> None:
+        """Wpisy z poprzedniego uruchomienia (pliki .json z metadanymi), od najdawniej używanych."""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.root.is_dir():
+            return
+        found = []
+        for meta_path in self.root.glob("*.json"):
+            try:
+                entry = json.loads(meta_path.read_text(encoding="utf-8"))
+                data_path = self._path(str(entry["id"]), ".bin")
+                size = data_path.stat().st_size
+                used = data_path.stat().st_atime
+            except (OSError, ValueError, KeyError):
+                continue
+            found.append((used, dict(entry, path=str(data_path), bytes=size, checked=0.0)))
+        for _, entry in sorted(found, key=lambda x: x[0]):
+            self._entries[entry["id"]] = entry
+            self.bytes += entry["bytes"]
+        self._evict()
+
+    # --- Odczyt ---
+    def get(self, file_id: str, fetch_meta: Callable[[str], Dict[str, Any]],
+            download: Callable[[str, BinaryIO], None]) -> Dict[str, Any]:
+        """
+        Wpis pliku (path, name, mimeType, modifiedTime, etag, transient), przypięty do `release()`.
+        fetch_meta(id) – metadane z Drive; download(id, plik) – zapis treści do otwartego pliku.
+        """
+        with self._lock:
+            self._load()
+            slot = self._fetch_locks.setdefault(file_id, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                return self._get_locked(file_id, fetch_meta, download)
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    self._fetch_locks.pop(file_id, None)
+
+    def _get_locked(self, file_id: str, fetch_meta: Callable[[str], Dict[str, Any]],
+                    download: Callable[[str, BinaryIO], None]) -> Dict[str, Any]:
+        """get() pod blokadą pliku – jedno pobranie naraz."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(file_id)
+            fresh = entry is not None and os.path.exists(entry["path"])
+            if fresh and now - entry["checked"] < self.revalidate_after:
+                return self._hit(file_id, entry)
+        try:
+            meta = fetch_meta(file_id)
+        except Exception:
+            # Drive niedostępny – lepiej oddać ostatnią znaną wersję niż błąd
+            if fresh:
+                with self._lock:
+                    return self._hit(file_id, entry)
+            raise
+        if str(meta.get("mimeType") or "").startswith(GOOGLE_APPS_MIME):
+            raise UnsupportedFile(f"Plik {meta.get('name') or file_id} to dokument Google – brak treści do pobrania")
+        version = version_of(meta)
+        with self._lock:
+            entry = self._entries.get(file_id)
+            if entry is not None and fresh and entry["version"] == version:
+                entry["checked"] = now
+                self.revalidations += 1
+                return self._hit(file_id, entry)
+        return self._fetch(file_id, meta, version, download, now)
+
+    def _hit(self, file_id: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        self._entries.move_to_end(file_id)
+        self._pins[file_id] = self._pins.get(file_id, 0) + 1
+        self.hits += 1
+        return dict(entry, transient=False)
+
+    def _fetch(self, file_id: str, meta: Dict[str, Any], version: str,
+               download: Callable[[str, BinaryIO], None], now: float) -> Dict[str, Any]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=str(self.root), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                download(file_id, fh)
+            size = os.path.getsize(tmp)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        entry = {
+            "id": file_id, "name": meta.get("name"), "mimeType": meta.get("mimeType"),
+            "modifiedTime": meta.get("modifiedTime"), "version": version, "etag": etag_of(file_id, version),
+        }
+        with self._lock:
+            self.misses += 1
+            if size > self.max_bytes:
+                # Nie zmieści się w budżecie – plik jednorazowy, usuwany po wysłaniu odpowiedzi
+                return dict(entry, path=tmp, bytes=size, checked=now, transient=True)
+            path = self._path(file_id, ".bin")
+            os.replace(tmp, path)
+            self._path(file_id, ".json").write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+            old = self._entries.pop(file_id, None)
+            if old is not None:
+                self.bytes -= old["bytes"]
+            entry.update(path=str(path), bytes=size, checked=now)
+            self._entries[file_id] = entry
+            self.bytes += size
+            self._pins[file_id] = self._pins.get(file_id, 0) + 1
+            self._evict()
+            return dict(entry, transient=False)
+
+    def release(self, entry: Dict[str, Any]) -> None:
+        """Po wysłaniu odpowiedzi: odepnij wpis albo usuń plik jednorazowy."""
+        if entry.get("transient"):
+            try:
+                os.unlink(entry["path"])
+            except OSError:
+                pass
+            return
+        with self._lock:
+            file_id = entry["id"]
+            left = self._pins.get(file_id, 0) - 1
+            if left > 0:
+                self._pins[file_id] = left
+            else:
+                self._pins.pop(file_id, None)
+            self._evict()
+
+    def _evict(self) -> None:
+        """Usuń najdawniej używane, nieprzypięte wpisy ponad budżet (pod self._lock)."""
+        if self.bytes <= self.max_bytes:
+            return
+        for file_id in list(self._entries):
+            if self.bytes <= self.max_bytes:
+                break
+            if self._pins.get(file_id):
+                continue
+            entry = self._entries.pop(file_id)
+            self.bytes -= entry["bytes"]
+            self.evictions += 1
+            for suffix in (".bin", ".json"):
+                try:
+                    os.unlink(self._path(file_id, suffix))
+                except OSError:
+                    pass
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            return {
+                "dir": str(self.root), "maxBytes": self.max_bytes, "bytes": self.bytes,
+                "files": len(self._entries), "pinned": sum(1 for v in self._pins.values() if v),
+                "revalidateAfter": self.revalidate_after,
+                "hits": self.hits, "misses": self.misses, "revalidations": self.revalidations,
+                "evictions": self.evictions,
+            }
+
+
+class FileIndex:
+    """Id pliku Drive → załącznik produktu (kontener, produkt, rekord); odświeżany przyrostowo jak indeks wyszukiwania."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._changes = ChangeTracker()
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._by_container: Dict[str, List[str]] = {}
+
+    def invalidate(self, container_id: Optional[str] = None) -> None:
+        self._changes.invalidate(container_id)
+
+    def refresh(self, list_containers: Callable[[], List[Dict[str, Any]]],
+                get_container: Callable[[str], Optional[Dict[str, Any]]]) -> None:
+        stale, dirty = self._changes.take()
+        if stale:
+            containers = list_containers()
+            with self._lock:
+                self._files.clear()
+                self._by_container.clear()
+                for c in containers:
+                    self._add(c)
+            return
+        for cid in dirty:
+            c = get_container(cid)
+            with self._lock:
+                for fid in self._by_container.pop(cid, []):
+                    if self._files.get(fid, {}).get("containerId") == cid:
+                        self._files.pop(fid, None)
+                if c is not None:
+                    self._add(c)
+
+    def _add(self, c: Dict[str, Any]) -> None:
+        cid = str(c.get("id"))
+        ids = self._by_container.setdefault(cid, [])
+        for p in c.get("products") or []:
+            for f in attachments.resolved(p):
+                fid = attachments.drive_file_id(f.get("url") if isinstance(f, dict) else f)
+                if fid:
+                    rec = f if isinstance(f, dict) else {}
+                    self._files[fid] = dict(rec, containerId=cid, productId=str(p.get("id")))
+                    ids.append(fid)
+
+    def lookup(self, file_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            found = self._files.get(file_id)
+            return dict(found) if found is not None else None
@@ -0,0 +1,306 @@
+"""
+Tabela kursów walut (PLN za jednostkę waluty) z datami obowiązywania i przeliczenia.
+
+Źródło to lokalny plik w formatach NBP:
+- CSV archiwum tabel A (`data;1USD;1EUR;100JPY;…`, data YYYYMMDD lub YYYY-MM-DD,
+  przecinek dziesiętny, wiersze opisowe/stopka pomijane),
+- CSV „długi” z kolumnami code/date/mid (lub rate),
+- JSON z API NBP: pojedyncza waluta `{"code": "USD", "rates": [{"effectiveDate", "mid"}]}`
+  albo lista tabel `[{"effectiveDate", "rates": [{"code", "mid"}]}]`.
+
+Dla każdej waluty trzymane są posortowane listy dat i kursów – kurs na dzień
+(ostatni opublikowany nie później niż dana data) to bisect, O(log n).
+Wyniki wyszukań są zapamiętywane (słownik (waluta, data) → kurs), czyszczony
+przy wczytaniu tabeli.
+
+Przeszacowanie (Revaluation): koszty kontenera są liniowe względem 1/kurs –
+kwoty w USD wchodzą wprost, kwoty w PLN dzielone są przez kurs. Dla każdego
+kontenera wystarczą więc dwie liczby na sumę (część USD `a` i część PLN `b`):
+suma w USD = a + b/kurs, w PLN = a·kurs + b. Przeliczenie wszystkich
+kontenerów po nowym kursie to jedno przejście po kolumnach (NumPy, jeśli jest
+zainstalowany; inaczej zwykła pętla).
+"""
+from __future__ import annotations
+
+import bisect
+import csv
+import io
+import json
+import re
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app import costing
+from app.storage import ChangeTracker
+
+BASE_CURRENCY = "PLN"
+_CURRENCY_COL = re.compile(r"^(\d*)\s*([A-Z]{3})$")
+
+
+def parse_date(value: Any) -> Optional[date]:
+    s = str(value or "").strip()
+    for fmt in ("%Y-%m-%d", "%Y%m%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _rate(value: Any) -> Optional[float]:
+    try:
+        r = float(str(value).strip().replace(" ", "").replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+    return r if r > 0 else None
+
+
+def parse_csv(text: str) -> List[Tuple[str, date, float]]:
+    """Wiersze (waluta, data, kurs za 1 jednostkę) z CSV archiwum NBP lub CSV code/date/mid."""
+    sample = text[:4096]
+    delimiter = ";" if sample.count(";") >= sample.count(",") else ","
+    rows = list(csv.reader(io.StringIO(text), delimiter=delimiter))
+    if not rows:
+        return []
+    header = [h.strip() for h in rows[0]]
+    lower = [h.lower() for h in header]
+    out: List[Tuple[str, date, float]] = []
+    if "code" in lower and ("mid" in lower or "rate" in lower):
+        ci = lower.index("code")
+        di = next((lower.index(k) for k in ("date", "effectivedate", "data") if k in lower), None)
+        ri = lower.index("mid") if "mid" in lower else lower.index("rate")
+        if di is None:
+            return []
+        for row in rows[1:]:
+            if len(row) <= max(ci, di, ri):
+                continue
+            d, r = parse_date(row[di]), _rate(row[ri])
+            if d and r:
+                out.append((row[ci].strip().upper(), d, r))
+        return out
+    di = next((lower.index(k) for k in ("data", "date", "effectivedate") if k in lower), 0)
+    columns: List[Tuple[int, str, float]] = []
+    for i, h in enumerate(header):
+        m = _CURRENCY_COL.match(h.upper())
+        if i != di and m:
+            columns.append((i, m.group(2), float(m.group(1) or 1)))
+    for row in rows[1:]:
+        d = parse_date(row[di]) if len(row) > di else None
+        if d is None:
+            continue  # druga linia nagłówka NBP, stopka
+        for i, code, units in columns:
+            r = _rate(row[i]) if i < len(row) else None
+            if r:
+                out.append((code, d, r / units))
+    return out
+
+
+def parse_json(payload: Any) -> List[Tuple[str, date, float]]:
+    """Wiersze z odpowiedzi API NBP (pojedyncza waluta lub tabele) – także lista takich obiektów."""
+    out: List[Tuple[str, date, float]] = []
+    items = payload if isinstance(payload, list) else [payload]
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        code = str(item.get("code") or "").upper()
+        table_date = parse_date(item.get("effectiveDate"))
+        for r in item.get("rates") or []:
+            c = str(r.get("code") or code).upper()
+            d = parse_date(r.get("effectiveDate")) or table_date
+            mid = _rate(r.get("mid", r.get("rate")))
+            if c and d and mid:
+                out.append((c, d, mid))
+    return out
+
+
+class RateTable:
+    """Kursy per waluta: posortowane daty (ordinal) i kursy; kurs na dzień przez bisect."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._dates: Dict[str, List[int]] = {}
+        self._rates: Dict[str, List[float]] = {}
+        self._memo: Dict[Tuple[str, int], Optional[Tuple[date, float]]] = {}
+        self.source: Optional[str] = None
+        self.loaded_at: Optional[str] = None
+        self.lookups = 0
+        self.memo_hits = 0
+
+    def load_rows(self, rows: Iterable[Tuple[str, date, float]], source: Optional[str] = None) -> int:
+        by_code: Dict[str, Dict[int, float]] = {}
+        n = 0
+        for code, d, r in rows:
+            by_code.setdefault(code, {})[d.toordinal()] = r  # duplikat daty – ostatni wygrywa
+            n += 1
+        dates = {c: sorted(v) for c, v in by_code.items()}
+        rates = {c: [by_code[c][d] for d in dates[c]] for c in dates}
+        with self._lock:
+            self._dates, self._rates, self._memo = dates, rates, {}
+            self.source = source
+            self.loaded_at = datetime.utcnow().isoformat() + "Z"
+        return n
+
+    def load_file(self, path: Path) -> int:
+        text = Path(path).read_text(encoding="utf-8-sig")
+        rows = parse_json(json.loads(text)) if str(path).lower().endswith(".json") else parse_csv(text)
+        return self.load_rows(rows, source=str(path))
+
+    def currencies(self) -> List[str]:
+        with self._lock:
+            return sorted(self._dates)
+
+    def rate_on(self, code: str, on: Optional[date] = None) -> Optional[Tuple[date, float]]:
+        """(data publikacji, kurs) ostatniego kursu nie późniejszego niż `on` (domyślnie dziś); PLN → 1."""
+        code = (code or "").upper()
+        day = (on or date.today()).toordinal()
+        if code == BASE_CURRENCY:
+            return date.fromordinal(day), 1.0
+        key = (code, day)
+        with self._lock:
+            self.lookups += 1
+            if key in self._memo:
+                self.memo_hits += 1
+                return self._memo[key]
+            dates = self._dates.get(code)
+            found: Optional[Tuple[date, float]] = None
+            if dates:
+                i = bisect.bisect_right(dates, day) - 1
+                if i >= 0:
+                    found = (date.fromordinal(dates[i]), self._rates[code][i])
+            self._memo[key] = found
+            return found
+
+    def convert(self, amount: Any, src: str, dst: str, on: Optional[date] = None) -> Optional[float]:
+        """Kwota w walucie src → dst po kursach na dzień (przez PLN); brak kursu → None."""
+        a = self.rate_on(src, on)
+        b = self.rate_on(dst, on)
+        if a is None or b is None:
+            return None
+        return costing.num(amount, 0.0) * a[1] / b[1]
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "source": self.source,
+                "loadedAt": self.loaded_at,
+                "currencies": {
+                    c: {"rates": len(d), "from": date.fromordinal(d[0]).isoformat(), "to": date.fromordinal(d[-1]).isoformat()}
+                    for c, d in sorted(self._dates.items())
+                },
+                "lookups": self.lookups,
+                "memoHits": self.memo_hits,
+            }
+
+
+# --- Przeszacowanie ---
+REVALUE_SUMS = ("netto", "brutto", "duty", "vat")
+
+
+def exposure(container: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Części USD (a) i PLN (b) sum kontenera: suma_USD(kurs) = a + b/kurs.
+    Wyznaczane z dwóch wyliczeń costing (kurs 1 i 2) – wzory są liniowe względem 1/kurs.
+    """
+    def sums(er: float) -> Dict[str, float]:
+        base = costing.container_cost_base(container, er)
+        out = dict.fromkeys(REVALUE_SUMS, 0.0)
+        for p in container.get("products") or []:
+            c = costing.product_costs(p, container, base)
+            out["netto"] += c["nettoTotal"]
+            out["brutto"] += c["bruttoTotal"]
+            out["duty"] += c["dutyAmount"]
+            out["vat"] += c["vatAmount"]
+        return out
+
+    t1, t2 = sums(1.0), sums(2.0)
+    out: Dict[str, float] = {}
+    for k in REVALUE_SUMS:
+        b = 2.0 * (t1[k] - t2[k])
+        out[f"{k}UsdPart"] = t1[k] - b
+        out[f"{k}PlnPart"] = b
+    return out
+
+
+def _numpy():
+    try:
+        import numpy  # type: ignore
+        return numpy
+    except ImportError:
+        return None
+
+
+class Revaluation:
+    """Kolumny ekspozycji per kontener (przyrostowo, jak indeks wyszukiwania) i przeliczenie po kursach."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._changes = ChangeTracker()
+        self._rows: Dict[str, Dict[str, Any]] = {}
+
+    def invalidate(self, container_id: Optional[str] = None) -> None:
+        self._changes.invalidate(container_id)
+
+    def refresh(self, list_containers: Callable[[], List[Dict[str, Any]]],
+                get_container: Callable[[str], Optional[Dict[str, Any]]]) -> None:
+        stale, dirty = self._changes.take()
+        if stale:
+            rows = {str(c.get("id")): self._row(c) for c in list_containers()}
+            with self._lock:
+                self._rows = rows
+            return
+        for cid in dirty:
+            c = get_container(cid)
+            with self._lock:
+                if c is None:
+                    self._rows.pop(cid, None)
+                else:
+                    self._rows[cid] = self._row(c)
+
+    @staticmethod
+    def _row(c: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": str(c.get("id")),
+            "name": c.get("name") or "",
+            "orderDate": c.get("orderDate") or "",
+            "exchangeRate": costing.num(c.get("exchangeRate"), 4.0),
+            **exposure(c),
+        }
+
+    def revalue(self, rate_for: Callable[[Dict[str, Any]], Optional[float]]) -> Dict[str, Any]:
+        """
+        Sumy wszystkich kontenerów po kursie z rate_for(wiersz) (None → bieżący kurs kontenera).
+        Zwraca kolumnowo przeliczone sumy PLN/USD i różnicę PLN względem bieżącego kursu.
+        """
+        with self._lock:
+            rows = list(self._rows.values())
+        current = [r["exchangeRate"] for r in rows]
+        rates = [rate_for(r) or r["exchangeRate"] for r in rows]
+        np = _numpy()
+        out: Dict[str, Any] = {"count": len(rows), "engine": "numpy" if np is not None else "python"}
+        cols: Dict[str, List[float]] = {}
+        if np is not None:
+            r_new, r_cur = np.asarray(rates, dtype=float), np.asarray(current, dtype=float)
+            for k in REVALUE_SUMS:
+                a = np.fromiter((r[f"{k}UsdPart"] for r in rows), dtype=float, count=len(rows))
+                b = np.fromiter((r[f"{k}PlnPart"] for r in rows), dtype=float, count=len(rows))
+                pln, usd = a * r_new + b, a + b / r_new
+                cols[f"{k}Pln"], cols[f"{k}Usd"] = pln.round(2).tolist(), usd.round(2).tolist()
+                cols[f"{k}PlnDelta"] = (pln - (a * r_cur + b)).round(2).tolist()
+        else:
+            for k in REVALUE_SUMS:
+                a = [r[f"{k}UsdPart"] for r in rows]
+                b = [r[f"{k}PlnPart"] for r in rows]
+                cols[f"{k}Pln"] = [round(x * rn + y, 2) for x, y, rn in zip(a, b, rates)]
+                cols[f"{k}Usd"] = [round(x + y / rn, 2) for x, y, rn in zip(a, b, rates)]
+                cols[f"{k}PlnDelta"] = [round(x * (rn - rc), 2) for x, rn, rc in zip(a, rates, current)]
+        out["columns"] = {
+            "id": [r["id"] for r in rows],
+            "name": [r["name"] for r in rows],
+            "currentRate": current,
+            "rate": rates,
+            **cols,
+        }
+        out["totals"] = {k: round(sum(v), 2) for k, v in cols.items()}
+        return out
@@ -0,0 +1,272 @@
+"""
+Planowanie załadunku: rozkład produktów (productCbm) na kontenery o zadanych pojemnościach.
+
+Dwa cele:
+- count – najmniej kontenerów (a przy remisie najtańsze rozmiary). First-fit-decreasing
+  daje plan startowy, potem w ramach budżetu czasu lokalne przeszukiwanie próbuje
+  opróżnić najsłabiej wypełniony kontener: jego pozycje trafiają do pozostałych
+  (best-fit), a pozycja, która nigdzie się nie mieści, może wymienić się z mniejszą
+  pozycją innego kontenera. Na końcu każdy kontener dostaje najtańszy rozmiar, w którym
+  mieści się jego ładunek.
+- value – jeden kontener o największej wartości (USD): zachłannie po wartości na CBM,
+  potem wymiany 1↔1 (pozycja z planu ↔ pozycja spoza planu) poprawiające wartość.
+
+Oba warianty są heurystykami (problem pakowania jest NP-trudny) – wynik zawiera
+dolne ograniczenie liczby kontenerów, żeby było widać, ile mógłby zyskać dokładny solver.
+"""
+from __future__ import annotations
+
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from app import costing
+
+# Pojemności ładunkowe typowych kontenerów (CBM) – używane, gdy żądanie nie poda własnych
+DEFAULT_SIZES = (
+    {"name": "20ft", "cbm": 33.0, "cost": 1.0},
+    {"name": "40ft", "cbm": 67.0, "cost": 1.6},
+    {"name": "40HC", "cbm": 76.0, "cost": 1.7},
+)
+OBJECTIVES = ("count", "value")
+EPS = 1e-9
+
+
+def items_from_containers(containers: Sequence[Dict[str, Any]],
+                          product_ids: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """Pozycje do planu z produktów kontenerów: CBM i wartość w USD po kursie kontenera."""
+    wanted = {str(i) for i in product_ids or ()}
+    out = []
+    for c in containers:
+        er = costing.num(c.get("exchangeRate"), 4.0)
+        for p in c.get("products") or []:
+            if wanted and str(p.get("id")) not in wanted:
+                continue
+            out.append({
+                "id": p.get("id"),
+                "name": p.get("name"),
+                "containerId": c.get("id"),
+                "cbm": max(0.0, costing.num(p.get("productCbm"), 0.0)),
+                "value": costing.to_usd(p.get("totalPrice"), p.get("totalPriceCurrency") or "USD", er),
+            })
+    return out
+
+
+def normalize_sizes(sizes: Optional[Sequence[Dict[str, Any]]], fill: float = 1.0) -> List[Dict[str, Any]]:
+    """Rozmiary posortowane rosnąco po pojemności; `fill` (0–1] – użyteczna część kubatury."""
+    out = []
+    for s in sizes or DEFAULT_SIZES:
+        cbm = costing.num(s.get("cbm"), 0.0)
+        if cbm <= 0:
+            raise ValueError(f"Pojemność kontenera {s.get('name') or '?'} musi być dodatnia")
+        out.append({"name": str(s.get("name") or f"{cbm:g} CBM"), "cbm": cbm,
+                    "capacity": cbm * fill, "cost": costing.num(s.get("cost"), cbm)})
+    if not out:
+        raise ValueError("Brak rozmiarów kontenerów")
+    return sorted(out, key=lambda s: (s["capacity"], s["cost"]))
+
+
+class _Bin:
+    __slots__ = ("capacity", "items", "load")
+
+    def __init__(self, capacity: float) -> None:
+        self.capacity = capacity
+        self.items: List[int] = []
+        self.load = 0.0
+
+    def free(self) -> float:
+        return self.capacity - self.load
+
+    def add(self, i: int, cbm: float) -> None:
+        self.items.append(i)
+        self.load += cbm
+
+    def remove(self, i: int, cbm: float) -> None:
+        self.items.remove(i)
+        self.load -= cbm
+
+
+def _first_fit_decreasing(order: List[int], cbm: List[float], capacity: float) -> List[_Bin]:
+    bins: List[_Bin] = []
+    for i in order:
+        for b in bins:
+            if cbm[i] <= b.free() + EPS:
+                b.add(i, cbm[i])
+                break
+        else:
+            b = _Bin(capacity)
+            b.add(i, cbm[i])
+            bins.append(b)
+    return bins
+
+
+def _try_eliminate(bins: List[_Bin], victim: int, cbm: List[float], deadline: float) -> bool:
+    """
+    Rozłóż pozycje kontenera `victim` na pozostałe. Zmiany są stosowane na miejscu;
+    przy porażce przywracany jest stan wyjściowy. Każda wymiana zmniejsza pozycję
+    oczekującą, więc pętla się kończy.
+    """
+    others = [b for k, b in enumerate(bins) if k != victim]
+    snapshot = [(list(b.items), b.load) for b in others]
+    pending = sorted(bins[victim].items, key=lambda i: -cbm[i])
+    while pending and time.monotonic() < deadline:
+        i = pending.pop(0)
+        best = None
+        for b in others:
+            if cbm[i] <= b.free() + EPS and (best is None or b.free() < best.free()):
+                best = b
+        if best is not None:
+            best.add(i, cbm[i])
+            continue
+        swap = None  # (kontener, pozycja) – największa mniejsza pozycja, dla której i się zmieści
+        for b in others:
+            for j in b.items:
+                if cbm[j] < cbm[i] - EPS and cbm[i] <= b.free() + cbm[j] + EPS and (swap is None or cbm[j] > cbm[swap[1]]):
+                    swap = (b, j)
+        if swap is None:
+            pending.append(i)
+            break
+        b, j = swap
+        b.remove(j, cbm[j])
+        b.add(i, cbm[i])
+        pending.append(j)
+        pending.sort(key=lambda k: -cbm[k])
+    if pending:
+        for b, (items, load) in zip(others, snapshot):
+            b.items, b.load = items, load
+        return False
+    del bins[victim]
+    return True
+
+
+def _pack_count(cbm: List[float], placeable: List[int], largest: float, deadline: float) -> Dict[str, Any]:
+    order = sorted(placeable, key=lambda i: -cbm[i])
+    bins = _first_fit_decreasing(order, cbm, largest)
+    start_count = len(bins)
+    iterations = 0
+    failed: set = set()
+    while len(bins) > 1 and time.monotonic() < deadline:
+        candidates = [k for k in range(len(bins)) if tuple(sorted(bins[k].items)) not in failed]
+        if not candidates:
+            break
+        victim = min(candidates, key=lambda k: bins[k].load)
+        iterations += 1
+        key = tuple(sorted(bins[victim].items))
+        if _try_eliminate(bins, victim, cbm, deadline):
+            failed.clear()  # inne kontenery się zmieniły – wcześniejsze porażki mogą się teraz udać
+        else:
+            failed.add(key)
+    return {"bins": bins, "startCount": start_count, "iterations": iterations}
+
+
+def _pack_value(cbm: List[float], value: List[float], placeable: List[int], capacity: float,
+                deadline: float) -> Dict[str, Any]:
+    density = sorted(placeable, key=lambda i: -(value[i] / cbm[i] if cbm[i] > EPS else math.inf))
+    chosen: List[int] = []
+    load = 0.0
+    for i in density:
+        if load + cbm[i] <= capacity + EPS:
+            chosen.append(i)
+            load += cbm[i]
+    start_value = sum(value[i] for i in chosen)
+    iterations = 0
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        inside = set(chosen)
+        outside = [i for i in placeable if i not in inside]
+        for j in outside:  # najpierw dołóż, co się mieści
+            if load + cbm[j] <= capacity + EPS:
+                chosen.append(j)
+                load += cbm[j]
+                improved = True
+        if improved:
+            continue
+        best = None  # (zysk, i, j)
+        for i in chosen:
+            for j in outside:
+                gain = value[j] - value[i]
+                if gain > EPS and load - cbm[i] + cbm[j] <= capacity + EPS and (best is None or gain > best[0]):
+                    best = (gain, i, j)
+            if time.monotonic() >= deadline:
+                break
+        iterations += 1
+        if best is not None:
+            _, i, j = best
+            chosen[chosen.index(i)] = j
+            load += cbm[j] - cbm[i]
+            improved = True
+    b = _Bin(capacity)
+    for i in chosen:
+        b.add(i, cbm[i])
+    return {"bins": [b] if chosen else [], "startValue": start_value, "iterations": iterations}
+
+
+def plan(items: Sequence[Dict[str, Any]], sizes: Optional[Sequence[Dict[str, Any]]] = None,
+         objective: str = "count", time_budget_ms: int = 200, fill: float = 1.0,
+         size: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Plan załadunku. `items` – słowniki z `cbm` i opcjonalnie `value`, `id`, `name`, `containerId`.
+    Dla objective=value `size` wybiera rozmiar kontenera (domyślnie największy).
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Nieznany cel: {objective} (dostępne: {', '.join(OBJECTIVES)})")
+    if not 0 < fill <= 1:
+        raise ValueError("fill musi być w zakresie (0, 1]")
+    started = time.monotonic()
+    deadline = started + max(0, time_budget_ms) / 1000.0
+    kinds = normalize_sizes(sizes, fill)
+    cbm = [max(0.0, costing.num(it.get("cbm"), 0.0)) for it in items]
+    value = [costing.num(it.get("value"), 0.0) for it in items]
+
+    if objective == "value":
+        chosen = [s for s in kinds if s["name"] == size] if size else kinds[-1:]
+        if not chosen:
+            raise ValueError(f"Nieznany rozmiar kontenera: {size}")
+        kinds = chosen
+    largest = kinds[-1]["capacity"]
+    placeable = [i for i in range(len(items)) if cbm[i] <= largest + EPS]
+    oversized = [i for i in range(len(items)) if cbm[i] > largest + EPS]
+
+    if objective == "count":
+        result = _pack_count(cbm, placeable, largest, deadline)
+        stats = {"startContainers": result["startCount"]}
+    else:
+        result = _pack_value(cbm, value, placeable, largest, deadline)
+        stats = {"startValue": round(result["startValue"], 2)}
+    bins: List[_Bin] = result["bins"]
+    placed = {i for b in bins for i in b.items}
+
+    def render(i: int) -> Dict[str, Any]:
+        it = items[i]
+        return {"id": it.get("id"), "name": it.get("name"), "containerId": it.get("containerId"),
+                "cbm": round(cbm[i], 4), "value": round(value[i], 2)}
+
+    containers = []
+    for b in sorted(bins, key=lambda b: -b.load):
+        kind = min((s for s in kinds if b.load <= s["capacity"] + EPS), key=lambda s: (s["cost"], s["capacity"]))
+        containers.append({
+            "size": kind["name"], "cbm": kind["cbm"], "capacity": round(kind["capacity"], 4),
+            "load": round(b.load, 4), "fill": round(b.load / kind["capacity"], 4),
+            "value": round(sum(value[i] for i in b.items), 2),
+            "items": [render(i) for i in sorted(b.items, key=lambda i: -cbm[i])],
+        })
+    total_cbm = sum(cbm[i] for i in placed)
+    capacity = sum(c["capacity"] for c in containers)
+    return {
+        "objective": objective,
+        "sizes": [{k: s[k] for k in ("name", "cbm", "capacity", "cost")} for s in kinds],
+        "containers": containers,
+        "unplaced": [render(i) for i in oversized] + [render(i) for i in placeable if i not in placed],
+        "totals": {
+            "items": len(items), "placed": len(placed), "containers": len(containers),
+            "cbm": round(total_cbm, 4), "capacity": round(capacity, 4),
+            "fill": round(total_cbm / capacity, 4) if capacity else 0.0,
+            "value": round(sum(value[i] for i in placed), 2),
+            "cost": round(sum(next(s["cost"] for s in kinds if s["name"] == c["size"]) for c in containers), 4),
+            "lowerBound": math.ceil(sum(cbm[i] for i in placeable) / largest - EPS) if placeable else 0,
+        },
+        **stats,
+        "iterations": result["iterations"],
+        "elapsedMs": round((time.monotonic() - started) * 1000, 2),
+    }
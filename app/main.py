@@ -1,27 +1,35 @@
 from __future__ import annotations
 
+import email.utils
 import json
 import os
+import re
 import threading
-import base64
 import secrets
-import subprocess
-from datetime import datetime, timedelta
+import time
+import hashlib
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import Any, Callable, Dict, List, Optional, Set
 
 import logging
 from app.pdf_generator import generate_container_pdf
+from app.bulk_export import filter_containers, iter_pdf_zip
+from app import analytics, attachments, auth, exporters, bulk_import, filecache, fx, loadplan, metrics, previews, quota, reconcile, search, settings, sheet_index, simulate, tracing
+from app.outbox import Outbox
+from app.sheets_poller import SheetsPoller
+from app.storage import ContainerExists, ContainerNotFound, ProductNotFound, RevisionConflict, Store, create_store, revision_of
+from app.cluster import InvalidationBus, LeaderLock, RevisionCounter
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, BackgroundTasks
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, BackgroundTasks, Query
 
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field, field_validator
 
 # TODO: Basic Auth (przygotowanie)
@@ -35,46 +43,105 @@ from pydantic import BaseModel, Field, field_validator
 BASE_DIR = Path(__file__).resolve().parent.parent
 STATIC_DIR = BASE_DIR / "static"
 
-# Wczytaj zmienne środowiskowe z pliku .env w katalogu głównym (bez zależności zewnętrznych)
-def _load_env_from_file():
-    env_path = BASE_DIR / ".env"
-    if not env_path.exists():
-        return
-    try:
-        for raw in env_path.read_text(encoding="utf-8").splitlines():
-            line = raw.strip()
-            if not line or line.startswith("#"):
-                continue
-            key, sep, value = line.partition("=")
-            if sep != "=":
-                continue
-            k = key.strip()
-            v = value.strip()
-            # Usuń otaczające cudzysłowy, jeśli są
-            if (v.startswith('"') and v.endswith('"')) or (v.startswith("'") and v.endswith("'")):
-                v = v[1:-1]
-            # Rozwiń sekwencje \n (np. w PRIVATE_KEY)
-            v = v.replace("\\n", "\n")
-            os.environ.setdefault(k, v)
-    except Exception:
-        # Ignoruj błędy parsowania
-        pass
-
-_load_env_from_file()
-# Brak lokalnego zapisu – dane wyłącznie w pamięci (in-memory)
+# Konfiguracja: .env wczytywany raz przy starcie; kolejne żądania dostają gotowy snapshot,
+# ponowne parsowanie wyłącznie po zmianie mtime pliku (app/settings.py)
+_settings = settings.SettingsStore(BASE_DIR / ".env")
+
+def _cfg() -> settings.Settings:
+    return _settings.get()
+
+# Magazyn danych: "memory" (domyślnie, lista w pamięci procesu) lub "sqlite" (lokalna baza WAL,
+# współdzielona przez wiele workerów uvicorn i trwała między restartami)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "memory")
+SQLITE_PATH = os.environ.get("SQLITE_PATH") or str(BASE_DIR / "data" / "import_tracker.sqlite3")
+# Tryb wielu workerów (uvicorn --workers N): lider wybierany blokadą pliku wykonuje import startowy
+# i poller arkusza; pozostałe workery czytają wspólny magazyn SQLite i unieważniają cache po zmianie rewizji
+CLUSTER_MODE = os.environ.get("CLUSTER_MODE", "0")
+CLUSTER_DIR = os.environ.get("CLUSTER_DIR") or str(BASE_DIR / "data")
+CLUSTER_CHECK_INTERVAL = os.environ.get("CLUSTER_CHECK_INTERVAL", "1")  # sekundy między sprawdzeniami rewizji
+_cluster_enabled = CLUSTER_MODE == "1"
+if _cluster_enabled and STORAGE_BACKEND.strip().lower() != "sqlite":
+    logger.warning("[Cluster] CLUSTER_MODE=1 requires shared storage — switching STORAGE_BACKEND to sqlite")
+    STORAGE_BACKEND = "sqlite"
+_leader_lock: Optional[LeaderLock] = LeaderLock(str(Path(CLUSTER_DIR) / "leader.lock")) if _cluster_enabled else None
+_revision: Optional[RevisionCounter] = RevisionCounter(str(Path(CLUSTER_DIR) / "revision")) if _cluster_enabled else None
 _data_lock = threading.Lock()
 _mem_data: List[Dict[str, Any]] = []
+_store: Store = create_store(STORAGE_BACKEND, SQLITE_PATH, _mem_data, _data_lock,
+                             revision_source=_revision.read if _revision else None)
+_store.lock_wait_observer = metrics.observe_lock_wait
+_store.span_factory = tracing.span
+# Indeks wyszukiwania: magazyn zgłasza zmienione kontenery, indeks nanosi je przy najbliższym zapytaniu
+_search = search.SearchIndex()
+_store.add_change_listener(_search.invalidate)
+# Agregaty /api/analytics – ten sam mechanizm: przeliczany tylko wkład zmienionych kontenerów
+_analytics = analytics.Rollups()
+_store.add_change_listener(_analytics.invalidate)
+# Kolumny ekspozycji walutowej dla przeszacowania (/api/fx/revalue)
+_revaluation = fx.Revaluation()
+_store.add_change_listener(_revaluation.invalidate)
+# Metadane plików Drive widziane przy uploadzie/listowaniu – dołączane do produktów przy zapisie
+_attachments = attachments.Registry()
+# Id plików Drive z linków produktów – proxy /api/files/{id} serwuje tylko załączniki
+_file_index = filecache.FileIndex()
+_store.add_change_listener(_file_index.invalidate)
+_invalidation: Optional[InvalidationBus] = None
+if _revision is not None:
+    try:
+        _check_interval = float(CLUSTER_CHECK_INTERVAL)
+    except ValueError:
+        _check_interval = 1.0
+    _invalidation = InvalidationBus(_revision, interval=_check_interval)
+    _store.add_write_listener(_invalidation.publish)
+    # Zapis innego workera – nieznany zakres zmian, pełne przeliczenie widoków pochodnych
+    for _view in (_search, _analytics, _revaluation, _file_index):
+        _invalidation.subscribe(lambda _rev, view=_view: view.invalidate())
+    # Followerzy co interwał próbują przejąć blokadę lidera (zwolnioną po jego śmierci)
+    _invalidation.every_tick(lambda: _try_take_over_leadership())
 
 def _load_data() -> List[Dict[str, Any]]:
-    # Zwracamy kopię płytką listy, aby uniknąć modyfikowania globalnego stanu poza lockiem
-    with _data_lock:
-        return [dict(item) for item in _mem_data]
+    # Kopia danych – modyfikacje nie wpływają na magazyn bez _save_data
+    return _store.list_containers()
 
 def _save_data(data: List[Dict[str, Any]]) -> None:
-    # Aktualizacja wyłącznie w pamięci
-    global _mem_data
-    with _data_lock:
-        _mem_data = [dict(item) for item in data]
+    _store.replace_all(data)
+
+def _with_attachments(product: Dict[str, Any]) -> Dict[str, Any]:
+    """Produkt z rekordami z rejestru dla jego linków; magazyn scala je z dotychczasowymi rekordami produktu."""
+    return dict(product, attachments=attachments.for_files(product.get("files") or [], registry=_attachments))
+
+def _if_match(request: Request) -> Optional[int]:
+    """
+    Oczekiwana rewizja z nagłówka If-Match ("3", W/"3"); brak nagłówka lub "*" → zapis bezwarunkowy.
+    Wartość, która nie jest rewizją, nigdy nie pasuje (412).
+    """
+    raw = (request.headers.get("if-match") or "").strip()
+    if not raw or raw == "*":
+        return None
+    tag = raw.split(",")[0].strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        return -1
+
+def _etag(rec: Dict[str, Any]) -> str:
+    return f'"{revision_of(rec)}"'
+
+def _precondition_failed(e: RevisionConflict) -> HTTPException:
+    return HTTPException(
+        status_code=412,
+        detail=f"Rekord został zmieniony przez inny zapis (aktualna rewizja: {e.current})",
+        headers={"ETag": f'"{e.current}"'},
+    )
+
+def _data_transaction(commit: bool = True):
+    """
+    Pojedyncza transakcja na magazynie: kopia robocza pod blokadą, zapis tylko po sukcesie.
+    Wyjątek w bloku (lub commit=False) porzuca zmiany.
+    """
+    return _store.transaction(commit=commit)
 
 def _next_id() -> str:
     import string
@@ -92,54 +159,69 @@ def _calc_pickup_date(order_date: Optional[str], production_days: Optional[str])
     except Exception:
         return None
 
-def _get_short_sha() -> Optional[str]:
-    # Preferowane zmienne środowiskowe (Vercel/CI)
-    sha = (
-        os.environ.get("VERCEL_GIT_COMMIT_SHA")
-        or os.environ.get("GIT_COMMIT_SHA")
-        or os.environ.get("SHORT_SHA")
-        or os.environ.get("COMMIT_SHA")
-    )
-    if sha:
-        return str(sha)[:7]
-    # Fallback lokalny – jeśli dostępny git w repo
-    try:
-        out = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.STDOUT)
-        return out.decode("utf-8").strip()
-    except Exception:
-        return None
-
 # Google Sheets (service account) integration
 SHEET_CONTAINERS_TITLE = os.environ.get("SHEET_CONTAINERS_TITLE", "containers")
 SHEET_PRODUCTS_TITLE = os.environ.get("SHEET_PRODUCTS_TITLE", "products")
-SHEETS_SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+# drive.metadata.readonly – tani odczyt modifiedTime arkusza przez poller
+SHEETS_SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive.metadata.readonly"]
 SHEETS_SYNC_ON_WRITE = os.environ.get("SHEETS_SYNC_ON_WRITE", "1")  # "1" = append to Sheets on create/add
+SHEETS_POLL_INTERVAL = os.environ.get("SHEETS_POLL_INTERVAL", "0")  # sekundy; "0" = poller wyłączony
+SHEETS_POLL_QUIET_SECONDS = os.environ.get("SHEETS_POLL_QUIET_SECONDS", "10")  # odstęp od lokalnego zapisu przed reconcile
+# Outbox zmian do arkusza (trwała kolejka z ponowieniami i dead-letter)
+SHEETS_OUTBOX_PATH = os.environ.get("SHEETS_OUTBOX_PATH") or str(BASE_DIR / "data" / "sheets_outbox.sqlite3")
+SHEETS_OUTBOX_INTERVAL = os.environ.get("SHEETS_OUTBOX_INTERVAL", "5")  # sekundy między przebiegami wątku ponowień
+SHEETS_OUTBOX_BATCH = os.environ.get("SHEETS_OUTBOX_BATCH", "50")
+SHEETS_OUTBOX_MAX_ATTEMPTS = os.environ.get("SHEETS_OUTBOX_MAX_ATTEMPTS", "8")
+SHEETS_OUTBOX_CONCURRENCY = os.environ.get("SHEETS_OUTBOX_CONCURRENCY", "4")  # równoległe partycje (kontenery)
+SHEETS_ROW_INDEX_TTL = os.environ.get("SHEETS_ROW_INDEX_TTL", "60")  # sekundy ważności indeksu id → wiersz
+SHEETS_ID_BACKFILL = os.environ.get("SHEETS_ID_BACKFILL", "1")  # "1" = uzupełnij puste id w arkuszu przy starcie (lider)
+# Tabela kursów NBP (CSV/JSON) – wczytywana przy pierwszym użyciu i przez POST /api/fx/reload
+FX_RATES_FILE = os.environ.get("FX_RATES_FILE") or str(BASE_DIR / "data" / "fx_rates.csv")
+# Próg dopasowania nazw kontenerów przy importach (arkusz, plik, Drive): 1 (domyślnie) = tylko po normalizacji;
+# niższa wartość jawnie włącza rozmycie – podobne nazwy różnych kontenerów mogą się wtedy scalić
+try:
+    IMPORT_MATCH_THRESHOLD = float(os.environ.get("IMPORT_MATCH_THRESHOLD", "1"))
+except ValueError:
+    IMPORT_MATCH_THRESHOLD = 1.0
+# Proxy plików Drive (/api/files/{id}): lokalny cache z budżetem rozmiaru i rewalidacją co N sekund
+FILE_CACHE_DIR = os.environ.get("FILE_CACHE_DIR") or str(BASE_DIR / "data" / "file_cache")
+FILE_CACHE_MAX_MB = os.environ.get("FILE_CACHE_MAX_MB", "512")
+FILE_CACHE_REVALIDATE = os.environ.get("FILE_CACHE_REVALIDATE", "300")
+FILE_CACHE_CHUNK = 8 * 1024 * 1024  # rozmiar porcji pobierania z Drive (MediaIoBaseDownload)
+# Miniatury załączników (obrazy, 1. strona PDF): katalog cache, procesy renderujące ("0" = w bieżącym
+# procesie) i maksymalny rozmiar pliku źródłowego, dla którego generowany jest podgląd
+PREVIEW_DIR = os.environ.get("PREVIEW_DIR") or str(BASE_DIR / "data" / "previews")
+PREVIEW_WORKERS = os.environ.get("PREVIEW_WORKERS", "2")
+PREVIEW_MAX_MB = os.environ.get("PREVIEW_MAX_MB", "25")
+# Planer załadunku: limit pozycji w jednym planie i maksymalny budżet czasu przeszukiwania
+LOAD_PLAN_MAX_ITEMS = 5000
+LOAD_PLAN_MAX_BUDGET_MS = 2000
 
 # Google Drive (service account) integration
 DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive"]
 DRIVE_PUBLIC = os.environ.get("DRIVE_PUBLIC", "1")  # "1" = set file permission to public reader
 DRIVE_SUPPORTS_ALL = os.environ.get("DRIVE_SUPPORTS_ALL", "0")  # "1" if using shared drives
-DRIVE_ROOT_FOLDER_ID = os.environ.get("FOLDER_ID") or os.environ.get("DRIVE_FOLDER_ID")
 
-def _get_service_account_info() -> Optional[Dict[str, Any]]:
-    if not os.environ.get("CLIENT_EMAIL") or not os.environ.get("PRIVATE_KEY"):
+# Raporty zbiorcze (PDF/ZIP) – liczba procesów renderujących; "0" = renderowanie w bieżącym procesie
+REPORT_WORKERS = os.environ.get("REPORT_WORKERS", "2")
+
+def _get_service_account_info(cfg: Optional[settings.Settings] = None) -> Optional[Dict[str, Any]]:
+    return (cfg or _cfg()).service_account_info()
+
+def _gcall(op: str, fn, *args, **kwargs):
+    """Wywołanie Google API przez wspólny harmonogram (limit, priorytet, ponowienia) z metrykami per operacja."""
+    return quota.call(op, fn, *args, **kwargs)
+
+def _google_fake(cfg: Optional[settings.Settings] = None):
+    """GOOGLE_FAKE=1 – atrapy Sheets/Drive w procesie (testy obciążeniowe bez limitów Google)."""
+    cfg = cfg or _cfg()
+    if not cfg.google_fake:
         return None
-    info = {
-        "type": os.environ.get("TYPE", "service_account"),
-        "project_id": os.environ.get("PROJECT_ID", ""),
-        "private_key_id": os.environ.get("PRIVATE_KEY_ID", ""),
-        "private_key": os.environ.get("PRIVATE_KEY", "").replace("\\n", "\n"),
-        "client_email": os.environ.get("CLIENT_EMAIL", ""),
-        "client_id": os.environ.get("CLIENT_ID", ""),
-        "auth_uri": os.environ.get("AUTH_URI", "https://accounts.google.com/o/oauth2/auth"),
-        "token_uri": os.environ.get("TOKEN_URI", "https://oauth2.googleapis.com/token"),
-        "auth_provider_x509_cert_url": os.environ.get("AUTH_PROVIDER_X509_CERT_URL", "https://www.googleapis.com/oauth2/v1/certs"),
-        "client_x509_cert_url": os.environ.get("CLIENT_X509_CERT_URL", ""),
-        "universe_domain": os.environ.get("UNIVERSE_DOMAIN", "googleapis.com"),
-    }
-    return info
+    from app import fake_google
+
+    return fake_google.shared_services(cfg.file_id, cfg.drive_folder_id, request_wrapper=quota.call)
 
-def _get_gspread_client():
+def _get_gspread_client(cfg: Optional[settings.Settings] = None):
     # cache – jeśli klient już został utworzony wcześniej w tym procesie
     try:
         cached = globals().get("_GSPREAD_CLIENT")
@@ -148,6 +230,12 @@ def _get_gspread_client():
     except Exception:
         pass
 
+    cfg = cfg or _cfg()
+    fake = _google_fake(cfg)
+    if fake is not None:
+        globals()["_GSPREAD_CLIENT"] = fake[0]
+        return fake[0]
+
     # Lazy import
     try:
         import gspread  # type: ignore
@@ -155,7 +243,7 @@ def _get_gspread_client():
         logger.error(f"[Sheets] Import gspread failed: {e}")
         return None
 
-    info = _get_service_account_info()
+    info = cfg.service_account_info()
     if not info:
         logger.error("[Sheets] Service account info missing (CLIENT_EMAIL/PRIVATE_KEY not set)")
         return None
@@ -163,6 +251,7 @@ def _get_gspread_client():
     # Standard creation
     try:
         client = gspread.service_account_from_dict(info, scopes=SHEETS_SCOPES)
+        metrics.instrument_token_refresh(getattr(client.http_client, "auth", None))
         globals()["_GSPREAD_CLIENT"] = client
         return client
     except Exception as e1:
@@ -172,6 +261,7 @@ def _get_gspread_client():
     try:
         from google.oauth2.service_account import Credentials  # type: ignore
         creds = Credentials.from_service_account_info(info, scopes=SHEETS_SCOPES)
+        metrics.instrument_token_refresh(creds)
         client = gspread.authorize(creds)
         globals()["_GSPREAD_CLIENT"] = client
         return client
@@ -183,8 +273,9 @@ def _get_gspread_client():
 
 def _sheet_records(title: str):
     logger.info(f"[Sheets] _sheet_records('{title}') called")
-    client = _get_gspread_client()
-    file_id = os.environ.get("FILE_ID")
+    cfg = _cfg()
+    client = _get_gspread_client(cfg)
+    file_id = cfg.file_id
     if not client:
         logger.error(f"[Sheets] _sheet_records('{title}'): No gspread client — cannot read sheet. Check CLIENT_EMAIL / PRIVATE_KEY in .env")
         return []
@@ -193,15 +284,30 @@ def _sheet_records(title: str):
         return []
     logger.info(f"[Sheets] _sheet_records('{title}'): client OK, FILE_ID={file_id[:12]}...")
     try:
-        sh = client.open_by_key(file_id)
-        ws = sh.worksheet(title)
-        records = ws.get_all_records()
+        sh = _gcall("open_by_key", client.open_by_key, file_id)
+        ws = _gcall("worksheet", sh.worksheet, title)
+        records = _gcall("get_all_records", ws.get_all_records)
         logger.info(f"[Sheets] _sheet_records('{title}'): fetched {len(records)} rows")
         return records
     except Exception as e:
         logger.error(f"[Sheets] _sheet_records('{title}'): FAILED to read worksheet — {type(e).__name__}: {e}")
         return []
 
+def _sheet_records_many(titles: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Pobierz rekordy kilku zakładek przy jednym otwarciu arkusza. Błąd → wyjątek (bez cichego [])."""
+    cfg = _cfg()
+    client = _get_gspread_client(cfg)
+    file_id = cfg.file_id
+    if not client or not file_id:
+        raise RuntimeError("Brak konfiguracji Google Sheets (CLIENT_EMAIL/PRIVATE_KEY/FILE_ID)")
+    sh = _gcall("open_by_key", client.open_by_key, file_id)
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for title in titles:
+        ws = _gcall("worksheet", sh.worksheet, title)
+        out[title] = _gcall("get_all_records", ws.get_all_records)
+        logger.info(f"[Sheets] _sheet_records_many('{title}'): fetched {len(out[title])} rows")
+    return out
+
 def _truthy(v) -> bool:
     if isinstance(v, bool):
         return v
@@ -293,9 +399,14 @@ HEADERS_PRODUCTS = [
     "id","name","quantity","totalPrice","totalPriceCurrency","productCbm","customsDutyPercent","containerName","containerId"
 ]
 
+try:
+    _sheet_index = sheet_index.RowIndex(ttl=float(SHEETS_ROW_INDEX_TTL))
+except ValueError:
+    _sheet_index = sheet_index.RowIndex()
+
 def _sheet_get_headers(ws):
     try:
-        header = ws.row_values(1)
+        header = _gcall("row_values", ws.row_values, 1)
     except Exception:
         header = []
     return [str(h).strip() for h in header if str(h).strip()]
@@ -304,7 +415,7 @@ def _sheet_ensure_headers(ws, default_headers):
     header = _sheet_get_headers(ws)
     if not header:
         try:
-            ws.append_row(default_headers, value_input_option="RAW")
+            _gcall("append_row", ws.append_row, default_headers, value_input_option="RAW")
             header = _sheet_get_headers(ws)
         except Exception:
             pass
@@ -313,21 +424,69 @@ def _sheet_ensure_headers(ws, default_headers):
         if missing:
             try:
                 new_header = header + missing
-                ws.update('A1', [new_header])
+                _gcall("update", ws.update, 'A1', [new_header])
                 header = new_header
             except Exception:
                 pass
     return header if header else default_headers
 
+def _sheet_tab(title: str, default_headers: List[str], create: bool = False) -> Optional[sheet_index.Tab]:
+    """
+    Zakładka z cache _sheet_index: worksheet i nagłówki pobierane raz na proces
+    (open_by_key/worksheet/row_values), nie przy każdym zapisie. None – brak klienta/FILE_ID.
+    create=True – brakującą zakładkę utwórz (append); w przeciwnym razie wyjątek.
+    """
+    cfg = _cfg()
+    client = _get_gspread_client(cfg)
+    file_id = cfg.file_id
+    if not client or not file_id:
+        return None
+    owner = (client, file_id)
+    tab = _sheet_index.tab(title, owner)
+    with tab.open_lock:
+        if tab.ws is None:
+            sh = _gcall("open_by_key", client.open_by_key, file_id)
+            try:
+                ws = _gcall("worksheet", sh.worksheet, title)
+            except Exception:
+                if not create:
+                    raise
+                logger.info(f"[Sheets] Worksheet '{title}' not found. Creating...")
+                ws = _gcall("add_worksheet", sh.add_worksheet, title=title, rows=100, cols=max(1, len(default_headers)))
+            tab.headers = _sheet_ensure_headers(ws, default_headers)
+            tab.ws, tab.owner = ws, owner
+    return tab
+
+def _sheet_row_of(tab: sheet_index.Tab, record_id: Any) -> Optional[int]:
+    """
+    Numer wiersza rekordu z indeksu id. Arkusz edytują ludzie (sortowanie, wstawianie, usuwanie wierszy),
+    a inne procesy mają własne indeksy – numer z indeksu sprawdzany jest odczytem komórki id tego wiersza.
+    Inne id w komórce, brak w indeksie albo indeks nieświeży → przebudowa jednym col_values kolumny id.
+    """
+    key = str(record_id or "").strip()
+    if not key:
+        return None
+    id_col = tab.column("id")
+    if id_col is None:
+        return None
+    if tab.fresh(_sheet_index.ttl):
+        row = tab.find(key)
+        if row is not None:
+            cell = _gcall("cell", tab.ws.cell, row, id_col)
+            if str(getattr(cell, "value", "") or "").strip() == key:
+                return row
+            logger.info(f"[Sheets] Row {row} in '{tab.ws.title}' no longer holds id='{key}' -> rebuilding row index")
+    tab.load(_gcall("col_values", tab.ws.col_values, id_col))
+    return tab.find(key)
+
 def _sheet_append_row_dynamic(title: str, default_headers: List[str], record: Dict[str, Any]) -> bool:
-    # Upewnij się, że zmienne z .env są załadowane w bieżącym procesie
-    _load_env_from_file()
-    client = _get_gspread_client()
-    file_id = os.environ.get("FILE_ID")
+    cfg = _cfg()
+    client = _get_gspread_client(cfg)
+    file_id = cfg.file_id
 
     # Diagnostyka przyczyn braku klienta / FILE_ID
     if client is None:
-        info = _get_service_account_info()
+        info = cfg.service_account_info()
         logger.error(f"[Sheets] Client missing; SERVICE_ACCOUNT={'OK' if info else 'MISSING'} (***REMOVED***")
     if not file_id:
         logger.error("[Sheets] FILE_ID missing or empty")
@@ -337,27 +496,41 @@ def _sheet_append_row_dynamic(title: str, default_headers: List[str], record: Di
         return False
 
     try:
-        sh = client.open_by_key(file_id)
-        try:
-            ws = sh.worksheet(title)
-        except Exception:
-            logger.info(f"[Sheets] Worksheet '{title}' not found. Creating...")
-            try:
-                ws = sh.add_worksheet(title=title, rows=100, cols=max(1, len(default_headers)))
-            except Exception as e:
-                logger.info(f"[Sheets] Failed to create worksheet '{title}': {e}")
-                return False
-        headers = _sheet_ensure_headers(ws, default_headers)
-        row = []
-        for h in headers:
-            row.append(record.get(h, ""))
-        ws.append_row(row, value_input_option="USER_ENTERED")
+        tab = _sheet_tab(title, default_headers, create=True)
+        with tab.shared():
+            resp = _gcall("append_row", tab.ws.append_row, _sheet_build_row(tab.headers, record), value_input_option="USER_ENTERED")
+            tab.appended([record.get("id")], sheet_index.first_row(resp))
         logger.info(f"[Sheets] Appended 1 row to '{title}'")
         return True
     except Exception as e:
+        _sheet_index.invalidate(title, handles=True)
         logger.error(f"[Sheets] Append failed for '{title}': {e}")
         return False
 
+def _sheet_append_rows_dynamic(title: str, default_headers: List[str], records: List[Dict[str, Any]]) -> bool:
+    """Dopisz wiele wierszy jednym wywołaniem append_rows (import zbiorczy)."""
+    if not records:
+        return True
+    cfg = _cfg()
+    client = _get_gspread_client(cfg)
+    file_id = cfg.file_id
+    if not client or not file_id:
+        logger.error(f"[Sheets] Skip bulk append for '{title}' due to missing config")
+        return False
+    try:
+        tab = _sheet_tab(title, default_headers, create=True)
+        with tab.shared():
+            rows = [_sheet_build_row(tab.headers, rec) for rec in records]
+            resp = _gcall("append_rows", tab.ws.append_rows, rows, value_input_option="USER_ENTERED")
+            tab.appended([rec.get("id") for rec in records], sheet_index.first_row(resp))
+        logger.info(f"[Sheets] Appended {len(rows)} rows to '{title}'")
+        return True
+    except Exception as e:
+        _sheet_index.invalidate(title, handles=True)
+        logger.error(f"[Sheets] Bulk append failed for '{title}': {e}")
+        return False
+
+@quota.background
 def _on_created_container_sync_to_sheet(container: Dict[str, Any]) -> bool:
     if SHEETS_SYNC_ON_WRITE != "1":
         logger.info("[Sheets] Sync disabled (SHEETS_SYNC_ON_WRITE!=1)")
@@ -380,147 +553,114 @@ def _sheet_build_row(headers: List[str], record: Dict[str, Any]) -> List[Any]:
     """Zbuduj listę wartości w kolejności nagłówków."""
     return [record.get(h, "") for h in headers]
 
-def _sheet_update_row_by_key(title: str, default_headers: List[str], key: str, value: Any, record: Dict[str, Any]) -> bool:
+def _sheet_update_row_by_id(title: str, default_headers: List[str], record_id: Any, record: Dict[str, Any],
+                            upsert: bool = False) -> bool:
     """
-    Zaktualizuj pojedynczy wiersz w arkuszu 'title', znajdując go po wartości w kolumnie 'key'.
-    Wartości wpisywane są zgodnie z kolejnością nagłówków (USER_ENTERED).
+    Zaktualizuj wiersz rekordu w arkuszu 'title' jednym zapisem zakresu A{n}:{X}{n}.
+    Numer wiersza z indeksu kolumny 'id' (_sheet_index) – bez pobierania kolumn przy każdej zmianie.
+    upsert=True: brak wiersza w arkuszu → dopisz rekord (arkusz dogania magazyn).
     """
-    _load_env_from_file()
-    client = _get_gspread_client()
-    file_id = os.environ.get("FILE_ID")
-
-    if not client or not file_id:
-        logger.error(f"[Sheets] Skip update for '{title}' due to missing config")
-        return False
-
     try:
-        sh = client.open_by_key(file_id)
-        ws = sh.worksheet(title)
-        headers = _sheet_ensure_headers(ws, default_headers)
-
-        try:
-            lower_headers = [h.lower() for h in headers]
-            key_index = lower_headers.index(key.lower()) + 1  # 1-based indeks kolumny
-        except ValueError:
-            logger.error(f"[Sheets] Key '{key}' not found in headers -> update aborted")
+        tab = _sheet_tab(title, default_headers)
+        if tab is None:
+            logger.error(f"[Sheets] Skip update for '{title}' due to missing config")
             return False
-
-        # Znajdź numer wiersza z wartością 'value' w kolumnie 'key'
-        col_vals = ws.col_values(key_index)
-        target_row = None
-        for idx, cell in enumerate(col_vals[1:], start=2):  # pomiń nagłówek (row 1)
-            if str(cell).strip() == str(value).strip():
-                target_row = idx
-                break
-
-        if not target_row:
-            logger.error(f"[Sheets] Row with {key}='{value}' not found -> update aborted")
-            return False
-
-        row_values = _sheet_build_row(headers, record)
-        end_col = _col_letter(len(headers))
-        rng = f"A{target_row}:{end_col}{target_row}"
-        ws.update(rng, [row_values], value_input_option="USER_ENTERED")
-        logger.info(f"[Sheets] Updated 1 row in '{title}' at {target_row}")
+        with tab.shared(), tracing.span("sheets.update_row", title=title):
+            values = _sheet_build_row(tab.headers, record)
+            row = _sheet_row_of(tab, record_id)
+            if row is None:
+                if not upsert:
+                    logger.error(f"[Sheets] Row with id='{record_id}' not found in '{title}' -> update aborted")
+                    return False
+                resp = _gcall("append_row", tab.ws.append_row, values, value_input_option="USER_ENTERED")
+                tab.appended([record_id], sheet_index.first_row(resp))
+                logger.info(f"[Sheets] Row with id='{record_id}' missing in '{title}' -> appended")
+                return True
+            rng = f"A{row}:{_col_letter(len(tab.headers))}{row}"
+            _gcall("update", tab.ws.update, rng, [values], value_input_option="USER_ENTERED")
+        logger.info(f"[Sheets] Updated 1 row in '{title}' at {row}")
         return True
     except Exception as e:
+        _sheet_index.invalidate(title, handles=True)
         logger.error(f"[Sheets] Update failed for '{title}': {e}")
         return False
 
-def _sheet_delete_row_by_key(title: str, default_headers: List[str], key: str, value: Any) -> bool:
+def _sheet_delete_row_by_id(title: str, default_headers: List[str], record_id: Any) -> bool:
     """
-    Usuń wiersz z arkusza 'title', dopasowując po wartości kolumny 'key'.
+    Usuń wiersz rekordu z arkusza 'title' (kolumna 'id').
     Fizycznie usuwa wiersz (nie czyści komórek), aby nie zostawił pustego wpisu.
+    Numer wiersza z indeksu id; usunięcie blokuje zakładkę wyłącznie (przesuwa numery
+    pozostałych wierszy), po nim indeks przesuwany jest lokalnie.
     """
-    _load_env_from_file()
-    client = _get_gspread_client()
-    file_id = os.environ.get("FILE_ID")
-
-    if not client or not file_id:
-        logger.error(f"[Sheets] Skip delete for '{title}' due to missing config")
-        return False
-
     try:
-        sh = client.open_by_key(file_id)
-        ws = sh.worksheet(title)
-        headers = _sheet_ensure_headers(ws, default_headers)
-
-        try:
-            lower_headers = [h.lower() for h in headers]
-            key_index = lower_headers.index(key.lower()) + 1  # 1-based
-        except ValueError:
-            logger.error(f"[Sheets] Key '{key}' not found in headers -> delete aborted")
-            return False
-
-        col_vals = ws.col_values(key_index)
-        target_row = None
-        for idx, cell in enumerate(col_vals[1:], start=2):  # pomiń nagłówek
-            if str(cell).strip() == str(value).strip():
-                target_row = idx
-                break
-
-        if not target_row:
-            logger.error(f"[Sheets] Row with {key}='{value}' not found -> delete aborted")
+        tab = _sheet_tab(title, default_headers)
+        if tab is None:
+            logger.error(f"[Sheets] Skip delete for '{title}' due to missing config")
             return False
-
-        ws.delete_rows(target_row)
-        logger.info(f"[Sheets] Deleted row {target_row} from '{title}' (matched {key}='{value}')")
+        with tab.exclusive():
+            target_row = _sheet_row_of(tab, record_id)
+            if not target_row:
+                # brak wiersza = stan docelowy osiągnięty (ponowienie z outboxa po częściowym sukcesie)
+                logger.info(f"[Sheets] Row with id='{record_id}' not found in '{title}' -> nothing to delete")
+                return True
+            _gcall("delete_rows", tab.ws.delete_rows, target_row)
+            tab.deleted(target_row)
+        logger.info(f"[Sheets] Deleted row {target_row} from '{title}' (matched id='{record_id}')")
         return True
     except Exception as e:
+        _sheet_index.invalidate(title, handles=True)
         logger.error(f"[Sheets] Delete row failed for '{title}': {e}")
         return False
 
 def _sheet_delete_rows_by_key(title: str, default_headers: List[str], key: str, value: Any) -> int:
     """
     Usuń WSZYSTKIE wiersze z arkusza 'title' pasujące do wartości kolumny 'key'.
-    Zwraca liczbę usuniętych wierszy. Usuwa od dołu, aby nie przesuwać indeksów.
+    Zwraca liczbę usuniętych wierszy. Sąsiednie wiersze usuwane jednym delete_rows,
+    od dołu, aby nie przesuwać indeksów.
     """
-    _load_env_from_file()
-    client = _get_gspread_client()
-    file_id = os.environ.get("FILE_ID")
-
-    if not client or not file_id:
-        logger.error(f"[Sheets] Skip delete-all for '{title}' due to missing config")
-        return 0
-
     try:
-        sh = client.open_by_key(file_id)
-        ws = sh.worksheet(title)
-        headers = _sheet_ensure_headers(ws, default_headers)
-
-        try:
-            lower_headers = [h.lower() for h in headers]
-            key_index = lower_headers.index(key.lower()) + 1
-        except ValueError:
-            logger.error(f"[Sheets] Key '{key}' not found in headers -> delete-all aborted")
+        tab = _sheet_tab(title, default_headers)
+        if tab is None:
+            logger.error(f"[Sheets] Skip delete-all for '{title}' due to missing config")
             return 0
-
-        col_vals = ws.col_values(key_index)
-        # Zbierz numery wierszy do usunięcia (od dołu)
-        rows_to_delete = []
-        for idx, cell in enumerate(col_vals[1:], start=2):
-            if str(cell).strip() == str(value).strip():
-                rows_to_delete.append(idx)
-
-        if not rows_to_delete:
-            logger.info(f"[Sheets] No rows with {key}='{value}' found in '{title}'")
+        key_index = tab.column(key)
+        if key_index is None:
+            logger.error(f"[Sheets] Key '{key}' not found in headers -> delete-all aborted")
             return 0
 
-        # Usuń od dołu, aby nie przesuwać indeksów
-        deleted = 0
-        for row in reversed(rows_to_delete):
-            try:
-                ws.delete_rows(row)
-                deleted += 1
-            except Exception as e:
-                logger.error(f"[Sheets] Failed to delete row {row} from '{title}': {e}")
+        with tab.exclusive():
+            col_vals = _gcall("col_values", tab.ws.col_values, key_index)
+            rows_to_delete = [idx for idx, cell in enumerate(col_vals[1:], start=2)
+                              if str(cell).strip() == str(value).strip()]
+            if not rows_to_delete:
+                logger.info(f"[Sheets] No rows with {key}='{value}' found in '{title}'")
+                return 0
+
+            # Zakresy kolejnych wierszy [start, end], od dołu
+            runs: List[List[int]] = []
+            for row in rows_to_delete:
+                if runs and runs[-1][1] == row - 1:
+                    runs[-1][1] = row
+                else:
+                    runs.append([row, row])
+            deleted = 0
+            for start, end in reversed(runs):
+                try:
+                    _gcall("delete_rows", tab.ws.delete_rows, start, end)
+                    tab.deleted(start, end - start + 1)
+                    deleted += end - start + 1
+                except Exception as e:
+                    tab.reset()
+                    logger.error(f"[Sheets] Failed to delete rows {start}-{end} from '{title}': {e}")
 
         logger.info(f"[Sheets] Deleted {deleted}/{len(rows_to_delete)} rows from '{title}' (matched {key}='{value}')")
         return deleted
     except Exception as e:
+        _sheet_index.invalidate(title, handles=True)
         logger.error(f"[Sheets] Delete-all rows failed for '{title}': {e}")
         return 0
 
+@quota.background
 def _on_deleted_container_sync_to_sheet(container: Dict[str, Any]) -> bool:
     """
     Usuń kontener z arkusza Google Sheets po DELETE (write-through).
@@ -530,13 +670,14 @@ def _on_deleted_container_sync_to_sheet(container: Dict[str, Any]) -> bool:
         logger.info("[Sheets] Delete sync disabled (SHEETS_SYNC_ON_WRITE!=1)")
         return False
     # Usuń z arkusza kontener po ID
-    ok = _sheet_delete_row_by_key(SHEET_CONTAINERS_TITLE, HEADERS_CONTAINERS, "id", container.get("id"))
+    ok = _sheet_delete_row_by_id(SHEET_CONTAINERS_TITLE, HEADERS_CONTAINERS, container.get("id"))
     logger.info(f"[Sheets] Container delete sync {'OK' if ok else 'FAILED'} (id='{container.get('id')}')")
     # Usuń powiązane produkty (po containerId)
     deleted_products = _sheet_delete_rows_by_key(SHEET_PRODUCTS_TITLE, HEADERS_PRODUCTS, "containerId", container.get("id"))
     logger.info(f"[Sheets] Deleted {deleted_products} products for container '{container.get('id')}'")
     return ok
 
+@quota.background
 def _on_deleted_product_sync_to_sheet(container_name: str, product: Dict[str, Any]) -> bool:
     """
     Usuń produkt z arkusza Google Sheets po DELETE (write-through).
@@ -546,23 +687,22 @@ def _on_deleted_product_sync_to_sheet(container_name: str, product: Dict[str, An
         logger.info("[Sheets] Delete sync disabled (SHEETS_SYNC_ON_WRITE!=1)")
         return False
     # Usuń produkt z arkusza po ID
-    ok = _sheet_delete_row_by_key(SHEET_PRODUCTS_TITLE, HEADERS_PRODUCTS, "id", product.get("id"))
+    ok = _sheet_delete_row_by_id(SHEET_PRODUCTS_TITLE, HEADERS_PRODUCTS, product.get("id"))
     logger.info(f"[Sheets] Product delete sync {'OK' if ok else 'FAILED'} (id='{product.get('id')}', container='{container_name}')")
     return ok
 
+@quota.background
 def _on_updated_container_sync_to_sheet(container: Dict[str, Any]) -> bool:
-    """
-    Zapisz zmiany kontenera do arkusza (write-through na PUT).
-    Obecnie dopasowanie po 'name'; w przyszłości zalecane dopasowanie po 'id' kolumnie.
-    """
+    """Zapisz zmiany kontenera do arkusza (write-through na PUT) – wiersz po kolumnie 'id'."""
     if SHEETS_SYNC_ON_WRITE != "1":
         logger.info("[Sheets] Update sync disabled (SHEETS_SYNC_ON_WRITE!=1)")
         return False
-    rec = {**container}
-    ok = _sheet_update_row_by_key(SHEET_CONTAINERS_TITLE, HEADERS_CONTAINERS, "id", container.get("id", ""), rec)
+    rec = {k: v for k, v in container.items() if k != "products"}
+    ok = _sheet_update_row_by_id(SHEET_CONTAINERS_TITLE, HEADERS_CONTAINERS, container.get("id"), rec, upsert=True)
     logger.info(f"[Sheets] Container update sync {'OK' if ok else 'FAILED'}")
     return ok
 
+@quota.background
 def _on_added_product_sync_to_sheet(container: Dict[str, Any], product: Dict[str, Any]) -> bool:
     if SHEETS_SYNC_ON_WRITE != "1":
         logger.info("[Sheets] Sync disabled (SHEETS_SYNC_ON_WRITE!=1)")
@@ -574,77 +714,23 @@ def _on_added_product_sync_to_sheet(container: Dict[str, Any], product: Dict[str
     logger.info(f"[Sheets] Product sync {'OK' if ok else 'FAILED'} (containerId={rec['containerId']})")
     return ok
 
-def _sheet_update_row_by_keys(title: str, default_headers: List[str], keys_values: Dict[str, Any], record: Dict[str, Any]) -> bool:
-    """
-    Zaktualizuj jeden wiersz dopasowując po WIELU kolumnach (np. containerId + name).
-    keys_values: słownik {kolumna: wartość} – wszystkie muszą pasować w danym wierszu.
-    """
-    _load_env_from_file()
-    client = _get_gspread_client()
-    file_id = os.environ.get("FILE_ID")
-
-    if not client or not file_id:
-        logger.error(f"[Sheets] Skip update for '{title}' due to missing config")
-        return False
-
-    try:
-        sh = client.open_by_key(file_id)
-        ws = sh.worksheet(title)
-        headers = _sheet_ensure_headers(ws, default_headers)
-
-        # Wyznacz indeksy kolumn dla kluczy
-        key_names = list(keys_values.keys())
-        key_indices: List[int] = []
-        for k in key_names:
-            try:
-                key_indices.append(headers.index(k) + 1)
-            except ValueError:
-                logger.error(f"[Sheets] Key '{k}' not found in headers -> update aborted")
-                return False
-
-        # Pobierz wartości kolumn dla każdego klucza
-        cols: List[List[str]] = []
-        for idx in key_indices:
-            try:
-                cols.append(ws.col_values(idx))
-            except Exception:
-                cols.append([])
-
-        # Szukaj wiersza, w którym WSZYSTKIE klucze pasują
-        target_row: Optional[int] = None
-        max_rows = max((len(c) for c in cols), default=0)
-        for row in range(2, max_rows + 1):  # pomijamy nagłówek
-            match = True
-            for ci, k in enumerate(key_names):
-                column_vals = cols[ci]
-                cell = column_vals[row - 1] if (row - 1) < len(column_vals) else ""
-                if str(cell).strip() != str(keys_values[k]).strip():
-                    match = False
-                    break
-            if match:
-                target_row = row
-                break
-
-        if not target_row:
-            logger.error(f"[Sheets] Row with keys {keys_values} not found -> update aborted")
-            return False
-
-        row_values = _sheet_build_row(headers, record)
-        end_col = _col_letter(len(headers))
-        rng = f"A{target_row}:{end_col}{target_row}"
-        ws.update(rng, [row_values], value_input_option="USER_ENTERED")
-        logger.info(f"[Sheets] Updated 1 row in '{title}' at {target_row}")
-        return True
-    except Exception as e:
-        logger.error(f"[Sheets] Update failed for '{title}': {e}")
+@quota.background
+def _on_bulk_import_sync_to_sheet(containers: List[Dict[str, Any]], products: List[Dict[str, Any]]) -> bool:
+    """Jedna zbiorcza synchronizacja po imporcie pliku: append kontenerów, potem produktów."""
+    if SHEETS_SYNC_ON_WRITE != "1":
+        logger.info("[Sheets] Sync disabled (SHEETS_SYNC_ON_WRITE!=1)")
         return False
+    recs = [{k: v for k, v in c.items() if k != "products"} for c in containers]
+    ok_c = _sheet_append_rows_dynamic(SHEET_CONTAINERS_TITLE, HEADERS_CONTAINERS, recs)
+    ok_p = _sheet_append_rows_dynamic(SHEET_PRODUCTS_TITLE, HEADERS_PRODUCTS, products)
+    logger.info(f"[Sheets] Bulk import sync {'OK' if ok_c and ok_p else 'FAILED'} ({len(recs)} containers, {len(products)} products)")
+    return ok_c and ok_p
 
+@quota.background
 def _on_updated_product_sync_to_sheet(container: Dict[str, Any], product: Dict[str, Any]) -> bool:
     """
-    Write-through dla edycji produktu (PUT):
-    - Preferowane dopasowanie po (containerId + name)
-    - Fallback: (containerName + name)
-    - Ostateczny fallback: (name)
+    Write-through dla edycji produktu (PUT): wiersz po niezmiennym 'id' produktu,
+    więc zmiana nazwy produktu lub kontenera nie gubi dopasowania.
     """
     if SHEETS_SYNC_ON_WRITE != "1":
         logger.info("[Sheets] Update sync disabled (SHEETS_SYNC_ON_WRITE!=1)")
@@ -653,25 +739,77 @@ def _on_updated_product_sync_to_sheet(container: Dict[str, Any], product: Dict[s
     rec = {**product}
     rec["containerName"] = container.get("name", "")
     rec["containerId"] = container.get("id")
+    ok = _sheet_update_row_by_id(SHEET_PRODUCTS_TITLE, HEADERS_PRODUCTS, rec.get("id"), rec, upsert=True)
+    logger.info(f"[Sheets] Product update sync {'OK' if ok else 'FAILED'}")
+    return ok
 
-    variants: List[Dict[str, Any]] = [
-        {"containerId": rec.get("containerId"), "name": rec.get("name", "")},
-        {"containerName": rec.get("containerName"), "name": rec.get("name", "")},
-        {"name": rec.get("name", "")},
-    ]
-
-    for kv in variants:
-        # Usuń puste wartości, aby nie blokować dopasowania
-        kv_clean = {k: v for k, v in kv.items() if v not in (None, "")}
-        if not kv_clean:
-            continue
-        ok = _sheet_update_row_by_keys(SHEET_PRODUCTS_TITLE, HEADERS_PRODUCTS, kv_clean, rec)
-        if ok:
-            logger.info("[Sheets] Product update sync OK")
-            return True
-
-    logger.info("[Sheets] Product update sync FAILED")
-    return False
+def _sheets_backfill_ids() -> Dict[str, int]:
+    """
+    Jednorazowe uzupełnienie pustej kolumny 'id' w starszych wierszach arkusza, aby
+    aktualizacje mogły dopasowywać wiersze wyłącznie po id. Id brane z magazynu
+    (kontener po nazwie, produkt po kontenerze i nazwie – jak w reconcile), dla
+    pozostałych wierszy nowe. Kolumna zapisywana jednym update na zakładkę;
+    przy okazji budowany jest indeks wierszy. Zwraca liczbę uzupełnionych id.
+    """
+    data = _load_data()
+    containers_by_name: Dict[str, Dict[str, Any]] = {}
+    products_by_key: Dict[tuple, str] = {}
+    for c in data:
+        containers_by_name.setdefault(str(c.get("name", "")).strip().lower(), c)
+        for p in c.get("products") or []:
+            products_by_key.setdefault((str(c.get("id")), str(p.get("name", "")).strip().lower()), str(p.get("id")))
+
+    def container_id(cells: Dict[str, str]) -> Optional[str]:
+        c = containers_by_name.get(cells.get("name", "").lower())
+        return str(c.get("id")) if c else None
+
+    def product_id(cells: Dict[str, str]) -> Optional[str]:
+        cid = cells.get("containerid") or ""
+        if not cid:
+            c = containers_by_name.get(cells.get("containername", "").lower())
+            cid = str(c.get("id")) if c else ""
+        return products_by_key.get((cid, cells.get("name", "").lower()))
+
+    assigned: Dict[str, int] = {}
+    for key, title, headers, match in (("containers", SHEET_CONTAINERS_TITLE, HEADERS_CONTAINERS, container_id),
+                                       ("products", SHEET_PRODUCTS_TITLE, HEADERS_PRODUCTS, product_id)):
+        tab = _sheet_tab(title, headers, create=True)
+        if tab is None:
+            raise RuntimeError("Brak konfiguracji Google Sheets (CLIENT_EMAIL/PRIVATE_KEY/FILE_ID)")
+        with tab.exclusive():
+            values = _gcall("get_all_values", tab.ws.get_all_values)
+            header = [str(h).strip().lower() for h in (values[0] if values else [])]
+            if "id" not in header:
+                raise RuntimeError(f"Zakładka '{title}' nie ma kolumny 'id'")
+            id_pos = header.index("id")
+            ids: List[str] = []
+            used = {str(r[id_pos]).strip() for r in values[1:] if id_pos < len(r)}
+            count = 0
+            for r in values[1:]:
+                cells = {h: str(r[i]).strip() if i < len(r) else "" for i, h in enumerate(header)}
+                rid = cells["id"]
+                if not rid and any(cells.values()):
+                    rid = match(cells) or ""
+                    if not rid or rid in used:
+                        rid = _next_id()
+                    used.add(rid)
+                    count += 1
+                ids.append(rid)
+            if count:
+                col = _col_letter(id_pos + 1)
+                _gcall("update", tab.ws.update, f"{col}2:{col}{len(values)}", [[v] for v in ids], value_input_option="RAW")
+                logger.info(f"[Sheets] Backfilled {count} ids in '{title}'")
+            tab.load(["id"] + ids)
+        assigned[key] = count
+    return assigned
+
+def _sheets_backfill_ids_on_start() -> None:
+    if SHEETS_SYNC_ON_WRITE != "1" or SHEETS_ID_BACKFILL != "1" or not _cfg().file_id:
+        return
+    try:
+        quota.background(_sheets_backfill_ids)()
+    except Exception as e:
+        logger.error(f"[Startup] Sheets id backfill FAILED: {type(e).__name__}: {e}")
 
 class ProductIn(BaseModel):
     id: Optional[str] = None
@@ -694,8 +832,20 @@ class ProductIn(BaseModel):
             raise ValueError(f"Wartość musi być liczbą, otrzymano: {v}")
 
 
+class Attachment(BaseModel):
+    """Metadane pliku Drive załącznika (app.attachments) – zapisywane przez serwer, nie przez formularz."""
+    id: Optional[str] = None
+    name: Optional[str] = None
+    mimeType: Optional[str] = None
+    size: Optional[int] = None
+    modifiedTime: Optional[str] = None
+    folderId: Optional[str] = None
+    url: str = ""
+
 class Product(ProductIn):
     id: str = Field(default_factory=_next_id)
+    revision: int = 0
+    attachments: List[Attachment] = Field(default_factory=list)
 
 class ContainerIn(BaseModel):
     id: Optional[str] = None
@@ -744,6 +894,7 @@ class ContainerIn(BaseModel):
 class Container(ContainerIn):
     id: str = Field(default_factory=_next_id)
     pickupDate: Optional[str] = None
+    revision: int = 0
     products: List[Product] = Field(default_factory=list)
 
 class ContainerUpdate(BaseModel):
@@ -782,8 +933,61 @@ class ContainerUpdate(BaseModel):
 
     # pickupDate wyliczamy automatycznie na podstawie orderDate + productionDays
 
+@quota.background
+def _outbox_append_containers(batch: List[List[Any]]) -> bool:
+    """Partia wpisów container.created → jeden append_rows."""
+    recs = [{k: v for k, v in args[0].items() if k != "products"} for args in batch]
+    return _sheet_append_rows_dynamic(SHEET_CONTAINERS_TITLE, HEADERS_CONTAINERS, recs)
+
+@quota.background
+def _outbox_append_products(batch: List[List[Any]]) -> bool:
+    """Partia wpisów product.added → jeden append_rows."""
+    recs = [{**product, "containerName": container.get("name", ""), "containerId": container.get("id")} for container, product in batch]
+    return _sheet_append_rows_dynamic(SHEET_PRODUCTS_TITLE, HEADERS_PRODUCTS, recs)
+
+# Handlery po nazwie (lambda) – podmiana funkcji _on_* (np. w testach) działa także dla outboxa
+_sheets_outbox = Outbox(
+    SHEETS_OUTBOX_PATH,
+    handlers={
+        "container.created": lambda c: _on_created_container_sync_to_sheet(c),
+        "container.updated": lambda c: _on_updated_container_sync_to_sheet(c),
+        "container.deleted": lambda c: _on_deleted_container_sync_to_sheet(c),
+        "product.added": lambda c, p: _on_added_product_sync_to_sheet(c, p),
+        "product.updated": lambda c, p: _on_updated_product_sync_to_sheet(c, p),
+        "product.deleted": lambda name, p: _on_deleted_product_sync_to_sheet(name, p),
+        "bulk.imported": lambda cs, ps: _on_bulk_import_sync_to_sheet(cs, ps),
+    },
+    batch_handlers={
+        "container.created": lambda batch: _outbox_append_containers(batch),
+        "product.added": lambda batch: _outbox_append_products(batch),
+    },
+    batch_size=int(SHEETS_OUTBOX_BATCH),
+    max_attempts=int(SHEETS_OUTBOX_MAX_ATTEMPTS),
+    concurrency=int(SHEETS_OUTBOX_CONCURRENCY),
+)
+
+def _drain_sheets_outbox() -> None:
+    try:
+        _sheets_outbox.drain()
+    except Exception as e:
+        logger.error(f"[Outbox] Drain failed: {type(e).__name__}: {e}")
+
+def _sync_to_sheet(background_tasks: Optional[BackgroundTasks], kind: str, *args: Any, partition: str = "", dedupe: Optional[str] = None) -> None:
+    """
+    Zapisz zmianę do outboxa i opróżnij go po wysłaniu odpowiedzi (BackgroundTasks).
+    Bez background_tasks – obudź wątek outboxa. Nieudane wpisy ponawia wątek tła.
+    """
+    if SHEETS_SYNC_ON_WRITE != "1" or not _cfg().file_id:
+        return  # synchronizacja wyłączona / brak arkusza docelowego
+    _sheets_outbox.enqueue(kind, *args, partition=partition, dedupe=dedupe)
+    if background_tasks is not None:
+        background_tasks.add_task(tracing.bind(_drain_sheets_outbox))
+    else:
+        _sheets_outbox.kick()
+
 # (Removed old app definition)
 
+@quota.background
 def _auto_import_from_sheets_on_start() -> None:
     # Auto-import z arkusza przy starcie aplikacji
     logger.info("[Startup] _auto_import_from_sheets_on_start() begin")
@@ -812,7 +1016,10 @@ def _auto_import_from_sheets_on_start() -> None:
                 new_data.append(c)
             if new_data:
                 logger.info(f"[Startup] Imported {len(new_data)} containers from sheet")
-                _save_data(new_data)
+                with _data_transaction() as current:
+                    # Zapis tylko, jeśli magazyn nadal jest pusty (inny worker/żądanie mogło już coś dodać)
+                    if not current:
+                        current.extend(new_data)
                 data = _load_data()
             else:
                 logger.warning("[Startup] No valid containers parsed from sheet rows")
@@ -827,18 +1034,24 @@ def _auto_import_from_sheets_on_start() -> None:
             ps = sheet_products()
             logger.info(f"[Startup] sheet_products() returned {len(ps)} rows")
             if ps:
-                by_name: Dict[str, Dict[str, Any]] = {
-                    str(c.get("name", "")).strip().lower(): c for c in data
-                }
-                logger.info(f"[Startup] Container names for matching: {list(by_name.keys())}")
+                # Nazwa kontenera z arkusza → kontener (normalizacja + dopasowanie rozmyte)
+                by_name = search.Matcher(((i, c.get("name")) for i, c in enumerate(data)), threshold=IMPORT_MATCH_THRESHOLD)
+                logger.info(f"[Startup] Container names for matching: {[c.get('name') for c in data]}")
                 matched = 0
                 unmatched = 0
+                added: Dict[str, List[Dict[str, Any]]] = {}
                 for rec in ps:
                     cname = str(rec.get("containerName", "")).strip().lower()
-                    container = by_name.get(cname) if cname else (data[0] if data else None)
+                    if cname:
+                        idx = by_name.match(cname)
+                        container = data[idx] if idx is not None else None
+                    else:
+                        container = data[0] if data else None
                     if not container:
                         unmatched += 1
-                        logger.warning(f"[Startup] Product '{rec.get('name', '?')}' has containerName='{cname}' — no matching container found, skipping")
+                        hint = by_name.suggest(cname) if cname else None
+                        similar = f" (similar: '{data[hint].get('name')}')" if hint is not None else ""
+                        logger.warning(f"[Startup] Product '{rec.get('name', '?')}' has containerName='{cname}' — no matching container found{similar}, skipping")
                         continue
                     matched += 1
                     # Zbuduj payload produktu z tolerancją braków
@@ -857,11 +1070,14 @@ def _auto_import_from_sheets_on_start() -> None:
                         logger.warning(f"[Startup] Product '{payload.get('name')}' pydantic failed ({ep}), using raw dict")
                         # W skrajnych przypadkach akceptuj bez pydantic (minimalny rekord)
                         p = {"id": _next_id(), **payload}
-                    products = container.get("products", [])
-                    products.append(p)
-                    container["products"] = products
+                    added.setdefault(str(container.get("id")), []).append(p)
                 logger.info(f"[Startup] Products: {matched} matched, {unmatched} unmatched")
-                _save_data(data)
+                with _data_transaction() as current:
+                    # Dopisz tylko do kontenerów, które nadal istnieją i nie mają produktów
+                    for c in current:
+                        extra = added.get(str(c.get("id")))
+                        if extra and not (c.get("products") or []):
+                            c["products"] = extra
             else:
                 logger.warning("[Startup] sheet_products() returned 0 rows — no products to import")
         else:
@@ -876,15 +1092,15 @@ def _auto_import_from_sheets_on_start() -> None:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # --- Startup config diagnostic ---
-    _load_env_from_file()
+    cfg = _cfg()
     logger.info("=" * 60)
     logger.info("[Config] Import Tracker — startup diagnostic")
-    logger.info(f"[Config] FILE_ID          = {'SET (' + os.environ.get('FILE_ID', '')[:12] + '...)' if os.environ.get('FILE_ID') else 'MISSING ⚠️'}")
+    logger.info(f"[Config] FILE_ID          = {'SET (' + (cfg.file_id or '')[:12] + '...)' if cfg.file_id else 'MISSING ⚠️'}")
     logger.info(f"[Config] CLIENT_EMAIL      = {'SET (' + os.environ.get('CLIENT_EMAIL', '')[:20] + '...)' if os.environ.get('CLIENT_EMAIL') else 'MISSING ⚠️'}")
     logger.info(f"[Config] PRIVATE_KEY       = {'SET (' + str(len(os.environ.get('PRIVATE_KEY', ''))) + ' chars)' if os.environ.get('PRIVATE_KEY') else 'MISSING ⚠️'}")
-    logger.info(f"[Config] FOLDER_ID         = {'SET (' + os.environ.get('FOLDER_ID', '') + ')' if os.environ.get('FOLDER_ID') else 'NOT SET (optional)'}")
-    logger.info(f"[Config] OAUTH_CLIENT_ID   = {'SET' if os.environ.get('OAUTH_CLIENT_ID') else 'MISSING ⚠️'}")
-    logger.info(f"[Config] OAUTH_REFRESH_TOKEN = {'SET' if os.environ.get('OAUTH_REFRESH_TOKEN') else 'MISSING ⚠️'}")
+    logger.info(f"[Config] FOLDER_ID         = {'SET (' + cfg.drive_folder_id + ')' if cfg.drive_folder_id else 'NOT SET (optional)'}")
+    logger.info(f"[Config] OAUTH_CLIENT_ID   = {'SET' if cfg.oauth_client_id else 'MISSING ⚠️'}")
+    logger.info(f"[Config] OAUTH_REFRESH_TOKEN = {'SET' if cfg.oauth_refresh_token else 'MISSING ⚠️'}")
     logger.info(f"[Config] SHEETS_SYNC       = {SHEETS_SYNC_ON_WRITE}")
     try:
         import gspread  # type: ignore
@@ -903,8 +1119,54 @@ async def lifespan(app: FastAPI):
         logger.error("[Config] google-api-python = NOT INSTALLED ⚠️ — pip install google-api-python-client")
     logger.info("=" * 60)
     # --- End diagnostic ---
-    _auto_import_from_sheets_on_start()
+    if _is_leader():
+        _start_leader_duties()
+    else:
+        logger.info(f"[Cluster] Worker pid={os.getpid()} is a follower — skipping startup import and poller")
+    if _invalidation is not None:
+        _invalidation.start()
+    # zaległe wpisy z poprzedniego uruchomienia idą od razu, dalej co SHEETS_OUTBOX_INTERVAL
+    _sheets_outbox.start(float(SHEETS_OUTBOX_INTERVAL))
+    _sheets_outbox.kick()
     yield
+    _sheets_outbox.stop()
+    _sheets_poller.stop()
+    _previews.shutdown()
+    if _invalidation is not None:
+        _invalidation.stop()
+    if _leader_lock is not None:
+        _leader_lock.release()
+
+def _is_leader() -> bool:
+    """Bez trybu klastra każdy proces jest liderem; w klastrze – ten, który przejął blokadę pliku."""
+    if _leader_lock is None:
+        return True
+    if _leader_lock.try_acquire():
+        logger.info(f"[Cluster] Worker pid={os.getpid()} elected leader")
+        return True
+    return False
+
+def _start_leader_duties() -> None:
+    _auto_import_from_sheets_on_start()
+    _sheets_backfill_ids_on_start()
+    _sheets_poller.start()
+
+def _try_take_over_leadership() -> bool:
+    """Wywoływane z wątku InvalidationBus: po śmierci lidera blokada jest wolna – przejmij jego zadania."""
+    if _leader_lock is None or _leader_lock.is_leader or not _leader_lock.try_acquire():
+        return False
+    logger.info(f"[Cluster] Worker pid={os.getpid()} took over as leader")
+    _start_leader_duties()
+    return True
+
+def _cluster_status() -> Dict[str, Any]:
+    return {
+        "enabled": _cluster_enabled,
+        "pid": os.getpid(),
+        "isLeader": _leader_lock.is_leader if _leader_lock is not None else True,
+        "revision": _revision.read() if _revision is not None else None,
+        "storage": STORAGE_BACKEND,
+    }
 
 app = FastAPI(title="Import Tracker API", version="0.1.0", lifespan=lifespan)
 
@@ -917,87 +1179,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Basic Auth middleware (global)
+# Basic Auth middleware (global) – czysty ASGI, polityka tras kompilowana raz na snapshot konfiguracji
 # Wymagane w .env: BASIC_AUTH_USERNAME, BASIC_AUTH_PASSWORD
 # Opcjonalnie: BASIC_AUTH_EXCLUDE=/api/oauth/callback,/api/oauth/url,/api/health
-def _basic_auth_enabled() -> bool:
-    _load_env_from_file()
-    # W produkcji (VERCEL) – egzekwuj Basic Auth.
-    # Lokalnie – domyślnie wyłącz, aby umożliwić testy w przeglądarce bez promptów.
-    vercel = bool(os.environ.get("VERCEL"))
-    force = (os.environ.get("BASIC_AUTH_FORCE") or "").strip() == "1"
-    if not vercel and not force:
-        return False
-    return bool(os.environ.get("BASIC_AUTH_USERNAME")) and bool(os.environ.get("BASIC_AUTH_PASSWORD"))
-
-def _basic_auth_skip(request: Request) -> bool:
-    """
-    Zasada:
-    - Zawsze publiczne: "/", statyki, /api/version, /api/health oraz wpisy z BASIC_AUTH_EXCLUDE.
-    - Publiczne wyłącznie dla GET: /api/containers, /api/sheets/containers, /api/sheets/products.
-    - Mutacje (POST/PUT/DELETE) wymagają Basic Auth, z wyjątkiem importu z arkusza (source=sheet) na endpointach kontenerów/produktów.
-    """
-    path = request.url.path
-    method = str(getattr(request, "method", "GET")).upper()
-
-    # Import z arkusza (source=sheet) – przepuść mutacje bez auth dla UI automatycznego importu
-    try:
-        src = (request.query_params.get("source") or "").strip().lower()
-    except Exception:
-        src = ""
-    if src == "sheet" and method in ("POST", "PUT", "DELETE"):
-        if path.startswith("/api/containers"):
-            return True
-
-    # Dokładne wykluczenia (zawsze publiczne)
-    excludes_exact = {"/", "/api/health", "/api/version", "/api/oauth/callback", "/api/oauth/url"}
-    # Prefiksowe wykluczenia (zawsze publiczne)
-    excludes_prefix = ["/static"]
-
-    # GET-only public API dla UI
-    if method == "GET":
-        excludes_prefix += ["/api/containers", "/api/sheets/containers", "/api/sheets/products", "/api/drive/product-files"]
-
-    # Dodatkowe wykluczenia z .env (BASIC_AUTH_EXCLUDE)
-    # - wpisy zakończone "*" traktujemy jako prefiks
-    # - pozostałe jako dopasowanie dokładne
-    extra = os.environ.get("BASIC_AUTH_EXCLUDE", "")
-    for p in [s.strip() for s in extra.split(",") if s.strip()]:
-        if p.endswith("*"):
-            excludes_prefix.append(p[:-1])
-        else:
-            excludes_exact.add(p)
-
-    if path in excludes_exact:
-        return True
-    for pref in excludes_prefix:
-        if path.startswith(pref):
-            return True
-    return False
-
-@app.middleware("http")
-async def _basic_auth_middleware(request: Request, call_next):
-    try:
-        # Jeśli Basic Auth niewłączone lub dany request powinien być publiczny → przepuść
-        if not _basic_auth_enabled() or _basic_auth_skip(request):
-            return await call_next(request)
-
-        auth = request.headers.get("Authorization")
-        if not auth or not auth.startswith("Basic "):
-            return Response(status_code=401, headers={"WWW-Authenticate": 'Basic realm="Restricted"'})
-        try:
-            decoded = base64.b64decode(auth[6:].strip()).decode("utf-8")
-            username, password = decoded.split(":", 1)
-        except Exception:
-            return Response(status_code=401, headers={"WWW-Authenticate": 'Basic realm="Restricted"'})
-        u = os.environ.get("BASIC_AUTH_USERNAME", "")
-        p = os.environ.get("BASIC_AUTH_PASSWORD", "")
-        if not (secrets.compare_digest(username, u) and secrets.compare_digest(password, p)):
-            return Response(status_code=401, headers={"WWW-Authenticate": 'Basic realm="Restricted"'})
-        return await call_next(request)
-    except Exception:
-        # W razie problemów w middleware nie blokuj ruchu
-        return await call_next(request)
+# Zasada (app/auth.py):
+# - Zawsze publiczne: "/", statyki, /api/version, /api/health oraz wpisy z BASIC_AUTH_EXCLUDE.
+# - Publiczne wyłącznie dla GET: /api/containers, /api/sheets/containers, /api/sheets/products, /api/search.
+# - Mutacje (POST/PUT/DELETE) wymagają Basic Auth, z wyjątkiem importu z arkusza (source=sheet) na endpointach kontenerów/produktów.
+app.add_middleware(auth.BasicAuthMiddleware, get_settings=_cfg)
+
+# Metryki żądań (czysty ASGI – bez narzutu BaseHTTPMiddleware); dodany jako ostatni = najbardziej zewnętrzny,
+# więc mierzy również czas weryfikacji Basic Auth
+app.add_middleware(metrics.MetricsMiddleware)
+# Trace id per żądanie (nagłówek X-Trace-Id); wolne trace'y → log JSON (TRACE_SLOW_MS)
+app.add_middleware(tracing.TracingMiddleware)
 
 # Serwowanie plików statycznych
 if STATIC_DIR.exists():
@@ -1014,22 +1209,11 @@ def serve_index() -> Response:
 # Endpoint wersji – short SHA + opcjonalny buildNumber
 @app.get("/api/version")
 def api_version() -> Dict[str, Any]:
-    _load_env_from_file()
-    sha = _get_short_sha()
-    env = os.environ.get("VERCEL_ENV") or ("production" if os.environ.get("VERCEL") else "development")
-
-    # Opcjonalny numer builda z env (np. z CI/CD): APP_BUILD_NUMBER / COMMIT_COUNT / BUILD_NUMBER
-    build_env = (
-        os.environ.get("APP_BUILD_NUMBER")
-        or os.environ.get("COMMIT_COUNT")
-        or os.environ.get("BUILD_NUMBER")
-    )
-    build_number: Optional[int] = None
-    if build_env:
-        try:
-            build_number = int(str(build_env).strip())
-        except Exception:
-            build_number = None
+    # SHA i numer builda (APP_BUILD_NUMBER / COMMIT_COUNT / BUILD_NUMBER) rozwiązane przy wczytaniu konfiguracji
+    cfg = _cfg()
+    sha = cfg.build_sha
+    env = cfg.env_name
+    build_number = cfg.build_number
 
     version_label = f"Version {sha or 'local'}" + (f" (build {build_number})" if build_number is not None else "")
     return {
@@ -1045,17 +1229,80 @@ def api_version() -> Dict[str, Any]:
 
 @app.get("/api/containers/{container_id}/report.pdf")
 def get_container_report_pdf(container_id: str):
-    c = next((x for x in _mem_data if str(x.get("id")) == container_id), None)
+    c = _store.get_container(container_id)
     if not c:
         raise HTTPException(status_code=404, detail="Container not found")
     
     pdf_bytes = generate_container_pdf(c)
     return Response(content=pdf_bytes, media_type="application/pdf", headers={"Content-Disposition": f'attachment; filename="raport_{container_id}.pdf"'})
 
+@app.get("/api/containers/reports.zip")
+def get_containers_reports_zip(
+    dateFrom: Optional[str] = None,
+    dateTo: Optional[str] = None,
+    pickedUpInChina: Optional[bool] = None,
+    customsClearanceDone: Optional[bool] = None,
+    deliveredToWarehouse: Optional[bool] = None,
+    documentsInSystem: Optional[bool] = None,
+):
+    """
+    Zbiorczy eksport raportów PDF (jeden plik na kontener) jako strumieniowany ZIP.
+    Filtry: zakres orderDate (dateFrom/dateTo, YYYY-MM-DD) oraz flagi statusu.
+    PDF-y renderowane są równolegle w puli procesów (REPORT_WORKERS).
+    """
+    flags = {
+        "pickedUpInChina": pickedUpInChina,
+        "customsClearanceDone": customsClearanceDone,
+        "deliveredToWarehouse": deliveredToWarehouse,
+        "documentsInSystem": documentsInSystem,
+    }
+    selected = filter_containers(_load_data(), dateFrom, dateTo, flags)
+    try:
+        workers = int(REPORT_WORKERS)
+    except ValueError:
+        workers = 0
+    return StreamingResponse(
+        iter_pdf_zip(selected, workers=workers),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="raporty_kontenerow.zip"'},
+    )
+
+def _export_response(kind: str, fmt: str, columns: List[str], rows) -> StreamingResponse:
+    fmt = (fmt or "csv").strip().lower()
+    try:
+        exporters.check_format_available(fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    stamp = datetime.utcnow().strftime("%Y%m%d")
+    return StreamingResponse(
+        exporters.stream_export(fmt, columns, rows, title=kind),
+        media_type=exporters.EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{kind}_{stamp}.{fmt}"'},
+    )
+
+@app.get("/api/export/containers")
+def export_containers(format: str = "csv"):
+    """
+    Eksport kontenerów (kolumny HEADERS_CONTAINERS + sumy kosztów USD) jako CSV/XLSX/Parquet.
+    Wiersze czytane kursorem magazynu (Store.iter_containers) – bez kopii całego zbioru.
+    """
+    columns = exporters.container_columns(HEADERS_CONTAINERS)
+    return _export_response("containers", format, columns, exporters.iter_container_rows(_store.iter_containers(), HEADERS_CONTAINERS))
+
+@app.get("/api/export/products")
+def export_products(format: str = "csv"):
+    """Eksport produktów (kolumny HEADERS_PRODUCTS + koszty wyliczone) jako CSV/XLSX/Parquet."""
+    columns = exporters.product_columns(HEADERS_PRODUCTS)
+    return _export_response("products", format, columns, exporters.iter_product_rows(_store.iter_containers(), HEADERS_PRODUCTS))
+
 @app.post("/api/files/upload")
-async def upload_product_file(productName: str = Form(...), file: UploadFile = File(...)):
+def upload_product_file(productName: str = Form(...), file: UploadFile = File(...)):
     """
     Upload WYŁĄCZNIE do Google Drive przez OAuth użytkownika (My Drive).
+    Zwykła funkcja (pula wątków): wywołania Drive przez harmonogram limitów mogą czekać na token
+    i ponawiać z opóźnieniem – nie mogą blokować pętli zdarzeń.
     Wymagane .env: OAUTH_CLIENT_ID, OAUTH_CLIENT_SECRET, OAUTH_REFRESH_TOKEN.
     Folder docelowy: FOLDER_ID; jeśli puste lub 'root' – użyty zostanie folder wynikający z FILE_ID:
       - jeśli FILE_ID to folder → on będzie rootem,
@@ -1070,23 +1317,23 @@ async def upload_product_file(productName: str = Form(...), file: UploadFile = F
         return s[:100] or "file"
 
     # Konfiguracja
-    _load_env_from_file()
-    env_root_id = os.environ.get("FOLDER_ID") or os.environ.get("DRIVE_FOLDER_ID") or DRIVE_ROOT_FOLDER_ID
-    file_id_sheet = os.environ.get("FILE_ID")
-
-    client_id = os.environ.get("OAUTH_CLIENT_ID")
-    client_secret = os.environ.get("OAUTH_CLIENT_SECRET")
-    refresh_token = os.environ.get("OAUTH_REFRESH_TOKEN")
-    token_uri = os.environ.get("OAUTH_TOKEN_URI", "https://oauth2.googleapis.com/token")
-    if not client_id or not client_secret or not refresh_token:
+    cfg = _cfg()
+    env_root_id = cfg.drive_folder_id
+    file_id_sheet = cfg.file_id
+
+    client_id = cfg.oauth_client_id
+    client_secret = cfg.oauth_client_secret
+    refresh_token = cfg.oauth_refresh_token
+    token_uri = cfg.oauth_token_uri
+    if not cfg.oauth_configured:
         raise HTTPException(status_code=500, detail="Brak konfiguracji OAuth (wymagane: OAUTH_CLIENT_ID, OAUTH_CLIENT_SECRET, OAUTH_REFRESH_TOKEN)")
 
     # Dane pliku
     folder_name = sanitize(productName or "product")
     filename = sanitize(getattr(file, "filename", "file"))
     content_type = file.content_type or "application/octet-stream"
-    content = await file.read()
-    await file.close()
+    content = file.file.read()
+    file.file.close()
 
     try:
         # OAuth Credentials użytkownika
@@ -1105,11 +1352,11 @@ async def upload_product_file(productName: str = Form(...), file: UploadFile = F
             scopes=DRIVE_SCOPES,
         )
         try:
-            creds.refresh(Request())
+            _gcall("token.refresh", creds.refresh, Request())
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"OAuth refresh failed: {e}")
 
-        service = build("drive", "v3", credentials=creds, cache_discovery=False)
+        service = build("drive", "v3", credentials=creds, cache_discovery=False, requestBuilder=metrics.timed_http_request_class())
 
         # Ustal folder bazowy (root) zgodnie z FOLDER_ID/FILE_ID
         root_id = env_root_id
@@ -1170,7 +1417,7 @@ async def upload_product_file(productName: str = Form(...), file: UploadFile = F
         created = service.files().create(
             body=file_meta,
             media_body=media,
-            fields="id,name,webViewLink,webContentLink"
+            fields=attachments.DRIVE_FILE_FIELDS
         ).execute()
 
         file_id = created.get("id")
@@ -1185,14 +1432,23 @@ async def upload_product_file(productName: str = Form(...), file: UploadFile = F
         except Exception as pe:
             logger.error(f"[Drive] Permission set failed (ignored): {pe}")
 
-        # URL do pobrania
+        # URL do pobrania; metadane do rejestru – dołączane do produktu przy jego zapisie
         url = web_content or (f"https://drive.google.com/uc?export=download&id={file_id}" if file_id else web_view or "")
+        record = attachments.record({**created, "size": created.get("size") or len(content)}, subfolder_id, url)
+        _attachments.remember([record])
+        if file_id and previews.previewable(content_type) and len(content) <= _preview_max_bytes():
+            try:
+                # treść jest już w pamięci – miniatura bez ponownego pobierania z Drive
+                _previews.submit(file_id, content, content_type)
+            except Exception as pe:
+                logger.error(f"[Previews] {file_id}: preview not scheduled (ignored): {pe}")
         return {
             "url": url,
             "fileId": file_id,
             "folderId": subfolder_id,
             "filename": filename,
             "size": len(content),
+            "attachment": record,
         }
     except Exception as e:
         try:
@@ -1212,6 +1468,31 @@ async def upload_product_file(productName: str = Form(...), file: UploadFile = F
 def health():
     return {"status": "ok"}
 
+@app.get("/api/metrics")
+def api_metrics() -> Response:
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/traces/slow")
+def api_slow_traces() -> Dict[str, Any]:
+    return {"thresholdMs": tracing.SLOW_MS, "traces": tracing.slow_traces()}
+
+@app.get("/api/cluster/status")
+def cluster_status() -> Dict[str, Any]:
+    return _cluster_status()
+
+@app.get("/api/google/quota")
+def google_quota_status() -> Dict[str, Any]:
+    """Stan harmonogramu Google API: tokeny, kolejki per priorytet, nasycenie, ponowienia."""
+    return quota.SCHEDULER.status()
+
+@app.get("/api/fake-google/stats")
+def fake_google_stats() -> Dict[str, Any]:
+    """Statystyki atrap Google (GOOGLE_FAKE=1): wywołania i wstrzyknięte błędy per operacja."""
+    fake = _google_fake(_cfg())
+    if fake is None:
+        raise HTTPException(status_code=404, detail="Atrapy Google wyłączone (GOOGLE_FAKE=1)")
+    return fake[0].sim.stats()
+
 # Diagnostyka Google Drive – sprawdzenie konfiguracji i dostępu
 # [removed duplicate drive_status definition]
 
@@ -1221,9 +1502,9 @@ def health():
 # Diagnostyka Google Drive – sprawdzenie konfiguracji i dostępu
 @app.get("/api/drive/status")
 def drive_status() -> Dict[str, Any]:
-    _load_env_from_file()
-    info = _get_service_account_info()
-    root_id = os.environ.get("FOLDER_ID") or os.environ.get("DRIVE_FOLDER_ID") or DRIVE_ROOT_FOLDER_ID
+    cfg = _cfg()
+    info = cfg.service_account_info()
+    root_id = cfg.drive_folder_id
 
     out: Dict[str, Any] = {
         "has_service_account": bool(info),
@@ -1237,7 +1518,7 @@ def drive_status() -> Dict[str, Any]:
         out["error"] = "Brak danych service account (CLIENT_EMAIL/PRIVATE_KEY)"
         return out
     if not root_id:
-        out["error"] = "FOLDER_ID (DRIVE_ROOT_FOLDER_ID) nie ustawiony w .env"
+        out["error"] = "FOLDER_ID (DRIVE_FOLDER_ID) nie ustawiony w .env"
         return out
 
     try:
@@ -1249,7 +1530,8 @@ def drive_status() -> Dict[str, Any]:
 
     try:
         creds = Credentials.from_service_account_info(info, scopes=DRIVE_SCOPES)
-        service = build("drive", "v3", credentials=creds)
+        metrics.instrument_token_refresh(creds)
+        service = build("drive", "v3", credentials=creds, requestBuilder=metrics.timed_http_request_class())
         out["service_built"] = True
     except Exception as e:
         out["error"] = f"Nie udało się utworzyć klienta Drive: {e}"
@@ -1279,49 +1561,446 @@ def list_containers() -> List[Container]:
     data = _load_data()
     return data
 
+@app.get("/api/search")
+def search_records(q: str = "", kind: Optional[str] = None, offset: int = 0, limit: int = 20) -> Dict[str, Any]:
+    """
+    Wyszukiwanie pełnotekstowe/rozmyte po nazwach kontenerów, produktów i plików załączników.
+    kind – opcjonalnie lista rodzajów po przecinku (container,product,attachment).
+    """
+    kinds = [k.strip() for k in (kind or "").split(",") if k.strip()]
+    unknown = [k for k in kinds if k not in search.KINDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Nieznany rodzaj wyników: {', '.join(unknown)}")
+    _search.refresh(_store.list_containers, _store.get_container)
+    with tracing.span("search.query"):
+        return _search.search(q, kinds or None, offset=max(0, offset), limit=max(1, min(limit, 200)))
+
+_MONTH_RE = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+def _analytics_params(month: Optional[str] = None, status: Optional[str] = None, *months: Optional[str]) -> None:
+    for m in (month, *months):
+        if m and not _MONTH_RE.match(m) and m != analytics.NO_MONTH:
+            raise HTTPException(status_code=400, detail=f"Miesiąc musi być w formacie YYYY-MM: {m}")
+    if status and status not in analytics.STATUSES:
+        raise HTTPException(status_code=400, detail=f"Nieznany status: {status} (dozwolone: {', '.join(analytics.STATUSES)})")
+
+@app.get("/api/analytics")
+def analytics_summary(start: Optional[str] = Query(None, alias="from"), end: Optional[str] = Query(None, alias="to"),
+                      status: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Agregaty wszystkich kontenerów: wydatki netto/brutto (USD, PLN), cło, VAT, CBM, wydatki w walucie pozycji
+    i liczba kontenerów z zaznaczoną flagą – całość, po miesiącu zamówienia (orderDate) i po statusie.
+    """
+    _analytics_params(start, status, end)
+    _analytics.refresh(_store.list_containers, _store.get_container)
+    return _analytics.summary(start, end, status)
+
+@app.get("/api/analytics/months/{month}")
+def analytics_month(month: str, status: Optional[str] = None) -> Dict[str, Any]:
+    """Jeden kubełek miesiąca (opcjonalnie miesiąc × status)."""
+    _analytics_params(month, status)
+    _analytics.refresh(_store.list_containers, _store.get_container)
+    return {"month": month, "status": status, **_analytics.month(month, status)}
+
+_fx_rates = fx.RateTable()
+_fx_lock = threading.Lock()
+
+def _fx_table() -> fx.RateTable:
+    """Tabela kursów; plik FX_RATES_FILE wczytywany przy pierwszym użyciu (brak pliku → pusta tabela)."""
+    if _fx_rates.source is None:
+        with _fx_lock:
+            path = Path(FX_RATES_FILE)
+            if _fx_rates.source is None and path.exists():
+                try:
+                    n = _fx_rates.load_file(path)
+                    logger.info(f"[FX] Loaded {n} rates from {path}")
+                except Exception as e:
+                    logger.error(f"[FX] Failed to load {path}: {e}")
+    return _fx_rates
+
+def _fx_date(value: Optional[str]):
+    if not value:
+        return None
+    d = fx.parse_date(value)
+    if d is None:
+        raise HTTPException(status_code=400, detail=f"Data musi być w formacie YYYY-MM-DD: {value}")
+    return d
+
+@app.get("/api/fx/status")
+def fx_status() -> Dict[str, Any]:
+    return {"file": FX_RATES_FILE, **_fx_table().status()}
+
+@app.post("/api/fx/reload")
+def fx_reload() -> Dict[str, Any]:
+    path = Path(FX_RATES_FILE)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail=f"Brak pliku kursów: {path}")
+    try:
+        n = _fx_rates.load_file(path)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Nie udało się wczytać kursów z {path}: {e}")
+    return {"loaded": n, **_fx_rates.status()}
+
+@app.get("/api/fx/rates/{code}")
+def fx_rate(code: str, date: Optional[str] = None) -> Dict[str, Any]:
+    """Kurs waluty (PLN za jednostkę) obowiązujący w danym dniu – ostatni opublikowany nie później niż date."""
+    found = _fx_table().rate_on(code, _fx_date(date))
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Brak kursu {code.upper()} na dzień {date or 'dzisiejszy'}")
+    return {"code": code.upper(), "date": date, "effectiveDate": found[0].isoformat(), "rate": found[1]}
+
+@app.get("/api/fx/convert")
+def fx_convert(amount: float, src: str = Query(..., alias="from"), dst: str = Query(fx.BASE_CURRENCY, alias="to"),
+               date: Optional[str] = None) -> Dict[str, Any]:
+    value = _fx_table().convert(amount, src, dst, _fx_date(date))
+    if value is None:
+        raise HTTPException(status_code=404, detail=f"Brak kursu {src.upper()}/{dst.upper()} na dzień {date or 'dzisiejszy'}")
+    return {"amount": amount, "from": src.upper(), "to": dst.upper(), "date": date, "value": round(value, 6)}
+
+class RevalueRequest(BaseModel):
+    """Kurs przeszacowania: stały `rate`, kurs tabeli z dnia `date` albo (bez obu) kurs z dnia zamówienia kontenera."""
+    rate: Optional[float] = Field(default=None, gt=0)
+    date: Optional[str] = None
+    code: str = "USD"
+
+@app.post("/api/fx/revalue")
+def fx_revalue(req: RevalueRequest) -> Dict[str, Any]:
+    """
+    Sumy PLN/USD (netto, brutto, cło, VAT) wszystkich kontenerów po nowym kursie – bez zapisu zmian.
+    Kontener bez kursu w tabeli (tryb orderDate) zachowuje swój bieżący exchangeRate.
+    """
+    table = _fx_table()
+    if req.rate is not None:
+        fixed: Optional[float] = req.rate
+        source = "rate"
+    elif req.date:
+        found = table.rate_on(req.code, _fx_date(req.date))
+        if found is None:
+            raise HTTPException(status_code=404, detail=f"Brak kursu {req.code.upper()} na dzień {req.date}")
+        fixed, source = found[1], f"table:{found[0].isoformat()}"
+    else:
+        fixed, source = None, "table:orderDate"
+
+    def rate_for(row: Dict[str, Any]) -> Optional[float]:
+        if fixed is not None:
+            return fixed
+        d = fx.parse_date(row["orderDate"])
+        found = table.rate_on(req.code, d) if d else None
+        return found[1] if found else None
+
+    _revaluation.refresh(_store.list_containers, _store.get_container)
+    with tracing.span("fx.revalue"):
+        return {"rateSource": source, "code": req.code.upper(), **_revaluation.revalue(rate_for)}
+
+class SimulateRequest(BaseModel):
+    """
+    Osie siatki: lista wartości albo zakres {from, to, steps}. Pominięta oś – bieżąca wartość kontenera
+    (dla cła – stawka każdego produktu). containerCost w walucie kontenera.
+    """
+    exchangeRate: Optional[Any] = None
+    customsDutyPercent: Optional[Any] = None
+    containerCost: Optional[Any] = None
+    totalTransportCbm: Optional[Any] = None
+    metric: str = "totalCostPerUnit"
+    currency: str = "USD"
+    productIds: Optional[List[str]] = None
+    includeValues: bool = False  # pełna siatka w `values` (limit simulate.MAX_VALUE_CELLS)
+
+@app.post("/api/containers/{container_id}/simulate")
+def simulate_container(container_id: str, req: SimulateRequest) -> Response:
+    """
+    Koszt jednostkowy produktów na iloczynie kartezjańskim osi, bez zapisu zmian. Ciało JSON serializowane
+    od razu (simulate.to_json) – bez jsonable_encoder, który dla dużej siatki kosztuje więcej niż obliczenie.
+    """
+    container = _store.get_container(container_id)
+    if container is None:
+        raise HTTPException(status_code=404, detail="Container not found")
+    try:
+        simulate.check_available()
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    grid = {k: getattr(req, k) for k in simulate.AXES}
+    try:
+        with tracing.span("containers.simulate"):
+            out = simulate.simulate(container, grid, metric=req.metric, currency=req.currency.upper(),
+                                    product_ids=req.productIds, include_values=req.includeValues)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=simulate.to_json(out), media_type="application/json")
+
+class LoadPlanRequest(BaseModel):
+    """
+    Pozycje do zaplanowania: własne `items` ({id, name, cbm, value}) albo produkty kontenerów `containerIds`
+    (opcjonalnie zawężone do `productIds`). Bez obu – produkty kontenerów jeszcze w produkcji (nieodebranych w Chinach).
+    """
+    items: Optional[List[Dict[str, Any]]] = None
+    containerIds: Optional[List[str]] = None
+    productIds: Optional[List[str]] = None
+    sizes: Optional[List[Dict[str, Any]]] = None
+    objective: str = "count"
+    size: Optional[str] = None
+    fill: float = Field(default=1.0, gt=0, le=1)
+    timeBudgetMs: int = Field(default=200, ge=0, le=LOAD_PLAN_MAX_BUDGET_MS)
+
+@app.post("/api/load-plan")
+def load_plan(req: LoadPlanRequest) -> Dict[str, Any]:
+    """Rozkład produktów na kontenery (najmniej kontenerów albo największa wartość jednego) – bez zapisu zmian."""
+    if req.items is not None:
+        items = req.items
+    else:
+        if req.containerIds:
+            containers = [c for c in (_store.get_container(cid) for cid in req.containerIds) if c is not None]
+        else:
+            containers = [c for c in _store.list_containers() if analytics.status_of(c) == "production"]
+        items = loadplan.items_from_containers(containers, req.productIds)
+    if len(items) > LOAD_PLAN_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Za dużo pozycji ({len(items)}, limit {LOAD_PLAN_MAX_ITEMS})")
+    try:
+        with tracing.span("loadplan.plan"):
+            return loadplan.plan(items, req.sizes, objective=req.objective, time_budget_ms=req.timeBudgetMs,
+                                 fill=req.fill, size=req.size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+try:
+    _file_cache = filecache.FileCache(FILE_CACHE_DIR, int(float(FILE_CACHE_MAX_MB) * 1024 * 1024),
+                                      revalidate_after=float(FILE_CACHE_REVALIDATE))
+except ValueError:
+    _file_cache = filecache.FileCache(FILE_CACHE_DIR, 512 * 1024 * 1024)
+_DRIVE_FILE_ID = re.compile(r"[A-Za-z0-9_-]{10,200}")
+
+def _http_date(rfc3339: Optional[str]) -> Optional[str]:
+    """modifiedTime z Drive (2025-01-02T10:00:00.000Z) → data nagłówka HTTP."""
+    try:
+        dt = datetime.fromisoformat(str(rfc3339).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    return email.utils.format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[str]) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return inm.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in inm.split(",")]
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified:
+        try:
+            return email.utils.parsedate_to_datetime(last_modified) <= email.utils.parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _drive_download(service, file_id: str, fh) -> None:
+    """Treść pliku do `fh` – porcjami (MediaIoBaseDownload), bez trzymania całego pliku w pamięci."""
+    request = service.files().get_media(fileId=file_id)
+    try:
+        from googleapiclient.http import HttpRequest, MediaIoBaseDownload  # type: ignore
+    except ImportError:
+        HttpRequest = None  # type: ignore
+    if HttpRequest is not None and isinstance(request, HttpRequest):
+        downloader = MediaIoBaseDownload(fh, request, chunksize=FILE_CACHE_CHUNK)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk()
+        return
+    fh.write(request.execute())
+
+class _PinnedFileResponse(FileResponse):
+    """FileResponse zwalniający wpis cache po wysyłce – także gdy klient rozłączy się w trakcie (BackgroundTask by nie ruszył)."""
+
+    def __init__(self, *args: Any, release: Callable[[], None], **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+def _cached_drive_file(file_id: str) -> Dict[str, Any]:
+    """Wpis pliku z cache proxy (przypięty – wymaga `_file_cache.release`); Drive budowany dopiero przy potrzebie."""
+    service = None
+
+    def drive():
+        nonlocal service
+        if service is None:
+            service = _drive_build_service()
+        return service
+
+    def fetch_meta(fid: str) -> Dict[str, Any]:
+        return drive().files().get(fileId=fid, fields=filecache.DRIVE_META_FIELDS).execute()
+
+    return _file_cache.get(file_id, fetch_meta, lambda fid, fh: _drive_download(drive(), fid, fh))
+
+@app.get("/api/files/{file_id}")
+def drive_file(file_id: str, request: Request, download: bool = False):
+    """
+    Pobranie załącznika przez serwer: cache na dysku (LRU), rewalidacja z Drive, zakresy bajtów (Range),
+    ETag/Last-Modified (304). Tylko pliki podpięte do produktów.
+    """
+    if not _DRIVE_FILE_ID.fullmatch(file_id):
+        raise HTTPException(status_code=400, detail="Nieprawidłowe id pliku Drive")
+    _file_index.refresh(_store.list_containers, _store.get_container)
+    if _file_index.lookup(file_id) is None and _attachments.get(file_id) is None:
+        raise HTTPException(status_code=404, detail="Plik nie jest załącznikiem produktu")
+
+    try:
+        with tracing.span("files.cache"):
+            entry = _cached_drive_file(file_id)
+    except filecache.UnsupportedFile as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Drive download failed: {e}")
+
+    last_modified = _http_date(entry.get("modifiedTime"))
+    headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    if _not_modified(request, entry["etag"], last_modified):
+        _file_cache.release(entry)
+        return Response(status_code=304, headers=headers)
+    return _PinnedFileResponse(
+        entry["path"],
+        media_type=entry.get("mimeType") or "application/octet-stream",
+        filename=entry.get("name") or file_id,
+        content_disposition_type="attachment" if download else "inline",
+        headers=headers,
+        release=lambda: _file_cache.release(entry),
+    )
+
+@app.get("/api/file-cache/status")
+def file_cache_status() -> Dict[str, Any]:
+    return _file_cache.status()
+
+try:
+    _previews = previews.PreviewCache(PREVIEW_DIR, workers=int(PREVIEW_WORKERS))
+except ValueError:
+    _previews = previews.PreviewCache(PREVIEW_DIR)
+
+def _preview_max_bytes() -> int:
+    try:
+        return int(float(PREVIEW_MAX_MB) * 1024 * 1024)
+    except ValueError:
+        return 25 * 1024 * 1024
+
+def _generate_previews(records: List[Dict[str, Any]]) -> None:
+    """
+    Miniatury załączników (po odpowiedzi – BackgroundTasks): treść z cache proxy /api/files,
+    więc późniejsze pobranie pliku nie pyta Drive ponownie. Pliki już opisane w cache podglądów są pomijane.
+    """
+    for rec in records:
+        fid, mime = rec.get("id"), rec.get("mimeType")
+        # link bez metadanych (mimeType nieznany) – typ rozstrzyga dopiero wpis z cache
+        if not fid or (mime and not previews.previewable(mime)) or _previews.lookup(fid) is not None:
+            continue
+        if (rec.get("size") or 0) > _preview_max_bytes():
+            continue
+        try:
+            entry = _cached_drive_file(fid)
+            try:
+                mime = entry.get("mimeType") or mime
+                if not previews.previewable(mime) or entry.get("bytes", 0) > _preview_max_bytes():
+                    continue
+                with open(entry["path"], "rb") as fh:
+                    data = fh.read()
+            finally:
+                _file_cache.release(entry)
+            _previews.submit(fid, data, mime)
+        except Exception as e:
+            logger.error(f"[Previews] {fid}: {e}")
+
+@app.get("/api/files/{file_id}/preview")
+def drive_file_preview(file_id: str, request: Request, background_tasks: BackgroundTasks):
+    """
+    Miniatura załącznika (JPEG, dłuższy bok 256 px); ETag = sha256 treści pliku (304 bez wysyłki).
+    202 – miniatura w przygotowaniu (dla starszych załączników generowana przy pierwszym żądaniu);
+    404 – plik nie jest załącznikiem albo podglądu nie da się wygenerować.
+    """
+    if not _DRIVE_FILE_ID.fullmatch(file_id):
+        raise HTTPException(status_code=400, detail="Nieprawidłowe id pliku Drive")
+    _file_index.refresh(_store.list_containers, _store.get_container)
+    rec = _file_index.lookup(file_id) or _attachments.get(file_id)
+    if rec is None:
+        raise HTTPException(status_code=404, detail="Plik nie jest załącznikiem produktu")
+    state = _previews.lookup(file_id)
+    if state is None:
+        if (rec.get("mimeType") and not previews.previewable(rec["mimeType"])) or (rec.get("size") or 0) > _preview_max_bytes():
+            raise HTTPException(status_code=404, detail="Brak podglądu dla tego pliku")
+        background_tasks.add_task(tracing.bind(_generate_previews), [dict(rec, id=file_id)])
+        return JSONResponse(status_code=202, content={"status": "pending"})
+    if state["status"] == "pending":
+        return JSONResponse(status_code=202, content={"status": "pending"})
+    if state["status"] != "ready":
+        raise HTTPException(status_code=404, detail=state.get("error") or "Brak podglądu")
+    # ten sam adres może po zmianie pliku w Drive wskazać inną treść – stąd krótki max-age + ETag, nie immutable
+    headers = {"ETag": f'"{state["sha"]}"', "Cache-Control": "private, max-age=3600"}
+    if _not_modified(request, headers["ETag"], None):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(state["path"], media_type="image/jpeg", headers=headers)
+
+@app.get("/api/previews/status")
+def previews_status() -> Dict[str, Any]:
+    return _previews.status()
+
 @app.post("/api/containers", status_code=201)
-def create_container(payload: ContainerIn, request: Request, background_tasks: BackgroundTasks) -> Container:
+def create_container(payload: ContainerIn, request: Request, response: Response, background_tasks: BackgroundTasks) -> Container:
     payload_dict = payload.model_dump(exclude_unset=True)
     if "id" in payload_dict and not payload_dict["id"]:
         del payload_dict["id"]
     c = Container(**payload_dict)
     c.pickupDate = _calc_pickup_date(c.orderDate, c.productionDays)
-    data = _load_data()
-    data.append(c.model_dump())
-    _save_data(data)
+    try:
+        saved = _store.insert_container(c.model_dump())
+    except ContainerExists:
+        raise HTTPException(status_code=409, detail="Container with this id already exists")
+    response.headers["ETag"] = _etag(saved)
     # zapis do Google Sheets (append); ignoruj błędy
     # jeżeli import z arkusza (source=sheet) – pomiń append, aby nie duplikować wierszy
     try:
         src = (request.query_params.get("source") or "").strip().lower()
         if src != "sheet":
-            background_tasks.add_task(_on_created_container_sync_to_sheet, c.model_dump())
+            _sync_to_sheet(background_tasks, "container.created", saved, partition=saved["id"])
     except Exception:
         pass
-    return c.model_dump()
+    return saved
 
 @app.put("/api/containers/{container_id}")
-def update_container(container_id: str, payload: ContainerUpdate, background_tasks: BackgroundTasks) -> Container:
-    data = _load_data()
-    for i, item in enumerate(data):
-        if str(item.get("id")) == container_id:
-            # zachowaj products
-            products = item.get("products", [])
-            # zaktualizuj pola
-            updated = {**item, **{k: v for k, v in payload.model_dump(exclude_unset=True).items()}}
-            # przelicz pickupDate jeśli dotyczy
-            orderDate = updated.get("orderDate")
-            productionDays = updated.get("productionDays")
-            updated["pickupDate"] = _calc_pickup_date(orderDate, productionDays)
-            updated["products"] = products
-            data[i] = updated
-            _save_data(data)
-            # write-through do Google Sheets (ignoruj błędy)
-            try:
-                background_tasks.add_task(_on_updated_container_sync_to_sheet, updated)
-            except Exception:
-                pass
-            return updated
-    raise HTTPException(status_code=404, detail="Container not found")
+def update_container(container_id: str, payload: ContainerUpdate, request: Request, response: Response,
+                     background_tasks: BackgroundTasks) -> Container:
+    expected = _if_match(request)
+    current = _store.get_container(container_id)
+    if current is None:
+        raise HTTPException(status_code=404, detail="Container not found")
+    fields = payload.model_dump(exclude_unset=True)
+    # przelicz pickupDate jeśli dotyczy
+    merged = {**current, **fields}
+    fields["pickupDate"] = _calc_pickup_date(merged.get("orderDate"), merged.get("productionDays"))
+    # Bez If-Match: CAS względem odczytanej rewizji (pickupDate liczone z tych samych danych)
+    try:
+        updated = _store.update_container(container_id, fields,
+                                          expected_revision=expected if expected is not None else revision_of(current))
+    except ContainerNotFound:
+        raise HTTPException(status_code=404, detail="Container not found")
+    except RevisionConflict as e:
+        if expected is not None:
+            raise _precondition_failed(e)
+        # Równoległy zapis między odczytem a CAS – przelicz na świeżych danych
+        current = _store.get_container(container_id) or current
+        merged = {**current, **payload.model_dump(exclude_unset=True)}
+        fields["pickupDate"] = _calc_pickup_date(merged.get("orderDate"), merged.get("productionDays"))
+        try:
+            updated = _store.update_container(container_id, fields)
+        except ContainerNotFound:
+            raise HTTPException(status_code=404, detail="Container not found")
+    response.headers["ETag"] = _etag(updated)
+    # write-through do Google Sheets (ignoruj błędy)
+    try:
+        _sync_to_sheet(background_tasks, "container.updated", updated, partition=updated["id"], dedupe=f"container:{updated['id']}")
+    except Exception:
+        pass
+    return updated
 
 # Diagnostyka zapisu do Google Sheets
 @app.get("/api/sheets/status")
@@ -1333,22 +2012,25 @@ def sheets_status() -> Dict[str, Any]:
         "products_title": SHEET_PRODUCTS_TITLE,
         "containers_ws_exists": False,
         "products_ws_exists": False,
+        "poller": _sheets_poller.status(),
+        "rowIndex": _sheet_index.status(),
     }
     try:
-        client = _get_gspread_client()
-        file_id = os.environ.get("FILE_ID")
+        cfg = _cfg()
+        client = _get_gspread_client(cfg)
+        file_id = cfg.file_id
         info["has_client"] = client is not None
         info["file_id_set"] = bool(file_id)
         if client and file_id:
-            sh = client.open_by_key(file_id)
+            sh = _gcall("open_by_key", client.open_by_key, file_id)
             try:
-                ws_c = sh.worksheet(SHEET_CONTAINERS_TITLE)
+                ws_c = _gcall("worksheet", sh.worksheet, SHEET_CONTAINERS_TITLE)
                 info["containers_ws_exists"] = True
                 info["containers_headers"] = _sheet_get_headers(ws_c)
             except Exception as e:
                 info["containers_error"] = str(e)
             try:
-                ws_p = sh.worksheet(SHEET_PRODUCTS_TITLE)
+                ws_p = _gcall("worksheet", sh.worksheet, SHEET_PRODUCTS_TITLE)
                 info["products_ws_exists"] = True
                 info["products_headers"] = _sheet_get_headers(ws_p)
             except Exception as e:
@@ -1405,130 +2087,199 @@ def sheets_append_test(target: str = "containers") -> Dict[str, Any]:
 
 @app.delete("/api/containers/{container_id}", status_code=204)
 def delete_container(container_id: str, request: Request, background_tasks: BackgroundTasks):
-    data = _load_data()
-    deleted_container = None
-    new_data = []
-    for c in data:
-        if str(c.get("id")) == container_id:
-            deleted_container = c
-        else:
-            new_data.append(c)
-    if deleted_container is None:
+    try:
+        deleted_container = _store.delete_container(container_id, expected_revision=_if_match(request))
+    except ContainerNotFound:
         raise HTTPException(status_code=404, detail="Container not found")
-    _save_data(new_data)
+    except RevisionConflict as e:
+        raise _precondition_failed(e)
     # Usuń wiersz kontenera (i powiązanych produktów) z Google Sheets
     try:
         src = (request.query_params.get("source") or "").strip().lower()
         if deleted_container and src != "sheet":
-            background_tasks.add_task(_on_deleted_container_sync_to_sheet, deleted_container)
+            _sync_to_sheet(background_tasks, "container.deleted", deleted_container, partition=deleted_container["id"])
     except Exception:
         pass
     return
 
 @app.post("/api/containers/{container_id}/products", status_code=201)
-def add_product(container_id: str, payload: ProductIn, request: Request, background_tasks: BackgroundTasks) -> Product:
+def add_product(container_id: str, payload: ProductIn, request: Request, response: Response, background_tasks: BackgroundTasks) -> Product:
     """
     Dodawanie produktu:
     - Normalnie (bez parametru source=sheet): zawsze tworzy nowy wpis i appenduje do arkusza.
     - Import z arkusza (source=sheet): antyduplikacja po nazwie w obrębie kontenera (case-insensitive);
       jeśli istnieje produkt o tej samej nazwie → aktualizujemy istniejący (zachowując jego id) zamiast dodawać duplikat.
     """
-    data = _load_data()
-    for i, item in enumerate(data):
-        if str(item.get("id")) == container_id:
-            products = item.get("products", [])
+    container = _store.get_container(container_id)
+    if container is None:
+        raise HTTPException(status_code=404, detail="Container not found")
 
-            # Źródło żądania (np. import z arkusza)
-            try:
-                src = (request.query_params.get("source") or "").strip().lower()
-            except Exception:
-                src = ""
-
-            if src == "sheet":
-                # Antyduplikacja: znajdź istniejący produkt o tej samej nazwie (case-insensitive)
-                name_ci = str(payload.name or "").strip().lower()
-                existing_idx = next((j for j, p in enumerate(products) if str(p.get("name", "")).strip().lower() == name_ci), -1)
-                if existing_idx >= 0:
-                    # Aktualizuj istniejący produkt, zachowując jego id
-                    existing_id = str(products[existing_idx].get("id"))
-                    new_prod = {"id": existing_id, **payload.model_dump()}
-                    products[existing_idx] = new_prod
-                    item["products"] = products
-                    data[i] = item
-                    _save_data(data)
-                    # Import z arkusza nie powinien wykonywać append do Sheets
-                    return new_prod
-
-            # Domyślnie: utwórz nowy produkt
-            payload_dict = payload.model_dump(exclude_unset=True)
-            if "id" in payload_dict and not payload_dict["id"]:
-                del payload_dict["id"]
-            p = Product(**payload_dict)
-            products.append(p.model_dump())
-            item["products"] = products
-            data[i] = item
-            _save_data(data)
-
-            # zapis do Google Sheets (append); ignoruj błędy
+    # Źródło żądania (np. import z arkusza)
+    try:
+        src = (request.query_params.get("source") or "").strip().lower()
+    except Exception:
+        src = ""
+
+    if src == "sheet":
+        # Antyduplikacja: znajdź istniejący produkt o tej samej nazwie (case-insensitive)
+        name_ci = str(payload.name or "").strip().lower()
+        existing = next((p for p in container.get("products", []) if str(p.get("name", "")).strip().lower() == name_ci), None)
+        if existing is not None:
+            # Aktualizuj istniejący produkt, zachowując jego id
+            existing_id = str(existing.get("id"))
+            new_prod = _with_attachments({**payload.model_dump(), "id": existing_id})
             try:
-                if src != "sheet":
-                    background_tasks.add_task(_on_added_product_sync_to_sheet, item, p.model_dump())
-            except Exception:
-                pass
-            return p.model_dump()
-    raise HTTPException(status_code=404, detail="Container not found")
+                _, saved = _store.update_product(container_id, existing_id, new_prod)
+            except (ContainerNotFound, ProductNotFound):
+                raise HTTPException(status_code=404, detail="Container not found")
+            # Import z arkusza nie powinien wykonywać append do Sheets
+            response.headers["ETag"] = _etag(saved)
+            return saved
+
+    # Domyślnie: utwórz nowy produkt
+    payload_dict = payload.model_dump(exclude_unset=True)
+    if "id" in payload_dict and not payload_dict["id"]:
+        del payload_dict["id"]
+    p = Product(**payload_dict)
+    try:
+        item = _store.add_product(container_id, _with_attachments(p.model_dump()))
+    except ContainerNotFound:
+        raise HTTPException(status_code=404, detail="Container not found")
+    saved = next((x for x in item.get("products", []) if str(x.get("id")) == p.id), {**p.model_dump(), "revision": 1})
+    response.headers["ETag"] = _etag(saved)
 
+    # zapis do Google Sheets (append); ignoruj błędy
+    try:
+        if src != "sheet":
+            _sync_to_sheet(background_tasks, "product.added", item, saved, partition=item["id"])
+    except Exception:
+        pass
+    return saved
+
+@app.post("/api/import/file")
+def import_file(
+    background_tasks: BackgroundTasks,
+    kind: str = Form(...),
+    file: UploadFile = File(...),
+    dryRun: bool = Form(False),
+) -> Dict[str, Any]:
+    """
+    Import zbiorczy z pliku CSV/XLSX (kind=containers|products).
+    - walidacja całymi kolumnami; w odpowiedzi wszystkie błędne komórki,
+    - poprawne wiersze zapisywane w jednej transakcji magazynu,
+    - jedna zbiorcza synchronizacja do Google Sheets (append_rows).
+    Produkty dopasowywane są do kontenera po containerId, a następnie po containerName.
+    """
+    kind = (kind or "").strip().lower()
+    if kind not in ("containers", "products"):
+        raise HTTPException(status_code=400, detail="kind musi być 'containers' lub 'products'")
+    spec = bulk_import.CONTAINER_SPEC if kind == "containers" else bulk_import.PRODUCT_SPEC
+    try:
+        cols = bulk_import.to_columns(bulk_import.iter_file_rows(file.file, file.filename or ""))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Nie udało się odczytać pliku: {e}")
+    result = bulk_import.validate_columns(cols, spec)
+    if result["missing_columns"]:
+        raise HTTPException(status_code=422, detail={"missingColumns": result["missing_columns"], "errors": result["errors"]})
+    columns = result["columns"]
+    errors = list(result["errors"])
+
+    def row_payload(i: int, fields: List[str]) -> Dict[str, Any]:
+        # Puste komórki → wartości domyślne modelu (np. waluta "USD", kurs "4.0").
+        # Kolumna id z pliku jest pomijana – import zawsze tworzy nowe rekordy, a model_construct
+        # nie sprawdziłby kolizji z istniejącymi id ani powtórzeń w samym pliku.
+        rec = {k: v for k, v in bulk_import.row_at(columns, i, [f for f in fields if f != "id"]).items() if v != ""}
+        for k in spec["required"]:
+            rec.setdefault(k, "")
+        return rec
+
+    new_containers: List[Dict[str, Any]] = []
+    new_products: List[Dict[str, Any]] = []
+    with _data_transaction(commit=not dryRun) as data:
+        if kind == "containers":
+            fields = list(ContainerIn.model_fields)
+            for i in result["valid_rows"]:
+                c = Container.model_construct(**row_payload(i, fields)).model_dump()
+                c["pickupDate"] = _calc_pickup_date(c.get("orderDate"), c.get("productionDays"))
+                new_containers.append(c)
+            data.extend(new_containers)
+        else:
+            by_id = {str(c.get("id")): c for c in data}
+            by_name = search.Matcher(((i, c.get("name")) for i, c in enumerate(data)), threshold=IMPORT_MATCH_THRESHOLD)
+            cid_col = columns.get("containerId") or []
+            cname_col = columns.get("containerName") or []
+            fields = [f for f in ProductIn.model_fields if f != "files"]
+            for i in result["valid_rows"]:
+                cid = cid_col[i] if i < len(cid_col) else ""
+                cname = cname_col[i] if i < len(cname_col) else ""
+                container = by_id.get(cid) if cid else None
+                if container is None and cname:
+                    idx = by_name.match(cname)
+                    container = data[idx] if idx is not None else None
+                if container is None:
+                    error = {"row": i + 2, "column": "containerId" if cid else "containerName",
+                             "value": cid or cname, "error": "Nie znaleziono kontenera"}
+                    hint = by_name.suggest(cname) if cname else None
+                    if hint is not None:
+                        # podobna nazwa tylko jako podpowiedź – bez automatycznego przypisania
+                        error["suggestion"] = data[hint].get("name")
+                    errors.append(error)
+                    continue
+                p = Product.model_construct(**row_payload(i, fields)).model_dump()
+                container["products"] = list(container.get("products") or []) + [p]
+                new_products.append({**p, "containerId": container.get("id"), "containerName": container.get("name", "")})
+
+    if not dryRun and (new_containers or new_products):
+        _sync_to_sheet(background_tasks, "bulk.imported", new_containers, new_products, partition="bulk")
+    errors.sort(key=lambda e: (e["row"], e["column"]))
+    return {
+        "kind": kind,
+        "dryRun": dryRun,
+        "totalRows": result["total_rows"],
+        "imported": len(new_containers) if kind == "containers" else len(new_products),
+        "errorsCount": len(errors),
+        "errors": errors,
+    }
 @app.put("/api/containers/{container_id}/products/{product_id}")
-def update_product(container_id: str, product_id: str, payload: ProductIn, background_tasks: BackgroundTasks) -> Product:
-    data = _load_data()
-    for i, item in enumerate(data):
-        if str(item.get("id")) == container_id:
-            products = item.get("products", [])
-            for j, prod in enumerate(products):
-                if str(prod.get("id")) == product_id:
-                    # zachowujemy id, resztę nadpisujemy
-                    new_prod = {"id": product_id, **payload.model_dump()}
-                    products[j] = new_prod
-                    item["products"] = products
-                    data[i] = item
-                    _save_data(data)
-                    # write-through do Google Sheets (ignoruj błędy)
-                    try:
-                        background_tasks.add_task(_on_updated_product_sync_to_sheet, item, new_prod)
-                    except Exception:
-                        pass
-                    return new_prod
-            raise HTTPException(status_code=404, detail="Product not found")
-    raise HTTPException(status_code=404, detail="Container not found")
+def update_product(container_id: str, product_id: str, payload: ProductIn, request: Request, response: Response,
+                   background_tasks: BackgroundTasks) -> Product:
+    # zachowujemy id, resztę nadpisujemy (metadane załączników – dla linków, które zostały w files)
+    new_prod = _with_attachments({**payload.model_dump(), "id": product_id})
+    try:
+        item, new_prod = _store.update_product(container_id, product_id, new_prod, expected_revision=_if_match(request))
+    except ContainerNotFound:
+        raise HTTPException(status_code=404, detail="Container not found")
+    except ProductNotFound:
+        raise HTTPException(status_code=404, detail="Product not found")
+    except RevisionConflict as e:
+        raise _precondition_failed(e)
+    response.headers["ETag"] = _etag(new_prod)
+    # write-through do Google Sheets (ignoruj błędy)
+    try:
+        _sync_to_sheet(background_tasks, "product.updated", item, new_prod, partition=item["id"], dedupe=f"product:{new_prod['id']}")
+    except Exception:
+        pass
+    return new_prod
 
 @app.delete("/api/containers/{container_id}/products/{product_id}", status_code=204)
 def delete_product(container_id: str, product_id: str, request: Request, background_tasks: BackgroundTasks):
-    data = _load_data()
-    for i, item in enumerate(data):
-        if str(item.get("id")) == container_id:
-            products = item.get("products", [])
-            deleted_product = None
-            new_products = []
-            for p in products:
-                if str(p.get("id")) == product_id:
-                    deleted_product = p
-                else:
-                    new_products.append(p)
-            if deleted_product is None:
-                raise HTTPException(status_code=404, detail="Product not found")
-            item["products"] = new_products
-            data[i] = item
-            _save_data(data)
-            # Usuń wiersz produktu z Google Sheets
-            try:
-                src = (request.query_params.get("source") or "").strip().lower()
-                if deleted_product and src != "sheet":
-                    container_name = item.get("name", "")
-                    background_tasks.add_task(_on_deleted_product_sync_to_sheet, container_name, deleted_product)
-            except Exception:
-                pass
-            return
-    raise HTTPException(status_code=404, detail="Container not found")
+    try:
+        item, deleted_product = _store.delete_product(container_id, product_id, expected_revision=_if_match(request))
+    except ContainerNotFound:
+        raise HTTPException(status_code=404, detail="Container not found")
+    except ProductNotFound:
+        raise HTTPException(status_code=404, detail="Product not found")
+    except RevisionConflict as e:
+        raise _precondition_failed(e)
+    # Usuń wiersz produktu z Google Sheets
+    try:
+        src = (request.query_params.get("source") or "").strip().lower()
+        if deleted_product and src != "sheet":
+            container_name = item.get("name", "")
+            _sync_to_sheet(background_tasks, "product.deleted", container_name, deleted_product, partition=item["id"])
+    except Exception:
+        pass
+    return
 
 # Sheets API
 @app.get("/api/sheets/containers")
@@ -1547,6 +2298,154 @@ def sheet_products() -> List[Dict[str, Any]]:
     logger.info(f"[API] /api/sheets/products: raw={len(recs)} → mapped={len(mapped)}")
     return mapped
 
+def _container_from_sheet(rec: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        c = Container(**rec).model_dump()
+    except Exception as e:
+        # Wiersz arkusza z niepoprawnymi danymi (np. format daty) – zachowaj wartości bez walidacji
+        logger.warning(f"[Reconcile] Container '{rec.get('name')}' validation failed ({e}), keeping raw values")
+        c = Container.model_construct(**rec).model_dump()
+    c["pickupDate"] = _calc_pickup_date(c.get("orderDate"), c.get("productionDays"))
+    return c
+
+def _product_from_sheet(rec: Dict[str, Any]) -> Dict[str, Any]:
+    payload = {k: rec.get(k) for k in ("id", "name", "quantity", "totalPrice", "totalPriceCurrency",
+                                       "productCbm", "customsDutyPercent", "files") if rec.get(k) is not None}
+    if not payload.get("id"):
+        payload.pop("id", None)
+    try:
+        return Product(**payload).model_dump()
+    except Exception as e:
+        logger.warning(f"[Reconcile] Product '{rec.get('name')}' validation failed ({e}), keeping raw values")
+        return Product.model_construct(**payload).model_dump()
+
+def _outbox_held_containers() -> Set[str]:
+    """Id kontenerów ze zmianami czekającymi w outboxie (pending/dead) – partycja wpisu albo kontenery importu zbiorczego."""
+    held: Set[str] = set()
+    for kind, args, partition in _sheets_outbox.unsynced():
+        if kind == "bulk.imported":
+            containers, products = (list(args) + [[], []])[:2]
+            held.update(str(c.get("id")) for c in containers or [] if c.get("id"))
+            held.update(str(p.get("containerId")) for p in products or [] if p.get("containerId"))
+        elif partition:
+            held.add(str(partition))
+    return held
+
+def _sheets_reconcile(dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Uzgodnij magazyn z arkuszem: jedno pobranie obu zakładek, porównanie skrótów wierszy
+    i zastosowanie wyłącznie różnic (insert/update/delete). dry_run=True zwraca sam diff.
+    Kontenery z niezapisanymi jeszcze wpisami outboxa są pomijane (arkusz ich jeszcze nie zna).
+    """
+    # arkusz zmieniony z zewnątrz – numery wierszy i nagłówki mogły się przesunąć
+    _sheet_index.invalidate(handles=True)
+    sheets = _sheet_records_many([SHEET_CONTAINERS_TITLE, SHEET_PRODUCTS_TITLE])
+    cs = [_map_sheet_container(r) for r in sheets[SHEET_CONTAINERS_TITLE]
+          if isinstance(r, dict) and any(str(v).strip() for v in r.values())]
+    ps = [_map_sheet_product(r) for r in sheets[SHEET_PRODUCTS_TITLE]
+          if isinstance(r, dict) and any(str(v).strip() for v in r.values())]
+    container_fields = [h for h in HEADERS_CONTAINERS if h != "id"]
+    with _data_transaction(commit=not dry_run) as data:
+        diff = reconcile.hold(reconcile.plan(data, cs, ps, container_fields), _outbox_held_containers())
+        if not dry_run:
+            reconcile.apply(data, diff, _container_from_sheet, _product_from_sheet)
+    result = {"dryRun": dry_run, "summary": reconcile.summary(diff), "held": diff.get("held", [])}
+    if dry_run:
+        result["diff"] = diff
+    logger.info(f"[Reconcile] {'dry-run' if dry_run else 'applied'}: {result['summary']}")
+    return result
+
+def _sheets_revision() -> Optional[str]:
+    """
+    Tani identyfikator rewizji arkusza – jedno wywołanie API:
+    - Drive modifiedTime (wymaga zakresu drive.metadata.readonly),
+    - fallback: checksum wartości obu zakładek (values:batchGet).
+    """
+    cfg = _cfg()
+    client = _get_gspread_client(cfg)
+    file_id = cfg.file_id
+    if not client or not file_id:
+        return None
+    try:
+        meta = _gcall("get_file_drive_metadata", client.get_file_drive_metadata, file_id)
+        if meta.get("modifiedTime"):
+            return f"mtime:{meta['modifiedTime']}"
+    except Exception as e:
+        logger.info(f"[Poller] Drive metadata unavailable ({type(e).__name__}), using values checksum")
+    resp = _gcall("values_batch_get", client.http_client.values_batch_get, file_id, [SHEET_CONTAINERS_TITLE, SHEET_PRODUCTS_TITLE])
+    digest = hashlib.sha1(json.dumps(resp.get("valueRanges", []), sort_keys=True).encode("utf-8")).hexdigest()
+    return f"sha1:{digest}"
+
+def _poll_should_defer() -> bool:
+    try:
+        quiet = float(SHEETS_POLL_QUIET_SECONDS)
+    except ValueError:
+        quiet = 10.0
+    if _store.last_write > 0 and (time.monotonic() - _store.last_write) < quiet:
+        return True
+    # outbox jeszcze dopisuje zmiany do arkusza – uzgodnienie po jego opróżnieniu
+    return _sheets_outbox.stats()["pending"] > 0
+
+def _poll_interval() -> float:
+    try:
+        return float(SHEETS_POLL_INTERVAL)
+    except ValueError:
+        return 0.0
+
+_sheets_poller = SheetsPoller(
+    interval=_poll_interval(),
+    get_revision=quota.background(_sheets_revision),
+    on_change=quota.background(lambda: _sheets_reconcile(dry_run=False)),
+    should_defer=_poll_should_defer,
+)
+
+@app.post("/api/sheets/reconcile")
+def sheets_reconcile(dryRun: bool = False) -> Dict[str, Any]:
+    """Uzgodnienie arkusz → pamięć (zastępuje „replace from sheet” z UI). dryRun=true – tylko diff."""
+    try:
+        return _sheets_reconcile(dry_run=dryRun)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"[Reconcile] FAILED: {type(e).__name__}: {e}")
+        raise HTTPException(status_code=502, detail=f"Reconcile failed: {e}")
+
+@app.post("/api/sheets/backfill-ids")
+def sheets_backfill_ids() -> Dict[str, Any]:
+    """Uzupełnij puste id w starszych wierszach arkusza (to samo co przy starcie lidera)."""
+    try:
+        return {"assigned": _sheets_backfill_ids()}
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"[Sheets] Id backfill FAILED: {type(e).__name__}: {e}")
+        raise HTTPException(status_code=502, detail=f"Id backfill failed: {e}")
+
+class OutboxReplayRequest(BaseModel):
+    """Replay outboxa: puste ids = wszystkie wpisy dead-letter."""
+    ids: List[int] = Field(default_factory=list)
+
+@app.get("/api/sheets/outbox")
+def sheets_outbox(status: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+    """Stan outboxa synchronizacji arkusza: liczniki i wpisy (status=pending|dead)."""
+    if status not in (None, "pending", "dead"):
+        raise HTTPException(status_code=400, detail="status: pending | dead")
+    return {"stats": _sheets_outbox.stats(), "entries": _sheets_outbox.entries(status, max(1, min(limit, 1000)))}
+
+@app.post("/api/sheets/outbox/replay")
+def sheets_outbox_replay(req: OutboxReplayRequest, background_tasks: BackgroundTasks) -> Dict[str, Any]:
+    """Przywróć wpisy do kolejki (dead-letter lub wskazane ids) i opróżnij outbox po odpowiedzi."""
+    replayed = _sheets_outbox.replay(req.ids or None)
+    if replayed:
+        background_tasks.add_task(tracing.bind(_drain_sheets_outbox))
+    return {"replayed": replayed}
+
+@app.delete("/api/sheets/outbox/{entry_id}", status_code=204)
+def sheets_outbox_discard(entry_id: int):
+    if not _sheets_outbox.discard(entry_id):
+        raise HTTPException(status_code=404, detail="Outbox entry not found")
+    return
+
 # Lista plików dla produktu (folder o nazwie produktu w Google Drive)
 @app.get("/api/drive/product-files")
 def drive_product_files(name: str, rootId: Optional[str] = None) -> Dict[str, Any]:
@@ -1555,11 +2454,11 @@ def drive_product_files(name: str, rootId: Optional[str] = None) -> Dict[str, An
     Założenie: folder o nazwie produktu znajduje się bezpośrednio pod folderem root (FOLDER_ID/DRIVE_FOLDER_ID lub wyprowadzony z FILE_ID).
     Fallback: jeśli nie znajdziesz folderu bezpośrednio pod rootem, wyszukaj globalnie po nazwie.
     """
-    _load_env_from_file()
+    cfg = _cfg()
     try:
-        service = _drive_build_service()
-        file_id_sheet = os.environ.get("FILE_ID")
-        env_root_id = rootId or os.environ.get("FOLDER_ID") or os.environ.get("DRIVE_FOLDER_ID") or DRIVE_ROOT_FOLDER_ID
+        service = _drive_build_service(cfg)
+        file_id_sheet = cfg.file_id
+        env_root_id = rootId or cfg.drive_folder_id
         root_id = _drive_resolve_root_id(service, env_root_id, file_id_sheet)
 
         import re
@@ -1634,14 +2533,13 @@ if __name__ == "__main__":
     uvicorn.run("app.main:app", host="127.0.0.1", port=8000, reload=True)
 # --- Google Drive scan/import helpers & endpoints ---
 
-def _drive_build_service():
-    """Zbuduj klienta Google Drive z OAuth użytkownika."""
-    _load_env_from_file()
-    client_id = os.environ.get("OAUTH_CLIENT_ID")
-    client_secret = os.environ.get("OAUTH_CLIENT_SECRET")
-    refresh_token = os.environ.get("OAUTH_REFRESH_TOKEN")
-    token_uri = os.environ.get("OAUTH_TOKEN_URI", "https://oauth2.googleapis.com/token")
-    if not client_id or not client_secret or not refresh_token:
+def _drive_build_service(cfg: Optional[settings.Settings] = None):
+    """Zbuduj klienta Google Drive z OAuth użytkownika (dane z przekazanego snapshotu konfiguracji)."""
+    cfg = cfg or _cfg()
+    fake = _google_fake(cfg)
+    if fake is not None:
+        return fake[1]
+    if not cfg.oauth_configured:
         raise HTTPException(status_code=500, detail="Brak konfiguracji OAuth (wymagane: OAUTH_CLIENT_ID, OAUTH_CLIENT_SECRET, OAUTH_REFRESH_TOKEN)")
     try:
         from google.oauth2.credentials import Credentials  # type: ignore
@@ -1651,17 +2549,17 @@ def _drive_build_service():
         raise HTTPException(status_code=500, detail=f"Biblioteki Google API niedostępne: {e}")
     creds = Credentials(
         token=None,
-        refresh_token=refresh_token,
-        token_uri=token_uri,
-        client_id=client_id,
-        client_secret=client_secret,
+        refresh_token=cfg.oauth_refresh_token,
+        token_uri=cfg.oauth_token_uri,
+        client_id=cfg.oauth_client_id,
+        client_secret=cfg.oauth_client_secret,
         scopes=DRIVE_SCOPES,
     )
     try:
-        creds.refresh(Request())
+        _gcall("token.refresh", creds.refresh, Request())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OAuth refresh failed: {e}")
-    service = build("drive", "v3", credentials=creds, cache_discovery=False)
+    service = build("drive", "v3", credentials=creds, cache_discovery=False, requestBuilder=metrics.timed_http_request_class())
     return service
 
 
@@ -1702,17 +2600,16 @@ def _drive_list_folders(service, parent_id: str):
 def _drive_list_files(service, parent_id: str):
     """Zwróć listę plików (nie-folderów) w danym folderze."""
     q = f"mimeType!='application/vnd.google-apps.folder' and '{parent_id}' in parents and trashed=false"
-    resp = service.files().list(q=q, fields="files(id,name,mimeType,parents,webViewLink,webContentLink)", pageSize=1000).execute()
-    return resp.get("files", []) or []
+    resp = service.files().list(q=q, fields=f"files({attachments.DRIVE_FILE_FIELDS})", pageSize=1000).execute()
+    files = resp.get("files", []) or []
+    # Każde listowanie zasila rejestr metadanych (upload/import/skan nie pytają Drive drugi raz)
+    _attachments.remember(attachments.record(f, parent_id) for f in files)
+    return files
 
 
 def _drive_download_url(file_id: Optional[str], web_content: Optional[str], web_view: Optional[str]) -> str:
     """Zbuduj URL do pobrania pliku."""
-    if web_content:
-        return web_content
-    if file_id:
-        return f"https://drive.google.com/uc?export=download&id={file_id}"
-    return web_view or ""
+    return attachments.download_url(file_id, web_content, web_view)
 
 
 @app.get("/api/drive/scan")
@@ -1722,10 +2619,10 @@ def drive_scan(rootId: Optional[str] = None) -> Dict[str, Any]:
     - root → kontener → produkt → pliki
     Zwraca drzewo do importu produktów z załącznikami.
     """
-    _load_env_from_file()
-    service = _drive_build_service()
-    env_root_id = rootId or os.environ.get("FOLDER_ID") or os.environ.get("DRIVE_FOLDER_ID") or DRIVE_ROOT_FOLDER_ID
-    file_id_sheet = os.environ.get("FILE_ID")
+    cfg = _cfg()
+    service = _drive_build_service(cfg)
+    env_root_id = rootId or cfg.drive_folder_id
+    file_id_sheet = cfg.file_id
     root_id = _drive_resolve_root_id(service, env_root_id, file_id_sheet)
 
     out_containers: List[Dict[str, Any]] = []
@@ -1754,26 +2651,35 @@ class DriveImportRequest(BaseModel):
 
 
 @app.post("/api/containers/import/drive")
-def import_from_drive(req: DriveImportRequest) -> Dict[str, Any]:
+def import_from_drive(req: DriveImportRequest, background_tasks: BackgroundTasks) -> Dict[str, Any]:
     """
     Importuj kontenery/produkty z Google Drive:
     - jeśli podano containerIds: import produktów (folderów) i plików z tych kontenerów
     - jeśli podano productIds: import pojedynczych produktów (folderów) i ich plików
     Import trafia WYŁĄCZNIE do magazynu in‑memory; brak zapisu lokalnie. Opcjonalnie append do Google Sheets.
+    Każda zmiana zapisywana jest osobną operacją magazynu – równoległe edycje nie są nadpisywane.
     """
-    _load_env_from_file()
-    service = _drive_build_service()
-    file_id_sheet = os.environ.get("FILE_ID")
-    env_root_id = req.rootId or os.environ.get("FOLDER_ID") or os.environ.get("DRIVE_FOLDER_ID") or DRIVE_ROOT_FOLDER_ID
+    cfg = _cfg()
+    service = _drive_build_service(cfg)
+    file_id_sheet = cfg.file_id
+    env_root_id = req.rootId or cfg.drive_folder_id
     root_id = _drive_resolve_root_id(service, env_root_id, file_id_sheet)
 
     data = _load_data()
 
+    containers_by_name = search.Matcher(((i, c.get("name")) for i, c in enumerate(data)), threshold=IMPORT_MATCH_THRESHOLD)
+
+    suggestions: List[Dict[str, Any]] = []
+
     def find_container_index_by_name(name: str) -> int:
-        for i, item in enumerate(data):
-            if str(item.get("name", "")).strip() == str(name).strip():
-                return i
-        return -1
+        idx = containers_by_name.match(name)
+        if idx is None:
+            # nowy kontener mimo podobnej nazwy – do weryfikacji przez użytkownika
+            hint = containers_by_name.suggest(name)
+            if hint is not None:
+                suggestions.append({"folder": name, "similarContainerId": data[hint].get("id"),
+                                    "similarContainerName": data[hint].get("name")})
+        return -1 if idx is None else idx
 
     imported_containers = 0
     imported_products = 0
@@ -1786,43 +2692,34 @@ def import_from_drive(req: DriveImportRequest) -> Dict[str, Any]:
         if idx < 0:
             c = Container(name=cname, orderDate="", productionDays="0", exchangeRate="4.0")
             c.pickupDate = _calc_pickup_date(c.orderDate, c.productionDays)
-            c_dict = c.model_dump()
+            c_dict = _store.insert_container(c.model_dump())
             data.append(c_dict)
             imported_containers += 1
-            try:
-                _on_created_container_sync_to_sheet(c_dict)
-            except Exception:
-                pass
+            _sync_to_sheet(background_tasks, "container.created", c_dict, partition=c_dict["id"])
             idx = len(data) - 1
+            containers_by_name.add(idx, cname)
 
         # Produkty (foldery) wewnątrz kontenera
         for pf in _drive_list_folders(service, container_folder_id):
             pname = pf.get("name") or "Produkt"
             products = data[idx].get("products", [])
-            p_found_index = next((j for j, p in enumerate(products) if str(p.get("name", "")).strip() == str(pname).strip()), -1)
+            p_found_index = next((j for j, p in enumerate(products) if search.normalize(p.get("name")) == search.normalize(pname)), -1)
 
-            files_urls: List[str] = []
-            for f in _drive_list_files(service, pf.get("id")):
-                files_urls.append(_drive_download_url(f.get("id"), f.get("webContentLink"), f.get("webViewLink")))
+            records = [attachments.record(f, pf.get("id")) for f in _drive_list_files(service, pf.get("id"))]
+            files_urls: List[str] = [r["url"] for r in records]
 
             if p_found_index < 0:
                 p = Product(name=pname, quantity="1", totalPrice="0", totalPriceCurrency="USD", productCbm="", customsDutyPercent="")
                 p_dict = p.model_dump()
                 p_dict["files"] = files_urls
-                products.append(p_dict)
-                data[idx]["products"] = products
+                p_dict["attachments"] = records
+                data[idx] = _store.add_product(data[idx]["id"], p_dict)
                 imported_products += 1
-                try:
-                    _on_added_product_sync_to_sheet(data[idx], p_dict)
-                except Exception:
-                    pass
+                _sync_to_sheet(background_tasks, "product.added", data[idx], p_dict, partition=data[idx]["id"])
             else:
-                # scal załączniki bez duplikatów
-                existing = products[p_found_index]
-                existing_files = existing.get("files", []) or []
-                merged = list(existing_files) + [u for u in files_urls if u not in existing_files]
-                existing["files"] = merged
-                data[idx]["products"] = products
+                # scal załączniki bez duplikatów (atomowo w magazynie – bez nadpisywania równoległych zmian)
+                data[idx], _ = _store.merge_product_files(data[idx]["id"], str(products[p_found_index].get("id")), files_urls, records)
+            background_tasks.add_task(tracing.bind(_generate_previews), records)
 
     # Import z pojedynczych produktów (folderów)
     for product_folder_id in (req.productIds or []):
@@ -1837,43 +2734,34 @@ def import_from_drive(req: DriveImportRequest) -> Dict[str, Any]:
         if idx < 0:
             c = Container(name=cname, orderDate="", productionDays="0", exchangeRate="4.0")
             c.pickupDate = _calc_pickup_date(c.orderDate, c.productionDays)
-            c_dict = c.model_dump()
+            c_dict = _store.insert_container(c.model_dump())
             data.append(c_dict)
             imported_containers += 1
-            try:
-                _on_created_container_sync_to_sheet(c_dict)
-            except Exception:
-                pass
+            _sync_to_sheet(background_tasks, "container.created", c_dict, partition=c_dict["id"])
             idx = len(data) - 1
+            containers_by_name.add(idx, cname)
 
         pname = pmeta.get("name") or "Produkt"
         products = data[idx].get("products", [])
-        p_found_index = next((j for j, p in enumerate(products) if str(p.get("name", "")).strip() == str(pname).strip()), -1)
+        p_found_index = next((j for j, p in enumerate(products) if search.normalize(p.get("name")) == search.normalize(pname)), -1)
 
-        files_urls: List[str] = []
-        for f in _drive_list_files(service, product_folder_id):
-            files_urls.append(_drive_download_url(f.get("id"), f.get("webContentLink"), f.get("webViewLink")))
+        records = [attachments.record(f, product_folder_id) for f in _drive_list_files(service, product_folder_id)]
+        files_urls: List[str] = [r["url"] for r in records]
 
         if p_found_index < 0:
             p = Product(name=pname, quantity="1", totalPrice="0", totalPriceCurrency="USD", productCbm="", customsDutyPercent="")
             p_dict = p.model_dump()
             p_dict["files"] = files_urls
-            products.append(p_dict)
-            data[idx]["products"] = products
+            p_dict["attachments"] = records
+            data[idx] = _store.add_product(data[idx]["id"], p_dict)
             imported_products += 1
-            try:
-                _on_added_product_sync_to_sheet(data[idx], p_dict)
-            except Exception:
-                pass
+            _sync_to_sheet(background_tasks, "product.added", data[idx], p_dict, partition=data[idx]["id"])
         else:
-            existing = products[p_found_index]
-            existing_files = existing.get("files", []) or []
-            merged = list(existing_files) + [u for u in files_urls if u not in existing_files]
-            existing["files"] = merged
-            data[idx]["products"] = products
+            data[idx], _ = _store.merge_product_files(data[idx]["id"], str(products[p_found_index].get("id")), files_urls, records)
+        background_tasks.add_task(tracing.bind(_generate_previews), records)
 
-    _save_data(data)
     return {
         "imported": {"containers": imported_containers, "products": imported_products},
         "rootId": root_id,
+        "suggestions": suggestions,
     }
\ No newline at end of file
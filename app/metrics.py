@@ -0,0 +1,301 @@
+"""
+Metryki w formacie tekstowym Prometheus (bez zewnętrznych zależności).
+
+- Czas obsługi żądań per trasa (szablon ścieżki, np. /api/containers/{container_id}).
+- Czas oczekiwania na blokadę magazynu.
+- Harmonogram Google API (app.quota): oczekiwanie na token, kolejka, nasycenie, ponowienia.
+- Liczniki i czasy wywołań Google API per operacja (open_by_key, col_values,
+  append_row, delete_rows, files.list, files.create, token.refresh, ...),
+  w tym osobny licznik błędów limitów (quota / 429).
+
+Rejestracja wartości to kilka operacji na słownikach pod jednym lockiem –
+narzut middleware jest pomijalny wobec czasu obsługi żądania.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app import tracing
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LOCK_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        out += [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+        return out
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items = sorted(self._values.items())
+        out += [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # etykiety → [liczniki kubełków (nieskumulowane), suma, liczba]
+        self._values: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return entry[2] if entry else 0
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        for labels, (counts, total, n) in items:
+            acc = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = 'le="%s"' % _fmt(bound)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_fmt(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {n}")
+        return out
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[object] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        m = Counter(name, help, labelnames)
+        self._metrics.append(m)
+        return m
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        m = Gauge(name, help, labelnames)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        m = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(m)
+        return m
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines += m.render()  # type: ignore[attr-defined]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+http_requests = REGISTRY.counter(
+    "http_requests_total", "Liczba żądań HTTP", ("method", "route", "status"))
+http_latency = REGISTRY.histogram(
+    "http_request_duration_seconds", "Czas obsługi żądania HTTP", ("method", "route"))
+store_lock_wait = REGISTRY.histogram(
+    "store_lock_wait_seconds", "Czas oczekiwania na blokadę magazynu", ("backend", "op"), buckets=LOCK_BUCKETS)
+google_calls = REGISTRY.counter(
+    "google_api_calls_total", "Wywołania Google Sheets/Drive API", ("op", "outcome"))
+google_latency = REGISTRY.histogram(
+    "google_api_call_duration_seconds", "Czas wywołań Google Sheets/Drive API", ("op",))
+google_quota_errors = REGISTRY.counter(
+    "google_api_quota_errors_total", "Błędy limitów Google API (429 / rateLimitExceeded / quotaExceeded)", ("op",))
+google_retries = REGISTRY.counter(
+    "google_api_retries_total", "Ponowienia wywołań Google API po 429 / błędach przejściowych", ("op",))
+scheduler_wait = REGISTRY.histogram(
+    "google_scheduler_wait_seconds", "Czas oczekiwania na token harmonogramu Google API", ("api", "priority"))
+scheduler_queued = REGISTRY.gauge(
+    "google_scheduler_queued", "Wywołania czekające na token harmonogramu Google API", ("api", "priority"))
+scheduler_saturated = REGISTRY.counter(
+    "google_scheduler_saturated_total", "Nasycenie harmonogramu Google API (długie oczekiwanie lub odmowa)", ("api",))
+
+_QUOTA_REASONS = ("ratelimitexceeded", "userratelimitexceeded", "quotaexceeded", "resource_exhausted",
+                  "quota exceeded", "rate limit exceeded")
+
+
+def error_status(exc: BaseException) -> Optional[int]:
+    """Kod HTTP z wyjątku gspread.APIError / googleapiclient HttpError (jeśli dostępny)."""
+    # requests.Response z kodem >= 400 jest fałszywy w kontekście logicznym – tylko porównania z None
+    resp = getattr(exc, "response", None)
+    if resp is None:
+        resp = getattr(exc, "resp", None)
+    status = getattr(resp, "status_code", None)
+    if status is None:
+        status = getattr(resp, "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_quota_error(exc: BaseException) -> bool:
+    status = error_status(exc)
+    if status == 429:
+        return True
+    if status == 403:
+        text = str(exc).lower()
+        return any(r in text for r in _QUOTA_REASONS)
+    return "resource_exhausted" in str(exc).lower()
+
+
+@contextmanager
+def google_call(op: str) -> Iterator[None]:
+    """Zmierz jedno wywołanie Google API (operacja = etykieta `op`)."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        with tracing.span(f"google.{op}"):
+            yield
+    except BaseException as e:
+        if is_quota_error(e):
+            outcome = "quota"
+            google_quota_errors.inc(op)
+        else:
+            outcome = "error"
+        raise
+    finally:
+        google_latency.observe(time.perf_counter() - start, op)
+        google_calls.inc(op, outcome)
+
+
+def instrument_token_refresh(creds) -> None:
+    """Mierz odświeżanie tokenu wykonywane wewnętrznie przez bibliotekę (AuthorizedSession)."""
+    refresh = getattr(creds, "refresh", None)
+    if refresh is None or getattr(refresh, "_timed", False):
+        return
+
+    def timed_refresh(request):
+        with google_call("token.refresh"):
+            return refresh(request)
+
+    timed_refresh._timed = True  # type: ignore[attr-defined]
+    try:
+        creds.refresh = timed_refresh
+    except Exception:
+        pass
+
+
+_HTTP_REQUEST_CLASS = None
+
+
+def timed_http_request_class():
+    """
+    Podklasa googleapiclient.http.HttpRequest (parametr requestBuilder w build()) –
+    każde execute() idzie przez harmonogram app.quota i jest mierzone jako operacja
+    z methodId, np. drive.files.list → files.list.
+    """
+    global _HTTP_REQUEST_CLASS
+    if _HTTP_REQUEST_CLASS is None:
+        from googleapiclient.http import HttpRequest  # type: ignore
+
+        from app import quota
+
+        class TimedHttpRequest(HttpRequest):
+            def execute(self, *args, **kwargs):
+                op = str(getattr(self, "methodId", None) or "drive.request").split(".", 1)[-1]
+                return quota.call(op, super().execute, *args, **kwargs)
+
+        _HTTP_REQUEST_CLASS = TimedHttpRequest
+    return _HTTP_REQUEST_CLASS
+
+
+def observe_lock_wait(backend: str, op: str, seconds: float) -> None:
+    store_lock_wait.observe(seconds, backend, op)
+
+
+class MetricsMiddleware:
+    """Czysty middleware ASGI: czas i status każdego żądania HTTP per szablon trasy."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Szablon ścieżki zamiast surowej – bez eksplozji liczby serii dla /api/containers/<id>
+            template = getattr(route, "path", None) or ("/static" if scope.get("path", "").startswith("/static") else "<unmatched>")
+            method = scope.get("method", "")
+            http_latency.observe(time.perf_counter() - start, method, template)
+            http_requests.inc(method, template, str(status[0]))
+
+
+def render() -> str:
+    return REGISTRY.render()
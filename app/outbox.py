@@ -0,0 +1,387 @@
+"""
+Trwała kolejka (outbox) zmian do zsynchronizowania z Google Sheets.
+
+Każda zmiana w magazynie, która ma trafić do arkusza, jest najpierw zapisywana
+lokalnie (SQLite, tabela sheets_outbox), a dopiero potem wykonywana przez drain():
+- kolejność FIFO w obrębie partycji (id kontenera) – aktualizacja produktu nie
+  wyprzedzi jego utworzenia; błąd wpisu wstrzymuje dalsze wpisy tej partycji,
+  inne partycje idą dalej; wpis dead-letter blokuje swoją partycję do replay/usunięcia,
+- równolegle (concurrency) wykonywane są tylko wpisy różnych partycji,
+- partie: sąsiednie wpisy tego samego rodzaju z obsługą zbiorczą (np. append
+  wielu wierszy) wykonywane jednym wywołaniem; starsze wpisy z tym samym kluczem
+  `dedupe` (pełny stan rekordu) są pomijane, gdy w partii jest nowszy,
+- nieudane wpisy (wyjątek lub False z handlera) ponawiane z wykładniczym backoffem;
+  po max_attempts trafiają na listę dead-letter (status "dead"), skąd replay()
+  przywraca je do kolejki,
+- wiele procesów (uvicorn --workers) może opróżniać ten sam plik: wpisy są
+  rezerwowane na czas `lease` w transakcji BEGIN IMMEDIATE.
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app import tracing
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    args TEXT NOT NULL,
+    partition TEXT NOT NULL DEFAULT '',
+    dedupe TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    claimed_until REAL NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS sheets_outbox_status ON sheets_outbox (status, id);
+"""
+
+Handler = Callable[..., Any]
+BatchHandler = Callable[[List[List[Any]]], Any]
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+
+class Outbox:
+    def __init__(
+        self,
+        path: str,
+        handlers: Dict[str, Handler],
+        batch_handlers: Optional[Dict[str, BatchHandler]] = None,
+        batch_size: int = 50,
+        max_attempts: int = 8,
+        backoff_base: float = 2.0,
+        backoff_cap: float = 300.0,
+        lease: float = 120.0,
+        concurrency: int = 1,
+    ) -> None:
+        self.path = str(path)
+        self.handlers = handlers
+        self.batch_handlers = batch_handlers or {}
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.lease = lease
+        self.concurrency = concurrency
+        self._pool: Optional[ThreadPoolExecutor] = None
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # Jedno połączenie pod lockiem – operacje outboxa są krótkie, a ":memory:" musi być współdzielone
+        self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.interval = 0.0
+        self.last_drain: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.processed = 0
+        self.failed = 0
+
+    # --- Zapis ---
+
+    def enqueue(self, kind: str, *args: Any, partition: str = "", dedupe: Optional[str] = None) -> int:
+        if kind not in self.handlers:
+            raise KeyError(f"Unknown outbox kind: {kind}")
+        payload = json.dumps(list(args), ensure_ascii=False, default=str)
+        with self._db_lock:
+            cur = self._db.execute(
+                "INSERT INTO sheets_outbox (kind, args, partition, dedupe, created) VALUES (?, ?, ?, ?, ?)",
+                (kind, payload, partition, dedupe, time.time()),
+            )
+            return int(cur.lastrowid)
+
+    # --- Opróżnianie ---
+
+    def _claim(self, now: float) -> List[Tuple[int, str, List[Any], str, Optional[str], int]]:
+        """Zarezerwuj partię wpisów gotowych do wykonania (z zachowaniem kolejności w partycjach)."""
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, kind, args, partition, dedupe, attempts, next_attempt, claimed_until, status "
+                    "FROM sheets_outbox ORDER BY id LIMIT ?",
+                    (self.batch_size * 4,),
+                ).fetchall()
+                blocked = set()
+                batch = []
+                for rid, kind, args, part, dedupe, attempts, next_attempt, claimed_until, status in rows:
+                    if status == "dead" or part in blocked or claimed_until > now or next_attempt > now:
+                        blocked.add(part)  # wcześniejszy wpis partycji czeka – kolejne też
+                        continue
+                    batch.append((rid, kind, json.loads(args), part, dedupe, attempts))
+                    if len(batch) >= self.batch_size:
+                        break
+                if batch:
+                    self._db.executemany(
+                        "UPDATE sheets_outbox SET claimed_until = ? WHERE id = ?",
+                        [(now + self.lease, b[0]) for b in batch],
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return batch
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.backoff_cap, self.backoff_base * (2 ** (attempts - 1))) * random.uniform(0.5, 1.0)
+
+    def _finish(self, done: Iterable[int], failed: Iterable[Tuple[int, int, str]], released: Iterable[int]) -> int:
+        dead = 0
+        now = time.time()
+        with self._db_lock:
+            self._db.executemany("DELETE FROM sheets_outbox WHERE id = ?", [(i,) for i in done])
+            for rid, attempts, error in failed:
+                status = "dead" if attempts >= self.max_attempts else "pending"
+                dead += status == "dead"
+                self._db.execute(
+                    "UPDATE sheets_outbox SET status = ?, attempts = ?, next_attempt = ?, claimed_until = 0, last_error = ? WHERE id = ?",
+                    (status, attempts, now + self._backoff(attempts), error[:500], rid),
+                )
+            self._db.executemany("UPDATE sheets_outbox SET claimed_until = 0 WHERE id = ?", [(i,) for i in released])
+        return dead
+
+    def _run(self, kind: str, args_list: List[List[Any]]) -> Optional[str]:
+        """Wykonaj wpis (lub partię wpisów); None = sukces, w przeciwnym razie opis błędu."""
+        try:
+            with tracing.span(f"outbox:{kind}", entries=len(args_list)):
+                if len(args_list) > 1:
+                    ok = self.batch_handlers[kind](args_list)
+                else:
+                    ok = self.handlers[kind](*args_list[0])
+            return None if ok else "handler returned False"
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+
+    def _plan(self, batch: List[Tuple[int, str, List[Any], str, Optional[str], int]]) -> Tuple[List[List[Any]], List[int]]:
+        """
+        Podziel partię na jednostki (pojedynczy wpis lub grupa appendów) i fale:
+        jednostka trafia do fali o 1 późniejszej niż poprzednia jednostka którejkolwiek
+        z jej partycji – w obrębie fali partycje się nie powtarzają, więc fale mogą iść równolegle.
+        Zwraca (fale, id wpisów zastąpionych przez nowszy wpis z tym samym kluczem dedupe).
+        """
+        latest = {b[4]: b[0] for b in batch if b[4]}
+        coalesced: List[int] = []
+        units: List[List[Any]] = []
+        i = 0
+        while i < len(batch):
+            rid, kind, _, _, dedupe, _ = batch[i]
+            if dedupe and latest[dedupe] != rid:
+                coalesced.append(rid)
+                i += 1
+                continue
+            group = [batch[i]]
+            if kind in self.batch_handlers:
+                while i + len(group) < len(batch):
+                    nxt = batch[i + len(group)]
+                    if nxt[1] != kind or (nxt[4] and latest[nxt[4]] != nxt[0]):
+                        break
+                    group.append(nxt)
+            units.append(group)
+            i += len(group)
+        waves: List[List[Any]] = []
+        last_wave: Dict[str, int] = {}
+        for group in units:
+            parts = {g[3] for g in group}
+            w = 1 + max((last_wave.get(p, -1) for p in parts), default=-1)
+            for p in parts:
+                last_wave[p] = w
+            if w == len(waves):
+                waves.append([])
+            waves[w].append(group)
+        return waves, coalesced
+
+    def _run_wave(self, groups: List[List[Any]]) -> List[Optional[str]]:
+        jobs = [(g[0][1], [e[2] for e in g]) for g in groups]
+        if self.concurrency <= 1 or len(jobs) == 1:
+            return [self._run(kind, args) for kind, args in jobs]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="sheets-outbox")
+        # kopia kontekstu – spany trafiają do trace'u wywołującego drain()
+        futures = [self._pool.submit(contextvars.copy_context().run, self._run, kind, args) for kind, args in jobs]
+        return [f.result() for f in futures]
+
+    def _drain_once(self) -> Dict[str, int]:
+        batch = self._claim(time.time())
+        stats = {"done": 0, "failed": 0, "dead": 0, "coalesced": 0}
+        if not batch:
+            return stats
+        waves, done = self._plan(batch)
+        stats["coalesced"] = len(done)
+        failed: List[Tuple[int, int, str]] = []
+        released: List[int] = []
+        blocked = set()
+        for wave in waves:
+            runnable = []
+            for group in wave:
+                # błąd wcześniejszej fali wstrzymuje dalsze wpisy tej samej partycji
+                if any(g[3] in blocked for g in group):
+                    released += [g[0] for g in group]
+                else:
+                    runnable.append(group)
+            for group, error in zip(runnable, self._run_wave(runnable)):
+                if error is None:
+                    done += [g[0] for g in group]
+                    stats["done"] += len(group)
+                    continue
+                for g in group:
+                    failed.append((g[0], g[5] + 1, error))
+                    blocked.add(g[3])
+                stats["failed"] += len(group)
+                self.last_error = error
+                logger.warning(f"[Outbox] {group[0][1]} x{len(group)} failed: {error}")
+        stats["dead"] = self._finish(done, failed, released)
+        if stats["dead"]:
+            logger.error(f"[Outbox] {stats['dead']} entries moved to dead-letter")
+        return stats
+
+    def drain(self) -> Dict[str, int]:
+        """
+        Wykonaj wszystkie wpisy gotowe do wysłania. Jeśli w tym procesie inny wątek już
+        opróżnia kolejkę, tylko oznacz ją jako „brudną” – tamten wątek zrobi kolejny przebieg.
+        """
+        total = {"done": 0, "failed": 0, "dead": 0, "coalesced": 0}
+        while True:
+            self._dirty.set()
+            if not self._drain_lock.acquire(blocking=False):
+                return total
+            try:
+                while self._dirty.is_set():
+                    self._dirty.clear()
+                    while True:
+                        stats = self._drain_once()
+                        for k in total:
+                            total[k] += stats[k]
+                        if stats["done"] + stats["failed"] + stats["coalesced"] == 0:
+                            break
+            finally:
+                self._drain_lock.release()
+                self.last_drain = time.time()
+                self.processed += total["done"] + total["coalesced"]
+                self.failed += total["failed"]
+            if not self._dirty.is_set():
+                return total
+
+    # --- Dead-letter i podgląd ---
+
+    def replay(self, ids: Optional[List[int]] = None) -> int:
+        """Przywróć wpisy do kolejki (domyślnie wszystkie dead-letter) z wyzerowanym licznikiem prób."""
+        with self._db_lock:
+            if ids:
+                marks = ",".join("?" * len(ids))
+                cur = self._db.execute(
+                    f"UPDATE sheets_outbox SET status = 'pending', attempts = 0, next_attempt = 0, claimed_until = 0 WHERE id IN ({marks})",
+                    list(ids),
+                )
+            else:
+                cur = self._db.execute(
+                    "UPDATE sheets_outbox SET status = 'pending', attempts = 0, next_attempt = 0, claimed_until = 0 WHERE status = 'dead'"
+                )
+            return cur.rowcount
+
+    def discard(self, entry_id: int) -> bool:
+        with self._db_lock:
+            return self._db.execute("DELETE FROM sheets_outbox WHERE id = ?", (entry_id,)).rowcount > 0
+
+    def entries(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        sql = "SELECT id, kind, args, partition, status, attempts, next_attempt, created, last_error FROM sheets_outbox"
+        params: List[Any] = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        with self._db_lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [
+            {
+                "id": rid, "kind": kind, "args": json.loads(args), "partition": part, "status": st,
+                "attempts": attempts, "nextAttempt": _iso(next_attempt), "created": _iso(created), "lastError": err,
+            }
+            for rid, kind, args, part, st, attempts, next_attempt, created, err in rows
+        ]
+
+    def unsynced(self) -> List[Tuple[str, List[Any], str]]:
+        """(kind, args, partition) wpisów jeszcze niezapisanych w arkuszu (pending i dead)."""
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT kind, args, partition FROM sheets_outbox WHERE status IN ('pending', 'dead') ORDER BY id"
+            ).fetchall()
+        return [(kind, json.loads(args), part) for kind, args, part in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._db_lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM sheets_outbox GROUP BY status").fetchall())
+            oldest = self._db.execute("SELECT MIN(created) FROM sheets_outbox WHERE status = 'pending'").fetchone()[0]
+        return {
+            "pending": counts.get("pending", 0),
+            "dead": counts.get("dead", 0),
+            "oldestPendingAgeSeconds": round(time.time() - oldest, 1) if oldest else None,
+            "processed": self.processed,
+            "failed": self.failed,
+            "lastDrain": _iso(self.last_drain),
+            "lastError": self.last_error,
+            "worker": self.running,
+            "maxAttempts": self.max_attempts,
+        }
+
+    # --- Wątek tła ---
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def kick(self) -> None:
+        """Obudź wątek tła (np. po replay) bez czekania na interwał."""
+        self._wake.set()
+
+    def start(self, interval: float) -> None:
+        if interval <= 0 or self.running:
+            return
+        self.interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="sheets-outbox", daemon=True)
+        self._thread.start()
+        logger.info(f"[Outbox] Worker started (interval={interval}s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.drain()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"[Outbox] Drain failed: {self.last_error}")
@@ -0,0 +1,240 @@
+"""
+Miniatury załączników: obrazy i pierwsza strona PDF, w cache adresowanym treścią.
+
+Miniatura powstaje przy uploadzie pliku i przy imporcie z Drive (treść z cache proxy
+/api/files), a dla starszych załączników – przy pierwszym żądaniu podglądu. Renderowanie
+(dekodowanie obrazu, rasteryzacja PDF) jest CPU-bound, więc działa w puli procesów
+jak raporty PDF (app.bulk_export); workers <= 0 – w bieżącym procesie.
+
+Plik miniatury to `<katalog>/<sha256 treści>[:2]/<sha256>.jpg`: ten sam plik przesłany
+kilka razy (albo pod różnymi id w Drive) ma jedną miniaturę, a odpowiedź może być
+cache'owana przez przeglądarkę bez końca. Przypisanie id pliku Drive → sha256 trzymane
+jest w `index.jsonl` (dopisywanym; ostatni wpis wygrywa), więc przetrwa restart.
+
+Obrazy obsługuje Pillow (requirements.txt). PDF wymaga opcjonalnego pypdfium2
+(poza requirements.txt) – bez niego podgląd PDF ma status „unavailable”, a
+/api/previews/status zgłasza "pdf": false.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import BrokenExecutor, Executor, Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+THUMB_SIZE = 256  # dłuższy bok miniatury (px)
+JPEG_QUALITY = 80
+PDF_MIME = "application/pdf"
+
+
+class PreviewUnavailable(RuntimeError):
+    """Brak biblioteki do danego typu pliku (PDF bez pypdfium2) – nie błąd samego pliku."""
+
+
+def pdf_supported() -> bool:
+    try:
+        import pypdfium2  # type: ignore  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def previewable(mime: Optional[str]) -> bool:
+    m = str(mime or "").lower()
+    return m == PDF_MIME or (m.startswith("image/") and m != "image/svg+xml")
+
+
+def _pdf_first_page(data: bytes, size: int):
+    try:
+        import pypdfium2 as pdfium  # type: ignore
+    except ImportError as e:
+        raise PreviewUnavailable(f"Podgląd PDF wymaga biblioteki pypdfium2: {e}")
+    pdf = pdfium.PdfDocument(data)
+    try:
+        page = pdf[0]
+        width, height = page.get_size()
+        # Skala tak, by dłuższy bok miał ~2× rozmiar miniatury (ostrzejsze zmniejszenie)
+        scale = max(0.1, 2 * size / max(width, height, 1))
+        return page.render(scale=scale).to_pil()
+    finally:
+        pdf.close()
+
+
+def render_preview(data: bytes, mime: str, size: int = THUMB_SIZE) -> bytes:
+    """JPEG miniatury (dłuższy bok ≤ size). Funkcja modułowa – musi być picklowalna dla ProcessPoolExecutor."""
+    from PIL import Image, ImageOps  # type: ignore
+
+    if str(mime).lower() == PDF_MIME:
+        img = _pdf_first_page(data, size)
+    else:
+        img = Image.open(io.BytesIO(data))
+        # JPEG: dekodowanie od razu w zmniejszonej skali (DCT) – wielokrotnie szybciej dla zdjęć z aparatu
+        img.draft("RGB", (size * 2, size * 2))
+        img = ImageOps.exif_transpose(img)
+    img.thumbnail((size, size))
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+class PreviewCache:
+    """Miniatury adresowane sha256 treści + indeks id pliku Drive → stan podglądu."""
+
+    def __init__(self, root: str, workers: int = 2, size: int = THUMB_SIZE) -> None:
+        self.root = Path(root)
+        self.workers = workers
+        self.size = size
+        self._lock = threading.Lock()
+        self._index: Dict[str, Dict[str, Any]] = {}   # id pliku → {sha, status, error}
+        self._inflight: Dict[str, List[str]] = {}      # sha → id plików czekających na tę miniaturę
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._loaded = False
+        self.rendered = self.reused = self.failed = 0
+
+    def path_for(self, sha: str) -> Path:
+        return self.root / sha[:2] / f"{sha}.jpg"
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.root / "index.jsonl", encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        rec = json.loads(line)
+                        self._index[str(rec["id"])] = {k: rec.get(k) for k in ("sha", "status", "error")}
+                    except (ValueError, KeyError):
+                        continue
+        except OSError:
+            pass
+
+    def _record(self, file_id: str, sha: str, status: str, error: Optional[str] = None) -> None:
+        """Stan podglądu pliku (pod self._lock); nowe stany końcowe dopisywane do index.jsonl."""
+        rec = {"sha": sha, "status": status, "error": error}
+        if self._index.get(file_id) == rec:
+            return
+        self._index[file_id] = rec
+        if status == "pending":
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / "index.jsonl", "a", encoding="utf-8") as fh:
+            fh.write(json.dumps({"id": file_id, "sha": sha, "status": status, "error": error}, ensure_ascii=False) + "\n")
+
+    def submit(self, file_id: str, data: bytes, mime: str) -> Dict[str, Any]:
+        """Zleć miniaturę pliku; gotowa miniatura tej samej treści jest używana od razu."""
+        sha = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._load()
+            if self.path_for(sha).exists():
+                self.reused += 1
+                self._record(file_id, sha, "ready")
+                return dict(self._index[file_id])
+            waiting = self._inflight.get(sha)
+            if waiting is not None:
+                waiting.append(file_id)
+                self._record(file_id, sha, "pending")
+                return dict(self._index[file_id])
+            self._inflight[sha] = [file_id]
+            self._record(file_id, sha, "pending")
+            if self.workers > 0 and self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            pool = self._pool if self.workers > 0 else None
+        if pool is None:
+            fut: Future = Future()
+            try:
+                fut.set_result(render_preview(data, mime, self.size))
+            except Exception as e:
+                fut.set_exception(e)
+            self._finish(sha, fut)
+        else:
+            try:
+                pool.submit(render_preview, data, mime, self.size).add_done_callback(lambda f: self._finish(sha, f, pool))
+            except Exception as e:
+                # np. BrokenProcessPool po awarii procesu – zlecenie nieudane, pula odtwarzana przy kolejnym
+                self._drop_pool(pool)
+                fut = Future()
+                fut.set_exception(e)
+                self._finish(sha, fut)
+        return self.lookup(file_id) or {}
+
+    def _drop_pool(self, pool: Executor) -> None:
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _finish(self, sha: str, fut: Future, pool: Optional[Executor] = None) -> None:
+        unavailable = False
+        try:
+            jpeg = fut.result()
+            error = None
+        except Exception as e:
+            jpeg, error = None, f"{type(e).__name__}: {e}"
+            unavailable = isinstance(e, PreviewUnavailable)
+            if isinstance(e, BrokenExecutor) and pool is not None:
+                self._drop_pool(pool)  # proces renderujący padł w trakcie – pula bezużyteczna
+        if jpeg is not None:
+            path = self.path_for(sha)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".part")
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(jpeg)
+            os.replace(tmp, path)
+        with self._lock:
+            waiting = self._inflight.pop(sha, [])
+            if jpeg is not None:
+                self.rendered += 1
+                status = "ready"
+            else:
+                self.failed += 1
+                status = "unavailable" if unavailable else "failed"
+                logger.warning(f"[Previews] {', '.join(waiting)}: {error}")
+            for file_id in waiting:
+                self._record(file_id, sha, status, error)
+
+    def lookup(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """Stan podglądu (status, sha, error i path – gdy gotowy); None – plik nieznany."""
+        with self._lock:
+            self._load()
+            rec = self._index.get(file_id)
+            if rec is None:
+                return None
+            out = dict(rec)
+        if out["status"] == "ready":
+            path = self.path_for(out["sha"])
+            if not path.exists():
+                return None  # miniatura usunięta z dysku – do ponownego wygenerowania
+            out["path"] = str(path)
+        return out
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            states: Dict[str, int] = {}
+            for rec in self._index.values():
+                states[rec["status"]] = states.get(rec["status"], 0) + 1
+            return {"dir": str(self.root), "workers": self.workers, "size": self.size, "files": states,
+                    "inFlight": len(self._inflight), "rendered": self.rendered, "reused": self.reused,
+                    "failed": self.failed, "pdf": pdf_supported()}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
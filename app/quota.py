@@ -0,0 +1,252 @@
+"""
+Wspólny harmonogram wywołań Google API (Sheets i Drive) oparty na token bucket.
+
+- Osobny kubełek per API: Sheets pozwala na ~60 żądań/min na użytkownika, Drive
+  ma własne limity (GOOGLE_SHEETS_RATE/_BURST, GOOGLE_DRIVE_RATE/_BURST;
+  rate=0 – bez limitu).
+- Priorytety: wywołania interaktywne (żądanie użytkownika – upload, product-files,
+  skan Drive) dostają token przed zadaniami w tle (synchronizacja do arkusza,
+  poller, import startowy). Zadania w tle oznacza background() / in_background().
+- Błąd limitu (429) zeruje kubełek – pozostali wywołujący zwalniają razem.
+  429 i przejściowe 5xx są ponawiane z wykładniczym backoffem z pełnym jitterem
+  (GOOGLE_RETRY_MAX, GOOGLE_RETRY_BASE, GOOGLE_RETRY_CAP); operacje
+  nieidempotentne (append, create, delete_rows) – tylko po 429.
+- Nasycenie: oczekiwanie na token dłuższe niż GOOGLE_RATE_SATURATED_S →
+  licznik google_scheduler_saturated_total i ostrzeżenie w logu (maks. raz na 30 s);
+  brak tokenu w GOOGLE_RATE_MAX_WAIT sekund → SchedulerSaturated.
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_DRIVE_OPS = ("files.", "permissions.", "get_file_drive_metadata")
+_NON_IDEMPOTENT = ("append_row", "add_worksheet", "delete_rows", "files.create", "permissions.create")
+_TRANSIENT_STATUS = (500, 502, 503, 504)
+_WARN_EVERY = 30.0
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("google_priority", default=INTERACTIVE)
+
+
+class SchedulerSaturated(RuntimeError):
+    """Brak tokenu w dopuszczalnym czasie – limit Google API wyczerpany przez kolejkę."""
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def api_of(op: str) -> Optional[str]:
+    """Kubełek dla operacji; None = poza limitem (odświeżenie tokenu OAuth)."""
+    if op == "token.refresh":
+        return None
+    return "drive" if op.startswith(_DRIVE_OPS) else "sheets"
+
+
+def retryable(op: str, exc: BaseException) -> bool:
+    if metrics.is_quota_error(exc):
+        return True
+    if op.startswith(_NON_IDEMPOTENT):
+        return False
+    return metrics.error_status(exc) in _TRANSIENT_STATUS
+
+
+class TokenBucket:
+    """rate tokenów/s, pojemność burst; bez własnego locka – chroni go Scheduler."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now: float) -> float:
+        """Weź token (zwraca 0.0) albo podaj czas do następnego tokenu."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def drain(self, now: float) -> None:
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class Scheduler:
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[float, float]],
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 16.0,
+        max_wait: float = 60.0,
+        saturated_after: float = 2.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_wait = max_wait
+        self.saturated_after = saturated_after
+        self._buckets = {api: TokenBucket(rate, burst) for api, (rate, burst) in limits.items()}
+        self._cond = threading.Condition()
+        self._waiting: Dict[Tuple[str, str], int] = {}
+        self._rnd = random.Random(seed)
+        self._last_saturated: Dict[str, float] = {}
+        self._last_warn = 0.0
+        self.retries = 0
+
+    @classmethod
+    def from_env(cls) -> "Scheduler":
+        return cls(
+            limits={
+                "sheets": (_env_float("GOOGLE_SHEETS_RATE", 0.9), _env_float("GOOGLE_SHEETS_BURST", 5)),
+                "drive": (_env_float("GOOGLE_DRIVE_RATE", 10.0), _env_float("GOOGLE_DRIVE_BURST", 20)),
+            },
+            max_retries=int(_env_float("GOOGLE_RETRY_MAX", 4)),
+            backoff_base=_env_float("GOOGLE_RETRY_BASE", 0.5),
+            backoff_cap=_env_float("GOOGLE_RETRY_CAP", 16.0),
+            max_wait=_env_float("GOOGLE_RATE_MAX_WAIT", 60.0),
+            saturated_after=_env_float("GOOGLE_RATE_SATURATED_S", 2.0),
+        )
+
+    def _mark_saturated(self, api: str, waited: float, now: float) -> None:
+        self._last_saturated[api] = time.time()
+        metrics.scheduler_saturated.inc(api)
+        if now - self._last_warn >= _WARN_EVERY:
+            self._last_warn = now
+            queued = {p: self._waiting.get((api, p), 0) for p in (INTERACTIVE, BACKGROUND)}
+            logger.warning(f"[Quota] Google {api} scheduler saturated: waited {waited:.1f}s, queued={queued}")
+
+    def acquire(self, api: str, priority: Optional[str] = None) -> float:
+        """Czekaj na token kubełka api; zwraca czas oczekiwania [s]."""
+        bucket = self._buckets.get(api)
+        if bucket is None or bucket.rate <= 0:
+            return 0.0
+        priority = priority or _priority.get()
+        key = (api, priority)
+        start = time.monotonic()
+        with self._cond:
+            self._waiting[key] = self._waiting.get(key, 0) + 1
+            metrics.scheduler_queued.set(self._waiting[key], api, priority)
+            try:
+                while True:
+                    now = time.monotonic()
+                    # tło ustępuje, dopóki na ten kubełek czeka jakiekolwiek wywołanie interaktywne
+                    yielding = priority == BACKGROUND and self._waiting.get((api, INTERACTIVE), 0) > 0
+                    wait = 0.05 if yielding else bucket.try_take(now)
+                    if not yielding and wait == 0.0:
+                        break
+                    left = self.max_wait - (now - start)
+                    if left <= 0:
+                        self._mark_saturated(api, now - start, now)
+                        raise SchedulerSaturated(f"Google {api}: no quota token within {self.max_wait:.0f}s")
+                    self._cond.wait(min(wait, left))
+            finally:
+                self._waiting[key] -= 1
+                metrics.scheduler_queued.set(self._waiting[key], api, priority)
+                self._cond.notify_all()
+            waited = time.monotonic() - start
+            if waited >= self.saturated_after:
+                self._mark_saturated(api, waited, time.monotonic())
+        metrics.scheduler_wait.observe(waited, api, priority)
+        return waited
+
+    def _backoff(self, attempt: int) -> float:
+        with self._cond:
+            return self._rnd.uniform(0.0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def call(self, op: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Wywołanie Google API: token → pomiar (metrics.google_call) → ponowienia po 429/5xx."""
+        api = api_of(op)
+        attempt = 0
+        while True:
+            if api is not None:
+                self.acquire(api)
+            try:
+                with metrics.google_call(op):
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                if api is not None and metrics.is_quota_error(e):
+                    with self._cond:
+                        bucket = self._buckets.get(api)
+                        if bucket is not None:
+                            bucket.drain(time.monotonic())
+                if attempt >= self.max_retries or not retryable(op, e):
+                    raise
+                delay = self._backoff(attempt)
+                attempt += 1
+                self.retries += 1
+                metrics.google_retries.inc(op)
+                logger.info(f"[Quota] {op} failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        apis: Dict[str, Any] = {}
+        with self._cond:
+            for api, b in self._buckets.items():
+                b._refill(now)
+                last = self._last_saturated.get(api)
+                apis[api] = {
+                    "rate": b.rate,
+                    "burst": b.burst,
+                    "tokens": round(b.tokens, 2) if b.rate > 0 else None,
+                    "queued": {p: self._waiting.get((api, p), 0) for p in (INTERACTIVE, BACKGROUND)},
+                    "lastSaturated": datetime.fromtimestamp(last, timezone.utc).isoformat() if last else None,
+                    "saturated": bool(last and time.time() - last < 60),
+                }
+        return {"apis": apis, "retries": self.retries, "maxRetries": self.max_retries, "maxWaitSeconds": self.max_wait}
+
+
+SCHEDULER = Scheduler.from_env()
+
+
+def call(op: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    return SCHEDULER.call(op, fn, *args, **kwargs)
+
+
+@contextmanager
+def in_background() -> Iterator[None]:
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def background(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Dekorator: wywołania Google API wewnątrz fn mają priorytet tła."""
+
+    @functools.wraps(fn)
+    def run(*args: Any, **kwargs: Any) -> Any:
+        with in_background():
+            return fn(*args, **kwargs)
+
+    return run
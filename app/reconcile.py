@@ -0,0 +1,244 @@
+"""
+Uzgadnianie magazynu in-memory z arkuszem Google Sheets (row-hash diff).
+
+Zamiast kasować i odtwarzać wszystkie kontenery/produkty, każdy wiersz
+arkusza i każdy rekord w pamięci sprowadzany jest do skrótu (hash) pól
+biznesowych. Rekordy dopasowywane są po `id`, a następnie:
+- kontenery po nazwie (case-insensitive),
+- produkty po (containerId, name), potem (containerName, name).
+Do zastosowania trafiają wyłącznie różnice: inserty, update'y i delete'y.
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+PRODUCT_FIELDS = ["name", "quantity", "totalPrice", "totalPriceCurrency", "productCbm", "customsDutyPercent"]
+
+
+def _norm(v: Any) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "1" if v else "0"
+    return str(v).strip()
+
+
+def row_hash(rec: Dict[str, Any], fields: List[str]) -> str:
+    """Skrót pól biznesowych rekordu (kolejność wg fields; brak → '')."""
+    h = hashlib.blake2b(digest_size=16)
+    for f in fields:
+        h.update(_norm(rec.get(f)).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def _key(s: Any) -> str:
+    return str(s or "").strip().lower()
+
+
+def plan(
+    data: List[Dict[str, Any]],
+    sheet_containers: List[Dict[str, Any]],
+    sheet_products: List[Dict[str, Any]],
+    container_fields: List[str],
+) -> Dict[str, Any]:
+    """
+    Wyznacz różnice arkusz → pamięć. Nie modyfikuje danych.
+    container_fields: pola porównywane dla kontenerów (bez 'id').
+    """
+    # --- Kontenery ---
+    mem_by_id = {str(c.get("id")): c for c in data}
+    mem_by_name: Dict[str, Dict[str, Any]] = {}
+    for c in data:
+        mem_by_name.setdefault(_key(c.get("name")), c)
+
+    c_inserts: List[Dict[str, Any]] = []
+    c_updates: List[Dict[str, Any]] = []
+    matched_ids: Dict[int, str] = {}  # index wiersza arkusza → id kontenera w pamięci
+    claimed: set = set()
+    for i, row in enumerate(sheet_containers):
+        target = None
+        rid = str(row.get("id") or "").strip()
+        if rid and rid in mem_by_id and rid not in claimed:
+            target = mem_by_id[rid]
+        if target is None:
+            cand = mem_by_name.get(_key(row.get("name")))
+            if cand is not None and str(cand.get("id")) not in claimed and (not rid or rid not in mem_by_id):
+                target = cand
+        if target is None:
+            c_inserts.append({"row": i, "record": row})
+            continue
+        tid = str(target.get("id"))
+        claimed.add(tid)
+        matched_ids[i] = tid
+        if row_hash(row, container_fields) != row_hash(target, container_fields):
+            changed = [f for f in container_fields if _norm(row.get(f)) != _norm(target.get(f))]
+            c_updates.append({"id": tid, "record": row, "changed": changed})
+    c_deletes = [str(c.get("id")) for c in data if str(c.get("id")) not in claimed]
+    deleted_set = set(c_deletes)
+
+    # --- Produkty ---
+    # Kontenery docelowe po zastosowaniu planu (istniejące dopasowane + nowe z arkusza)
+    sheet_cid_to_target: Dict[str, Optional[str]] = {}
+    name_to_target: Dict[str, Optional[str]] = {}
+    for i, row in enumerate(sheet_containers):
+        target_id: Optional[str] = matched_ids.get(i)
+        if target_id is None:
+            target_id = "new:%d" % i
+        rid = str(row.get("id") or "").strip()
+        if rid:
+            sheet_cid_to_target[rid] = target_id
+        name_to_target.setdefault(_key(row.get("name")), target_id)
+
+    mem_products: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    mem_by_cid_name: Dict[Tuple[str, str], str] = {}
+    for c in data:
+        for p in c.get("products") or []:
+            pid = str(p.get("id"))
+            mem_products[pid] = (str(c.get("id")), p)
+            mem_by_cid_name.setdefault((str(c.get("id")), _key(p.get("name"))), pid)
+
+    p_inserts: List[Dict[str, Any]] = []
+    p_updates: List[Dict[str, Any]] = []
+    unmatched: List[Dict[str, Any]] = []
+    p_claimed: set = set()
+    for i, row in enumerate(sheet_products):
+        cid = str(row.get("containerId") or "").strip()
+        target_cid = sheet_cid_to_target.get(cid) if cid else None
+        if target_cid is None and cid in mem_by_id and cid not in deleted_set:
+            target_cid = cid
+        if target_cid is None:
+            target_cid = name_to_target.get(_key(row.get("containerName")))
+        if target_cid is None:
+            unmatched.append({"row": i, "name": row.get("name"), "containerId": cid or None,
+                              "containerName": row.get("containerName")})
+            continue
+        pid = str(row.get("id") or "").strip()
+        match: Optional[str] = pid if pid in mem_products and pid not in p_claimed else None
+        if match is None:
+            cand = mem_by_cid_name.get((target_cid, _key(row.get("name"))))
+            if cand is not None and cand not in p_claimed:
+                match = cand
+        if match is None:
+            p_inserts.append({"row": i, "containerId": target_cid, "record": row})
+            continue
+        p_claimed.add(match)
+        cur_cid, cur = mem_products[match]
+        moved = cur_cid != target_cid
+        if moved or row_hash(row, PRODUCT_FIELDS) != row_hash(cur, PRODUCT_FIELDS):
+            changed = [f for f in PRODUCT_FIELDS if _norm(row.get(f)) != _norm(cur.get(f))]
+            if moved:
+                changed.append("containerId")
+            p_updates.append({"id": match, "containerId": target_cid, "fromContainerId": cur_cid,
+                              "record": row, "changed": changed})
+    p_deletes = [{"id": pid, "containerId": cid} for pid, (cid, _) in mem_products.items()
+                 if pid not in p_claimed and cid not in deleted_set]
+
+    return {
+        "containers": {"insert": c_inserts, "update": c_updates, "delete": c_deletes},
+        "products": {"insert": p_inserts, "update": p_updates, "delete": p_deletes, "unmatched": unmatched},
+    }
+
+
+def hold(diff: Dict[str, Any], container_ids: Iterable[str]) -> Dict[str, Any]:
+    """
+    Plan bez zmian w kontenerach `container_ids` (zmiany jeszcze niezapisane w arkuszu – outbox):
+    arkusz nie zna ich jeszcze, więc nie może ich usunąć, cofnąć ani odtworzyć usuniętych.
+    Zwraca nowy plan; pominięte kontenery w kluczu "held".
+    """
+    held = {str(c) for c in container_ids}
+    if not held:
+        return diff
+    cd, pd = diff["containers"], diff["products"]
+    dropped_new = {"new:%d" % ins["row"] for ins in cd["insert"] if _norm(ins["record"].get("id")) in held}
+    blocked = held | dropped_new
+    return {
+        "containers": {
+            "insert": [i for i in cd["insert"] if "new:%d" % i["row"] not in dropped_new],
+            "update": [u for u in cd["update"] if u["id"] not in held],
+            "delete": [c for c in cd["delete"] if c not in held],
+        },
+        "products": {
+            "insert": [i for i in pd["insert"] if i["containerId"] not in blocked],
+            "update": [u for u in pd["update"] if u["containerId"] not in blocked and u["fromContainerId"] not in held],
+            "delete": [d for d in pd["delete"] if d["containerId"] not in held],
+            "unmatched": pd["unmatched"],
+        },
+        "held": sorted(held),
+    }
+
+
+def apply(
+    data: List[Dict[str, Any]],
+    diff: Dict[str, Any],
+    make_container: Callable[[Dict[str, Any]], Dict[str, Any]],
+    make_product: Callable[[Dict[str, Any]], Dict[str, Any]],
+) -> Dict[str, int]:
+    """
+    Zastosuj plan do listy kontenerów (w miejscu). make_container/make_product
+    budują pełne rekordy (walidacja pydantic, domyślne wartości, pickupDate).
+    """
+    cd = diff["containers"]
+    pd = diff["products"]
+    deleted = set(cd["delete"])
+    data[:] = [c for c in data if str(c.get("id")) not in deleted]
+    by_id = {str(c.get("id")): c for c in data}
+
+    for upd in cd["update"]:
+        c = by_id[upd["id"]]
+        fresh = make_container({**upd["record"], "id": upd["id"]})
+        fresh["products"] = c.get("products") or []
+        c.clear()
+        c.update(fresh)
+
+    new_ids: Dict[str, str] = {}
+    for ins in cd["insert"]:
+        c = make_container(ins["record"])
+        c["products"] = []
+        data.append(c)
+        by_id[str(c["id"])] = c
+        new_ids["new:%d" % ins["row"]] = str(c["id"])
+
+    def resolve(cid: str) -> Dict[str, Any]:
+        return by_id[new_ids.get(cid, cid)]
+
+    for d in pd["delete"]:
+        c = by_id.get(d["containerId"])
+        if c is not None:
+            c["products"] = [p for p in (c.get("products") or []) if str(p.get("id")) != d["id"]]
+
+    for upd in pd["update"]:
+        src = by_id.get(upd["fromContainerId"])
+        src_products = list((src or {}).get("products") or [])
+        old = next((p for p in src_products if str(p.get("id")) == upd["id"]), None)
+        fresh = make_product({**upd["record"], "id": upd["id"], "files": (old or {}).get("files") or []})
+        # arkusz nie ma kolumn załączników – metadane plików zostają z rekordu w pamięci
+        if (old or {}).get("attachments"):
+            fresh["attachments"] = old["attachments"]
+        if upd["fromContainerId"] == upd["containerId"]:
+            src["products"] = [fresh if str(p.get("id")) == upd["id"] else p for p in src_products]
+            continue
+        if src is not None:
+            src["products"] = [p for p in src_products if str(p.get("id")) != upd["id"]]
+        dst = resolve(upd["containerId"])
+        dst["products"] = list(dst.get("products") or []) + [fresh]
+
+    for ins in pd["insert"]:
+        dst = resolve(ins["containerId"])
+        dst["products"] = list(dst.get("products") or []) + [make_product(ins["record"])]
+
+    return summary(diff)
+
+
+def summary(diff: Dict[str, Any]) -> Dict[str, int]:
+    cd, pd = diff["containers"], diff["products"]
+    return {
+        "containersInserted": len(cd["insert"]),
+        "containersUpdated": len(cd["update"]),
+        "containersDeleted": len(cd["delete"]),
+        "productsInserted": len(pd["insert"]),
+        "productsUpdated": len(pd["update"]),
+        "productsDeleted": len(pd["delete"]),
+        "productsUnmatched": len(pd["unmatched"]),
+    }
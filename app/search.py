@@ -0,0 +1,372 @@
+"""
+Indeks wyszukiwania pełnotekstowego i rozmytego (trigramy) po kontenerach,
+produktach i nazwach plików załączników.
+
+Dokument to nazwa kontenera, produktu albo pliku. Tekst jest normalizowany
+(małe litery, bez polskich znaków, same litery/cyfry) i trafia do dwóch
+indeksów odwróconych:
+- słowo → dokumenty,
+- trigram (z ogranicznikami, np. "$kr", "krz", …) → słowa słownika.
+Słowo zapytania rozwijane jest na kilka najbliższych słów słownika
+(współczynnik Dice trigramów, prefiks przy wpisywaniu, 1.0 dla trafienia
+dokładnego) – literówki i odmiana ("krzeslo"/"krzesła") nadal trafiają.
+Słownik jest wielokrotnie mniejszy niż liczba dokumentów, a łączenie list
+dokumentów to operacje na zbiorach (w C) – bez pętli Pythona po każdym
+dokumencie, więc zapytanie na 50 tys. produktów mieści się w milisekundach.
+
+Indeks aktualizowany jest przyrostowo: magazyn zgłasza id zmienionego
+kontenera (Store.add_change_listener), a przy następnym zapytaniu
+przeindeksowany zostaje tylko ten kontener. Operacja zbiorcza (replace_all,
+transakcja, zapis innego workera) oznacza pełną przebudowę.
+
+Matcher – dopasowanie nazw kontenerów przy importach (arkusz, plik, Drive):
+domyślnie wyłącznie po normalizacji. Rozmycie (próg < 1) jest opcjonalne;
+wymaga zgodności wszystkich ciągów cyfr – także wewnątrz kodów typu
+"MSKU1234567" – i pojedynczych liter ("B-12" ≠ "A-12") oraz odrzuca remisy.
+suggest() zwraca najbliższą nazwę tylko jako podpowiedź dla użytkownika.
+"""
+from __future__ import annotations
+
+import heapq
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlparse
+
+from app import attachments
+from app.storage import ChangeTracker
+
+KINDS = ("container", "product", "attachment")
+_KIND_ORDER = {k: i for i, k in enumerate(KINDS)}
+_FOLD = str.maketrans({"ł": "l", "Ł": "l", "ø": "o", "đ": "d", "ß": "ss"})
+_DIGITS = re.compile(r"\d+")
+
+
+def normalize(text: Any) -> str:
+    """Małe litery bez diakrytyków; wszystko poza literami i cyframi → spacja."""
+    s = unicodedata.normalize("NFKD", str(text or "").translate(_FOLD).casefold())
+    out = []
+    for ch in s:
+        if unicodedata.combining(ch):
+            continue
+        out.append(ch if ch.isalnum() else " ")
+    return " ".join("".join(out).split())
+
+
+def tokens(text: Any) -> List[str]:
+    return normalize(text).split()
+
+
+def trigrams(words: Iterable[str]) -> Set[str]:
+    grams: Set[str] = set()
+    for w in words:
+        padded = f"${w}$"
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a: Any, b: Any) -> float:
+    """Współczynnik Dice trigramów dwóch nazw (0..1)."""
+    ga, gb = trigrams(tokens(a)), trigrams(tokens(b))
+    if not ga or not gb:
+        return 0.0
+    return 2.0 * len(ga & gb) / (len(ga) + len(gb))
+
+
+def attachment_name(file: Any) -> Optional[str]:
+    """Nazwa pliku załącznika: pole name rekordu albo ostatni segment ścieżki URL (bez URL-i Drive po id)."""
+    if isinstance(file, dict):
+        return str(file.get("name") or "") or None
+    try:
+        path = urlparse(str(file or "")).path
+    except ValueError:
+        return None
+    name = unquote(path.rsplit("/", 1)[-1])
+    # drive.google.com/uc?id=…, /file/d/<id>/view – bez nazwy w URL
+    if not name or name in ("uc", "view", "edit", "download") or "." not in name:
+        return None
+    return name
+
+
+class _Doc:
+    __slots__ = ("kind", "container_id", "product_id", "name", "url", "words", "ref")
+
+    def __init__(self, kind: str, container_id: str, product_id: Optional[str], name: str,
+                 url: Optional[str], ref: Dict[str, Any]) -> None:
+        self.kind = kind
+        self.container_id = container_id
+        self.product_id = product_id
+        self.name = name
+        self.url = url
+        self.words = set(tokens(name))
+        self.ref = ref  # {"containerName": …} – wspólny dla dokumentów kontenera
+
+
+class SearchIndex:
+    """Indeks odwrócony słów i trigramów słownika; `refresh()` nanosi zgłoszone zmiany magazynu."""
+
+    def __init__(self, max_expansions: int = 8) -> None:
+        self.max_expansions = max_expansions  # najbardziej podobne słowa słownika na słowo zapytania
+        self._lock = threading.Lock()
+        self._docs: Dict[int, _Doc] = {}
+        self._by_container: Dict[str, List[int]] = {}
+        self._by_kind: Dict[str, Set[int]] = {k: set() for k in KINDS}
+        self._words: Dict[str, Set[int]] = {}  # słowo → dokumenty
+        self._grams: Dict[str, Set[str]] = {}  # trigram → słowa słownika
+        self._gram_count: Dict[str, int] = {}  # słowo → liczba jego trigramów (mianownik Dice)
+        self._next = 0
+        self._changes = ChangeTracker()
+        self.builds = 0
+        self.updates = 0
+
+    # --- Zgłoszenia zmian (bez czytania magazynu – wywoływane pod jego blokadą) ---
+    def invalidate(self, container_id: Optional[str] = None) -> None:
+        self._changes.invalidate(container_id)
+
+    def refresh(self, list_containers: Callable[[], List[Dict[str, Any]]],
+                get_container: Callable[[str], Optional[Dict[str, Any]]]) -> None:
+        stale, dirty = self._changes.take()
+        # Zmiany zgłoszone w trakcie odczytu trafią do następnego refresh()
+        if stale:
+            self.rebuild(list_containers())
+            return
+        for cid in dirty:
+            self.index_container(get_container(cid), cid)
+
+    # --- Utrzymanie indeksu ---
+    def rebuild(self, containers: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._docs.clear()
+            self._by_container.clear()
+            self._by_kind = {k: set() for k in KINDS}
+            self._words.clear()
+            self._grams.clear()
+            self._gram_count.clear()
+            self._next = 0
+            for c in containers:
+                self._add_container(c)
+            self.builds += 1
+
+    def index_container(self, container: Optional[Dict[str, Any]], container_id: Optional[str] = None) -> None:
+        """Przeindeksuj jeden kontener (None – kontener usunięty)."""
+        cid = str(container.get("id")) if container is not None else str(container_id)
+        with self._lock:
+            self._remove_container(cid)
+            if container is not None:
+                self._add_container(container)
+            self.updates += 1
+
+    def _add_container(self, c: Dict[str, Any]) -> None:
+        cid = str(c.get("id"))
+        ref = {"containerName": str(c.get("name") or "")}
+        docs = [_Doc("container", cid, None, ref["containerName"], None, ref)]
+        for p in c.get("products") or []:
+            pid = str(p.get("id"))
+            docs.append(_Doc("product", cid, pid, str(p.get("name") or ""), None, ref))
+            for f in attachments.resolved(p):
+                name = attachment_name(f)
+                if name:
+                    url = f.get("url") if isinstance(f, dict) else str(f)
+                    docs.append(_Doc("attachment", cid, pid, name, url, ref))
+        ids = self._by_container.setdefault(cid, [])
+        for d in docs:
+            if not d.words:
+                continue
+            n = self._next
+            self._next += 1
+            self._docs[n] = d
+            self._by_kind[d.kind].add(n)
+            ids.append(n)
+            for w in d.words:
+                docs_of = self._words.get(w)
+                if docs_of is None:
+                    docs_of = self._words[w] = set()
+                    grams = trigrams((w,))
+                    self._gram_count[w] = len(grams)
+                    for g in grams:
+                        self._grams.setdefault(g, set()).add(w)
+                docs_of.add(n)
+
+    def _remove_container(self, cid: str) -> None:
+        for n in self._by_container.pop(cid, []):
+            d = self._docs.pop(n)
+            self._by_kind[d.kind].discard(n)
+            for w in d.words:
+                docs_of = self._words[w]
+                docs_of.discard(n)
+                if not docs_of:
+                    del self._words[w]
+                    del self._gram_count[w]
+                    for g in trigrams((w,)):
+                        words = self._grams[g]
+                        words.discard(w)
+                        if not words:
+                            del self._grams[g]
+
+    # --- Zapytania ---
+    def _expand(self, word: str, min_score: float) -> List[Tuple[float, str]]:
+        """Słowa słownika podobne do słowa zapytania: (podobieństwo, słowo), malejąco."""
+        q_grams = trigrams((word,))
+        common: Counter = Counter()
+        for g in q_grams:
+            words = self._grams.get(g)
+            if words:
+                common.update(words)
+        out: List[Tuple[float, str]] = []
+        n_grams = len(q_grams)
+        gram_count = self._gram_count
+        for w, shared in common.items():
+            if w == word:
+                score = 1.0
+            else:
+                score = 2.0 * shared / (n_grams + gram_count[w])
+                # wpisywanie na bieżąco: słowo zapytania jako początek słowa nazwy
+                if len(word) >= 2 and w.startswith(word):
+                    score = max(score, 0.9)
+            if score >= min_score:
+                out.append((score, w))
+        return heapq.nsmallest(self.max_expansions, out, key=lambda x: (-x[0], x[1]))
+
+    def search(self, query: str, kinds: Optional[Iterable[str]] = None, offset: int = 0, limit: int = 20,
+               min_score: float = 0.4) -> Dict[str, Any]:
+        """
+        Każde słowo zapytania musi trafić (dokładnie, prefiksem albo rozmycie) w słowo nazwy.
+        Wynik dokumentu – średnie podobieństwo słów; remis → kolejność indeksowania.
+        """
+        words = list(dict.fromkeys(tokens(query)))
+        empty = {"query": query, "total": 0, "offset": offset, "limit": limit, "results": []}
+        if not words:
+            return empty
+        with self._lock:
+            allowed: Optional[Set[int]] = None
+            if kinds:
+                allowed = set().union(*(self._by_kind.get(k, set()) for k in kinds))
+            # Najpierw słowo o najmniejszej liczbie dokumentów – kolejne słowa przecinane są już tylko
+            # z jego kandydatami (iloczyn zbiorów iteruje po mniejszym), a nie z całym słownikiem
+            expanded = [self._expand(word, min_score) for word in words]
+            expanded.sort(key=lambda ex: sum(len(self._words[w]) for _, w in ex))
+            # Koszyki (suma podobieństw, dokumenty) – operacje na zbiorach w C zamiast pętli po dokumentach
+            buckets: Optional[Dict[float, Set[int]]] = None
+            for expansions in expanded:
+                seen: Set[int] = set()
+                per_word: List[Tuple[float, Set[int]]] = []
+                scope = allowed if buckets is None else set().union(*buckets.values())
+                for score, w in expansions:
+                    docs = self._words[w] - seen if scope is None else (scope & self._words[w]) - seen
+                    if docs:
+                        seen |= docs
+                        per_word.append((score, docs))
+                if buckets is None:
+                    buckets = {}
+                    for score, docs in per_word:
+                        buckets.setdefault(score, set()).update(docs)
+                else:
+                    merged: Dict[float, Set[int]] = {}
+                    for acc, acc_docs in buckets.items():
+                        for score, docs in per_word:
+                            both = acc_docs & docs
+                            if both:
+                                merged.setdefault(round(acc + score, 9), set()).update(both)
+                    buckets = merged
+                if not buckets:
+                    return empty
+            ordered = sorted((buckets or {}).items(), key=lambda x: -x[0])
+            total = sum(len(docs) for _, docs in ordered)
+            results: List[Dict[str, Any]] = []
+            skip = offset
+            for score, docs in ordered:
+                if len(results) >= limit:
+                    break
+                if skip >= len(docs):
+                    skip -= len(docs)
+                    continue
+                for n in sorted(docs)[skip:skip + limit - len(results)]:
+                    results.append(self._result(self._docs[n], score / len(words)))
+                skip = 0
+        return {"query": query, "total": total, "offset": offset, "limit": limit, "results": results}
+
+    @staticmethod
+    def _result(d: _Doc, score: float) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "kind": d.kind,
+            "score": round(score, 3),
+            "name": d.name,
+            "containerId": d.container_id,
+            "containerName": d.ref["containerName"],
+        }
+        if d.product_id is not None:
+            out["productId"] = d.product_id
+        if d.url:
+            out["url"] = d.url
+        return out
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": {k: len(v) for k, v in self._by_kind.items()},
+                "words": len(self._words),
+                "trigrams": len(self._grams),
+                "builds": self.builds,
+                "updates": self.updates,
+                "pending": self._changes.pending(),
+            }
+
+
+class Matcher:
+    """
+    Dopasowanie nazwy do jednego z kluczy po normalizacji. Rozmycie trigramowe tylko przy
+    threshold < 1 (jawne włączenie) – podobne nazwy różnych kontenerów nie mogą się scalić.
+    """
+
+    def __init__(self, items: Iterable[Tuple[Hashable, Any]], threshold: float = 1.0, margin: float = 0.05) -> None:
+        self.threshold = threshold
+        self.margin = margin
+        self._exact: Dict[str, Hashable] = {}
+        self._items: List[Tuple[Hashable, Set[str], Set[str]]] = []
+        for key, name in items:
+            self.add(key, name)
+
+    @staticmethod
+    def _codes(norm: str) -> Counter:
+        """Wyróżniki, które muszą się zgadzać: każdy ciąg cyfr (także w "msku1234567") i pojedyncze litery."""
+        return Counter(_DIGITS.findall(norm) + [w for w in norm.split() if len(w) == 1 and w.isalpha()])
+
+    def add(self, key: Hashable, name: Any) -> None:
+        norm = normalize(name)
+        if not norm:
+            return
+        self._exact.setdefault(norm, key)
+        self._items.append((key, trigrams(norm.split()), self._codes(norm)))
+
+    def _ranked(self, norm: str, codes: bool = True) -> List[Tuple[float, Hashable]]:
+        grams, own = trigrams(norm.split()), self._codes(norm)
+        best = [(2.0 * len(grams & cand) / (len(grams) + len(cand)), key)
+                for key, cand, cand_codes in self._items if not codes or cand_codes == own]
+        best.sort(key=lambda x: -x[0])
+        return best
+
+    def match(self, name: Any) -> Optional[Hashable]:
+        norm = normalize(name)
+        if not norm:
+            return None
+        if norm in self._exact:
+            return self._exact[norm]
+        if self.threshold >= 1.0:
+            return None
+        best = self._ranked(norm)
+        if not best or best[0][0] < self.threshold:
+            return None
+        # Remis (dwa podobne kandydaty) – bez zgadywania
+        if len(best) > 1 and best[1][1] != best[0][1] and best[0][0] - best[1][0] < self.margin:
+            return None
+        return best[0][1]
+
+    def suggest(self, name: Any, min_score: float = 0.6) -> Optional[Hashable]:
+        """Najbardziej podobny klucz (bez wymogu zgodności cyfr) – podpowiedź, nie dopasowanie."""
+        norm = normalize(name)
+        if not norm:
+            return None
+        best = self._ranked(norm, codes=False)
+        return best[0][1] if best and best[0][0] >= min_score else None
@@ -0,0 +1,236 @@
+"""
+Konfiguracja aplikacji jako niezmienny snapshot, przeładowywany tylko po zmianie `.env`.
+
+Wcześniej każde żądanie (middleware Basic Auth, /api/version, helpery Sheets
+i Drive) czytało i parsowało `.env` z dysku, a /api/version uruchamiało
+`git rev-parse` przy każdym wywołaniu. Teraz:
+- `.env` wczytywany jest raz przy starcie do os.environ (zmienne ustawione
+  w środowisku mają pierwszeństwo – jak dotąd),
+- SettingsStore.get() zwraca gotowy obiekt Settings; mtime pliku sprawdzany
+  jest najwyżej raz na `check_interval` sekund, a plik parsowany ponownie
+  tylko po zmianie mtime (klucze z pliku są wtedy aktualizowane/usuwane),
+- SHA builda rozwiązywany raz: zmienne CI/Vercel, a gdy ich brak – jeden
+  `git rev-parse` na proces.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict
+
+logger = logging.getLogger(__name__)
+
+_SHA_VARS = ("VERCEL_GIT_COMMIT_SHA", "GIT_COMMIT_SHA", "SHORT_SHA", "COMMIT_SHA")
+_BUILD_VARS = ("APP_BUILD_NUMBER", "COMMIT_COUNT", "BUILD_NUMBER")
+
+
+def parse_env_file(path: Path) -> Dict[str, str]:
+    """Parsuj plik KEY=VALUE (komentarze #, cudzysłowy, sekwencje \\n); błąd odczytu → {}."""
+    out: Dict[str, str] = {}
+    try:
+        text = path.read_text(encoding="utf-8")
+    except Exception:
+        return out
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        key, sep, value = line.partition("=")
+        if sep != "=":
+            continue
+        k = key.strip()
+        v = value.strip()
+        # Usuń otaczające cudzysłowy, jeśli są
+        if (v.startswith('"') and v.endswith('"')) or (v.startswith("'") and v.endswith("'")):
+            v = v[1:-1]
+        # Rozwiń sekwencje \n (np. w PRIVATE_KEY)
+        out[k] = v.replace("\\n", "\n")
+    return out
+
+
+def _float(value: Optional[str], default: float) -> float:
+    try:
+        return float(value) if value not in (None, "") else default
+    except ValueError:
+        return default
+
+
+class Settings(BaseModel):
+    """Snapshot konfiguracji czytanej w ścieżce żądania (auth, Sheets, Drive, wersja)."""
+
+    model_config = ConfigDict(frozen=True)
+
+    loaded_at: str
+    env_mtime: Optional[float] = None
+
+    # Google Sheets / Drive
+    file_id: Optional[str] = None
+    drive_folder_id: Optional[str] = None
+    google_fake: bool = False
+    service_account: Optional[Tuple[Tuple[str, str], ...]] = None
+    oauth_client_id: Optional[str] = None
+    oauth_client_secret: Optional[str] = None
+    oauth_refresh_token: Optional[str] = None
+    oauth_token_uri: str = "https://oauth2.googleapis.com/token"
+    drive_public: bool = True  # DRIVE_PUBLIC=1 – pliki w Drive publiczne, proxy /api/files bez auth
+
+    # Basic Auth
+    vercel: bool = False
+    basic_auth_force: bool = False
+    basic_auth_username: str = ""
+    basic_auth_password: str = ""
+    basic_auth_exclude: Tuple[str, ...] = ()
+    basic_auth_cache_ttl: float = 60.0
+
+    # Wersja
+    build_sha: Optional[str] = None
+    build_number: Optional[int] = None
+    env_name: str = "development"
+
+    @property
+    def basic_auth_enabled(self) -> bool:
+        # W produkcji (VERCEL) – egzekwuj Basic Auth; lokalnie tylko z BASIC_AUTH_FORCE=1
+        if not self.vercel and not self.basic_auth_force:
+            return False
+        return bool(self.basic_auth_username) and bool(self.basic_auth_password)
+
+    @property
+    def oauth_configured(self) -> bool:
+        return bool(self.oauth_client_id and self.oauth_client_secret and self.oauth_refresh_token)
+
+    def service_account_info(self) -> Optional[Dict[str, str]]:
+        return dict(self.service_account) if self.service_account else None
+
+    @classmethod
+    def from_env(cls, env_mtime: Optional[float], build_sha: Optional[str]) -> "Settings":
+        env = os.environ
+        google_fake = env.get("GOOGLE_FAKE", "0") == "1"
+        service_account = None
+        if env.get("CLIENT_EMAIL") and env.get("PRIVATE_KEY"):
+            service_account = (
+                ("type", env.get("TYPE", "service_account")),
+                ("project_id", env.get("PROJECT_ID", "")),
+                ("private_key_id", env.get("PRIVATE_KEY_ID", "")),
+                ("private_key", env.get("PRIVATE_KEY", "").replace("\\n", "\n")),
+                ("client_email", env.get("CLIENT_EMAIL", "")),
+                ("client_id", env.get("CLIENT_ID", "")),
+                ("auth_uri", env.get("AUTH_URI", "https://accounts.google.com/o/oauth2/auth")),
+                ("token_uri", env.get("TOKEN_URI", "https://oauth2.googleapis.com/token")),
+                ("auth_provider_x509_cert_url", env.get("AUTH_PROVIDER_X509_CERT_URL", "https://www.googleapis.com/oauth2/v1/certs")),
+                ("client_x509_cert_url", env.get("CLIENT_X509_CERT_URL", "")),
+                ("universe_domain", env.get("UNIVERSE_DOMAIN", "googleapis.com")),
+            )
+        build_number: Optional[int] = None
+        build_env = next((env[k] for k in _BUILD_VARS if env.get(k)), None)
+        if build_env:
+            try:
+                build_number = int(str(build_env).strip())
+            except ValueError:
+                build_number = None
+        vercel = bool(env.get("VERCEL"))
+        return cls(
+            loaded_at=datetime.now(timezone.utc).isoformat(),
+            env_mtime=env_mtime,
+            # GOOGLE_FAKE=1 bez FILE_ID – arkusz atrapy o stałym kluczu
+            file_id=env.get("FILE_ID") or ("fake-spreadsheet" if google_fake else None),
+            drive_folder_id=env.get("FOLDER_ID") or env.get("DRIVE_FOLDER_ID") or None,
+            google_fake=google_fake,
+            service_account=service_account,
+            oauth_client_id=env.get("OAUTH_CLIENT_ID") or None,
+            oauth_client_secret=env.get("OAUTH_CLIENT_SECRET") or None,
+            oauth_refresh_token=env.get("OAUTH_REFRESH_TOKEN") or None,
+            oauth_token_uri=env.get("OAUTH_TOKEN_URI", "https://oauth2.googleapis.com/token"),
+            drive_public=env.get("DRIVE_PUBLIC", "1") == "1",
+            vercel=vercel,
+            basic_auth_force=(env.get("BASIC_AUTH_FORCE") or "").strip() == "1",
+            basic_auth_username=env.get("BASIC_AUTH_USERNAME", ""),
+            basic_auth_password=env.get("BASIC_AUTH_PASSWORD", ""),
+            basic_auth_exclude=tuple(s.strip() for s in env.get("BASIC_AUTH_EXCLUDE", "").split(",") if s.strip()),
+            basic_auth_cache_ttl=_float(env.get("BASIC_AUTH_CACHE_TTL"), 60.0),
+            build_sha=build_sha,
+            build_number=build_number,
+            env_name=env.get("VERCEL_ENV") or ("production" if vercel else "development"),
+        )
+
+
+class SettingsStore:
+    """Bieżący snapshot Settings; przeładowanie po zmianie mtime `.env` lub jawnie przez reload()."""
+
+    def __init__(self, env_path: Path, check_interval: float = 1.0) -> None:
+        self.env_path = Path(env_path)
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._file_values: Dict[str, str] = {}  # klucze wpisane do os.environ z pliku
+        self._git_sha: Optional[str] = None
+        self._git_checked = False
+        self._checked = time.monotonic()
+        self._current = self._load()
+
+    def _mtime(self) -> Optional[float]:
+        try:
+            return self.env_path.stat().st_mtime
+        except OSError:
+            return None
+
+    def _apply_file(self) -> None:
+        """
+        Wpisz `.env` do os.environ. Zmienne środowiska procesu mają pierwszeństwo;
+        klucze pochodzące z pliku są aktualizowane, a usunięte z pliku – usuwane.
+        """
+        values = parse_env_file(self.env_path) if self.env_path.exists() else {}
+        applied: Dict[str, str] = {}
+        for k, v in values.items():
+            ours = k in self._file_values and os.environ.get(k) == self._file_values[k]
+            if ours or k not in os.environ:
+                os.environ[k] = v
+                applied[k] = v
+        for k, old in self._file_values.items():
+            if k not in values and os.environ.get(k) == old:
+                del os.environ[k]
+        self._file_values = applied
+
+    def _build_sha(self) -> Optional[str]:
+        sha = next((os.environ[k] for k in _SHA_VARS if os.environ.get(k)), None)
+        if sha:
+            return str(sha)[:7]
+        # Fallback lokalny – jeden git rev-parse na proces
+        if not self._git_checked:
+            self._git_checked = True
+            try:
+                out = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.STDOUT,
+                                              cwd=str(self.env_path.parent), timeout=5)
+                self._git_sha = out.decode("utf-8").strip() or None
+            except Exception:
+                self._git_sha = None
+        return self._git_sha
+
+    def _load(self) -> Settings:
+        mtime = self._mtime()
+        self._apply_file()
+        return Settings.from_env(mtime, self._build_sha())
+
+    def reload(self) -> Settings:
+        with self._lock:
+            self._current = self._load()
+            self._checked = time.monotonic()
+            self.reloads += 1
+        logger.info(f"[Settings] Reloaded configuration (reload #{self.reloads})")
+        return self._current
+
+    def get(self) -> Settings:
+        current = self._current
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return current
+        self._checked = now
+        if self._mtime() != current.env_mtime:
+            return self.reload()
+        return current
@@ -0,0 +1,186 @@
+"""
+Cache uchwytów zakładek arkusza i indeks wierszy id → numer wiersza.
+
+Zapis rekordu do arkusza (update/delete) wymagał wcześniej pobrania całej
+kolumny klucza przy każdej próbie dopasowania. Tutaj per zakładka trzymane są:
+- uchwyt worksheet i nagłówki (jedno open_by_key/worksheet/row_values na proces),
+- indeks niezmiennej kolumny `id`, budowany jednym col_values i utrzymywany
+  lokalnie: append dopisuje wiersze (z updatedRange odpowiedzi API), delete
+  przesuwa numery wierszy poniżej usuniętego.
+Indeks wygasa po `ttl` sekundach i jest unieważniany po zmianie arkusza
+z zewnątrz (poller/reconcile) oraz po błędzie zapisu. Arkusz może jednak zmienić
+się w dowolnej chwili (edycja ręczna, inny proces), więc przed zapisem numer
+wiersza jest potwierdzany odczytem komórki id (main._sheet_row_of); niezgodność
+albo brak id w świeżym indeksie → jedna przebudowa.
+
+Numery wierszy zmienia tylko usuwanie, więc zapisy i dopisania idą równolegle
+(shared), a usuwanie wyłącznie (exclusive) – numer odczytany z indeksu pozostaje
+aktualny do końca zapisu.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+_RANGE_ROW = re.compile(r"!?\$?[A-Z]+\$?(\d+)")
+
+
+class _SharedLock:
+    """Prosty lock współdzielony/wyłączny (bez priorytetu dla piszących)."""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        with self._cond:
+            while self._exclusive:
+                self._cond.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._cond:
+            while self._exclusive or self._shared:
+                self._cond.wait()
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+def first_row(response: Any) -> Optional[int]:
+    """Pierwszy dopisany wiersz z odpowiedzi values.append ({"updates": {"updatedRange": "'T'!A5:X7"}})."""
+    try:
+        rng = str(response["updates"]["updatedRange"]).rsplit("!", 1)[-1]
+    except (KeyError, TypeError):
+        return None
+    m = _RANGE_ROW.match(rng)
+    return int(m.group(1)) if m else None
+
+
+class Tab:
+    """Stan jednej zakładki: uchwyt, nagłówki i indeks id → wiersz (None = do zbudowania)."""
+
+    def __init__(self) -> None:
+        self.owner: Any = None
+        self.ws: Any = None
+        self.headers: List[str] = []
+        self.rows: Optional[Dict[str, int]] = None
+        self.built = 0.0
+        self.builds = 0
+        self.open_lock = threading.Lock()
+        self._lock = _SharedLock()
+        self._rows_lock = threading.Lock()
+
+    def shared(self):
+        return self._lock.shared()
+
+    def exclusive(self):
+        return self._lock.exclusive()
+
+    def column(self, name: str) -> Optional[int]:
+        """1-based indeks kolumny wg nagłówków (bez rozróżniania wielkości liter)."""
+        lower = [h.lower() for h in self.headers]
+        try:
+            return lower.index(name.lower()) + 1
+        except ValueError:
+            return None
+
+    def fresh(self, ttl: float) -> bool:
+        return self.rows is not None and (ttl <= 0 or time.monotonic() - self.built < ttl)
+
+    def load(self, id_column: List[Any]) -> None:
+        """Zbuduj indeks z wartości kolumny id (z nagłówkiem); duplikat → pierwszy wiersz."""
+        rows: Dict[str, int] = {}
+        for n, cell in enumerate(id_column[1:], start=2):
+            key = str(cell).strip()
+            if key:
+                rows.setdefault(key, n)
+        with self._rows_lock:
+            self.rows = rows
+            self.built = time.monotonic()
+            self.builds += 1
+
+    def find(self, record_id: Any) -> Optional[int]:
+        with self._rows_lock:
+            return None if self.rows is None else self.rows.get(str(record_id).strip())
+
+    def appended(self, ids: Iterable[Any], start: Optional[int]) -> None:
+        """Dopisane wiersze od `start`; bez numeru (nieznana odpowiedź API) indeks jest budowany od nowa."""
+        with self._rows_lock:
+            if self.rows is None:
+                return
+            if start is None:
+                self.rows = None
+                return
+            for n, record_id in enumerate(ids, start=start):
+                key = str(record_id or "").strip()
+                if key:
+                    self.rows.setdefault(key, n)
+
+    def deleted(self, row: int, count: int = 1) -> None:
+        """Usunięte wiersze row..row+count-1; niższe przesuwają się o count w górę."""
+        end = row + count - 1
+        with self._rows_lock:
+            if self.rows is not None:
+                self.rows = {k: (r - count if r > end else r) for k, r in self.rows.items() if not row <= r <= end}
+
+    def reset(self, handles: bool = False) -> None:
+        with self._rows_lock:
+            self.rows = None
+        if handles:
+            self.ws, self.headers, self.owner = None, [], None
+
+
+class RowIndex:
+    """Zakładki po tytule; owner (klient + FILE_ID) – zmiana arkusza docelowego czyści stan zakładki."""
+
+    def __init__(self, ttl: float = 300.0) -> None:
+        self.ttl = ttl
+        self._tabs: Dict[str, Tab] = {}
+        self._lock = threading.Lock()
+
+    def tab(self, title: str, owner: Any) -> Tab:
+        with self._lock:
+            tab = self._tabs.setdefault(title, Tab())
+        if tab.owner is not None and tab.owner != owner:
+            tab.reset(handles=True)
+        return tab
+
+    def invalidate(self, title: Optional[str] = None, handles: bool = False) -> None:
+        with self._lock:
+            tabs = list(self._tabs.values()) if title is None else [t for k, t in self._tabs.items() if k == title]
+        for t in tabs:
+            t.reset(handles=handles)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            items = list(self._tabs.items())
+        now = time.monotonic()
+        return {
+            "ttlSeconds": self.ttl,
+            "tabs": {
+                title: {
+                    "open": t.ws is not None,
+                    "rows": len(t.rows) if t.rows is not None else None,
+                    "ageSeconds": round(now - t.built, 1) if t.rows is not None else None,
+                    "builds": t.builds,
+                }
+                for title, t in items
+            },
+        }
@@ -0,0 +1,108 @@
+"""
+Okresowe sprawdzanie zmian w arkuszu Google Sheets (multi-instance).
+
+Każda instancja co `interval` sekund pobiera tani identyfikator rewizji
+arkusza (Drive modifiedTime lub checksum wartości). Pełne pobranie i
+uzgodnienie (reconcile) uruchamiane jest tylko, gdy rewizja się zmieniła.
+Pierwsze sprawdzenie zawsze uzgadnia – zmiany wprowadzone w arkuszu między
+startem a pierwszym cyklem nie mogą przepaść.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SheetsPoller:
+    def __init__(
+        self,
+        interval: float,
+        get_revision: Callable[[], Optional[str]],
+        on_change: Callable[[], Any],
+        should_defer: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        self.interval = interval
+        self._get_revision = get_revision
+        self._on_change = on_change
+        self._should_defer = should_defer
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.last_revision: Optional[str] = None
+        self.last_check: Optional[str] = None
+        self.last_sync: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.checks = 0
+        self.syncs = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.interval <= 0 or self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheets-poller", daemon=True)
+        self._thread.start()
+        logger.info(f"[Poller] Started (interval={self.interval}s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.tick()
+
+    def tick(self) -> str:
+        """Jedno sprawdzenie: 'unchanged' | 'synced' | 'deferred' | 'error'."""
+        with self._lock:
+            self.checks += 1
+            self.last_check = datetime.utcnow().isoformat() + "Z"
+            try:
+                revision = self._get_revision()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"[Poller] Revision check failed: {self.last_error}")
+                return "error"
+            if revision is None:
+                return "error"
+            # brak zapamiętanej rewizji (pierwszy cykl) – import startowy mógł nie
+            # widzieć późniejszych edycji arkusza, więc uzgadniamy bezwarunkowo
+            if revision == self.last_revision:
+                return "unchanged"
+            if self._should_defer and self._should_defer():
+                # Świeże lokalne zapisy mogą jeszcze nie być w arkuszu – spróbuj w kolejnym cyklu
+                return "deferred"
+            try:
+                self._on_change()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"[Poller] Sync after change failed: {self.last_error}")
+                return "error"
+            self.last_revision = revision
+            self.last_sync = datetime.utcnow().isoformat() + "Z"
+            self.last_error = None
+            self.syncs += 1
+            logger.info(f"[Poller] Sheet changed → reconciled (revision={revision})")
+            return "synced"
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.interval > 0,
+            "running": self.running,
+            "interval": self.interval,
+            "lastRevision": self.last_revision,
+            "lastCheck": self.last_check,
+            "lastSync": self.last_sync,
+            "lastError": self.last_error,
+            "checks": self.checks,
+            "syncs": self.syncs,
+        }
@@ -0,0 +1,180 @@
+"""
+Symulacja „co jeśli” kosztu jednostkowego produktów kontenera na siatce parametrów.
+
+Osie: kurs (exchangeRate), cło w % (customsDutyPercent – nadpisuje stawkę
+każdego produktu), koszt kontenera (containerCost, w walucie kontenera) oraz
+wypełnienie (totalTransportCbm). Wzory są te same co w app.costing
+(product_costs / calculateProductCosts w UI): cło od wartości celnej, VAT 23%,
+podział transportu po CBM. Zamiast pętli po scenariuszach liczone są
+jednocześnie dla całego iloczynu kartezjańskiego osi – tablice NumPy
+o kształcie (kurs, cło, koszt, CBM, produkt) z rozgłaszaniem.
+
+Odpowiedź domyślnie zawiera tylko podsumowanie per produkt (min/max i scenariusz,
+w którym wystąpiły); pełne wartości siatki (`values`, płaska lista wierszami) są
+opcjonalne i mają niższy limit – serializacja milionów liczb do JSON kosztuje
+wielokrotnie więcej niż samo obliczenie. `to_json` serializuje wynik od razu do
+bajtów, z pominięciem jsonable_encoder FastAPI.
+
+NumPy jest zależnością opcjonalną (jak pyarrow dla Parquet) – bez niego
+endpoint zwraca błąd z informacją o brakującej bibliotece.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+from app import costing
+
+AXES = ("exchangeRate", "customsDutyPercent", "containerCost", "totalTransportCbm")
+METRICS = ("totalCostPerUnit", "nettoPerUnit")
+MAX_STEPS = 500          # wartości na oś
+MAX_CELLS = 2_000_000    # scenariusze × produkty liczone w jednym żądaniu
+MAX_VALUE_CELLS = 250_000  # scenariusze × produkty zwracane w `values`
+
+
+def check_available() -> None:
+    """RuntimeError przy braku NumPy – sprawdzane przed obliczeniem."""
+    try:
+        import numpy  # type: ignore  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(f"Symulacja wymaga biblioteki numpy: {e}")
+
+
+def axis_values(spec: Any) -> Optional[List[float]]:
+    """
+    Oś z żądania: lista liczb albo zakres {"from", "to", "steps"} (włącznie z końcami).
+    None → oś nieużywana (bieżąca wartość kontenera/produktu). ValueError dla błędnej specyfikacji.
+    """
+    if spec is None:
+        return None
+    if isinstance(spec, dict):
+        try:
+            start, stop = float(spec["from"]), float(spec["to"])
+            steps = int(spec.get("steps", 11))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Zakres osi wymaga pól from, to i opcjonalnie steps")
+        if steps < 1 or steps > MAX_STEPS:
+            raise ValueError(f"steps musi być w zakresie 1..{MAX_STEPS}")
+        if steps == 1:
+            return [start]
+        return [start + (stop - start) * i / (steps - 1) for i in range(steps)]
+    if isinstance(spec, (list, tuple)):
+        if not spec or len(spec) > MAX_STEPS:
+            raise ValueError(f"Oś musi mieć od 1 do {MAX_STEPS} wartości")
+        try:
+            return [float(v) for v in spec]
+        except (TypeError, ValueError):
+            raise ValueError("Wartości osi muszą być liczbami")
+    raise ValueError("Oś to lista liczb albo obiekt {from, to, steps}")
+
+
+def simulate(container: Dict[str, Any], grid: Dict[str, Any], metric: str = "totalCostPerUnit",
+             currency: str = "USD", product_ids: Optional[Sequence[str]] = None,
+             include_values: bool = False) -> Dict[str, Any]:
+    """
+    Metryka na siatce: min/max per produkt i indeks scenariusza (wiersza), w którym wystąpiły.
+    include_values=True – także `values`: płaska macierz scenariusze × produkty (wierszami, kolejność C po osiach AXES).
+    """
+    import numpy as np  # type: ignore
+
+    if metric not in METRICS:
+        raise ValueError(f"Nieznana metryka: {metric} (dostępne: {', '.join(METRICS)})")
+    if currency not in ("USD", "PLN"):
+        raise ValueError("Waluta wyniku: USD albo PLN")
+    wanted = {str(i) for i in product_ids or ()}
+    products = [p for p in (container.get("products") or []) if not wanted or str(p.get("id")) in wanted]
+    if not products:
+        raise ValueError("Kontener nie ma produktów do symulacji")
+
+    axes = {k: axis_values(grid.get(k)) for k in AXES}
+    base_er = costing.num(container.get("exchangeRate"), 4.0)
+    used = {
+        "exchangeRate": axes["exchangeRate"] or [base_er],
+        "customsDutyPercent": axes["customsDutyPercent"],  # None → stawka każdego produktu
+        "containerCost": axes["containerCost"] or [costing.num(container.get("containerCost"), 0.0)],
+        "totalTransportCbm": axes["totalTransportCbm"] or [costing.num(container.get("totalTransportCbm"), 1.0)],
+    }
+    if any(v <= 0 for v in used["exchangeRate"]):
+        raise ValueError("Kurs musi być dodatni")
+    shape = [len(used["exchangeRate"]), len(used["customsDutyPercent"] or [0]),
+             len(used["containerCost"]), len(used["totalTransportCbm"]), len(products)]
+    cells = int(np.prod(shape))
+    if cells > MAX_CELLS:
+        raise ValueError(f"Siatka ma {cells} komórek (limit {MAX_CELLS}) – zmniejsz liczbę wartości osi")
+    if include_values and cells > MAX_VALUE_CELLS:
+        raise ValueError(f"Pełne wartości siatki to {cells} komórek (limit {MAX_VALUE_CELLS}) – "
+                         f"zmniejsz liczbę wartości osi albo pobierz samo podsumowanie")
+
+    # Osie jako tablice o kształcie rozgłaszanym do (R, D, C, F, P)
+    er = np.asarray(used["exchangeRate"], dtype=float).reshape(-1, 1, 1, 1, 1)
+    cc = np.asarray(used["containerCost"], dtype=float).reshape(1, 1, -1, 1, 1)
+    fill = np.asarray(used["totalTransportCbm"], dtype=float).reshape(1, 1, 1, -1, 1)
+
+    def usd(amount: Any, cur: Optional[str]):
+        """Kwota w walucie pola → USD przy kursie z osi (jak costing.to_usd)."""
+        return amount if (cur or "USD") == "USD" else amount / er
+
+    def field(name: str):
+        return usd(costing.num(container.get(name), 0.0), container.get(f"{name}Currency"))
+
+    container_cost = usd(cc, container.get("containerCostCurrency"))
+    clearance, china, poland = field("customsClearanceCost"), field("transportChinaCost"), field("transportPolandCost")
+    insurance, additional = field("insuranceCost"), field("additionalCosts")
+    total_cbm = np.maximum(1.0, fill)
+    total_product_cbm = sum(max(0.0, costing.num(p.get("productCbm"), 0.0)) for p in (container.get("products") or [])) or 1.0
+    total_transport = container_cost + clearance + china + poland + insurance
+
+    # Kolumny produktów (P)
+    def col(values: List[float]):
+        return np.asarray(values, dtype=float).reshape(1, 1, 1, 1, -1)
+
+    usd_price = col([costing.num(p.get("totalPrice"), 0.0) if (p.get("totalPriceCurrency") or "USD") == "USD" else 0.0
+                     for p in products])
+    other_price = col([0.0 if (p.get("totalPriceCurrency") or "USD") == "USD" else costing.num(p.get("totalPrice"), 0.0)
+                       for p in products])
+    quantity = col([max(1.0, costing.num(p.get("quantity"), 1.0)) for p in products])
+    cbm = col([max(0.0, costing.num(p.get("productCbm"), 0.0)) for p in products])
+    if used["customsDutyPercent"] is None:
+        duty_pct = col([max(0.0, costing.num(p.get("customsDutyPercent"), 0.0)) for p in products])
+    else:
+        duty_pct = np.maximum(0.0, np.asarray(used["customsDutyPercent"], dtype=float)).reshape(1, -1, 1, 1, 1)
+
+    total_price = usd_price + other_price / er
+    share = cbm / total_cbm
+    transport_per_unit = total_transport / total_cbm * cbm / quantity
+    customs_value = total_price + (container_cost + china + insurance) * share
+    duty = customs_value * (duty_pct / 100)
+    vat = (customs_value + duty + poland * share) * costing.VAT_RATE
+    additional_per_unit = additional * (cbm / total_product_cbm) / quantity
+    if metric == "nettoPerUnit":
+        values = total_price / quantity + transport_per_unit + duty / quantity + additional_per_unit
+    else:
+        values = total_price / quantity + transport_per_unit + (duty + vat) / quantity + additional_per_unit
+    values = np.broadcast_to(values, shape)
+    if currency == "PLN":
+        values = values * er
+    matrix = values.reshape(-1, len(products))
+    lo, hi = matrix.argmin(axis=0), matrix.argmax(axis=0)
+    cols = np.arange(len(products))
+
+    out = {
+        "containerId": container.get("id"),
+        "metric": metric,
+        "currency": currency,
+        "axes": used,
+        "shape": shape,
+        "order": list(AXES) + ["product"],
+        "products": [{"id": p.get("id"), "name": p.get("name"), "quantity": p.get("quantity")} for p in products],
+        "min": np.round(matrix[lo, cols], 4).tolist(),
+        "max": np.round(matrix[hi, cols], 4).tolist(),
+        "argmin": lo.tolist(),
+        "argmax": hi.tolist(),
+    }
+    if include_values:
+        out["values"] = np.round(matrix, 4).ravel().tolist()
+    return out
+
+
+def to_json(result: Dict[str, Any]) -> bytes:
+    """Wynik jako gotowe ciało odpowiedzi JSON (bez spacji; liczby już zaokrąglone)."""
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,777 @@
+"""
+Magazyn danych kontenerów/produktów/załączników.
+
+Dwie implementacje wspólnego interfejsu Store:
+- MemoryStore – dotychczasowa lista słowników w pamięci procesu,
+- SqliteStore – lokalna baza SQLite (WAL), współdzielona przez wiele
+  workerów uvicorn na jednej maszynie i trwała między restartami.
+
+Rekordy na zewnątrz mają zawsze ten sam kształt co w API: kontener to
+słownik z listą `products`, produkt ma listę `files` (URL-e załączników)
+i `attachments` – metadane tych plików z Drive (app.attachments), zapisywane
+razem z produktem; rekord znika, gdy jego link zniknie z `files`.
+
+Każdy kontener i produkt ma pole `revision` (1 po utworzeniu, +1 po każdej
+zmianie). Metody update/delete przyjmują `expected_revision` – zapis
+warunkowy (compare-and-set) wykonywany atomowo pod blokadą magazynu;
+niezgodność kończy się RevisionConflict.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app import attachments
+
+
+class ContainerNotFound(KeyError):
+    pass
+
+
+class ProductNotFound(KeyError):
+    pass
+
+
+class ContainerExists(KeyError):
+    """Kontener o podanym id już jest w magazynie."""
+
+
+class RevisionConflict(Exception):
+    """Zapis warunkowy na nieaktualnej rewizji rekordu."""
+
+    def __init__(self, current: int) -> None:
+        super().__init__(current)
+        self.current = current
+
+
+def revision_of(rec: Optional[Dict[str, Any]]) -> int:
+    try:
+        return int((rec or {}).get("revision") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _check_revision(rec: Dict[str, Any], expected: Optional[int]) -> None:
+    if expected is not None and revision_of(rec) != expected:
+        raise RevisionConflict(revision_of(rec))
+
+
+def _body(rec: Dict[str, Any], *skip: str) -> Dict[str, Any]:
+    return {k: v for k, v in rec.items() if k != "revision" and k not in skip}
+
+
+def _stamp_revisions(old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> None:
+    """
+    Nadaj rewizje po operacji zbiorczej (w miejscu): nowy rekord → 1,
+    zmieniony → poprzednia + 1, niezmieniony → poprzednia.
+    """
+    old_c = {str(c.get("id")): c for c in old}
+    old_p = {str(p.get("id")): p for c in old for p in (c.get("products") or [])}
+    for c in new:
+        prev = old_c.get(str(c.get("id")))
+        if prev is None:
+            c["revision"] = 1
+        elif _body(prev, "products") != _body(c, "products"):
+            c["revision"] = revision_of(prev) + 1
+        else:
+            c["revision"] = max(revision_of(prev), 1)
+        for p in c.get("products") or []:
+            prev_p = old_p.get(str(p.get("id")))
+            if prev_p is None:
+                p["revision"] = 1
+            elif _body(prev_p) != _body(p):
+                p["revision"] = revision_of(prev_p) + 1
+            else:
+                p["revision"] = max(revision_of(prev_p), 1)
+
+
+def _new_container(c: Dict[str, Any]) -> Dict[str, Any]:
+    out = dict(c, revision=1)
+    out["products"] = [dict(p, files=list(p.get("files") or []), revision=1) for p in (c.get("products") or [])]
+    return out
+
+
+class Store(ABC):
+    """Interfejs magazynu (klasa abstrakcyjna). Metody zwracają kopie – modyfikacja wyniku nie zmienia stanu."""
+
+    backend = "abstract"
+
+    def __init__(self) -> None:
+        # time.monotonic() ostatniego zapisu w tym procesie (poller arkusza odkłada reconcile po świeżych zmianach)
+        self.last_write = 0.0
+        self._write_listeners: List[Callable[[], None]] = []
+        self._change_listeners: List[Callable[[Optional[str]], None]] = []
+        # (backend, operacja, sekundy) – czas oczekiwania na blokadę zapisu (metryki)
+        self.lock_wait_observer: Optional[Callable[[str, str, float], None]] = None
+        # Fabryka spanów śledzenia: op → context manager (tracing.span)
+        self.span_factory: Optional[Callable[[str], Any]] = None
+
+    def add_write_listener(self, callback: Callable[[], None]) -> None:
+        """Wywoływane po każdym zatwierdzonym zapisie (np. rozgłoszenie unieważnienia do innych workerów)."""
+        self._write_listeners.append(callback)
+
+    def add_change_listener(self, callback: Callable[[Optional[str]], None]) -> None:
+        """
+        Jak add_write_listener, z id zmienionego kontenera (None – operacja zbiorcza,
+        mogło zmienić się wszystko). Wywoływane także pod blokadą magazynu – callback
+        nie może czytać magazynu, najwyżej zapamiętać id (np. indeks wyszukiwania).
+        """
+        self._change_listeners.append(callback)
+
+    def _span(self, op: str):
+        return self.span_factory(f"store.{op}") if self.span_factory is not None else nullcontext()
+
+    def _observe_wait(self, op: str, started: float) -> None:
+        if self.lock_wait_observer is not None:
+            self.lock_wait_observer(self.backend, op, time.perf_counter() - started)
+
+    def _touch(self, container_id: Optional[str] = None) -> None:
+        self.last_write = time.monotonic()
+        for cb in self._write_listeners:
+            cb()
+        for changed in self._change_listeners:
+            changed(container_id)
+
+    @abstractmethod
+    def list_containers(self) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def iter_containers(self) -> Iterator[Dict[str, Any]]:
+        """Kontenery po kolei (kopie), bez budowania listy całego zbioru – dla eksportów strumieniowych."""
+
+    @abstractmethod
+    def get_container(self, container_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def insert_container(self, container: Dict[str, Any]) -> Dict[str, Any]:
+        """Dodaj kontener; ContainerExists, jeśli id jest zajęte."""
+
+    @abstractmethod
+    def update_container(self, container_id: str, fields: Dict[str, Any],
+                         expected_revision: Optional[int] = None) -> Dict[str, Any]:
+        """Scal pola kontenera (bez products). ContainerNotFound, jeśli brak."""
+
+    @abstractmethod
+    def delete_container(self, container_id: str, expected_revision: Optional[int] = None) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def add_product(self, container_id: str, product: Dict[str, Any]) -> Dict[str, Any]:
+        """Dopisz produkt; zwraca kontener po zmianie."""
+
+    @abstractmethod
+    def update_product(self, container_id: str, product_id: str, product: Dict[str, Any],
+                       expected_revision: Optional[int] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Zastąp produkt; zwraca (kontener, produkt)."""
+
+    @abstractmethod
+    def merge_product_files(self, container_id: str, product_id: str, urls: List[str],
+                            records: Optional[List[Dict[str, Any]]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Dopisz załączniki produktu (i ich metadane) bez duplikatów (atomowo); zwraca (kontener, produkt)."""
+
+    @abstractmethod
+    def delete_product(self, container_id: str, product_id: str,
+                       expected_revision: Optional[int] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Usuń produkt; zwraca (kontener, usunięty produkt)."""
+
+    @abstractmethod
+    def replace_all(self, data: List[Dict[str, Any]]) -> None:
+        ...
+
+    @abstractmethod
+    def transaction(self, commit: bool = True):
+        """Operacje zbiorcze: kopia robocza całego zbioru, zapis atomowy po wyjściu z bloku (context manager)."""
+
+
+class ChangeTracker:
+    """
+    Zgłoszone zmiany magazynu dla widoków pochodnych (indeks wyszukiwania, agregaty):
+    invalidate(id) z listenera zmian, take() przy odczycie – widok przelicza tylko
+    zmienione kontenery albo (stale) całość.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._dirty: set = set()
+        self._stale = True  # pełne przeliczenie przy pierwszym odczycie
+
+    def invalidate(self, container_id: Optional[str] = None) -> None:
+        with self._lock:
+            if container_id is None:
+                self._stale = True
+            else:
+                self._dirty.add(str(container_id))
+
+    def take(self) -> Tuple[bool, List[str]]:
+        with self._lock:
+            stale, dirty = self._stale, sorted(self._dirty)
+            self._stale, self._dirty = False, set()
+        return stale, dirty
+
+    def pending(self) -> Any:
+        with self._lock:
+            return "all" if self._stale else len(self._dirty)
+
+
+def _replaced_product(old: Dict[str, Any], product: Dict[str, Any]) -> Dict[str, Any]:
+    """Nowa wersja produktu: metadane załączników przechodzą z poprzedniej dla linków, które zostały w `files`."""
+    files = list(product.get("files") or [])
+    known = attachments.merge(old.get("attachments") or [], product.get("attachments") or [])
+    return dict(product, files=files, attachments=attachments.for_files(files, known))
+
+
+def _merged_files(old: Dict[str, Any], urls: List[str], records: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    files = list(old.get("files") or [])
+    files += [u for u in dict.fromkeys(urls) if u not in files]
+    new = dict(old, files=files)
+    if records or old.get("attachments"):
+        new["attachments"] = attachments.for_files(files, attachments.merge(old.get("attachments") or [], records or []))
+    return new
+
+
+def _copy_container(c: Dict[str, Any]) -> Dict[str, Any]:
+    out = dict(c)
+    out["products"] = [dict(p, files=list(p.get("files") or [])) for p in (c.get("products") or [])]
+    return out
+
+
+class MemoryStore(Store):
+    """Lista kontenerów w pamięci procesu, chroniona lockiem."""
+
+    backend = "memory"
+
+    def __init__(self, data: Optional[List[Dict[str, Any]]] = None, lock: Optional[threading.Lock] = None) -> None:
+        super().__init__()
+        self.data: List[Dict[str, Any]] = data if data is not None else []
+        self.lock = lock or threading.Lock()
+
+    @contextmanager
+    def _locked(self, op: str) -> Iterator[None]:
+        with self._span(op):
+            started = time.perf_counter()
+            with self.lock:
+                self._observe_wait(op, started)
+                yield
+
+    def _find(self, container_id: str) -> Dict[str, Any]:
+        for c in self.data:
+            if str(c.get("id")) == container_id:
+                return c
+        raise ContainerNotFound(container_id)
+
+    def list_containers(self) -> List[Dict[str, Any]]:
+        with self._locked("list_containers"):
+            return [_copy_container(c) for c in self.data]
+
+    def iter_containers(self) -> Iterator[Dict[str, Any]]:
+        # Lista referencji pod blokadą, kopia każdego kontenera osobno – blokada nie jest
+        # trzymana między kolejnymi elementami (wolny klient nie wstrzymuje zapisów)
+        with self._locked("iter_containers"):
+            refs = list(self.data)
+        for c in refs:
+            with self.lock:
+                item = _copy_container(c)
+            yield item
+
+    def get_container(self, container_id: str) -> Optional[Dict[str, Any]]:
+        with self._locked("get_container"):
+            try:
+                return _copy_container(self._find(container_id))
+            except ContainerNotFound:
+                return None
+
+    def insert_container(self, container: Dict[str, Any]) -> Dict[str, Any]:
+        c = _new_container(container)
+        cid = str(c.get("id"))
+        with self._locked("insert_container"):
+            if any(str(x.get("id")) == cid for x in self.data):
+                raise ContainerExists(cid)
+            self.data.append(c)
+            self._touch(str(c.get("id")))
+            return _copy_container(c)
+
+    def update_container(self, container_id: str, fields: Dict[str, Any],
+                         expected_revision: Optional[int] = None) -> Dict[str, Any]:
+        with self._locked("update_container"):
+            c = self._find(container_id)
+            _check_revision(c, expected_revision)
+            c.update({k: v for k, v in fields.items() if k not in ("id", "products", "revision")})
+            c["revision"] = revision_of(c) + 1
+            self._touch(container_id)
+            return _copy_container(c)
+
+    def delete_container(self, container_id: str, expected_revision: Optional[int] = None) -> Dict[str, Any]:
+        with self._locked("delete_container"):
+            c = self._find(container_id)
+            _check_revision(c, expected_revision)
+            self.data[:] = [x for x in self.data if x is not c]
+            self._touch(container_id)
+            return _copy_container(c)
+
+    def add_product(self, container_id: str, product: Dict[str, Any]) -> Dict[str, Any]:
+        with self._locked("add_product"):
+            c = self._find(container_id)
+            c["products"] = list(c.get("products") or []) + [dict(product, files=list(product.get("files") or []), revision=1)]
+            self._touch(container_id)
+            return _copy_container(c)
+
+    def _replace_product(self, container_id: str, product_id: str,
+                         build: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        with self._locked("update_product"):
+            c = self._find(container_id)
+            products = list(c.get("products") or [])
+            for j, p in enumerate(products):
+                if str(p.get("id")) == product_id:
+                    products[j] = dict(build(p), id=product_id, revision=revision_of(p) + 1)
+                    c["products"] = products
+                    self._touch(container_id)
+                    return _copy_container(c), dict(products[j], files=list(products[j]["files"]))
+            raise ProductNotFound(product_id)
+
+    def update_product(self, container_id: str, product_id: str, product: Dict[str, Any],
+                       expected_revision: Optional[int] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        def build(old: Dict[str, Any]) -> Dict[str, Any]:
+            _check_revision(old, expected_revision)
+            return _replaced_product(old, product)
+        return self._replace_product(container_id, product_id, build)
+
+    def merge_product_files(self, container_id: str, product_id: str, urls: List[str],
+                            records: Optional[List[Dict[str, Any]]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self._replace_product(container_id, product_id, lambda old: _merged_files(old, urls, records))
+
+    def delete_product(self, container_id: str, product_id: str,
+                       expected_revision: Optional[int] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        with self._locked("delete_product"):
+            c = self._find(container_id)
+            products = list(c.get("products") or [])
+            deleted = next((p for p in products if str(p.get("id")) == product_id), None)
+            if deleted is None:
+                raise ProductNotFound(product_id)
+            _check_revision(deleted, expected_revision)
+            c["products"] = [p for p in products if p is not deleted]
+            self._touch(container_id)
+            return _copy_container(c), dict(deleted)
+
+    def replace_all(self, data: List[Dict[str, Any]]) -> None:
+        with self._locked("replace_all"):
+            new = [_copy_container(c) for c in data]
+            _stamp_revisions(self.data, new)
+            # W miejscu – referencje do listy (np. _mem_data) pozostają aktualne
+            self.data[:] = new
+            self._touch()
+
+    @contextmanager
+    def transaction(self, commit: bool = True) -> Iterator[List[Dict[str, Any]]]:
+        with self._locked("transaction"):
+            data = [_copy_container(c) for c in self.data]
+            yield data
+            if commit:
+                new = [_copy_container(c) for c in data]
+                _stamp_revisions(self.data, new)
+                self.data[:] = new
+                self._touch()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS containers (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    order_date TEXT,
+    payment_date TEXT,
+    delivery_date TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_containers_position ON containers(position);
+CREATE INDEX IF NOT EXISTS ix_containers_name ON containers(name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS ix_containers_order_date ON containers(order_date);
+CREATE INDEX IF NOT EXISTS ix_containers_delivery_date ON containers(delivery_date);
+CREATE INDEX IF NOT EXISTS ix_containers_payment_date ON containers(payment_date);
+
+CREATE TABLE IF NOT EXISTS products (
+    container_id TEXT NOT NULL REFERENCES containers(id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL,
+    PRIMARY KEY (container_id, id)
+);
+CREATE INDEX IF NOT EXISTS ix_products_id ON products(id);
+CREATE INDEX IF NOT EXISTS ix_products_container ON products(container_id, position);
+CREATE INDEX IF NOT EXISTS ix_products_name ON products(name COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS attachments (
+    container_id TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (container_id, product_id, position),
+    FOREIGN KEY (container_id, product_id) REFERENCES products(container_id, id) ON DELETE CASCADE
+);
+"""
+
+# Stałe zapytania – sqlite3 trzyma je w cache przygotowanych instrukcji połączenia
+_SQL_CONTAINERS_ALL = "SELECT id, data FROM containers ORDER BY position"
+_SQL_CONTAINER_ONE = "SELECT id, data FROM containers WHERE id = ?"
+_SQL_PRODUCTS_ALL = "SELECT container_id, id, data FROM products ORDER BY container_id, position"
+_SQL_PRODUCTS_OF = "SELECT container_id, id, data FROM products WHERE container_id = ? ORDER BY position"
+_SQL_ATTACH_ALL = "SELECT container_id, product_id, url FROM attachments ORDER BY container_id, product_id, position"
+_SQL_ATTACH_OF = "SELECT container_id, product_id, url FROM attachments WHERE container_id = ? ORDER BY product_id, position"
+_SQL_INSERT_CONTAINER = (
+    "INSERT INTO containers (id, position, name, order_date, payment_date, delivery_date, data) "
+    "VALUES (?, (SELECT COALESCE(MAX(position), 0) + 1 FROM containers), ?, ?, ?, ?, ?)"
+)
+_SQL_UPDATE_CONTAINER = (
+    "UPDATE containers SET name = ?, order_date = ?, payment_date = ?, delivery_date = ?, data = ? WHERE id = ?"
+)
+_SQL_DELETE_CONTAINER = "DELETE FROM containers WHERE id = ?"
+_SQL_INSERT_PRODUCT = (
+    "INSERT INTO products (container_id, id, position, name, data) "
+    "VALUES (?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM products WHERE container_id = ?), ?, ?)"
+)
+_SQL_UPDATE_PRODUCT = "UPDATE products SET name = ?, data = ? WHERE container_id = ? AND id = ?"
+_SQL_DELETE_PRODUCT = "DELETE FROM products WHERE container_id = ? AND id = ?"
+_SQL_DELETE_ATTACH = "DELETE FROM attachments WHERE container_id = ? AND product_id = ?"
+_SQL_INSERT_ATTACH = "INSERT INTO attachments (container_id, product_id, position, url) VALUES (?, ?, ?, ?)"
+
+
+class SqliteStore(Store):
+    """
+    SQLite w trybie WAL: wielu czytelników równolegle z jednym piszącym, także
+    między procesami. Zapisy w BEGIN IMMEDIATE (blokada zapisu od startu transakcji).
+    Połączenie per wątek (FastAPI wykonuje endpointy sync w puli wątków).
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000, revision_source: Optional[Callable[[], int]] = None) -> None:
+        super().__init__()
+        self.path = str(path)
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        # Cache pełnej listy kontenerów ważny tak długo, jak współdzielony licznik rewizji się nie zmienia
+        self._revision_source = revision_source
+        self._snapshot: Optional[Tuple[int, List[Dict[str, Any]]]] = None
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self, op: str, container_id: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+        with self._span(op):
+            conn = self._conn()
+            started = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            self._observe_wait(op, started)
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        self._touch(container_id)
+
+    # --- Serializacja ---
+    @staticmethod
+    def _container_row(c: Dict[str, Any]) -> Tuple[Any, ...]:
+        body = {k: v for k, v in c.items() if k != "products"}
+        return (
+            str(body.get("name") or ""), body.get("orderDate") or None, body.get("paymentDate") or None,
+            body.get("deliveryDate") or None, json.dumps(body, ensure_ascii=False),
+        )
+
+    def _insert_products(self, conn: sqlite3.Connection, cid: str, products: List[Dict[str, Any]]) -> None:
+        for p in products:
+            self._insert_product(conn, cid, p)
+
+    def _insert_product(self, conn: sqlite3.Connection, cid: str, p: Dict[str, Any]) -> None:
+        body = {k: v for k, v in p.items() if k != "files"}
+        pid = str(body.get("id"))
+        conn.execute(_SQL_INSERT_PRODUCT, (cid, pid, cid, str(body.get("name") or ""), json.dumps(body, ensure_ascii=False)))
+        self._write_files(conn, cid, pid, p.get("files") or [])
+
+    def _write_files(self, conn: sqlite3.Connection, cid: str, pid: str, files: List[str]) -> None:
+        conn.execute(_SQL_DELETE_ATTACH, (cid, pid))
+        conn.executemany(_SQL_INSERT_ATTACH, [(cid, pid, i, str(u)) for i, u in enumerate(files)])
+
+    def _assemble(self, containers, products, attachments) -> List[Dict[str, Any]]:
+        files: Dict[Tuple[str, str], List[str]] = {}
+        for cid, pid, url in attachments:
+            files.setdefault((cid, pid), []).append(url)
+        by_container: Dict[str, List[Dict[str, Any]]] = {}
+        for cid, pid, data in products:
+            p = json.loads(data)
+            p["files"] = files.get((cid, pid), [])
+            by_container.setdefault(cid, []).append(p)
+        out = []
+        for cid, data in containers:
+            c = json.loads(data)
+            c["products"] = by_container.get(cid, [])
+            out.append(c)
+        return out
+
+    def _load_all(self, conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+        return self._assemble(
+            conn.execute(_SQL_CONTAINERS_ALL).fetchall(),
+            conn.execute(_SQL_PRODUCTS_ALL).fetchall(),
+            conn.execute(_SQL_ATTACH_ALL).fetchall(),
+        )
+
+    def _load_one(self, conn: sqlite3.Connection, container_id: str) -> Dict[str, Any]:
+        rows = conn.execute(_SQL_CONTAINER_ONE, (container_id,)).fetchall()
+        if not rows:
+            raise ContainerNotFound(container_id)
+        return self._assemble(
+            rows,
+            conn.execute(_SQL_PRODUCTS_OF, (container_id,)).fetchall(),
+            conn.execute(_SQL_ATTACH_OF, (container_id,)).fetchall(),
+        )[0]
+
+    # --- Interfejs Store ---
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+    def list_containers(self) -> List[Dict[str, Any]]:
+        revision = self._revision_source() if self._revision_source else None
+        snap = self._snapshot
+        if snap is not None and revision is not None and snap[0] == revision:
+            return [_copy_container(c) for c in snap[1]]
+        conn = self._conn()
+        # Spójny odczyt trzech tabel (snapshot WAL w ramach jednej transakcji)
+        with self._span("list_containers"):
+            conn.execute("BEGIN")
+            try:
+                data = self._load_all(conn)
+            finally:
+                conn.execute("COMMIT")
+        if revision is not None:
+            self._snapshot = (revision, [_copy_container(c) for c in data])
+        return data
+
+    def iter_containers(self) -> Iterator[Dict[str, Any]]:
+        """
+        Kursor po kontenerach; produkty i załączniki dociągane per kontener. Osobne połączenie
+        z własną transakcją odczytu – spójny snapshot WAL, a generator konsumowany z różnych
+        wątków puli nie koliduje z zapisami na połączeniu wątku.
+        """
+        revision = self._revision_source() if self._revision_source else None
+        snap = self._snapshot
+        if snap is not None and revision is not None and snap[0] == revision:
+            for c in snap[1]:
+                yield _copy_container(c)
+            return
+        if self.path == ":memory:":
+            yield from self.list_containers()
+            return
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        try:
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            conn.execute("BEGIN")
+            for row in conn.execute(_SQL_CONTAINERS_ALL):
+                yield self._assemble(
+                    [row],
+                    conn.execute(_SQL_PRODUCTS_OF, (row[0],)).fetchall(),
+                    conn.execute(_SQL_ATTACH_OF, (row[0],)).fetchall(),
+                )[0]
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def get_container(self, container_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        with self._span("get_container"):
+            conn.execute("BEGIN")
+            try:
+                return self._load_one(conn, container_id)
+            except ContainerNotFound:
+                return None
+            finally:
+                conn.execute("COMMIT")
+
+    def insert_container(self, container: Dict[str, Any]) -> Dict[str, Any]:
+        c = _new_container(container)
+        cid = str(c.get("id"))
+        with self._write("insert_container", cid) as conn:
+            # sprawdzenie pod BEGIN IMMEDIATE – zamiast IntegrityError z klucza głównego
+            if conn.execute(_SQL_CONTAINER_ONE, (cid,)).fetchone():
+                raise ContainerExists(cid)
+            conn.execute(_SQL_INSERT_CONTAINER, (cid, *self._container_row(c)))
+            self._insert_products(conn, cid, c["products"])
+        return c
+
+    def update_container(self, container_id: str, fields: Dict[str, Any],
+                         expected_revision: Optional[int] = None) -> Dict[str, Any]:
+        with self._write("update_container", container_id) as conn:
+            current = self._load_one(conn, container_id)
+            _check_revision(current, expected_revision)
+            current.update({k: v for k, v in fields.items() if k not in ("id", "products", "revision")})
+            current["revision"] = revision_of(current) + 1
+            conn.execute(_SQL_UPDATE_CONTAINER, (*self._container_row(current), container_id))
+            return current
+
+    def delete_container(self, container_id: str, expected_revision: Optional[int] = None) -> Dict[str, Any]:
+        with self._write("delete_container", container_id) as conn:
+            current = self._load_one(conn, container_id)
+            _check_revision(current, expected_revision)
+            conn.execute(_SQL_DELETE_CONTAINER, (container_id,))
+            return current
+
+    def add_product(self, container_id: str, product: Dict[str, Any]) -> Dict[str, Any]:
+        with self._write("add_product", container_id) as conn:
+            if not conn.execute(_SQL_CONTAINER_ONE, (container_id,)).fetchone():
+                raise ContainerNotFound(container_id)
+            self._insert_product(conn, container_id, dict(product, revision=1))
+            return self._load_one(conn, container_id)
+
+    def _replace_product(self, container_id: str, product_id: str,
+                         build: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        with self._write("update_product", container_id) as conn:
+            container = self._load_one(conn, container_id)
+            old = next((p for p in container["products"] if str(p.get("id")) == product_id), None)
+            if old is None:
+                raise ProductNotFound(product_id)
+            new = build(old)
+            body = {k: v for k, v in new.items() if k != "files"}
+            body["id"] = product_id
+            body["revision"] = revision_of(old) + 1
+            conn.execute(_SQL_UPDATE_PRODUCT, (str(body.get("name") or ""), json.dumps(body, ensure_ascii=False), container_id, product_id))
+            self._write_files(conn, container_id, product_id, new.get("files") or [])
+        saved = dict(body, files=[str(u) for u in (new.get("files") or [])])
+        container["products"] = [saved if str(p.get("id")) == product_id else p for p in container["products"]]
+        return container, dict(saved, files=list(saved["files"]))
+
+    def update_product(self, container_id: str, product_id: str, product: Dict[str, Any],
+                       expected_revision: Optional[int] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        def build(old: Dict[str, Any]) -> Dict[str, Any]:
+            _check_revision(old, expected_revision)
+            return _replaced_product(old, product)
+        return self._replace_product(container_id, product_id, build)
+
+    def merge_product_files(self, container_id: str, product_id: str, urls: List[str],
+                            records: Optional[List[Dict[str, Any]]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self._replace_product(container_id, product_id, lambda old: _merged_files(old, urls, records))
+
+    def delete_product(self, container_id: str, product_id: str,
+                       expected_revision: Optional[int] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        with self._write("delete_product", container_id) as conn:
+            container = self._load_one(conn, container_id)
+            deleted = next((p for p in container["products"] if str(p.get("id")) == product_id), None)
+            if deleted is None:
+                raise ProductNotFound(product_id)
+            _check_revision(deleted, expected_revision)
+            conn.execute(_SQL_DELETE_PRODUCT, (container_id, product_id))
+            container["products"] = [p for p in container["products"] if p is not deleted]
+            return container, deleted
+
+    @staticmethod
+    def _product_row(p: Dict[str, Any]) -> Tuple[str, str, List[str]]:
+        body = {k: v for k, v in p.items() if k != "files"}
+        return str(body.get("name") or ""), json.dumps(body, ensure_ascii=False), [str(u) for u in (p.get("files") or [])]
+
+    @staticmethod
+    def _reorder(conn: sqlite3.Connection, old_ids: List[str], wanted: List[str], sql: str, *scope: str) -> None:
+        # Kolejność w bazie po diffie: zachowane wiersze jak dotąd, nowe dopisane na końcu (MAX(position) + 1).
+        # Pozycje przepisywane tylko, gdy różni się od żądanej (luki po usunięciach nie przeszkadzają).
+        kept, existing = set(wanted), set(old_ids)
+        current = [key for key in old_ids if key in kept] + [key for key in wanted if key not in existing]
+        if current != wanted:
+            conn.executemany(sql, [(i, *scope, key) for i, key in enumerate(wanted, start=1)])
+
+    def _apply_diff(self, conn: sqlite3.Connection, old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> None:
+        """
+        Zapis operacji zbiorczej jako różnicy względem stanu bazy: insert/update/delete tylko
+        zmienionych wierszy (reconcile zmieniający jeden wiersz nie przepisuje całej bazy i indeksów).
+        """
+        old_by_id = {str(c.get("id")): c for c in old}
+        new_ids = [str(c.get("id")) for c in new]
+        for cid in old_by_id.keys() - set(new_ids):
+            conn.execute(_SQL_DELETE_CONTAINER, (cid,))  # produkty i załączniki – ON DELETE CASCADE
+        for c in new:
+            cid = str(c.get("id"))
+            prev = old_by_id.pop(cid, None)
+            if prev is None:
+                conn.execute(_SQL_INSERT_CONTAINER, (cid, *self._container_row(c)))
+                self._insert_products(conn, cid, c.get("products") or [])
+                continue
+            row = self._container_row(c)
+            if row != self._container_row(prev):
+                conn.execute(_SQL_UPDATE_CONTAINER, (*row, cid))
+            self._apply_product_diff(conn, cid, prev.get("products") or [], c.get("products") or [])
+        self._reorder(conn, [str(c.get("id")) for c in old], new_ids, "UPDATE containers SET position = ? WHERE id = ?")
+
+    def _apply_product_diff(self, conn: sqlite3.Connection, cid: str, old: List[Dict[str, Any]],
+                            new: List[Dict[str, Any]]) -> None:
+        old_by_id = {str(p.get("id")): p for p in old}
+        new_ids = [str(p.get("id")) for p in new]
+        for pid in old_by_id.keys() - set(new_ids):
+            conn.execute(_SQL_DELETE_PRODUCT, (cid, pid))
+        for p in new:
+            pid = str(p.get("id"))
+            prev = old_by_id.get(pid)
+            if prev is None:
+                self._insert_product(conn, cid, p)
+                continue
+            name, body, files = self._product_row(p)
+            prev_name, prev_body, prev_files = self._product_row(prev)
+            if (name, body) != (prev_name, prev_body):
+                conn.execute(_SQL_UPDATE_PRODUCT, (name, body, cid, pid))
+            if files != prev_files:
+                self._write_files(conn, cid, pid, files)
+        self._reorder(conn, [str(p.get("id")) for p in old], new_ids,
+                      "UPDATE products SET position = ? WHERE container_id = ? AND id = ?", cid)
+
+    def replace_all(self, data: List[Dict[str, Any]]) -> None:
+        new = [_copy_container(c) for c in data]
+        with self._write("replace_all") as conn:
+            old = self._load_all(conn)
+            _stamp_revisions(old, new)
+            self._apply_diff(conn, old, new)
+
+    @contextmanager
+    def transaction(self, commit: bool = True) -> Iterator[List[Dict[str, Any]]]:
+        with self._span("transaction"):
+            conn = self._conn()
+            started = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            self._observe_wait("transaction", started)
+            try:
+                data = self._load_all(conn)
+                old = [_copy_container(c) for c in data]
+                yield data
+                if commit:
+                    _stamp_revisions(old, data)
+                    self._apply_diff(conn, old, data)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        if commit:
+            self._touch()
+
+
+def create_store(backend: str, sqlite_path: str, data: Optional[List[Dict[str, Any]]] = None,
+                 lock: Optional[threading.Lock] = None, revision_source: Optional[Callable[[], int]] = None) -> Store:
+    """Fabryka magazynu wg STORAGE_BACKEND ("memory" | "sqlite")."""
+    if (backend or "memory").strip().lower() == "sqlite":
+        return SqliteStore(sqlite_path, revision_source=revision_source)
+    return MemoryStore(data, lock)
@@ -0,0 +1,209 @@
+"""
+Lekkie śledzenie żądań (trace/span) bez zewnętrznych zależności.
+
+- Każde żądanie HTTP dostaje trace id (z nagłówka `traceparent`, jeśli poprawny,
+  w przeciwnym razie losowy); zwracany jest w nagłówku `X-Trace-Id`.
+- span(name) mierzy fragment pracy: wywołania Google API, operacje magazynu,
+  zadania w tle. Kontekst niesie contextvars – działa w wątkach puli FastAPI.
+- bind(fn) przenosi bieżący trace do zadań BackgroundTasks.
+- Trace dłuższy niż TRACE_SLOW_MS trafia jako jedna linia JSON do loggera
+  `app.trace` i do bufora ostatnich wolnych trace'ów (/api/traces/slow).
+- TRACE_OTEL=1: dodatkowo spany OpenTelemetry (jeśli zainstalowane opentelemetry-api).
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger("app.trace")
+
+_TRACEPARENT_RE = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-[0-9a-f]{16}-[0-9a-f]{2}$")
+MAX_SPANS = 500  # ochrona przed pętlami wywołań – nadmiarowe spany są tylko zliczane
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class Trace:
+    __slots__ = ("trace_id", "name", "start", "end", "spans", "dropped", "attrs", "_lock")
+
+    def __init__(self, name: str, trace_id: Optional[str] = None) -> None:
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+        self.dropped = 0
+        self.attrs: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            if len(self.spans) >= MAX_SPANS:
+                self.dropped += 1
+            else:
+                self.spans.append(span)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["startMs"])
+        return {
+            "traceId": self.trace_id,
+            "name": self.name,
+            "durationMs": round(self.duration_ms, 2),
+            **self.attrs,
+            "spans": spans,
+            "droppedSpans": self.dropped,
+        }
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+_parent: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("span_parent", default=None)
+
+SLOW_MS = _env_float("TRACE_SLOW_MS", 1000.0)
+_slow: Deque[Dict[str, Any]] = deque(maxlen=50)
+_otel_tracer = None
+_otel_checked = False
+
+
+def _otel():
+    global _otel_tracer, _otel_checked
+    if not _otel_checked:
+        _otel_checked = True
+        if os.environ.get("TRACE_OTEL", "0") == "1":
+            try:
+                from opentelemetry import trace as otel_trace  # type: ignore
+
+                _otel_tracer = otel_trace.get_tracer("import-tracker")
+            except ImportError:
+                logger.warning("[Trace] TRACE_OTEL=1, ale opentelemetry-api nie jest zainstalowane")
+    return _otel_tracer
+
+
+def current_trace_id() -> Optional[str]:
+    t = _trace.get()
+    return t.trace_id if t else None
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[None]:
+    """Mierz fragment pracy w bieżącym trace (bez aktywnego trace – tylko OpenTelemetry, jeśli włączone)."""
+    tracer = _otel()
+    otel_cm = tracer.start_as_current_span(name, attributes={k: str(v) for k, v in attrs.items()}) if tracer else nullcontext()
+    t = _trace.get()
+    if t is None:
+        with otel_cm:
+            yield
+        return
+    span_id = secrets.token_hex(8)
+    parent = _parent.set(span_id)
+    start = time.perf_counter()
+    error: Optional[str] = None
+    try:
+        with otel_cm:
+            yield
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        end = time.perf_counter()
+        _parent.reset(parent)
+        rec: Dict[str, Any] = {
+            "name": name,
+            "spanId": span_id,
+            "parentId": parent.old_value if parent.old_value is not contextvars.Token.MISSING else None,
+            "startMs": round((start - t.start) * 1000.0, 2),
+            "durationMs": round((end - start) * 1000.0, 2),
+        }
+        if attrs:
+            rec["attrs"] = attrs
+        if error:
+            rec["error"] = error
+        t.add(rec)
+
+
+def bind(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Zadanie w tle dziedziczy bieżący trace (span `background:<nazwa>`)."""
+    t = _trace.get()
+    if t is None:
+        return fn
+    name = f"background:{getattr(fn, '__name__', 'task')}"
+
+    @functools.wraps(fn)
+    def run(*args: Any, **kwargs: Any) -> Any:
+        token = _trace.set(t)
+        try:
+            with span(name):
+                return fn(*args, **kwargs)
+        finally:
+            _trace.reset(token)
+
+    return run
+
+
+def _finish(t: Trace) -> None:
+    t.end = time.perf_counter()
+    if SLOW_MS >= 0 and t.duration_ms >= SLOW_MS:
+        rec = t.to_dict()
+        _slow.append(rec)
+        logger.warning(json.dumps({"event": "slow_trace", **rec}, ensure_ascii=False))
+
+
+def slow_traces() -> List[Dict[str, Any]]:
+    return list(reversed(_slow))
+
+
+def _incoming_trace_id(scope) -> Optional[str]:
+    for k, v in scope.get("headers") or []:
+        if k == b"traceparent":
+            m = _TRACEPARENT_RE.match(v.decode("latin-1").strip().lower())
+            return m.group(1) if m else None
+    return None
+
+
+class TracingMiddleware:
+    """Czysty middleware ASGI: trace na każde żądanie HTTP (łącznie z zadaniami w tle)."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        t = Trace(f"{scope.get('method', '')} {scope.get('path', '')}", _incoming_trace_id(scope))
+        token = _trace.set(t)
+        header = (b"x-trace-id", t.trace_id.encode("ascii"))
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers") or []) + [header]
+                t.attrs["status"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            if getattr(route, "path", None):
+                t.attrs["route"] = route.path
+            _trace.reset(token)
+            _finish(t)
@@ -0,0 +1,97 @@
+"""
+Dane i podłączenie atrap Google (app.fake_google) do aplikacji na potrzeby benchmarków.
+
+install() podmienia fabryki klientów w app.main: _get_gspread_client korzysta
+z cache _GSPREAD_CLIENT, a _drive_build_service jest wywoływane przez endpointy
+po nazwie modułowej – obie ścieżki trafiają do atrap bez zmian w kodzie aplikacji.
+"""
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List, Tuple
+
+from app.fake_google import FakeDriveService, FakeGspreadClient, Simulator
+
+FILE_ID = "bench-spreadsheet"
+ROOT_FOLDER_ID = "bench-root"
+
+
+def container_record(i: int) -> Dict[str, Any]:
+    return {
+        "id": f"c{i:06d}",
+        "name": f"Kontener {i:06d}",
+        "orderDate": f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+        "productionDays": str(20 + i % 40),
+        "exchangeRate": "4.05",
+        "containerCost": str(2500 + i % 500),
+        "containerCostCurrency": "USD",
+        "customsClearanceCost": "300",
+        "customsClearanceCostCurrency": "PLN",
+        "transportChinaCost": "150",
+        "transportPolandCost": "900",
+        "transportPolandCostCurrency": "PLN",
+        "insuranceCost": "80",
+        "totalTransportCbm": "68",
+        "pickedUpInChina": i % 2 == 0,
+        "customsClearanceDone": i % 3 == 0,
+        "deliveredToWarehouse": i % 5 == 0,
+        "documentsInSystem": False,
+    }
+
+
+def product_record(i: int, j: int, container: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": f"p{i:06d}{j:03d}",
+        "name": f"Produkt {j} / {i}",
+        "quantity": str(10 + j),
+        "totalPrice": str(100 * (j + 1)),
+        "totalPriceCurrency": "USD",
+        "productCbm": f"{1.5 + j * 0.25:.2f}",
+        "customsDutyPercent": "4",
+        "containerName": container["name"],
+        "containerId": container["id"],
+    }
+
+
+def dataset(n_containers: int, products_per_container: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    containers = [container_record(i) for i in range(n_containers)]
+    products = [product_record(i, j, c) for i, c in enumerate(containers) for j in range(products_per_container)]
+    return containers, products
+
+
+def install(main, sim: Simulator) -> Tuple[FakeGspreadClient, FakeDriveService]:
+    """Podłącz atrapy do modułu app.main (wspólny Simulator dla Sheets i Drive, Drive przez harmonogram app.quota)."""
+    from app import quota
+
+    sheets = FakeGspreadClient(sim)
+    drive = FakeDriveService(sim, request_wrapper=quota.call)
+    sheets.spreadsheet(FILE_ID).seed(main.SHEET_CONTAINERS_TITLE, main.HEADERS_CONTAINERS, [])
+    sheets.spreadsheet(FILE_ID).seed(main.SHEET_PRODUCTS_TITLE, main.HEADERS_PRODUCTS, [])
+    drive.add_folder("Import Tracker", None, file_id=ROOT_FOLDER_ID)
+    os.environ["FILE_ID"] = FILE_ID
+    os.environ["FOLDER_ID"] = ROOT_FOLDER_ID
+    main._settings.reload()
+    main._GSPREAD_CLIENT = sheets
+    main._drive_build_service = lambda cfg=None: drive
+    return sheets, drive
+
+
+def seed_sheets(main, sheets: FakeGspreadClient, n_containers: int, products_per_container: int) -> None:
+    containers, products = dataset(n_containers, products_per_container)
+    sh = sheets.spreadsheet(FILE_ID)
+    sh.seed(main.SHEET_CONTAINERS_TITLE, main.HEADERS_CONTAINERS, containers)
+    sh.seed(main.SHEET_PRODUCTS_TITLE, main.HEADERS_PRODUCTS, products)
+    main._sheet_index.invalidate()  # numery wierszy w atrapie zmienione poza aplikacją
+
+
+def seed_drive(drive: FakeDriveService, n_containers: int, products_per_container: int, files_per_product: int) -> List[str]:
+    """Drzewo root → kontener → produkt → pliki; zwraca id folderów kontenerów."""
+    ids = []
+    for i in range(n_containers):
+        c = drive.add_folder(f"Kontener {i:06d}", ROOT_FOLDER_ID)
+        ids.append(c["id"])
+        for j in range(products_per_container):
+            p = drive.add_folder(f"Produkt {j} / {i}", c["id"])
+            for k in range(files_per_product):
+                drive.add(f"zdjecie_{k}.jpg", p["id"], "image/jpeg", b"\xff\xd8" + bytes(64))
+    return ids
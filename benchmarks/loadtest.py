@@ -0,0 +1,373 @@
+"""
+Test obciążeniowy: równoległy CRUD przez HTTP + synchronizacja do arkusza w tle,
+z pomiarem end-to-end opóźnienia arkusza (Sheets lag).
+
+    python -m benchmarks.loadtest --workers 8 --duration 30 --latency 0.05 --rate-limit 60
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --user admin --password ...
+
+Bez --url uruchamiany jest uvicorn w wątku tego procesu z GOOGLE_FAKE=1 (atrapy
+Sheets/Drive z app.fake_google, warunki z --latency/--rate-limit/--quota-rate/
+--failure-rate). Z --url test idzie na działający serwer – uruchomiony z GOOGLE_FAKE=1
+i GOOGLE_FAKE_* w .env, żeby nie zużywać limitów Google.
+
+Każdy worker powtarza scenariusz: kontener → 2 produkty → zmiana ilości produktu →
+zmiana kosztu kontenera → usunięcie produktu → (co 3. cykl) usunięcie kontenera.
+Po każdej operacji rejestrowane jest oczekiwanie względem arkusza (wiersz pojawił się /
+ma nową wartość / zniknął). Obserwator sprawdza arkusz co --poll sekund: w procesie
+bezpośrednio z atrapy (bez symulacji), zdalnie przez /api/sheets/containers|products.
+Sheets lag = czas od wysłania żądania do chwili, gdy zmiana jest widoczna w arkuszu.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+FILE_ID = "loadtest-spreadsheet"
+ROOT_FOLDER_ID = "loadtest-root"
+ABSENT = object()  # oczekiwanie: wiersz usunięty z arkusza
+
+Rows = Dict[str, Dict[str, Dict[str, Any]]]  # zakładka → id → rekord
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--url", default="", help="adres działającego serwera; puste = uvicorn w procesie z atrapami")
+    p.add_argument("--user", default="", help="Basic Auth (tryb --url)")
+    p.add_argument("--password", default="")
+    p.add_argument("--workers", type=int, default=8, help="równoległe wątki klientów")
+    p.add_argument("--duration", type=float, default=20.0, help="czas generowania obciążenia [s]")
+    p.add_argument("--settle", type=float, default=30.0, help="maks. czas oczekiwania na zaległe zmiany arkusza [s]")
+    p.add_argument("--poll", type=float, default=0.05, help="odstęp sprawdzeń arkusza przez obserwatora [s]")
+    p.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    p.add_argument("--latency", type=float, default=0.02, help="opóźnienie wywołania atrapy Google [s]")
+    p.add_argument("--jitter", type=float, default=0.01)
+    p.add_argument("--rate-limit", type=float, default=0.0, help="maks. wywołań atrapy na sekundę (nadmiar → 429)")
+    p.add_argument("--quota-rate", type=float, default=0.0, help="odsetek losowych 429")
+    p.add_argument("--failure-rate", type=float, default=0.0, help="odsetek losowych 500")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--sheets-rate", default="", help="GOOGLE_SHEETS_RATE harmonogramu; puste = domyślny limit aplikacji")
+    p.add_argument("--drive-rate", default="", help="GOOGLE_DRIVE_RATE harmonogramu")
+    p.add_argument("--out", default="benchmarks/results-loadtest.json")
+    p.add_argument("--verbose", action="store_true", help="pozostaw logi INFO aplikacji")
+    return p.parse_args(argv)
+
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    return round(s[min(len(s) - 1, int(len(s) * q))] * 1000, 2)
+
+
+def _summary(values: List[float]) -> Dict[str, Any]:
+    return {
+        "count": len(values),
+        "p50Ms": round(statistics.median(values) * 1000, 2) if values else None,
+        "p95Ms": _pct(values, 0.95),
+        "p99Ms": _pct(values, 0.99),
+        "maxMs": round(max(values) * 1000, 2) if values else None,
+    }
+
+
+class LagWatcher:
+    """
+    Oczekiwania względem arkusza i ich spełnienie: (zakładka, id, pole, wartość, t0).
+    Pole "id" z wartością id = wiersz istnieje; wartość ABSENT = wiersz usunięty.
+    Nowsze oczekiwanie dla tego samego (zakładka, id, pole) zastępuje starsze –
+    wcześniejsza wartość mogła zostać nadpisana, zanim obserwator ją zobaczył;
+    usunięcie wiersza zastępuje wszystkie oczekiwania dla tego id.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str, str], Tuple[str, Any, float]] = {}
+        self.lags: Dict[str, List[float]] = {}
+        self.superseded = 0
+
+    def expect(self, kind: str, sheet: str, rid: str, field: str, value: Any, t0: float) -> None:
+        with self._lock:
+            stale = [k for k in self._pending if k[:2] == (sheet, rid) and (value is ABSENT or k[2] == field)]
+            for k in stale:
+                del self._pending[k]
+            self.superseded += len(stale)
+            self._pending[(sheet, rid, field)] = (kind, value, t0)
+            self.lags.setdefault(kind, [])
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def pending_by_kind(self) -> Dict[str, int]:
+        with self._lock:
+            out: Dict[str, int] = {}
+            for kind, _, _ in self._pending.values():
+                out[kind] = out.get(kind, 0) + 1
+            return out
+
+    def check(self, rows: Rows, now: float) -> int:
+        """Zdejmij spełnione oczekiwania; zwraca liczbę nadal oczekujących."""
+        with self._lock:
+            for key, (kind, value, t0) in list(self._pending.items()):
+                sheet, rid, field = key
+                rec = rows.get(sheet, {}).get(rid)
+                if value is ABSENT:
+                    ok = rec is None
+                else:
+                    ok = rec is not None and str(rec.get(field, "")) == str(value)
+                if ok:
+                    del self._pending[key]
+                    self.lags[kind].append(max(0.0, now - t0))
+            return len(self._pending)
+
+
+def _index_rows(containers: List[Dict[str, Any]], products: List[Dict[str, Any]]) -> Rows:
+    return {
+        "containers": {str(r.get("id")): r for r in containers if r.get("id")},
+        "products": {str(r.get("id")): r for r in products if r.get("id")},
+    }
+
+
+def _fake_reader(main) -> Callable[[], Rows]:
+    from app import fake_google
+
+    sh = fake_google.shared_services(FILE_ID, ROOT_FOLDER_ID)[0].spreadsheet(FILE_ID)
+
+    def read() -> Rows:
+        tabs = {t: sh.worksheets.get(t) for t in (main.SHEET_CONTAINERS_TITLE, main.SHEET_PRODUCTS_TITLE)}
+        return _index_rows(
+            tabs[main.SHEET_CONTAINERS_TITLE].peek_records() if tabs[main.SHEET_CONTAINERS_TITLE] else [],
+            tabs[main.SHEET_PRODUCTS_TITLE].peek_records() if tabs[main.SHEET_PRODUCTS_TITLE] else [],
+        )
+
+    return read
+
+
+def _api_reader(client) -> Callable[[], Rows]:
+    def read() -> Rows:
+        c = client.get("/api/sheets/containers")
+        p = client.get("/api/sheets/products")
+        c.raise_for_status()
+        p.raise_for_status()
+        return _index_rows(c.json(), p.json())
+
+    return read
+
+
+def _start_inprocess_server(args: argparse.Namespace):
+    tmp = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ.update({
+        "GOOGLE_FAKE": "1",
+        "GOOGLE_FAKE_LATENCY": str(args.latency),
+        "GOOGLE_FAKE_JITTER": str(args.jitter),
+        "GOOGLE_FAKE_RATE_LIMIT": str(args.rate_limit),
+        "GOOGLE_FAKE_QUOTA_RATE": str(args.quota_rate),
+        "GOOGLE_FAKE_FAILURE_RATE": str(args.failure_rate),
+        "GOOGLE_FAKE_SEED": str(args.seed),
+        "FILE_ID": FILE_ID,
+        "FOLDER_ID": ROOT_FOLDER_ID,
+        "STORAGE_BACKEND": args.backend,
+        "SQLITE_PATH": os.path.join(tmp, "loadtest.sqlite3"),
+        "SHEETS_OUTBOX_PATH": os.path.join(tmp, "outbox.sqlite3"),
+        "SHEETS_POLL_INTERVAL": "0",
+        "TRACE_SLOW_MS": "-1",
+        "BASIC_AUTH_USERNAME": "",
+        "BASIC_AUTH_PASSWORD": "",
+    })
+    for name, value in (("GOOGLE_SHEETS_RATE", args.sheets_rate), ("GOOGLE_DRIVE_RATE", args.drive_rate)):
+        if value:
+            os.environ[name] = value
+    import uvicorn
+    from app import main as app_main
+
+    config = uvicorn.Config(app_main.app, host="127.0.0.1", port=0, log_level="warning" if not args.verbose else "info")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, name="loadtest-uvicorn", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("uvicorn nie wystartował")
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return app_main, server, thread, f"http://127.0.0.1:{port}"
+
+
+def _worker(wid: int, base_url: str, auth, deadline: float, watcher: LagWatcher,
+            api: Dict[str, List[float]], errors: Dict[str, int], lock: threading.Lock) -> None:
+    import httpx
+
+    def call(op: str, method: str, path: str, **kw):
+        t0 = time.perf_counter()
+        try:
+            res = client.request(method, path, **kw)
+        except httpx.HTTPError:
+            res = None
+        dt = time.perf_counter() - t0
+        with lock:
+            api.setdefault(op, []).append(dt)
+            if res is None or res.status_code >= 400:
+                errors[op] = errors.get(op, 0) + 1
+        return t0, (res if res is not None and res.status_code < 400 else None)
+
+    with httpx.Client(base_url=base_url, auth=auth, timeout=60.0) as client:
+        cycle = 0
+        while time.perf_counter() < deadline:
+            cycle += 1
+            t0, res = call("containers.create", "POST", "/api/containers", json={
+                "name": f"LT {wid}-{cycle}", "orderDate": "2025-03-01", "productionDays": "30",
+                "exchangeRate": "4.05", "containerCost": "2500", "totalTransportCbm": "68",
+            })
+            if res is None:
+                continue
+            cid = res.json()["id"]
+            watcher.expect("container.create", "containers", cid, "id", cid, t0)
+            pids: List[str] = []
+            for j in range(2):
+                t0, res = call("products.create", "POST", f"/api/containers/{cid}/products", json={
+                    "name": f"P {wid}-{cycle}-{j}", "quantity": "10", "totalPrice": "1000",
+                    "totalPriceCurrency": "USD", "productCbm": "2.5", "customsDutyPercent": "4",
+                })
+                if res is not None:
+                    product = res.json()
+                    pids.append(product["id"])
+                    watcher.expect("product.create", "products", product["id"], "id", product["id"], t0)
+            for pid in pids[:1]:
+                qty = str(20 + cycle)
+                t0, res = call("products.update", "PUT", f"/api/containers/{cid}/products/{pid}", json={
+                    "name": f"P {wid}-{cycle}-0", "quantity": qty, "totalPrice": "1000",
+                    "totalPriceCurrency": "USD", "productCbm": "2.5", "customsDutyPercent": "4",
+                })
+                if res is not None:
+                    watcher.expect("product.update", "products", pid, "quantity", qty, t0)
+            cost = str(3000 + cycle)
+            t0, res = call("containers.update", "PUT", f"/api/containers/{cid}", json={"containerCost": cost})
+            if res is not None:
+                watcher.expect("container.update", "containers", cid, "containerCost", cost, t0)
+            if len(pids) > 1:
+                t0, res = call("products.delete", "DELETE", f"/api/containers/{cid}/products/{pids[1]}")
+                if res is not None:
+                    watcher.expect("product.delete", "products", pids[1], "id", ABSENT, t0)
+            if cycle % 3 == 0:
+                t0, res = call("containers.delete", "DELETE", f"/api/containers/{cid}")
+                if res is not None:
+                    watcher.expect("container.delete", "containers", cid, "id", ABSENT, t0)
+                    # produkty kontenera znikają z arkusza razem z nim
+                    for pid in pids[:1]:
+                        watcher.expect("container.delete", "products", pid, "id", ABSENT, t0)
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    auth = (args.user, args.password) if args.user else None
+    server = thread = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        observer = httpx.Client(base_url=base_url, auth=auth, timeout=60.0)
+        read_rows = _api_reader(observer)
+    else:
+        app_main, server, thread, base_url = _start_inprocess_server(args)
+        observer = None
+        read_rows = _fake_reader(app_main)
+
+    watcher = LagWatcher()
+    api: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+    observer_errors = 0
+
+    def observe() -> None:
+        nonlocal observer_errors
+        while not stop.is_set():
+            try:
+                watcher.check(read_rows(), time.perf_counter())
+            except Exception:
+                observer_errors += 1
+            stop.wait(args.poll)
+
+    obs = threading.Thread(target=observe, name="loadtest-observer", daemon=True)
+    obs.start()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    workers = [threading.Thread(target=_worker, args=(w, base_url, auth, deadline, watcher, api, errors, lock), daemon=True)
+               for w in range(args.workers)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    load_seconds = time.perf_counter() - started
+    settle_deadline = time.perf_counter() + args.settle
+    while watcher.pending() and time.perf_counter() < settle_deadline:
+        time.sleep(args.poll)
+    stop.set()
+    obs.join()
+
+    fake_stats: Optional[Dict[str, Any]] = None
+    scheduler: Optional[Dict[str, Any]] = None
+    try:
+        with httpx.Client(base_url=base_url, auth=auth, timeout=10.0) as c:
+            res = c.get("/api/fake-google/stats")
+            fake_stats = res.json() if res.status_code == 200 else None
+            res = c.get("/api/google/quota")
+            scheduler = res.json() if res.status_code == 200 else None
+    except httpx.HTTPError:
+        pass
+    if observer is not None:
+        observer.close()
+    if server is not None:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    all_lags = [x for v in watcher.lags.values() for x in v]
+    total_ops = sum(len(v) for v in api.values())
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "target": args.url or "in-process (GOOGLE_FAKE=1)",
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "verbose", "password")},
+        },
+        "loadSeconds": round(load_seconds, 3),
+        "ops": total_ops,
+        "opsPerSec": round(total_ops / load_seconds, 1) if load_seconds > 0 else None,
+        "api": {op: {**_summary(v), "errors": errors.get(op, 0)} for op, v in sorted(api.items())},
+        "sheetsLag": {"all": _summary(all_lags), **{k: _summary(v) for k, v in sorted(watcher.lags.items())}},
+        "unsynced": watcher.pending(),
+        "unsyncedByKind": watcher.pending_by_kind(),
+        "superseded": watcher.superseded,
+        "observerErrors": observer_errors,
+        "fakeGoogle": fake_stats,
+        "scheduler": scheduler,
+    }
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_args(argv)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger("app.main").setLevel(logging.WARNING)
+    report = run(args)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+    print(f"ops={report['ops']} ({report['opsPerSec']}/s) unsynced={report['unsynced']} {report['unsyncedByKind']} "
+          f"superseded={report['superseded']}")
+    for op, s in report["api"].items():
+        print(f"  api   {op:<20} n={s['count']:<6} err={s['errors']:<4} p50={s['p50Ms']}ms p95={s['p95Ms']}ms")
+    for kind, s in report["sheetsLag"].items():
+        print(f"  lag   {kind:<20} n={s['count']:<6} p50={s['p50Ms']}ms p95={s['p95Ms']}ms max={s['maxMs']}ms")
+    print(f"[loadtest] results → {args.out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
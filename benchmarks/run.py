@@ -0,0 +1,254 @@
+"""
+Benchmarki ścieżek magazynu i synchronizacji z atrapami Google Sheets/Drive w procesie.
+
+    python -m benchmarks.run --sizes 100,1000,10000 --out benchmarks/results.json
+    python -m benchmarks.run --backend sqlite --latency 0.005 --quota-rate 0.02
+
+Mierzone:
+- CRUD przez API (POST/GET/PUT/DELETE kontenerów) przy 100/1k/10k kontenerach,
+  łącznie z synchronizacją do atrapy arkusza w tle,
+- import startowy z arkusza (_auto_import_from_sheets_on_start),
+- skan drzewa Drive (/api/drive/scan) i import z Drive,
+- generowanie PDF kontenera,
+- wyszukiwanie /api/search (budowa indeksu, zapytania, aktualizacja po zapisie),
+- agregaty /api/analytics (budowa, odczyt miesiąca, aktualizacja po zapisie).
+Wyniki (czasy, ops/s, p50/p95, statystyki wywołań atrap) zapisywane są do JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+from benchmarks import fixtures
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--sizes", default="100,1000,10000", help="liczby kontenerów dla testów CRUD")
+    p.add_argument("--sample", type=int, default=500, help="liczba operacji PUT/DELETE na rozmiar")
+    p.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    p.add_argument("--latency", type=float, default=0.0, help="opóźnienie każdego wywołania atrapy Google [s]")
+    p.add_argument("--jitter", type=float, default=0.0, help="losowy dodatek do opóźnienia [s]")
+    p.add_argument("--quota-rate", type=float, default=0.0, help="odsetek wywołań kończących się 429")
+    p.add_argument("--failure-rate", type=float, default=0.0, help="odsetek wywołań kończących się 500")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--sheets-rate", default="0", help="GOOGLE_SHEETS_RATE harmonogramu (0 = bez limitu – mierzony narzut aplikacji)")
+    p.add_argument("--drive-rate", default="0", help="GOOGLE_DRIVE_RATE harmonogramu")
+    p.add_argument("--import-size", type=int, default=1000, help="kontenery w arkuszu dla importu startowego")
+    p.add_argument("--search-products", type=int, default=50000, help="produkty w magazynie dla testu wyszukiwania")
+    p.add_argument("--drive-tree", default="20x5x3", help="kontenery x produkty x pliki w drzewie Drive")
+    p.add_argument("--out", default="benchmarks/results.json")
+    p.add_argument("--verbose", action="store_true", help="pozostaw logi INFO aplikacji")
+    return p.parse_args(argv)
+
+
+def _git_sha() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return ""
+
+
+def _measure(name: str, size: int, ops: int, fn: Callable[[int], Any]) -> Dict[str, Any]:
+    """
+    Wykonaj fn(i) ops razy; czasy pojedynczych operacji → p50/p95.
+    Wyjątek lub odpowiedź HTTP >= 400 liczone są jako błąd (np. wstrzyknięte 429 atrapy).
+    """
+    lat: List[float] = []
+    errors = 0
+    start = time.perf_counter()
+    for i in range(ops):
+        t0 = time.perf_counter()
+        try:
+            res = fn(i)
+            if getattr(res, "status_code", 200) >= 400:
+                errors += 1
+        except Exception:
+            errors += 1
+        lat.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+    lat.sort()
+    return {
+        "name": name,
+        "size": size,
+        "ops": ops,
+        "errors": errors,
+        "seconds": round(total, 4),
+        "opsPerSec": round(ops / total, 1) if total > 0 else None,
+        "p50Ms": round(statistics.median(lat) * 1000, 3) if lat else None,
+        "p95Ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000, 3) if lat else None,
+    }
+
+
+def bench_crud(client, main, n: int, sample: int) -> List[Dict[str, Any]]:
+    main._store.replace_all([])
+    records = [fixtures.container_record(i) for i in range(n)]
+    for r in records:
+        r.pop("id")
+    ids: List[str] = []
+
+    def create(i: int):
+        resp = client.post("/api/containers", json=records[i])
+        ids.append(resp.json()["id"])
+        return resp
+
+    out = [_measure("containers.create", n, n, create)]
+    repeat = max(3, min(50, 20000 // max(n, 1)))
+    out.append(_measure("containers.list", n, repeat, lambda i: client.get("/api/containers")))
+    k = min(sample, n)
+    out.append(_measure("containers.update", n, k,
+                        lambda i: client.put(f"/api/containers/{ids[i]}", json={"containerCost": str(1000 + i)})))
+    out.append(_measure("containers.delete", n, k, lambda i: client.delete(f"/api/containers/{ids[i]}")))
+    return out
+
+
+def bench_startup_import(main, sheets, n: int) -> Dict[str, Any]:
+    fixtures.seed_sheets(main, sheets, n, 3)
+    main._store.replace_all([])
+    res = _measure("sheets.startup_import", n, 1, lambda i: main._auto_import_from_sheets_on_start())
+    res["imported"] = len(main._load_data())
+    return res
+
+
+def bench_drive(client, main, drive, tree: str) -> List[Dict[str, Any]]:
+    c, p, f = (int(x) for x in tree.lower().split("x"))
+    ids = fixtures.seed_drive(drive, c, p, f)
+    main._store.replace_all([])
+    scan = _measure("drive.scan", c * p * f, 1, lambda i: client.get("/api/drive/scan"))
+    imp = _measure("drive.import", c * p * f, 1,
+                   lambda i: client.post("/api/containers/import/drive", json={"containerIds": ids}))
+    return [scan, imp]
+
+
+def bench_pdf(main) -> List[Dict[str, Any]]:
+    out = []
+    for n_products in (10, 100):
+        container = {**fixtures.container_record(0), "pickupDate": "2025-02-01"}
+        container["products"] = [fixtures.product_record(0, j, container) for j in range(n_products)]
+        out.append(_measure("pdf.generate", n_products, 5, lambda i: main.generate_container_pdf(container)))
+    return out
+
+
+def bench_search(client, main, n_products: int) -> List[Dict[str, Any]]:
+    per = 50
+    containers = []
+    for i in range(max(1, n_products // per)):
+        c = fixtures.container_record(i)
+        c["products"] = [fixtures.product_record(i, j, c) for j in range(per)]
+        containers.append(c)
+    main._store.replace_all(containers)
+    out = [_measure("search.build", n_products, 1, lambda i: client.get("/api/search", params={"q": "x"}))]
+    queries = ["produkt", "produkt 7", "prodkut 12", "kontener 000042", "nieistniejacy"]
+    out.append(_measure("search.query", n_products, 200,
+                        lambda i: client.get("/api/search", params={"q": queries[i % len(queries)], "offset": 20})))
+    cid = containers[0]["id"]
+    out.append(_measure("search.update", n_products, 50,
+                        lambda i: (client.put(f"/api/containers/{cid}", json={"name": f"Kontener zmiana {i}"}),
+                                   client.get("/api/search", params={"q": f"zmiana {i}"}))[1]))
+    return out
+
+
+def bench_analytics(client, main) -> List[Dict[str, Any]]:
+    """Na magazynie z bench_search (ta sama liczba produktów)."""
+    data = main._store.list_containers()
+    n_products = sum(len(c.get("products") or []) for c in data)
+    out = [_measure("analytics.build", n_products, 1, lambda i: client.get("/api/analytics"))]
+    out.append(_measure("analytics.month", n_products, 200, lambda i: client.get(f"/api/analytics/months/2025-{i % 12 + 1:02d}")))
+    cid = data[0]["id"]
+    out.append(_measure("analytics.update", n_products, 50,
+                        lambda i: (client.put(f"/api/containers/{cid}", json={"containerCost": str(1000 + i)}),
+                                   client.get("/api/analytics/months/2025-01"))[1]))
+    return out
+
+
+def bench_simulate(client, main) -> List[Dict[str, Any]]:
+    """
+    Siatka 20×10×10×20 scenariuszy na pierwszym kontenerze z bench_search (50 produktów) – samo podsumowanie;
+    pełne wartości (includeValues) na siatce 20×10×10×2 (200 tys. komórek).
+    """
+    cid = main._store.list_containers()[0]["id"]
+    grid = {"exchangeRate": {"from": 3.6, "to": 4.6, "steps": 20}, "customsDutyPercent": {"from": 0, "to": 12, "steps": 10},
+            "containerCost": {"from": 2000, "to": 8000, "steps": 10}, "totalTransportCbm": {"from": 20, "to": 68, "steps": 20}}
+    full = {**grid, "totalTransportCbm": [30, 60], "includeValues": True}
+    return [_measure("containers.simulate", 40_000, 5, lambda i: client.post(f"/api/containers/{cid}/simulate", json=grid)),
+            _measure("containers.simulate.values", 4_000, 5,
+                     lambda i: client.post(f"/api/containers/{cid}/simulate", json=full))]
+
+
+def bench_loadplan(client, main) -> List[Dict[str, Any]]:
+    """Produkty 10 kontenerów z bench_search (500 pozycji), domyślne rozmiary kontenerów."""
+    ids = [c["id"] for c in main._store.list_containers()[:10]]
+    return [_measure(f"loadplan.{objective}", 500, 5,
+                     lambda i, o=objective: client.post("/api/load-plan", json={"containerIds": ids, "objective": o}))
+            for objective in ("count", "value")]
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_args(argv)
+    tmp = tempfile.mkdtemp(prefix="bench-")
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ["SQLITE_PATH"] = os.path.join(tmp, "bench.sqlite3")
+    os.environ["SHEETS_POLL_INTERVAL"] = "0"
+    os.environ["TRACE_SLOW_MS"] = "-1"
+    os.environ["GOOGLE_SHEETS_RATE"] = args.sheets_rate
+    os.environ["GOOGLE_DRIVE_RATE"] = args.drive_rate
+
+    from fastapi.testclient import TestClient
+    from app import main as app_main
+    from app.fake_google import Simulator
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger("app.main").setLevel(logging.WARNING)
+
+    sim = Simulator(latency=args.latency, jitter=args.jitter, quota_error_rate=args.quota_rate,
+                    failure_rate=args.failure_rate, seed=args.seed)
+    sheets, drive = fixtures.install(app_main, sim)
+    # Błędy serwera (np. 429 z atrapy przy skanie Drive) jako odpowiedzi 500, nie wyjątki
+    client = TestClient(app_main.app, raise_server_exceptions=False)
+
+    results: List[Dict[str, Any]] = []
+    for n in (int(s) for s in args.sizes.split(",") if s.strip()):
+        results += bench_crud(client, app_main, n, args.sample)
+        print(f"[bench] CRUD n={n} done", file=sys.stderr)
+    results.append(bench_startup_import(app_main, sheets, args.import_size))
+    results += bench_drive(client, app_main, drive, args.drive_tree)
+    results += bench_pdf(app_main)
+    results += bench_search(client, app_main, args.search_products)
+    results += bench_analytics(client, app_main)
+    results += bench_simulate(client, app_main)
+    results += bench_loadplan(client, app_main)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "gitSha": _git_sha(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "verbose")},
+        },
+        "results": results,
+        "fakeGoogle": sim.stats(),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+    for r in results:
+        print(f"{r['name']:<24} size={r['size']:<6} ops={r['ops']:<6} err={r['errors']:<4} {r['seconds']:>9.3f}s  "
+              f"{r['opsPerSec'] or 0:>9.1f}/s  p95={r['p95Ms']}ms")
+    print(f"[bench] results → {args.out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
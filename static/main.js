@@ -4,7 +4,7 @@ import { els } from './dom.js';
 import {
   showToast, showLoader, hideLoader, initTheme, num, toUSD, convertPrice, normalizeDateValue, fillSheetContainerSelect, fillSheetProductSelect,
   fileNameFromUrl, extractDriveFileId, needsNameFromDrive, fetchDriveFilesByProductName, renderAttachmentLinksInto,
-  loadSheets, syncContainersFromSheet, syncProductsFromSheet, getSheetContainers, getSheetProducts
+  loadSheets, syncContainersFromSheet, syncProductsFromSheet, getSheetContainers, getSheetProducts, reconcileFromSheet
 } from './utils.js';
 import { api, loadContainers } from './api.js';
 import { renderProductContainerSelect, renderContainersList, renderProductsList, getAllProducts } from './render.js';
@@ -554,13 +554,8 @@ els.refreshBtn.addEventListener("click", async () => {
   await initTheme();
   await loadContainers();
 
-  // Następnie wymuś pełną synchronizację (replace) kontenerów
-  await syncContainersFromSheet(true);
-  await initTheme();
-  await loadContainers();
-
-  // Teraz wymuś pełną synchronizację (replace) produktów
-  await syncProductsFromSheet(true);
+  // Uzgodnij kontenery i produkty z arkuszem po stronie serwera (tylko różnice)
+  await reconcileFromSheet();
 
   // Na końcu odśwież widok i dane
   await initTheme();
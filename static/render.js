@@ -2,7 +2,7 @@ import { state } from './state.js';
 import { els } from './dom.js';
 import { 
   num, toUSD, convertPrice, calculateProductCosts, calculateContainerTotals, getStatusClass,
-  fileNameFromUrl, extractDriveFileId, needsNameFromDrive, fetchDriveFilesByProductName, renderAttachmentLinksInto 
+  fileNameFromUrl, extractDriveFileId, needsNameFromDrive, fetchDriveFilesByProductName, renderAttachmentLinksInto, productFiles 
 } from './utils.js';
 import { api } from './api.js';
 
@@ -145,7 +145,7 @@ export function renderContainersList() {
           (function hydrateAttachments() {
             const attEl = row.querySelector(".attachments");
             if (!attEl) return;
-            const localFiles = Array.isArray(p.files) ? p.files : [];
+            const localFiles = productFiles(p);
             if (localFiles.length) {
               // Jeśli lokalne linki wyglądają jak linki Drive bez nazwy (np. /uc?export=download&id=...),
               // spróbuj podciągnąć nazwy z Drive i zmapować po fileId.
@@ -258,7 +258,7 @@ export function renderProductsList() {
       // Znajdź placeholder attachments w kafelku produktu
       const el = box.querySelector(`.product-card[data-pkey="${key}"] .attachments`);
       if (!el) continue;
-      const localFiles = Array.isArray(product.files) ? product.files : [];
+      const localFiles = productFiles(product);
       if (localFiles.length > 0) {
         const shouldUpgrade = localFiles.some(x => {
           const href = (typeof x === "object" && x !== null) ? (x.url || "") : String(x || "");
@@ -397,6 +397,24 @@ export async function syncProductsFromSheet(replaceExisting = false) {
   }
 }
 
+/* Uzgodnienie z arkuszem po stronie serwera (row-hash diff) – zastępuje replace kontenerów/produktów.
+   Zmieniane są tylko różniące się wiersze; id kontenerów i produktów pozostają stabilne. */
+export async function reconcileFromSheet() {
+  if (state.isSyncingFromSheet) return null;
+  state.isSyncingFromSheet = true;
+  console.log("[Sync] reconcileFromSheet() begin");
+  try {
+    const res = await api("POST", "/api/sheets/reconcile", undefined, 60000);
+    console.log("[Sync] reconcileFromSheet done:", res?.summary);
+    return res;
+  } catch (e) {
+    console.error("[Sync] reconcileFromSheet FAILED:", e);
+    return null;
+  } finally {
+    state.isSyncingFromSheet = false;
+  }
+}
+
 export function calculateProductCosts(product, container) {
   const exchangeRate = num(container.exchangeRate, 4.0);
   const totalPriceUSD = toUSD(num(product.totalPrice, 0), product.totalPriceCurrency, exchangeRate);
@@ -553,6 +571,15 @@ export function needsNameFromDrive(url) {
   return isDrive && (generic || !hasExt);
 }
 
+/* Załączniki produktu: rekord z metadanymi serwera (product.attachments), jeśli znany – inaczej sam link */
+export function productFiles(product) {
+  const files = Array.isArray(product?.files) ? product.files : [];
+  const records = Array.isArray(product?.attachments) ? product.attachments : [];
+  if (!records.length) return files;
+  const byUrl = new Map(records.map(r => [r.url, r]));
+  return files.map(f => (typeof f === "string" && byUrl.has(f)) ? byUrl.get(f) : f);
+}
+
 /* Pobieranie załączników z Google Drive wg nazwy produktu (folder = nazwa produktu) */
 export async function fetchDriveFilesByProductName(name) {
   const key = String(name || "").trim();
@@ -599,8 +626,14 @@ export function renderAttachmentLinksInto(containerEl, urls) {
   }
   containerEl.innerHTML = list.map(u => {
     const isObj = typeof u === "object" && u !== null;
-    const href = isObj ? (u.url || "") : String(u || "");
+    // Rekordy z metadanymi serwera (product.attachments) pobierane przez proxy z cache (/api/files/{id})
+    const href = isObj ? (u.id && u.mimeType ? `/api/files/${encodeURIComponent(u.id)}?download=1` : (u.url || "")) : String(u || "");
     const label = isObj ? (u.name || fileNameFromUrl(href)) : fileNameFromUrl(href);
-    return href ? `<a href="${href}" download class="btn small" rel="noopener" target="_blank">${label}</a>` : "";
+    // Miniatura z /api/files/{id}/preview (obrazy, PDF); brak podglądu (202/404) – zostaje sama nazwa
+    const mime = isObj ? String(u.mimeType || "") : "";
+    const thumb = isObj && u.id && (mime.startsWith("image/") || mime === "application/pdf")
+      ? `<img src="/api/files/${encodeURIComponent(u.id)}/preview" alt="" loading="lazy" decoding="async" style="display:block;max-width:96px;max-height:96px;margin-bottom:4px" onerror="this.remove()">`
+      : "";
+    return href ? `<a href="${href}" download class="btn small" rel="noopener" target="_blank">${thumb}${label}</a>` : "";
   }).filter(Boolean).join("");
 }
\ No newline at end of file
@@ -0,0 +1,31 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# app.main otwiera pliki robocze przy imporcie – w testach katalog tymczasowy zamiast data/ w repozytorium
+_TMP = tempfile.mkdtemp(prefix="import-tracker-tests-")
+atexit.register(shutil.rmtree, _TMP, ignore_errors=True)
+os.environ.setdefault("SHEETS_OUTBOX_PATH", os.path.join(_TMP, "sheets_outbox.sqlite3"))
+os.environ.setdefault("FILE_CACHE_DIR", os.path.join(_TMP, "file_cache"))
+os.environ.setdefault("PREVIEW_DIR", os.path.join(_TMP, "previews"))
+
+from app import main  # noqa: E402
+from app.storage import MemoryStore, SqliteStore  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def settings_snapshot():
+    """Testy zmieniające env przeładowują snapshot konfiguracji; po teście – powrót do stanu bez ich zmian."""
+    yield
+    main._settings.reload()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    """Każdy test korzystający z magazynu uruchamiany dla obu backendów."""
+    if request.param == "sqlite":
+        return SqliteStore(str(tmp_path / "store.sqlite3"))
+    return MemoryStore()
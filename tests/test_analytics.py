@@ -0,0 +1,75 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import analytics, costing, main
+from app.storage import MemoryStore
+
+
+def _container(cid, order_date, products=(), **flags):
+    return {"id": cid, "name": cid, "orderDate": order_date, "exchangeRate": "4.0",
+            "containerCost": "2000", "totalTransportCbm": "60", "products": list(products), **flags}
+
+
+def _product(pid, price, cbm, currency="USD"):
+    return {"id": pid, "name": pid, "quantity": "10", "totalPrice": str(price), "totalPriceCurrency": currency,
+            "productCbm": str(cbm), "customsDutyPercent": "5"}
+
+
+def test_rollups_track_mutations_without_recomputing(store):
+    rollups = analytics.Rollups()
+    store.add_change_listener(rollups.invalidate)
+    store.insert_container(_container("c1", "2025-01-10", [_product("p1", 1000, 10), _product("p2", 400, 5, "PLN")]))
+    store.insert_container(_container("c2", "2025-01-20", [_product("p3", 500, 20)], pickedUpInChina=True))
+    store.insert_container(_container("c3", "2025-03-01", [], pickedUpInChina=True, customsClearanceDone=True,
+                                      deliveredToWarehouse=True, documentsInSystem=True))
+
+    def summary(**kw):
+        rollups.refresh(store.list_containers, store.get_container)
+        return rollups.summary(**kw)
+
+    first = summary()
+    assert [m["month"] for m in first["byMonth"]] == ["2025-01", "2025-03"]
+    assert first["total"]["containers"] == 3 and first["total"]["spendByCurrency"] == {"PLN": 400.0, "USD": 1500.0}
+    assert {s: v["containers"] for s, v in first["byStatus"].items()} == \
+        {"production": 1, "customs": 1, "delivery": 0, "documents": 0, "done": 1}
+    assert first["total"]["flags"]["pickedUpInChina"] == 2
+
+    store.update_container("c1", {"orderDate": "2025-02-01", "pickedUpInChina": True})
+    store.delete_product("c2", "p3")
+    store.delete_container("c3")
+    after = summary()
+    assert rollups.builds == 1 and rollups.updates == 3
+    assert [m["month"] for m in after["byMonth"]] == ["2025-01", "2025-02"]
+
+    # zgodność z pełnym przeliczeniem
+    expected = analytics.Rollups()
+    expected.rebuild(store.list_containers())
+    assert after["total"] == expected.summary()["total"]
+    c1 = store.get_container("c1")
+    totals = costing.container_totals(c1)
+    feb = rollups.month("2025-02")
+    assert feb["nettoUsd"] == round(totals["nettoTotal"], 2) and feb["bruttoPln"] == round(totals["bruttoTotal"] * 4, 2)
+    assert rollups.month("2025-02", "customs")["containers"] == 1
+    assert summary(start="2025-02")["byStatus"]["customs"]["containers"] == 1
+    assert summary(start="2025-02")["byStatus"]["production"]["containers"] == 0
+
+    # kontenery bez daty zamówienia – tylko w zapytaniach bez zakresu albo z from/to=unknown
+    store.insert_container(_container("c4", "", [_product("p4", 100, 1)]))
+    assert [m["month"] for m in summary()["byMonth"]] == ["2025-01", "2025-02", analytics.NO_MONTH]
+    ranged = summary(start="2025-02")
+    assert [m["month"] for m in ranged["byMonth"]] == ["2025-02"] and ranged["total"]["containers"] == 1
+    assert [m["month"] for m in summary(start=analytics.NO_MONTH, end=analytics.NO_MONTH)["byMonth"]] == [analytics.NO_MONTH]
+
+
+def test_analytics_endpoints(monkeypatch):
+    monkeypatch.setattr(main, "_store", MemoryStore())
+    monkeypatch.setattr(main, "_analytics", analytics.Rollups())
+    main._store.add_change_listener(main._analytics.invalidate)
+    main._store.insert_container(_container("c1", "2025-05-05", [_product("p1", 100, 1)]))
+    client = TestClient(main.app)
+
+    body = client.get("/api/analytics", params={"from": "2025-01", "to": "2025-12", "status": "production"}).json()
+    assert body["total"]["containers"] == 1 and body["byMonth"][0]["month"] == "2025-05"
+    assert client.get("/api/analytics/months/2025-05").json()["products"] == 1
+    assert client.get("/api/analytics/months/2025-5").status_code == 400
+    assert client.get("/api/analytics", params={"status": "lost"}).status_code == 400
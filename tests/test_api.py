@@ -14,6 +14,15 @@ def clear_memory():
     with _data_lock:
         _mem_data.clear()
 
+@pytest.fixture(autouse=True)
+def sheets_outbox(monkeypatch):
+    from app import main
+    from app.outbox import Outbox
+
+    box = Outbox(":memory:", main._sheets_outbox.handlers, main._sheets_outbox.batch_handlers)
+    monkeypatch.setattr(main, "_sheets_outbox", box)
+    return box
+
 def test_get_containers_empty():
     response = client.get("/api/containers")
     assert response.status_code == 200
@@ -164,7 +173,7 @@ def test_delete_product():
 
 def test_import_from_drive_mocked(monkeypatch):
     # Mock _drive_build_service and _drive_resolve_root_id
-    monkeypatch.setattr("app.main._drive_build_service", lambda: None)
+    monkeypatch.setattr("app.main._drive_build_service", lambda cfg=None: None)
     monkeypatch.setattr("app.main._drive_resolve_root_id", lambda *args, **kwargs: "root_id")
     
     # Mock Google Drive API calls inside app.main
@@ -178,7 +187,7 @@ def test_import_from_drive_mocked(monkeypatch):
         def files(self):
             return FakeFiles()
             
-    monkeypatch.setattr("app.main._drive_build_service", lambda: FakeService())
+    monkeypatch.setattr("app.main._drive_build_service", lambda cfg=None: FakeService())
     
     # Mock _drive_list_folders and _drive_list_files
     monkeypatch.setattr("app.main._drive_list_folders", lambda service, parent_id: [
@@ -206,4 +215,427 @@ def test_import_from_drive_mocked(monkeypatch):
     assert response.status_code == 200
     data = response.json()
     assert data["imported"]["containers"] == 1
-    assert data["imported"]["products"] == 1
\ No newline at end of file
+    assert data["imported"]["products"] == 1
+
+
+def test_containers_reports_zip_filtered():
+    import io
+    import zipfile
+    with _data_lock:
+        _mem_data.extend([
+            {"id": "a1", "name": "Styczeń", "orderDate": "2025-01-10", "productionDays": "30",
+             "exchangeRate": "4.0", "pickedUpInChina": True, "products": []},
+            {"id": "b2", "name": "Luty", "orderDate": "2025-02-10", "productionDays": "30",
+             "exchangeRate": "4.0", "pickedUpInChina": False, "products": []},
+            {"id": "c3", "name": "Marzec", "orderDate": "2025-03-10", "productionDays": "30",
+             "exchangeRate": "4.0", "pickedUpInChina": True, "products": []},
+        ])
+    response = client.get("/api/containers/reports.zip?dateFrom=2025-01-01&dateTo=2025-02-28")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+    assert sorted(names) == ["raport_Luty_b2.pdf", "raport_Styczeń_a1.pdf"]
+
+    response = client.get("/api/containers/reports.zip?pickedUpInChina=true")
+    zf = zipfile.ZipFile(io.BytesIO(response.content))
+    assert len(zf.namelist()) == 2
+    assert all(zf.read(n).startswith(b"%PDF") for n in zf.namelist())
+
+def test_reports_zip_lists_failed_pdfs_in_errors_txt(monkeypatch):
+    import io
+    import zipfile
+    from app import bulk_export
+
+    real_render = bulk_export._render
+
+    def flaky_render(c):
+        if c["id"] == "bad":
+            raise ValueError("uszkodzone dane")
+        return real_render(c)
+
+    monkeypatch.setattr(bulk_export, "_render", flaky_render)
+    containers = [{"id": i, "name": i.upper(), "orderDate": "2025-01-10", "productionDays": "30",
+                   "exchangeRate": "4.0", "products": []} for i in ("ok", "bad")]
+    zf = zipfile.ZipFile(io.BytesIO(b"".join(bulk_export.iter_pdf_zip(containers, workers=0))))
+    assert sorted(zf.namelist()) == ["errors.txt", "raport_OK_ok.pdf"]
+    assert "bad\tBAD\tValueError: uszkodzone dane" in zf.read("errors.txt").decode("utf-8")
+
+def test_export_products_csv_with_costs():
+    import csv
+    import io
+    with _data_lock:
+        _mem_data.append({
+            "id": "e1", "name": "Eksport", "orderDate": "2025-01-01", "productionDays": "30",
+            "exchangeRate": "4.0", "containerCost": "1000", "containerCostCurrency": "USD",
+            "totalTransportCbm": "10",
+            "products": [{"id": "p1", "name": "Krzesło", "quantity": "10", "totalPrice": "400",
+                          "totalPriceCurrency": "PLN", "productCbm": "5", "customsDutyPercent": "10", "files": []}],
+        })
+    response = client.get("/api/export/products?format=csv")
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 1
+    row = rows[0]
+    assert row["containerId"] == "e1" and row["containerName"] == "Eksport"
+    assert float(row["pricePerUnit"]) == pytest.approx(10.0)      # 400 PLN / 4.0 / 10 szt.
+    assert float(row["transportPerUnit"]) == pytest.approx(50.0)  # 1000 USD * 5/10 CBM / 10 szt.
+    assert float(row["dutyAmount"]) == pytest.approx(60.0)        # (100 + 500) * 10%
+
+def test_export_formats():
+    with _data_lock:
+        _mem_data.append({"id": "e2", "name": "X", "orderDate": "2025-01-01", "productionDays": "1", "products": []})
+    response = client.get("/api/export/containers?format=xlsx")
+    assert response.status_code == 200
+    assert response.content[:2] == b"PK"
+    assert client.get("/api/export/containers?format=xml").status_code == 400
+
+
+def test_export_reads_store_cursor(monkeypatch):
+    from app import main
+    from app.storage import MemoryStore
+    store = MemoryStore([{"id": "e4", "name": "Z", "orderDate": "2025-01-01", "productionDays": "1",
+                          "products": [{"id": "p1", "name": "Lampa", "quantity": "2", "totalPrice": "10"}]}])
+
+    def no_full_copy():
+        raise AssertionError("eksport nie powinien kopiować całego zbioru")
+
+    monkeypatch.setattr(store, "list_containers", no_full_copy)
+    monkeypatch.setattr(main, "_store", store)
+    assert "Lampa" in client.get("/api/export/products").text
+    assert "Z" in client.get("/api/export/containers").text
+
+
+def test_export_parquet():
+    # pyarrow jest opcjonalny (poza requirements.txt – rozmiar funkcji Vercel)
+    pytest.importorskip("pyarrow")
+    with _data_lock:
+        _mem_data.append({"id": "e3", "name": "Y", "orderDate": "2025-01-01", "productionDays": "1", "products": []})
+    response = client.get("/api/export/containers?format=parquet")
+    assert response.status_code == 200
+    assert response.content[:4] == b"PAR1"
+
+def test_import_file_reports_all_bad_cells():
+    csv_body = (
+        "name,orderDate,productionDays,containerCost\n"
+        "Dobry,2025-01-01,30,1000\n"
+        "Zła data,01.02.2025,30,abc\n"
+        ",2025-03-01,x,\n"
+    ).encode("utf-8")
+    response = client.post(
+        "/api/import/file",
+        data={"kind": "containers"},
+        files={"file": ("kontenery.csv", csv_body, "text/csv")},
+        auth=("admin", "admin"),
+    )
+    if response.status_code == 401:
+        pytest.skip("Auth required but credentials not matching")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["imported"] == 1
+    bad = {(e["row"], e["column"]) for e in body["errors"]}
+    assert bad == {(3, "orderDate"), (3, "containerCost"), (4, "name"), (4, "productionDays")}
+
+    containers = client.get("/api/containers").json()
+    assert [c["name"] for c in containers] == ["Dobry"]
+    assert containers[0]["pickupDate"] == "2025-01-31"
+    assert containers[0]["containerCostCurrency"] == "USD"
+
+def test_import_file_ignores_id_column():
+    with _data_lock:
+        _mem_data.append({"id": "k1", "name": "Istniejący", "orderDate": "2025-01-01",
+                          "productionDays": "30", "products": []})
+    csv_body = (
+        "id,name,orderDate,productionDays\n"
+        "k1,Nowy A,2025-01-01,30\n"
+        "dup,Nowy B,2025-01-01,30\n"
+        "dup,Nowy C,2025-01-01,30\n"
+    ).encode("utf-8")
+    response = client.post("/api/import/file", data={"kind": "containers"},
+                           files={"file": ("kontenery.csv", csv_body, "text/csv")}, auth=("admin", "admin"))
+    if response.status_code == 401:
+        pytest.skip("Auth required but credentials not matching")
+    assert response.json()["imported"] == 3
+    names = {c["id"]: c["name"] for c in client.get("/api/containers").json()}
+    # id z pliku nie nadpisuje istniejącego kontenera ani nie powtarza się
+    assert len(names) == 4 and "dup" not in names and names["k1"] == "Istniejący"
+
+def test_import_file_products_xlsx_dry_run():
+    import io
+    from openpyxl import Workbook
+    with _data_lock:
+        _mem_data.append({"id": "k1", "name": "Kontener A", "orderDate": "2025-01-01",
+                          "productionDays": "30", "products": []})
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["name", "quantity", "totalPrice", "containerName"])
+    ws.append(["Stół", 5, 250.5, "kontener a"])
+    ws.append(["Szafa", 2, 100, "Nieznany"])
+    buf = io.BytesIO()
+    wb.save(buf)
+    files = {"file": ("produkty.xlsx", buf.getvalue(), "application/octet-stream")}
+
+    response = client.post("/api/import/file", data={"kind": "products", "dryRun": "true"}, files=files, auth=("admin", "admin"))
+    if response.status_code == 401:
+        pytest.skip("Auth required but credentials not matching")
+    body = response.json()
+    assert body["imported"] == 1
+    assert body["errors"] == [{"row": 3, "column": "containerName", "value": "Nieznany", "error": "Nie znaleziono kontenera"}]
+    assert client.get("/api/containers").json()[0]["products"] == []
+
+    response = client.post("/api/import/file", data={"kind": "products"}, files=files, auth=("admin", "admin"))
+    products = client.get("/api/containers").json()[0]["products"]
+    assert [(p["name"], p["quantity"], p["totalPrice"]) for p in products] == [("Stół", "5", "250.5")]
+
+def test_sheets_reconcile_applies_only_differences(monkeypatch):
+    with _data_lock:
+        _mem_data.extend([
+            {**ContainerIn(name="A", orderDate="2025-01-01", productionDays="10").model_dump(), "id": "c1",
+             "pickupDate": "2025-01-11",
+             "products": [{"id": "p1", "name": "Lampa", "quantity": "5", "totalPrice": "50",
+                           "totalPriceCurrency": "USD", "productCbm": "", "customsDutyPercent": "",
+                           "files": ["http://plik"]}]},
+            {**ContainerIn(name="Stary", orderDate="2025-01-01", productionDays="10").model_dump(), "id": "c2",
+             "products": []},
+        ])
+    sheet = {
+        "containers": [
+            {"id": "c1", "name": "A", "orderDate": "2025-01-01", "productionDays": "10", "exchangeRate": "4.2"},
+            {"id": "", "name": "B", "orderDate": "2025-02-01", "productionDays": "5"},
+        ],
+        "products": [
+            {"id": "p1", "name": "Lampa", "quantity": "7", "totalPrice": "50", "containerId": "c1"},
+            {"id": "", "name": "Biurko", "quantity": "1", "totalPrice": "90", "containerName": "b"},
+        ],
+    }
+    monkeypatch.setattr("app.main._sheet_records_many", lambda titles: sheet)
+
+    response = client.post("/api/sheets/reconcile?dryRun=true", auth=("admin", "admin"))
+    if response.status_code == 401:
+        pytest.skip("Auth required but credentials not matching")
+    body = response.json()
+    assert body["summary"] == {
+        "containersInserted": 1, "containersUpdated": 1, "containersDeleted": 1,
+        "productsInserted": 1, "productsUpdated": 1, "productsDeleted": 0, "productsUnmatched": 0,
+    }
+    assert body["diff"]["containers"]["update"][0]["changed"] == ["exchangeRate"]
+    assert {c["id"] for c in client.get("/api/containers").json()} == {"c1", "c2"}
+
+    client.post("/api/sheets/reconcile", auth=("admin", "admin"))
+    containers = {c["name"]: c for c in client.get("/api/containers").json()}
+    assert set(containers) == {"A", "B"}
+    assert containers["A"]["id"] == "c1" and containers["A"]["exchangeRate"] == "4.2"
+    assert containers["A"]["products"][0]["id"] == "p1"
+    assert containers["A"]["products"][0]["quantity"] == "7"
+    assert containers["A"]["products"][0]["files"] == ["http://plik"]
+    assert [p["name"] for p in containers["B"]["products"]] == ["Biurko"]
+
+    # Drugie uzgodnienie – brak różnic
+    again = client.post("/api/sheets/reconcile?dryRun=true", auth=("admin", "admin")).json()
+    assert not any(again["summary"].values())
+
+def test_sheets_reconcile_holds_containers_with_unsynced_outbox_entries(monkeypatch, sheets_outbox):
+    from app import main
+    with _data_lock:
+        _mem_data.extend([
+            {**ContainerIn(name="Nowy", orderDate="2025-01-01", productionDays="1").model_dump(), "id": "c1", "products": []},
+            {**ContainerIn(name="Zsync", orderDate="2025-01-01", productionDays="1").model_dump(), "id": "c2", "products": []},
+        ])
+    # c1 czeka w outboxie (append do arkusza nieudany), c3 usunięty lokalnie – usunięcie też czeka
+    sheets_outbox.enqueue("container.created", _mem_data[0], partition="c1")
+    sheets_outbox.enqueue("container.deleted", {"id": "c3", "name": "Usunięty"}, partition="c3")
+    sheet = {
+        "containers": [{"id": "c2", "name": "Zsync", "orderDate": "2025-01-01", "productionDays": "1"},
+                       {"id": "c3", "name": "Usunięty", "orderDate": "2025-01-01", "productionDays": "1"}],
+        "products": [{"id": "p3", "name": "Stary", "quantity": "1", "containerId": "c3"}],
+    }
+    monkeypatch.setattr("app.main._sheet_records_many", lambda titles: sheet)
+
+    response = client.post("/api/sheets/reconcile", auth=("admin", "admin"))
+    if response.status_code == 401:
+        pytest.skip("Auth required but credentials not matching")
+    body = response.json()
+    assert body["held"] == ["c1", "c3"] and not any(body["summary"].values())
+    assert {c["id"] for c in client.get("/api/containers").json()} == {"c1", "c2"}
+    assert main._poll_should_defer()
+
+def test_sheets_poller_reconciles_only_on_revision_change():
+    from app.sheets_poller import SheetsPoller
+    revisions = iter(["r1", "r1", "r2", "r2", "r3", "r3"])
+    synced = []
+    defer = {"on": False}
+    poller = SheetsPoller(interval=60, get_revision=lambda: next(revisions),
+                          on_change=lambda: synced.append(1), should_defer=lambda: defer["on"])
+    # pierwszy cykl uzgadnia – edycje arkusza sprzed pierwszego sprawdzenia nie giną
+    assert poller.tick() == "synced"
+    assert poller.tick() == "unchanged"
+    assert poller.tick() == "synced"
+    assert poller.tick() == "unchanged"
+    defer["on"] = True
+    assert poller.tick() == "deferred"
+    defer["on"] = False
+    assert poller.tick() == "synced"
+    assert len(synced) == 3
+    assert poller.status()["lastRevision"] == "r3"
+
+def test_sheets_status_exposes_poller():
+    response = client.get("/api/sheets/status")
+    assert response.status_code == 200
+    assert {"enabled", "lastRevision", "lastSync"} <= set(response.json()["poller"])
+
+
+def test_create_container_with_existing_id_conflicts():
+    payload = {"id": "dup1", "name": "Pierwszy", "orderDate": "2025-01-01", "productionDays": "30"}
+    created = client.post("/api/containers", json=payload, auth=("admin", "admin"))
+    if created.status_code == 401:
+        pytest.skip("Auth required but credentials not matching")
+    assert created.status_code == 201
+    again = client.post("/api/containers", json={**payload, "name": "Drugi"}, auth=("admin", "admin"))
+    assert again.status_code == 409
+    assert [c["name"] for c in client.get("/api/containers").json() if c["id"] == "dup1"] == ["Pierwszy"]
+
+
+def test_if_match_rejects_stale_writes():
+    payload = {"name": "Rewizje", "orderDate": "2025-01-01", "productionDays": "30"}
+    created = client.post("/api/containers", json=payload, auth=("admin", "admin"))
+    if created.status_code == 401:
+        pytest.skip("Auth required but credentials not matching")
+    assert created.json()["revision"] == 1 and created.headers["ETag"] == '"1"'
+    cid = created.json()["id"]
+
+    first = client.put(f"/api/containers/{cid}", json={"name": "A"}, headers={"If-Match": '"1"'}, auth=("admin", "admin"))
+    assert first.status_code == 200 and first.json()["revision"] == 2
+    stale = client.put(f"/api/containers/{cid}", json={"name": "B"}, headers={"If-Match": '"1"'}, auth=("admin", "admin"))
+    assert stale.status_code == 412 and stale.headers["ETag"] == '"2"'
+
+    prod = client.post(f"/api/containers/{cid}/products", json={"name": "P", "quantity": "1", "totalPrice": "5"},
+                       auth=("admin", "admin"))
+    pid = prod.json()["id"]
+    body = {"name": "P2", "quantity": "2", "totalPrice": "5"}
+    assert client.put(f"/api/containers/{cid}/products/{pid}", json=body, headers={"If-Match": 'W/"1"'},
+                      auth=("admin", "admin")).json()["revision"] == 2
+    assert client.put(f"/api/containers/{cid}/products/{pid}", json=body, headers={"If-Match": '"1"'},
+                      auth=("admin", "admin")).status_code == 412
+    assert client.delete(f"/api/containers/{cid}", headers={"If-Match": '"1"'}, auth=("admin", "admin")).status_code == 412
+    assert client.delete(f"/api/containers/{cid}", headers={"If-Match": '"2"'}, auth=("admin", "admin")).status_code == 204
+
+
+def test_metrics_exposes_route_latency_and_google_calls(monkeypatch):
+    from app import metrics, quota
+    from app.main import _gcall
+
+    monkeypatch.setattr(quota.SCHEDULER, "max_retries", 0)
+
+    class QuotaError(Exception):
+        class response:
+            status_code = 429
+
+    _gcall("col_values", lambda i: ["id", "x"], 1)
+    with pytest.raises(QuotaError):
+        _gcall("append_row", lambda: (_ for _ in ()).throw(QuotaError("Quota exceeded")))
+    client.get("/api/containers")
+    client.get("/api/containers/nope/report.pdf")
+
+    resp = client.get("/api/metrics", auth=("admin", "admin"))
+    if resp.status_code == 401:
+        pytest.skip("Auth required but credentials not matching")
+    text = resp.text
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/containers"}' in text
+    assert 'route="/api/containers/{container_id}/report.pdf",status="404"' in text
+    assert 'google_api_calls_total{op="col_values",outcome="ok"}' in text
+    assert metrics.google_quota_errors.value("append_row") >= 1
+    assert 'store_lock_wait_seconds_count{backend="memory",op="list_containers"}' in text
+
+
+def test_trace_spans_cover_store_and_background_sync(monkeypatch):
+    from app import main, quota, sheet_index, tracing
+    from app.fake_google import FakeGspreadClient
+    monkeypatch.setattr(tracing, "SLOW_MS", 0.0)
+    monkeypatch.setattr(quota, "SCHEDULER", quota.Scheduler({}))
+    sheets = FakeGspreadClient()
+    sheets.spreadsheet("trace-test")
+    monkeypatch.setattr(main, "_GSPREAD_CLIENT", sheets, raising=False)
+    monkeypatch.setattr(main, "_sheet_index", sheet_index.RowIndex())
+    monkeypatch.setenv("FILE_ID", "trace-test")
+    main._settings.reload()
+
+    created = client.post("/api/containers", json={"name": "T", "orderDate": "2025-01-01", "productionDays": "1"},
+                          auth=("admin", "admin"))
+    if created.status_code == 401:
+        pytest.skip("Auth required but credentials not matching")
+    cid = created.json()["id"]
+    pid = client.post(f"/api/containers/{cid}/products", json={"name": "P", "quantity": "1", "totalPrice": "1"},
+                      auth=("admin", "admin")).json()["id"]
+
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    resp = client.put(f"/api/containers/{cid}/products/{pid}", json={"name": "P", "quantity": "2", "totalPrice": "1"},
+                      headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"}, auth=("admin", "admin"))
+    assert resp.headers["X-Trace-Id"] == trace_id
+
+    trace = next(t for t in tracing.slow_traces() if t["traceId"] == trace_id)
+    names = [s["name"] for s in trace["spans"]]
+    assert "store.update_product" in names
+    assert "background:_drain_sheets_outbox" in names
+    sync = next(s for s in trace["spans"] if s["name"] == "outbox:product.updated")
+    update = next(s for s in trace["spans"] if s["name"] == "sheets.update_row")
+    assert update["parentId"] == sync["spanId"]
+    assert trace["route"] == "/api/containers/{container_id}/products/{product_id}"
+
+
+def test_google_fake_mode_routes_sync_through_fakes(monkeypatch):
+    from app import fake_google, main, quota
+
+    monkeypatch.setattr(quota, "SCHEDULER", quota.Scheduler({}))
+    fake_google.reset_shared()
+    monkeypatch.setenv("GOOGLE_FAKE", "1")
+    monkeypatch.setenv("FILE_ID", "fake-test")
+    main._settings.reload()
+    monkeypatch.setattr(main, "_GSPREAD_CLIENT", None, raising=False)
+    try:
+        resp = client.post("/api/containers", json={"name": "Fake Sync", "orderDate": "2025-01-01", "productionDays": "30", "exchangeRate": "4.0"})
+        if resp.status_code == 401:
+            pytest.skip("Auth required but credentials not matching")
+        sheets, drive = fake_google.shared_services()
+        rows = sheets.spreadsheet("fake-test").worksheets[main.SHEET_CONTAINERS_TITLE].peek_records()
+        assert [r["id"] for r in rows] == [resp.json()["id"]]
+        assert main._drive_build_service() is drive
+        stats = client.get("/api/fake-google/stats").json()
+        assert stats["calls"]["append_row"] >= 1 and stats["errors"] == {}
+    finally:
+        fake_google.reset_shared()
+
+
+def test_sheets_outbox_retries_dead_letters_and_replays(monkeypatch, sheets_outbox):
+    from app import main
+    calls = []
+
+    def flaky_create(c):
+        calls.append(c["id"])
+        raise RuntimeError("quota")
+
+    monkeypatch.setenv("FILE_ID", "outbox-test")
+    main._settings.reload()
+    monkeypatch.setattr("app.main._on_created_container_sync_to_sheet", flaky_create)
+    monkeypatch.setattr("app.main._on_added_product_sync_to_sheet", lambda c, p: calls.append(p["name"]) or True)
+    sheets_outbox.max_attempts, sheets_outbox.backoff_base = 2, 0.0
+
+    created = client.post("/api/containers", json={"name": "OB", "orderDate": "2025-01-01", "productionDays": "1"},
+                          auth=("admin", "admin"))
+    if created.status_code == 401:
+        pytest.skip("Auth required but credentials not matching")
+    cid = created.json()["id"]
+    client.post(f"/api/containers/{cid}/products", json={"name": "P", "quantity": "1", "totalPrice": "1"}, auth=("admin", "admin"))
+
+    # produkt czeka za nieudanym kontenerem (ta sama partycja); kontener po 2 próbach → dead-letter
+    body = client.get("/api/sheets/outbox").json()
+    assert calls == [cid, cid]
+    assert body["stats"]["dead"] == 1 and body["stats"]["pending"] == 1
+    dead = client.get("/api/sheets/outbox", params={"status": "dead"}).json()["entries"]
+    assert [(e["kind"], e["attempts"]) for e in dead] == [("container.created", 2)]
+    assert "RuntimeError: quota" in dead[0]["lastError"]
+
+    monkeypatch.setattr("app.main._on_created_container_sync_to_sheet", lambda c: calls.append("ok") or True)
+    assert client.post("/api/sheets/outbox/replay", json={}, auth=("admin", "admin")).json() == {"replayed": 1}
+    assert calls[-2:] == ["ok", "P"]
+    stats = client.get("/api/sheets/outbox").json()["stats"]
+    assert stats["pending"] == 0 and stats["dead"] == 0
@@ -0,0 +1,76 @@
+from fastapi.testclient import TestClient
+
+from app import attachments, filecache, main, previews, reconcile
+from app.fake_google import FakeDriveService
+from app.storage import MemoryStore, SqliteStore
+
+
+def test_drive_file_id_and_records():
+    assert attachments.drive_file_id("https://drive.google.com/uc?export=download&id=abc123XYZ_-") == "abc123XYZ_-"
+    assert attachments.drive_file_id("https://drive.google.com/file/d/1AbCdEfGhIjK/view?usp=sharing") == "1AbCdEfGhIjK"
+    assert attachments.drive_file_id("https://example.com/a.pdf?id=1") is None
+    rec = attachments.record({"id": "f1", "name": "a.pdf", "mimeType": "application/pdf", "size": "42",
+                              "parents": ["folder"], "webViewLink": "https://drive.google.com/file/d/f1/view"})
+    assert rec["size"] == 42 and rec["folderId"] == "folder"
+    assert rec["url"] == "https://drive.google.com/uc?export=download&id=f1"
+
+
+def test_store_keeps_records_only_for_remaining_links(tmp_path):
+    for store in (MemoryStore(), SqliteStore(str(tmp_path / "s.sqlite3"))):
+        a = {"id": "fa", "name": "a.pdf", "url": "https://drive.google.com/uc?export=download&id=fa"}
+        b = {"id": "fb", "name": "b.jpg", "url": "https://drive.google.com/uc?export=download&id=fb"}
+        store.insert_container({"id": "c1", "name": "C", "products": [
+            {"id": "p1", "name": "P", "files": [a["url"]], "attachments": [a]}]})
+        _, merged = store.merge_product_files("c1", "p1", [a["url"], b["url"]], [b])
+        assert [r["name"] for r in merged["attachments"]] == ["a.pdf", "b.jpg"]
+        # formularz odsyła same linki – rekordy zostają dla linków, które zostały
+        _, updated = store.update_product("c1", "p1", {"id": "p1", "name": "P", "files": [b["url"], "http://x/y.txt"]})
+        assert [r["id"] for r in updated["attachments"]] == ["fb"]
+        assert store.get_container("c1")["products"][0]["attachments"][0]["name"] == "b.jpg"
+
+
+def test_reconcile_update_keeps_attachment_records():
+    rec = {"id": "fa", "name": "a.pdf", "mimeType": "application/pdf", "url": "https://drive.google.com/uc?export=download&id=fa"}
+    data = [{"id": "c1", "name": "C", "products": [
+        {"id": "p1", "name": "Fotel", "quantity": "1", "files": [rec["url"]], "attachments": [rec]}]}]
+    diff = reconcile.plan(data, [{"id": "c1", "name": "C"}],
+                          [{"id": "p1", "name": "Fotel", "quantity": "4", "containerId": "c1"}], ["name"])
+    reconcile.apply(data, diff, main._container_from_sheet, main._product_from_sheet)
+    product = data[0]["products"][0]
+    assert product["quantity"] == "4" and product["files"] == [rec["url"]]
+    assert product["attachments"] == [rec]
+
+
+def test_drive_import_and_upload_capture_metadata(monkeypatch, tmp_path):
+    drive = FakeDriveService()
+    root = drive.add_folder("root", None, file_id="root")
+    cf = drive.add_folder("Kontener A", root["id"])
+    pf = drive.add_folder("Fotel", cf["id"])
+    drive.add("faktura.pdf", pf["id"], "application/pdf", b"%PDF-1.4 test")
+    monkeypatch.setattr(main, "_store", MemoryStore())
+    monkeypatch.setattr(main, "_attachments", attachments.Registry())
+    monkeypatch.setattr(main, "_drive_build_service", lambda cfg=None: drive)
+    monkeypatch.setattr(main, "_drive_resolve_root_id", lambda *a, **kw: "root")
+    monkeypatch.setattr(main, "_sync_to_sheet", lambda *a, **kw: None)
+    monkeypatch.setattr(main, "_file_cache", filecache.FileCache(str(tmp_path / "files"), 1 << 20))
+    monkeypatch.setattr(main, "_previews", previews.PreviewCache(str(tmp_path / "previews"), workers=0))
+    client = TestClient(main.app)
+
+    assert client.post("/api/containers/import/drive", json={"containerIds": [cf["id"]]}).status_code == 200
+    product = client.get("/api/containers").json()[0]["products"][0]
+    att = product["attachments"][0]
+    assert (att["name"], att["mimeType"], att["size"], att["folderId"]) == ("faktura.pdf", "application/pdf", 13, pf["id"])
+    assert att["url"] == product["files"][0] and att["modifiedTime"]
+    # miniatura zlecona po imporcie (PDF bez pypdfium2 – „unavailable”, ale plik jest już w cache proxy)
+    assert main._previews.lookup(att["id"])["status"] in ("ready", "unavailable", "failed")
+    assert main._file_cache.status()["files"] == 1
+
+    # upload zapisuje rekord w rejestrze; produkt zapisany z tym linkiem dostaje metadane bez pytania Drive
+    uploaded = drive.add("zdjecie.jpg", pf["id"], "image/jpeg", b"\xff\xd8jpeg")
+    main._attachments.remember([attachments.record(uploaded)])
+    url = attachments.download_url(uploaded["id"])
+    cid = client.get("/api/containers").json()[0]["id"]
+    body = client.put(f"/api/containers/{cid}/products/{product['id']}",
+                      json={"name": "Fotel", "quantity": "1", "totalPrice": "0", "files": product["files"] + [url]}).json()
+    assert [a["name"] for a in body["attachments"]] == ["faktura.pdf", "zdjecie.jpg"]
+    assert body["attachments"][1]["url"] == url
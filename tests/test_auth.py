@@ -0,0 +1,71 @@
+import base64
+
+from fastapi.testclient import TestClient
+
+from app import auth, main, settings
+
+
+def _basic(user, password):
+    return b"Basic " + base64.b64encode(f"{user}:{password}".encode())
+
+
+def _cfg(**kw):
+    base = dict(loaded_at="t", vercel=True, basic_auth_username="admin", basic_auth_password="tajne")
+    return settings.Settings(**{**base, **kw})
+
+
+def test_policy_matches_previous_rules():
+    policy = auth.AuthPolicy(_cfg(basic_auth_exclude=("/api/metrics", "/api/public/*")))
+    public = [
+        ("GET", "/", b""), ("POST", "/api/health", b""), ("DELETE", "/static/app.js", b""),
+        ("GET", "/api/containers/c1", b""), ("GET", "/api/sheets/products", b""),
+        ("POST", "/api/containers", b"source=sheet"), ("PUT", "/api/containers/c1/products/p1", b"x=1&source=Sheet"),
+        ("GET", "/api/metrics", b""), ("POST", "/api/public/anything", b""),
+    ]
+    private = [
+        ("POST", "/api/containers", b""), ("POST", "/api/containers", b"source=ui"),
+        ("POST", "/api/sheets/import", b"source=sheet"), ("GET", "/api/outbox", b""),
+        ("GET", "/api/metrics/x", b""), ("PATCH", "/api/containers", b"source=sheet"),
+    ]
+    assert all(policy.is_public(*r) for r in public)
+    assert not any(policy.is_public(*r) for r in private)
+
+
+def test_file_proxy_is_public_only_for_public_drive_files():
+    assert auth.AuthPolicy(_cfg(drive_public=True)).is_public("GET", "/api/files/abc1234567/preview")
+    private = auth.AuthPolicy(_cfg(drive_public=False))
+    assert not private.is_public("GET", "/api/files/abc1234567")
+    assert not private.is_public("GET", "/api/files/abc1234567/preview")
+    assert private.is_public("GET", "/api/containers")
+
+
+def test_verified_credentials_are_cached_by_header_hash():
+    policy = auth.AuthPolicy(_cfg())
+    assert not policy.check(None) and not policy.check(_basic("admin", "zle"))
+    assert policy.check(_basic("admin", "tajne")) and policy.hits == 0
+    assert policy.check(_basic("admin", "tajne")) and policy.hits == 1
+    assert not policy.check(b"Basic !!!") and policy.hits == 1
+
+
+def _container(name):
+    return {"name": name, "orderDate": "2025-01-01", "productionDays": "30", "exchangeRate": "4.0"}
+
+
+def test_middleware_enforces_auth_and_follows_settings_reload(monkeypatch):
+    monkeypatch.setenv("BASIC_AUTH_FORCE", "1")
+    monkeypatch.setenv("BASIC_AUTH_USERNAME", "admin")
+    monkeypatch.setenv("BASIC_AUTH_PASSWORD", "tajne")
+    main._settings.reload()
+    client = TestClient(main.app)
+
+    r = client.post("/api/containers", json=_container("Bez auth"))
+    assert r.status_code == 401 and r.headers["www-authenticate"] == 'Basic realm="Restricted"'
+    assert client.get("/api/health").status_code == 200
+    r = client.post("/api/containers", json=_container("Z auth"), auth=("admin", "tajne"))
+    assert r.status_code == 201
+    assert client.post("/api/containers", json=_container("Złe hasło"), auth=("admin", "x")).status_code == 401
+
+    monkeypatch.setenv("BASIC_AUTH_PASSWORD", "nowe")
+    main._settings.reload()
+    assert client.post("/api/containers", json=_container("Stare"), auth=("admin", "tajne")).status_code == 401
+    assert client.post("/api/containers", json=_container("Nowe"), auth=("admin", "nowe")).status_code == 201
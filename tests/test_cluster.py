@@ -0,0 +1,75 @@
+from app.cluster import InvalidationBus, LeaderLock, RevisionCounter
+from app.storage import SqliteStore
+
+
+def test_leader_lock_single_holder(tmp_path):
+    path = str(tmp_path / "leader.lock")
+    first, second = LeaderLock(path), LeaderLock(path)
+    assert first.try_acquire() is True
+    assert second.try_acquire() is False and not second.is_leader
+    first.release()
+    assert second.try_acquire() is True
+    second.release()
+
+
+def test_invalidation_bus_notifies_other_workers(tmp_path):
+    path = str(tmp_path / "revision")
+    writer = InvalidationBus(RevisionCounter(path), interval=0)
+    reader = InvalidationBus(RevisionCounter(path), interval=0)
+    seen = []
+    reader.subscribe(seen.append)
+
+    assert reader.check() is False
+    writer.publish()
+    writer.publish()
+    assert reader.check() is True and seen == [2]
+    assert reader.check() is False
+
+
+def test_sqlite_snapshot_reloads_after_remote_write(tmp_path):
+    db, rev = str(tmp_path / "store.sqlite3"), str(tmp_path / "revision")
+    workers = []
+    for _ in range(2):
+        counter = RevisionCounter(rev)
+        store = SqliteStore(db, revision_source=counter.read)
+        store.add_write_listener(counter.bump)
+        workers.append(store)
+    a, b = workers
+
+    assert b.list_containers() == []
+    a.insert_container({"id": "c1", "name": "Pierwszy", "orderDate": "2025-01-01", "productionDays": "30", "products": []})
+    assert [c["id"] for c in b.list_containers()] == ["c1"]
+    # Zwracane są kopie – modyfikacja wyniku nie psuje cache
+    b.list_containers()[0]["name"] = "zmiana"
+    assert b.list_containers()[0]["name"] == "Pierwszy"
+
+
+def test_revision_bump_is_atomic_between_threads(tmp_path):
+    import threading
+
+    counter = RevisionCounter(str(tmp_path / "revision"))
+    threads = [threading.Thread(target=lambda: [counter.bump() for _ in range(200)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert counter.read() == 1600
+
+
+def test_follower_takes_over_leadership_from_bus_thread(tmp_path):
+    import threading
+
+    path = str(tmp_path / "leader.lock")
+    leader, follower = LeaderLock(path), LeaderLock(path)
+    assert leader.try_acquire() and not follower.try_acquire()
+    took_over = threading.Event()
+    bus = InvalidationBus(RevisionCounter(str(tmp_path / "revision")), interval=0.01)
+    bus.every_tick(lambda: follower.try_acquire() and took_over.set())
+    bus.start()
+    try:
+        # lider kończy działanie – blokada wolna, follower przejmuje ją w kolejnym cyklu
+        leader.release()
+        assert took_over.wait(2) and follower.is_leader
+    finally:
+        bus.stop()
+        follower.release()
@@ -0,0 +1,30 @@
+import pytest
+from app import metrics
+from app.fake_google import FOLDER_MIME, FakeAPIError, FakeDriveService, FakeGspreadClient, Simulator
+
+
+def test_fake_drive_query_subset():
+    drive = FakeDriveService()
+    root = drive.add_folder("root", None, file_id="R")
+    folder = drive.add_folder("Kontener A", root["id"])
+    drive.add("a.pdf", folder["id"], "application/pdf", b"%PDF")
+
+    q_folders = f"mimeType='{FOLDER_MIME}' and 'R' in parents and trashed=false"
+    assert [f["name"] for f in drive.files().list(q=q_folders).execute()["files"]] == ["Kontener A"]
+    q_files = f"mimeType!='{FOLDER_MIME}' and '{folder['id']}' in parents and trashed=false"
+    files = drive.files().list(q=q_files).execute()["files"]
+    assert [f["name"] for f in files] == ["a.pdf"] and "content" not in files[0]
+    assert drive.files().get_media(fileId=files[0]["id"]).execute() == b"%PDF"
+
+
+def test_fake_sheets_update_and_injected_quota_errors():
+    sheets = FakeGspreadClient(Simulator(quota_error_rate=1.0))
+    ws = sheets.spreadsheet("F").seed("products", ["id", "name"], [{"id": "p1", "name": "A"}])
+    with pytest.raises(FakeAPIError) as exc:
+        ws.col_values(1)
+    assert metrics.is_quota_error(exc.value)
+
+    sheets.sim.quota_error_rate = 0.0
+    ws.update("A2:B2", [["p1", "B"]], value_input_option="USER_ENTERED")
+    assert ws.get_all_records() == [{"id": "p1", "name": "B"}]
+    assert sheets.sim.stats()["errors"] == {"col_values:429": 1}
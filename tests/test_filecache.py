@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import attachments, filecache, main
+from app.fake_google import FakeDriveService
+from app.storage import MemoryStore
+
+
+class _Drive:
+    """Metadane i treść plików z licznikami wywołań."""
+
+    def __init__(self):
+        self.files = {}
+        self.meta_calls = self.downloads = 0
+
+    def put(self, fid, content, md5):
+        self.files[fid] = {"id": fid, "name": f"{fid}.pdf", "mimeType": "application/pdf", "size": str(len(content)),
+                           "md5Checksum": md5, "modifiedTime": "2025-01-02T10:00:00.000Z", "content": content}
+
+    def meta(self, fid):
+        self.meta_calls += 1
+        return {k: v for k, v in self.files[fid].items() if k != "content"}
+
+    def download(self, fid, fh):
+        self.downloads += 1
+        fh.write(self.files[fid]["content"])
+
+
+def _read(entry):
+    with open(entry["path"], "rb") as fh:
+        return fh.read()
+
+
+def test_cache_revalidates_evicts_lru_and_skips_oversized(tmp_path):
+    drive = _Drive()
+    cache = filecache.FileCache(str(tmp_path), max_bytes=10, revalidate_after=0)
+    drive.put("a", b"aaaa", "m1")
+    drive.put("b", b"bbbb", "m1")
+    e = cache.get("a", drive.meta, drive.download)
+    cache.release(e)
+    e = cache.get("a", drive.meta, drive.download)  # wpis przeterminowany → tylko metadane, bez pobrania
+    cache.release(e)
+    assert (drive.meta_calls, drive.downloads, cache.revalidations) == (2, 1, 1)
+
+    drive.put("a", b"AAAA", "m2")
+    e = cache.get("a", drive.meta, drive.download)
+    assert _read(e) == b"AAAA" and drive.downloads == 2
+    cache.release(e)
+
+    cache.release(cache.get("b", drive.meta, drive.download))
+    drive.put("c", b"cccc", "m1")
+    pinned = cache.get("a", drive.meta, drive.download)   # „a” w użyciu – nie może zniknąć
+    cache.release(cache.get("c", drive.meta, drive.download))
+    assert cache.status()["bytes"] <= 10 and cache.status()["evictions"] == 1
+    assert _read(pinned) == b"AAAA"
+    cache.release(pinned)
+
+    drive.put("big", b"x" * 11, "m1")
+    big = cache.get("big", drive.meta, drive.download)
+    assert big["transient"] and _read(big) == b"x" * 11
+    cache.release(big)
+    assert not (tmp_path / big["path"]).exists()
+
+    # Drive niedostępny – ostatnia pobrana wersja
+    def down(fid):
+        raise RuntimeError("503")
+    cache.release(cache.get("c", down, drive.download))
+    with pytest.raises(RuntimeError):
+        cache.get("missing", down, drive.download)
+
+    # indeks odtwarzany z dysku po restarcie
+    again = filecache.FileCache(str(tmp_path), max_bytes=10, revalidate_after=60)
+    assert again.status()["files"] == cache.status()["files"]
+    assert cache._fetch_locks == {}  # blokady per id nie rosną bez końca
+
+
+def test_pinned_response_releases_entry_when_client_disconnects(tmp_path):
+    drive = _Drive()
+    drive.put("a", b"aaaa", "m1")
+    cache = filecache.FileCache(str(tmp_path), max_bytes=10)
+    entry = cache.get("a", drive.meta, drive.download)
+    response = main._PinnedFileResponse(entry["path"], release=lambda: cache.release(entry))
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        raise OSError("client disconnected")
+
+    with pytest.raises(OSError):
+        asyncio.run(response({"type": "http", "method": "GET", "headers": []}, receive, send))
+    assert cache.status()["pinned"] == 0
+
+
+def test_files_proxy_endpoint(monkeypatch, tmp_path):
+    drive = FakeDriveService()
+    f = drive.add("spec.pdf", "folder", "application/pdf", b"%PDF-1.4 spec sheet")
+    doc = drive.add("notes", "folder", "application/vnd.google-apps.document")
+    monkeypatch.setattr(main, "_store", MemoryStore())
+    monkeypatch.setattr(main, "_file_index", filecache.FileIndex())
+    main._store.add_change_listener(main._file_index.invalidate)
+    monkeypatch.setattr(main, "_file_cache", filecache.FileCache(str(tmp_path), 1 << 20, revalidate_after=60))
+    monkeypatch.setattr(main, "_drive_build_service", lambda cfg=None: drive)
+    downloads = []
+    real = main._drive_download
+    monkeypatch.setattr(main, "_drive_download", lambda s, fid, fh: (downloads.append(fid), real(s, fid, fh)))
+    urls = [attachments.download_url(f["id"]), attachments.download_url(doc["id"])]
+    main._store.insert_container({"id": "c1", "name": "C", "products": [{"id": "p1", "name": "P", "files": urls}]})
+    client = TestClient(main.app)
+
+    first = client.get(f"/api/files/{f['id']}")
+    assert first.status_code == 200 and first.content == b"%PDF-1.4 spec sheet"
+    assert first.headers["content-type"] == "application/pdf" and "spec.pdf" in first.headers["content-disposition"]
+    etag = first.headers["etag"]
+    assert client.get(f"/api/files/{f['id']}", headers={"If-None-Match": etag}).status_code == 304
+    part = client.get(f"/api/files/{f['id']}", headers={"Range": "bytes=0-3"})
+    assert part.status_code == 206 and part.content == b"%PDF"
+    assert downloads == [f["id"]]
+
+    assert client.get(f"/api/files/{doc['id']}").status_code == 415
+    assert client.get("/api/files/notAnAttachment123").status_code == 404
+    main._store.update_product("c1", "p1", {"id": "p1", "name": "P", "files": []})
+    assert client.get(f"/api/files/{f['id']}").status_code == 404
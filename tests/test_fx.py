@@ -0,0 +1,87 @@
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import costing, fx, main
+from app.storage import MemoryStore
+
+NBP_CSV = """data;1USD;1EUR;100JPY
+;dolar amerykański;euro;jen (Japonia)
+20250102;4,1012;4,2730;2,6101
+20250103;4,1219;4,2718;2,6150
+20250107;4,0805;4,2601;2,5900
+Źródło: NBP;;;
+"""
+
+
+def _container(cid, order_date, rate="4.0"):
+    return {"id": cid, "name": cid, "orderDate": order_date, "exchangeRate": rate,
+            "containerCost": "2000", "transportPolandCost": "1500", "transportPolandCostCurrency": "PLN",
+            "totalTransportCbm": "40",
+            "products": [{"id": f"{cid}-p", "name": "P", "quantity": "5", "totalPrice": "3000", "totalPriceCurrency": "USD",
+                          "productCbm": "10", "customsDutyPercent": "8"},
+                         {"id": f"{cid}-q", "name": "Q", "quantity": "2", "totalPrice": "800", "totalPriceCurrency": "PLN",
+                          "productCbm": "4", "customsDutyPercent": "3"}]}
+
+
+def test_rate_table_parses_nbp_formats_and_looks_up_as_of_date():
+    table = fx.RateTable()
+    assert table.load_rows(fx.parse_csv(NBP_CSV)) == 9
+    assert table.rate_on("USD", date(2025, 1, 3)) == (date(2025, 1, 3), 4.1219)
+    # weekend / brak tabeli → ostatni wcześniejszy kurs; przed pierwszym – brak
+    assert table.rate_on("usd", date(2025, 1, 6)) == (date(2025, 1, 3), 4.1219)
+    assert table.rate_on("USD", date(2024, 12, 31)) is None
+    assert table.rate_on("JPY", date(2025, 1, 2))[1] == pytest.approx(0.026101)
+    assert table.convert(100, "EUR", "USD", date(2025, 1, 7)) == pytest.approx(100 * 4.2601 / 4.0805)
+    table.convert(100, "EUR", "USD", date(2025, 1, 7))
+    assert table.memo_hits >= 2
+
+    table.load_rows(fx.parse_json({"table": "A", "code": "USD", "rates": [
+        {"no": "001/A/NBP/2025", "effectiveDate": "2025-02-03", "mid": 4.09}]}))
+    assert table.rate_on("USD", date(2025, 2, 10)) == (date(2025, 2, 3), 4.09)
+    assert table.rate_on("EUR", date(2025, 2, 10)) is None
+
+
+def test_exposure_reproduces_costing_at_any_rate():
+    c = _container("c1", "2025-01-03")
+    parts = fx.exposure(c)
+    for rate in (3.5, 4.0, 4.37):
+        totals = costing.container_totals(c, rate)
+        assert parts["nettoUsdPart"] + parts["nettoPlnPart"] / rate == pytest.approx(totals["nettoTotal"])
+        assert parts["bruttoUsdPart"] * rate + parts["bruttoPlnPart"] == pytest.approx(totals["bruttoTotal"] * rate)
+
+
+@pytest.mark.parametrize("engine", ["numpy", "python"])
+def test_revalue_endpoint(monkeypatch, tmp_path, engine):
+    if engine == "python":
+        monkeypatch.setattr(fx, "_numpy", lambda: None)
+    elif fx._numpy() is None:
+        pytest.skip("numpy niedostępny")
+    rates = tmp_path / "kursy.csv"
+    rates.write_text(NBP_CSV, encoding="utf-8")
+    monkeypatch.setattr(main, "FX_RATES_FILE", str(rates))
+    monkeypatch.setattr(main, "_fx_rates", fx.RateTable())
+    monkeypatch.setattr(main, "_store", MemoryStore())
+    monkeypatch.setattr(main, "_revaluation", fx.Revaluation())
+    main._store.add_change_listener(main._revaluation.invalidate)
+    for c in (_container("c1", "2025-01-03"), _container("c2", "2025-01-06", "4.3"), _container("c3", "2024-06-01")):
+        main._store.insert_container(c)
+    client = TestClient(main.app)
+
+    assert client.get("/api/fx/rates/USD", params={"date": "2025-01-05"}).json()["effectiveDate"] == "2025-01-03"
+    assert client.get("/api/fx/rates/CHF").status_code == 404
+
+    body = client.post("/api/fx/revalue", json={}).json()
+    assert body["engine"] == engine and body["columns"]["id"] == ["c1", "c2", "c3"]
+    # c3 sprzed pierwszego kursu w tabeli → bieżący kurs kontenera
+    assert body["columns"]["rate"] == [4.1219, 4.1219, 4.0]
+    expected = costing.container_totals(main._store.get_container("c2"), 4.1219)["bruttoTotal"] * 4.1219
+    assert body["columns"]["bruttoPln"][1] == pytest.approx(expected, abs=0.01)
+    assert body["columns"]["bruttoPlnDelta"][2] == 0
+
+    fixed = client.post("/api/fx/revalue", json={"rate": 5}).json()
+    assert fixed["rateSource"] == "rate" and set(fixed["columns"]["rate"]) == {5}
+    main._store.delete_container("c3")
+    assert client.post("/api/fx/revalue", json={"date": "2025-01-07"}).json()["count"] == 2
+    assert client.post("/api/fx/revalue", json={"date": "2024-01-01"}).status_code == 404
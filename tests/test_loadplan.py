@@ -0,0 +1,53 @@
+import random
+
+from fastapi.testclient import TestClient
+
+from app import loadplan, main
+from app.storage import MemoryStore
+
+
+def test_count_objective_packs_close_to_lower_bound():
+    # FFD: 5+5 | 5+4 | 4+3+2 | 2 – 4 kontenery; optimum 5+5 | 5+3+2 | 4+4+2 osiąga lokalne przeszukiwanie
+    items = [{"id": i, "cbm": c} for i, c in enumerate([2, 4, 5, 2, 5, 3, 5, 4])]
+    out = loadplan.plan(items, sizes=[{"name": "box", "cbm": 10}])
+    assert out["startContainers"] == 4
+    assert out["totals"]["containers"] == out["totals"]["lowerBound"] == 3
+    assert all(c["load"] <= c["capacity"] for c in out["containers"])
+
+    random.seed(7)
+    many = [{"id": i, "cbm": round(random.uniform(0.3, 20), 2), "value": random.uniform(100, 5000)} for i in range(400)]
+    out = loadplan.plan(many, time_budget_ms=300)
+    placed = sorted(it["id"] for c in out["containers"] for it in c["items"])
+    assert placed == list(range(400)) and not out["unplaced"]
+    assert out["totals"]["containers"] <= out["startContainers"]
+    assert out["totals"]["containers"] <= out["totals"]["lowerBound"] + 2
+    assert out["elapsedMs"] < 1000
+
+
+def test_rightsizing_value_objective_and_oversized_items():
+    out = loadplan.plan([{"id": "a", "cbm": 20}, {"id": "b", "cbm": 90}])
+    assert [c["size"] for c in out["containers"]] == ["20ft"]
+    assert [u["id"] for u in out["unplaced"]] == ["b"]
+
+    items = [{"id": "cheap", "cbm": 6, "value": 100}, {"id": "dense", "cbm": 5, "value": 400},
+             {"id": "big", "cbm": 9, "value": 600}]
+    best = loadplan.plan(items, sizes=[{"name": "s", "cbm": 10}], objective="value")
+    # zachłannie: dense (80/CBM) + nic więcej; wymiana dense → big daje 600
+    assert [it["id"] for it in best["containers"][0]["items"]] == ["big"]
+    assert best["startValue"] == 400 and best["totals"]["value"] == 600
+
+
+def test_load_plan_endpoint(monkeypatch):
+    monkeypatch.setattr(main, "_store", MemoryStore())
+    for cid, picked in (("c1", False), ("c2", True)):
+        main._store.insert_container({"id": cid, "name": cid, "exchangeRate": "4", "pickedUpInChina": picked, "products": [
+            {"id": f"{cid}-p{j}", "name": "P", "productCbm": "12", "totalPrice": "400", "totalPriceCurrency": "PLN"}
+            for j in range(4)]})
+    client = TestClient(main.app)
+
+    body = client.post("/api/load-plan", json={}).json()
+    assert body["totals"]["items"] == 4 and body["totals"]["containers"] == 1
+    assert body["containers"][0]["size"] == "40ft" and body["totals"]["value"] == 400
+    assert client.post("/api/load-plan", json={"containerIds": ["c1", "c2"], "productIds": ["c2-p0"]}).json()["totals"]["cbm"] == 12
+    assert client.post("/api/load-plan", json={"objective": "fastest"}).status_code == 400
+    assert client.post("/api/load-plan", json={"timeBudgetMs": 60000}).status_code == 422
@@ -0,0 +1,38 @@
+from app.outbox import Outbox
+
+
+def test_outbox_batches_appends_coalesces_updates_and_keeps_partition_order(tmp_path):
+    calls = []
+    fail = {"c2"}
+
+    def created(c):
+        calls.append(("created", c["id"]))
+        return c["id"] not in fail
+
+    box = Outbox(
+        str(tmp_path / "outbox.sqlite3"),
+        handlers={
+            "created": created,
+            "updated": lambda c: calls.append(("updated", c["id"], c["v"])) or True,
+        },
+        batch_handlers={"created": lambda batch: calls.append(("created*", [a[0]["id"] for a in batch])) or True},
+        backoff_base=60.0,
+        concurrency=2,
+    )
+    box.enqueue("created", {"id": "c1"}, partition="c1")
+    box.enqueue("created", {"id": "c3"}, partition="c3")
+    box.enqueue("updated", {"id": "c1", "v": 1}, partition="c1", dedupe="c1")
+    box.enqueue("updated", {"id": "c1", "v": 2}, partition="c1", dedupe="c1")
+    box.enqueue("created", {"id": "c2"}, partition="c2")
+    box.enqueue("updated", {"id": "c2", "v": 1}, partition="c2", dedupe="c2")
+
+    stats = box.drain()
+    # c1+c3 jednym appendem, update v1 zastąpiony przez v2, update c2 czeka za nieudanym create c2
+    assert sorted(calls) == sorted([("created*", ["c1", "c3"]), ("updated", "c1", 2), ("created", "c2")])
+    assert calls.index(("created*", ["c1", "c3"])) < calls.index(("updated", "c1", 2))
+    assert stats == {"done": 3, "failed": 1, "dead": 0, "coalesced": 1}
+    assert [(e["kind"], e["attempts"]) for e in box.entries()] == [("created", 1), ("updated", 0)]
+
+    # trwałość: nowa instancja na tym samym pliku widzi zaległe wpisy
+    reopened = Outbox(str(tmp_path / "outbox.sqlite3"), handlers=box.handlers)
+    assert reopened.stats()["pending"] == 2
@@ -0,0 +1,87 @@
+import io
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app import attachments, filecache, main, previews
+from app.fake_google import FakeDriveService
+from app.storage import MemoryStore
+
+
+def _png(size, color=(200, 30, 30, 255)):
+    out = io.BytesIO()
+    Image.new("RGBA", size, color).save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_render_and_content_addressed_dedup(tmp_path):
+    thumb = Image.open(io.BytesIO(previews.render_preview(_png((1200, 600)), "image/png")))
+    assert thumb.format == "JPEG" and thumb.size == (256, 128)
+
+    cache = previews.PreviewCache(str(tmp_path), workers=0)
+    data = _png((400, 400))
+    first = cache.submit("fileA1234567", data, "image/png")
+    assert first["status"] == "ready" and first["path"].endswith(f"{first['sha']}.jpg")
+    # ta sama treść pod innym id – gotowa miniatura bez ponownego renderowania
+    second = cache.submit("fileB1234567", data, "image/png")
+    assert second["sha"] == first["sha"] and (cache.rendered, cache.reused) == (1, 1)
+
+    broken = cache.submit("fileC1234567", b"not an image", "image/jpeg")
+    assert broken["status"] == "failed" and broken["error"]
+    pdf = cache.submit("fileD1234567", b"%PDF-1.4", "application/pdf")
+    if not previews.pdf_supported():
+        assert pdf["status"] == "unavailable"
+
+    # indeks id → sha odtwarzany z index.jsonl
+    again = previews.PreviewCache(str(tmp_path), workers=0)
+    assert again.lookup("fileB1234567")["sha"] == first["sha"]
+    assert again.status()["files"]["ready"] == 2
+    assert not previews.previewable("image/svg+xml") and not previews.previewable("text/plain")
+
+
+def test_broken_pool_marks_preview_failed_and_is_rebuilt(tmp_path):
+    from concurrent.futures.process import BrokenProcessPool
+
+    class _Broken:
+        def submit(self, *a, **kw):
+            raise BrokenProcessPool("worker died")
+
+        def shutdown(self, *a, **kw):
+            pass
+
+    cache = previews.PreviewCache(str(tmp_path), workers=1)
+    cache._pool = _Broken()
+    state = cache.submit("fileA1234567", _png((10, 10)), "image/png")
+    assert state["status"] == "failed" and "BrokenProcessPool" in state["error"]
+    assert cache._pool is None and cache.status()["inFlight"] == 0
+
+
+def test_preview_endpoint_generates_on_first_request(monkeypatch, tmp_path):
+    drive = FakeDriveService()
+    img = drive.add("foto.png", "folder", "image/png", _png((800, 300)))
+    txt = drive.add("notes.txt", "folder", "text/plain", b"hello")
+    monkeypatch.setattr(main, "_store", MemoryStore())
+    monkeypatch.setattr(main, "_file_index", filecache.FileIndex())
+    main._store.add_change_listener(main._file_index.invalidate)
+    monkeypatch.setattr(main, "_file_cache", filecache.FileCache(str(tmp_path / "files"), 1 << 20, revalidate_after=60))
+    monkeypatch.setattr(main, "_previews", previews.PreviewCache(str(tmp_path / "previews"), workers=0))
+    monkeypatch.setattr(main, "_drive_build_service", lambda cfg=None: drive)
+    records = [attachments.record(img), attachments.record(txt)]
+    main._store.insert_container({"id": "c1", "name": "C", "products": [
+        {"id": "p1", "name": "P", "files": [r["url"] for r in records], "attachments": records}]})
+    client = TestClient(main.app)
+
+    # pierwsze żądanie zleca miniaturę w tle (po odpowiedzi), kolejne ją zwraca
+    assert client.get(f"/api/files/{img['id']}/preview").status_code == 202
+    ready = client.get(f"/api/files/{img['id']}/preview")
+    assert ready.status_code == 200 and ready.headers["content-type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(ready.content)).size == (256, 96)
+    etag = ready.headers["etag"]
+    assert client.get(f"/api/files/{img['id']}/preview", headers={"If-None-Match": etag}).status_code == 304
+    # treść pobrana przy generowaniu została w cache proxy
+    assert main._file_cache.status()["files"] == 1
+
+    assert client.get(f"/api/files/{txt['id']}/preview").status_code == 404
+    assert client.get("/api/files/notAnAttachment123/preview").status_code == 404
+    status = client.get("/api/previews/status").json()
+    assert status["files"] == {"ready": 1} and status["pdf"] is previews.pdf_supported()
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+from app import quota
+from app.fake_google import FakeAPIError
+
+
+def test_token_bucket_limits_rate_and_background_yields_to_interactive():
+    sched = quota.Scheduler({"sheets": (10.0, 1)})
+    sched.acquire("sheets")  # kubełek pusty – kolejny token za ~0.1 s
+    order = []
+
+    def take(priority):
+        sched.acquire("sheets", priority)
+        order.append(priority)
+
+    bg = threading.Thread(target=take, args=(quota.BACKGROUND,))
+    bg.start()
+    time.sleep(0.03)
+    fg = threading.Thread(target=take, args=(quota.INTERACTIVE,))
+    fg.start()
+    bg.join(2)
+    fg.join(2)
+    assert order == [quota.INTERACTIVE, quota.BACKGROUND]
+    assert sched.status()["apis"]["sheets"]["queued"] == {"interactive": 0, "background": 0}
+
+
+def test_retries_quota_errors_with_backoff_but_not_non_idempotent_5xx():
+    sched = quota.Scheduler({}, max_retries=3, backoff_base=0.001, seed=1)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise FakeAPIError(429, "Quota exceeded RESOURCE_EXHAUSTED")
+        return "ok"
+
+    assert sched.call("col_values", flaky) == "ok"
+    assert len(calls) == 3 and sched.retries == 2
+
+    def broken():
+        raise FakeAPIError(500, "Internal error")
+
+    with pytest.raises(FakeAPIError):
+        sched.call("append_row", broken)
+    assert sched.retries == 2
+
+
+def test_real_client_errors_are_classified_and_retried():
+    import json
+
+    gspread = pytest.importorskip("gspread")
+    requests = pytest.importorskip("requests")
+    httplib2 = pytest.importorskip("httplib2")
+    from googleapiclient.errors import HttpError
+    from app import metrics
+
+    def api_error(status, message):
+        resp = requests.Response()
+        resp.status_code = status
+        resp._content = json.dumps({"error": {"code": status, "message": message}}).encode()
+        return gspread.exceptions.APIError(resp)
+
+    quota_429 = api_error(429, "Quota exceeded for quota metric 'Read requests'")
+    quota_403 = api_error(403, "Quota exceeded for quota metric 'Write requests'")
+    drive_503 = HttpError(httplib2.Response({"status": 503}), b'{"error": {"message": "Backend Error"}}')
+    assert metrics.error_status(quota_429) == 429 and metrics.is_quota_error(quota_429)
+    assert metrics.is_quota_error(quota_403) and not metrics.is_quota_error(api_error(403, "Forbidden"))
+    assert metrics.error_status(drive_503) == 503
+    assert quota.retryable("col_values", quota_429) and quota.retryable("files.get", drive_503)
+    assert not quota.retryable("append_row", api_error(503, "Backend Error"))
+
+    sched = quota.Scheduler({}, max_retries=3, backoff_base=0.001, seed=1)
+    errors = [quota_429, api_error(500, "Internal error")]
+
+    def flaky():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert sched.call("col_values", flaky) == "ok" and sched.retries == 2
+
+
+def test_saturation_raises_and_is_reported():
+    sched = quota.Scheduler({"drive": (0.5, 1)}, max_wait=0.05)
+    sched.acquire("drive")
+    with quota.in_background():
+        with pytest.raises(quota.SchedulerSaturated):
+            sched.call("files.list", lambda: None)
+    assert sched.status()["apis"]["drive"]["saturated"] is True
@@ -0,0 +1,76 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, search
+from app.storage import MemoryStore
+
+
+def _names(res):
+    return [(r["kind"], r["name"]) for r in res["results"]]
+
+
+def test_index_follows_store_changes_incrementally(store):
+    index = search.SearchIndex()
+    store.add_change_listener(index.invalidate)
+    store.insert_container({"id": "c1", "name": "Meble ogrodowe", "products": [
+        {"id": "p1", "name": "Krzesło składane", "files": ["https://cdn.example.com/docs/Krzeslo%20instrukcja.pdf"]},
+        {"id": "p2", "name": "Stół", "files": ["https://drive.google.com/uc?export=download&id=abc"]},
+    ]})
+    store.insert_container({"id": "c2", "name": "Oświetlenie", "products": [{"id": "p3", "name": "Lampa LED"}]})
+
+    def query(q, **kw):
+        index.refresh(store.list_containers, store.get_container)
+        return index.search(q, **kw)
+
+    # literówka i brak polskich znaków; załącznik po nazwie pliku z URL (Drive po id – bez nazwy)
+    assert _names(query("krzeslo")) == [("product", "Krzesło składane"), ("attachment", "Krzeslo instrukcja.pdf")]
+    assert _names(query("oswietlnie")) == [("container", "Oświetlenie")]
+    assert query("lampa", kinds=["container"])["total"] == 0
+    assert index.builds == 1 and index.updates == 0
+
+    store.update_product("c2", "p3", {"name": "Kinkiet"})
+    store.delete_product("c1", "p1")
+    assert _names(query("kinkiet")) == [("product", "Kinkiet")]
+    assert query("lampa")["total"] == 0 and query("krzeslo")["total"] == 0
+    assert index.builds == 1 and index.updates == 2
+
+    store.delete_container("c2")
+    store.replace_all(store.list_containers() + [{"id": "c3", "name": "Kontener 7"}])
+    res = query("kontener", offset=0, limit=1)
+    assert res["total"] == 1 and res["results"][0]["containerId"] == "c3"
+    assert index.builds == 2 and index.status()["documents"] == {"container": 2, "product": 1, "attachment": 0}
+
+
+def test_matcher_normalizes_and_refuses_ambiguous_or_renumbered_names():
+    m = search.Matcher([(0, "Kontener 12"), (1, "Kontener 13"), (2, "Meble Ogrodowe"), (3, "Meble ogrodowe 2")], threshold=0.8)
+    assert m.match(" KONTENER-12 ") == 0
+    assert m.match("Kontener 14") is None
+    assert m.match("meble ogrodowee") == 2
+    assert m.match("Meble") is None
+    assert search.Matcher([(0, "Meble ogrodowe")]).match("meble ogrodowee") is None
+
+
+def test_matcher_exact_by_default_and_compares_codes():
+    names = [(0, "MSKU1234567"), (1, "Zamówienie A-12"), (2, "Kontener Shenzhen marzec")]
+    exact, fuzzy = search.Matcher(names), search.Matcher(names, threshold=0.8)
+    assert exact.match("msku1234567") == 0 and exact.match("ZAMOWIENIE a 12") == 1
+    for name in ("MSKU1234568", "Zamówienie B-12", "Kontener Shenzhen maj"):
+        assert exact.match(name) is None
+    # przy włączonym rozmyciu cyfry w kodach i pojedyncze litery nadal muszą się zgadzać
+    assert fuzzy.match("MSKU1234568") is None and fuzzy.match("Zamówienie B-12") is None
+    assert fuzzy.match("MSKU 1234567") == 0
+    # podobna nazwa – tylko podpowiedź
+    assert exact.suggest("MSKU1234568") == 0 and exact.suggest("Meble") is None
+
+
+def test_search_endpoint(monkeypatch):
+    monkeypatch.setattr(main, "_store", MemoryStore())
+    monkeypatch.setattr(main, "_search", search.SearchIndex())
+    main._store.add_change_listener(main._search.invalidate)
+    main._store.insert_container({"id": "c1", "name": "Wiosna", "products": [{"id": f"p{i}", "name": f"Fotel {i}"} for i in range(5)]})
+    client = TestClient(main.app)
+
+    body = client.get("/api/search", params={"q": "fotle", "kind": "product", "offset": 1, "limit": 2}).json()
+    assert body["total"] == 5 and len(body["results"]) == 2
+    assert body["results"][0]["containerName"] == "Wiosna" and body["results"][0]["productId"]
+    assert client.get("/api/search", params={"q": "x", "kind": "plik"}).status_code == 400
@@ -0,0 +1,30 @@
+import os
+import time
+
+from app import settings
+
+
+def test_store_reloads_only_after_env_file_changes(tmp_path, monkeypatch):
+    env = tmp_path / ".env"
+    env.write_text("FILE_ID=sheet-a\nBASIC_AUTH_USERNAME=admin\nSETTINGS_TEST_ONLY=1\n", encoding="utf-8")
+    monkeypatch.delenv("FILE_ID", raising=False)
+    monkeypatch.delenv("SETTINGS_TEST_ONLY", raising=False)
+    monkeypatch.setenv("BASIC_AUTH_USERNAME", "z-env")
+    monkeypatch.setenv("SHORT_SHA", "abcdef123456")
+
+    store = settings.SettingsStore(env, check_interval=0)
+    try:
+        cfg = store.get()
+        # środowisko procesu ma pierwszeństwo przed plikiem
+        assert (cfg.file_id, cfg.basic_auth_username, cfg.build_sha) == ("sheet-a", "z-env", "abcdef1")
+        assert store.get() is cfg and store.reloads == 0
+
+        env.write_text("FILE_ID=sheet-b\n", encoding="utf-8")
+        os.utime(env, (time.time() + 5, time.time() + 5))
+        cfg = store.get()
+        assert cfg.file_id == "sheet-b" and store.reloads == 1
+        # klucz usunięty z pliku znika z os.environ; ustawiony w środowisku zostaje
+        assert "SETTINGS_TEST_ONLY" not in os.environ
+        assert os.environ["BASIC_AUTH_USERNAME"] == "z-env"
+    finally:
+        os.environ.pop("FILE_ID", None)
@@ -0,0 +1,100 @@
+import pytest
+
+from app import main, quota, sheet_index
+from app.fake_google import FakeGspreadClient, Simulator
+
+
+@pytest.fixture
+def sheets(monkeypatch):
+    sim = Simulator()
+    client = FakeGspreadClient(sim)
+    client.spreadsheet("index-test")
+    monkeypatch.setattr(quota, "SCHEDULER", quota.Scheduler({}))
+    monkeypatch.setattr(main, "_GSPREAD_CLIENT", client, raising=False)
+    monkeypatch.setattr(main, "_sheet_index", sheet_index.RowIndex(ttl=300))
+    monkeypatch.setenv("FILE_ID", "index-test")
+    main._settings.reload()
+    return client
+
+
+def _rows(client, title):
+    return client.spreadsheet("index-test").worksheets[title].peek_records()
+
+
+def test_tab_index_tracks_appends_and_deletes():
+    tab = sheet_index.Tab()
+    tab.load(["id", "a", "", "b", "c", "a"])
+    assert (tab.find("a"), tab.find("b"), tab.find("c")) == (2, 4, 5)
+    tab.appended(["d", "e"], sheet_index.first_row({"updates": {"updatedRange": "'products'!A8:I9"}}))
+    assert (tab.find("d"), tab.find("e")) == (8, 9)
+    tab.deleted(3, 2)
+    assert (tab.find("a"), tab.find("b"), tab.find("c"), tab.find("e")) == (2, None, 3, 7)
+    tab.appended(["f"], None)
+    assert tab.rows is None and not tab.fresh(300)
+
+
+def test_product_update_is_one_ranged_write_and_survives_rename(sheets):
+    container = {"id": "c1", "name": "K1"}
+    products = [{"id": f"p{i}", "name": f"P{i}", "quantity": "1"} for i in range(3)]
+    assert main._outbox_append_products([[container, p] for p in products])
+
+    # pierwsza aktualizacja buduje indeks (jedno col_values), kolejne – odczyt komórki id i zapis zakresu
+    assert main._on_updated_product_sync_to_sheet(container, {**products[0], "quantity": "2"})
+    sim = sheets.sim
+    before = dict(sim.calls)
+    renamed = {**products[1], "name": "Nowa nazwa", "quantity": "7"}
+    assert main._on_updated_product_sync_to_sheet({**container, "name": "K1 po zmianie"}, renamed)
+    calls = {op: n - before.get(op, 0) for op, n in sim.calls.items() if n != before.get(op, 0)}
+    assert calls == {"cell": 1, "update": 1}
+
+    rows = _rows(sheets, main.SHEET_PRODUCTS_TITLE)
+    assert [(r["id"], r["name"], r["containerName"]) for r in rows] == [
+        ("p0", "P0", "K1"), ("p1", "Nowa nazwa", "K1 po zmianie"), ("p2", "P2", "K1")]
+
+    # usunięcie przesuwa indeks; aktualizacja kolejnego wiersza trafia we właściwe miejsce
+    assert main._on_deleted_product_sync_to_sheet("K1", products[0])
+    assert main._on_updated_product_sync_to_sheet(container, {**products[2], "quantity": "9"})
+    rows = _rows(sheets, main.SHEET_PRODUCTS_TITLE)
+    assert [(r["id"], r["quantity"]) for r in rows] == [("p1", "7"), ("p2", "9")]
+
+    # brak wiersza w arkuszu → upsert
+    assert main._on_updated_product_sync_to_sheet(container, {"id": "p9", "name": "Spoza arkusza"})
+    assert [r["id"] for r in _rows(sheets, main.SHEET_PRODUCTS_TITLE)] == ["p1", "p2", "p9"]
+
+
+def test_backfill_assigns_store_ids_to_legacy_rows(sheets, monkeypatch):
+    sh = sheets.spreadsheet("index-test")
+    sh.seed(main.SHEET_CONTAINERS_TITLE, main.HEADERS_CONTAINERS,
+            [{"name": "Stary"}, {"id": "c2", "name": "Nowy"}, {"name": "Nieznany"}])
+    sh.seed(main.SHEET_PRODUCTS_TITLE, main.HEADERS_PRODUCTS,
+            [{"name": "Krzesło", "containerName": "Stary"}, {"id": "p2", "name": "Stół", "containerId": "c2"}])
+    store = [
+        {"id": "c1", "name": "Stary", "products": [{"id": "p1", "name": "krzesło"}]},
+        {"id": "c2", "name": "Nowy", "products": [{"id": "p2", "name": "Stół"}]},
+    ]
+    monkeypatch.setattr(main, "_load_data", lambda: store)
+
+    assert main._sheets_backfill_ids() == {"containers": 2, "products": 1}
+    ids = [r["id"] for r in _rows(sheets, main.SHEET_CONTAINERS_TITLE)]
+    assert ids[:2] == ["c1", "c2"] and ids[2] and ids[2] not in ("c1", "c2")
+    assert [r["id"] for r in _rows(sheets, main.SHEET_PRODUCTS_TITLE)] == ["p1", "p2"]
+
+    before = dict(sheets.sim.calls)
+    assert main._on_updated_product_sync_to_sheet(store[0], {"id": "p1", "name": "Krzesło biurowe"})
+    assert sheets.sim.calls["update"] - before.get("update", 0) == 1
+    assert sheets.sim.calls.get("col_values", 0) == before.get("col_values", 0)
+    assert main._sheets_backfill_ids() == {"containers": 0, "products": 0}
+
+
+def test_stale_index_is_detected_after_manual_sheet_edit(sheets):
+    containers = [{"id": c, "name": c.upper()} for c in ("a", "b", "c")]
+    for c in containers:
+        assert main._on_created_container_sync_to_sheet(c)
+    assert main._on_updated_container_sync_to_sheet({**containers[0], "name": "A1"})  # indeks zbudowany
+
+    # ktoś ręcznie usuwa wiersz „a” – numery wierszy „b” i „c” w indeksie są nieaktualne
+    ws = sheets.spreadsheet("index-test").worksheets[main.SHEET_CONTAINERS_TITLE]
+    ws.delete_rows(2)
+    assert main._on_updated_container_sync_to_sheet({**containers[2], "name": "C2"})
+    assert main._on_deleted_container_sync_to_sheet(containers[1])
+    assert [(r["id"], r["name"]) for r in _rows(sheets, main.SHEET_CONTAINERS_TITLE)] == [("c", "C2")]
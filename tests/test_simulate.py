@@ -0,0 +1,61 @@
+import itertools
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import costing, main, simulate
+from app.storage import MemoryStore
+
+
+def _container():
+    return {"id": "c1", "name": "c1", "exchangeRate": "4.0", "containerCost": "9000", "containerCostCurrency": "PLN",
+            "transportChinaCost": "300", "transportPolandCost": "1500", "transportPolandCostCurrency": "PLN",
+            "insuranceCost": "120", "additionalCosts": "400", "totalTransportCbm": "40",
+            "products": [{"id": "p1", "name": "P", "quantity": "5", "totalPrice": "3000", "totalPriceCurrency": "USD",
+                          "productCbm": "10", "customsDutyPercent": "8"},
+                         {"id": "p2", "name": "Q", "quantity": "2", "totalPrice": "800", "totalPriceCurrency": "PLN",
+                          "productCbm": "4", "customsDutyPercent": "3"}]}
+
+
+def test_grid_matches_scalar_costing_at_every_point():
+    c = _container()
+    grid = {"exchangeRate": {"from": 3.8, "to": 4.4, "steps": 4}, "customsDutyPercent": [0, 6.5],
+            "containerCost": [8000, 12000], "totalTransportCbm": [14, 30, 60]}
+    out = simulate.simulate(c, grid, include_values=True)
+    assert out["shape"] == [4, 2, 2, 3, 2] and len(out["values"]) == 96
+    rows = [out["values"][i:i + 2] for i in range(0, 96, 2)]
+    assert [rows[i][p] for p, i in enumerate(out["argmax"])] == out["max"]
+    points = itertools.product(*(out["axes"][k] for k in simulate.AXES))
+    for row, (er, duty, cost, cbm) in zip(rows, points):
+        variant = {**c, "containerCost": cost, "totalTransportCbm": cbm,
+                   "products": [{**p, "customsDutyPercent": duty} for p in c["products"]]}
+        base = costing.container_cost_base(variant, er)
+        expected = [costing.product_costs(p, variant, base)["totalCostPerUnit"] for p in variant["products"]]
+        assert row == pytest.approx(expected, abs=1e-3)
+
+    # bez osi cła – stawki produktów; PLN = USD × kurs
+    own = simulate.simulate(c, {"exchangeRate": [5.0]}, metric="nettoPerUnit", currency="PLN", product_ids=["p2"])
+    base = costing.container_cost_base(c, 5.0)
+    assert own["shape"] == [1, 1, 1, 1, 1] and own["axes"]["customsDutyPercent"] is None and "values" not in own
+    assert own["min"][0] == pytest.approx(costing.product_costs(c["products"][1], c, base)["nettoPerUnit"] * 5, abs=1e-3)
+
+
+def test_simulate_endpoint(monkeypatch):
+    monkeypatch.setattr(main, "_store", MemoryStore())
+    main._store.insert_container(_container())
+    client = TestClient(main.app)
+
+    body = client.post("/api/containers/c1/simulate", json={"exchangeRate": [4, 4.5], "totalTransportCbm": [20, 40]}).json()
+    assert body["order"][-1] == "product" and body["shape"] == [2, 1, 1, 2, 2]
+    assert [p["id"] for p in body["products"]] == ["p1", "p2"] and len(body["min"]) == 2 and "values" not in body
+    full = client.post("/api/containers/c1/simulate", json={"exchangeRate": [4, 4.5], "includeValues": True}).json()
+    assert len(full["values"]) == 4
+    assert [full["values"][i * 2 + p] for p, i in enumerate(full["argmin"])] == full["min"]
+    assert client.post("/api/containers/missing/simulate", json={}).status_code == 404
+    assert client.post("/api/containers/c1/simulate", json={"exchangeRate": [0]}).status_code == 400
+    assert client.post("/api/containers/c1/simulate", json={"metric": "margin"}).status_code == 400
+    monkeypatch.setattr(simulate, "MAX_VALUE_CELLS", 10)
+    assert client.post("/api/containers/c1/simulate", json={"containerCost": {"from": 1, "to": 9, "steps": 9},
+                                                            "includeValues": True}).status_code == 400
+    monkeypatch.setattr(simulate, "MAX_CELLS", 10)
+    assert client.post("/api/containers/c1/simulate", json={"containerCost": {"from": 1, "to": 9, "steps": 9}}).status_code == 400
@@ -0,0 +1,146 @@
+import pytest
+from app.storage import ContainerExists, ContainerNotFound, ProductNotFound, RevisionConflict, SqliteStore, Store
+
+
+def _container(cid, name, products=None):
+    return {"id": cid, "name": name, "orderDate": "2025-01-01", "productionDays": "30",
+            "pickedUpInChina": False, "products": products or []}
+
+
+def _product(pid, name, files=None):
+    return {"id": pid, "name": name, "quantity": "1", "totalPrice": "10", "files": files or []}
+
+
+def test_store_crud_roundtrip(store):
+    store.insert_container(_container("c1", "Pierwszy"))
+    store.insert_container(_container("c2", "Drugi", [_product("p0", "Stary", ["http://a"])]))
+    assert [c["id"] for c in store.list_containers()] == ["c1", "c2"]
+
+    container = store.add_product("c1", _product("p1", "Lampa", ["http://x", "http://y"]))
+    assert [p["id"] for p in container["products"]] == ["p1"]
+
+    updated = store.update_container("c1", {"name": "Nowa nazwa", "pickedUpInChina": True, "products": []})
+    assert updated["name"] == "Nowa nazwa" and updated["pickedUpInChina"] is True
+    assert updated["products"][0]["files"] == ["http://x", "http://y"]
+
+    _, saved = store.update_product("c1", "p1", _product("p1", "Lampa LED", ["http://z"]))
+    assert saved["name"] == "Lampa LED" and saved["files"] == ["http://z"]
+
+    _, deleted = store.delete_product("c2", "p0")
+    assert deleted["name"] == "Stary"
+    assert store.get_container("c2")["products"] == []
+
+    with pytest.raises(ProductNotFound):
+        store.update_product("c1", "nope", _product("nope", "X"))
+    with pytest.raises(ContainerNotFound):
+        store.add_product("nope", _product("p9", "X"))
+
+    store.delete_container("c2")
+    assert store.get_container("c2") is None
+    assert [c["name"] for c in store.list_containers()] == ["Nowa nazwa"]
+
+
+def test_insert_existing_id_is_rejected_by_both_backends(store):
+    store.insert_container(_container("c1", "A"))
+    with pytest.raises(ContainerExists):
+        store.insert_container(_container("c1", "Duplikat"))
+    assert [c["name"] for c in store.list_containers()] == ["A"]
+
+
+def test_store_interface_is_abstract():
+    class Partial(Store):
+        def list_containers(self):
+            return []
+
+    # brakująca metoda wychodzi przy tworzeniu instancji, a nie dopiero przy wywołaniu
+    with pytest.raises(TypeError, match="abstract"):
+        Partial()
+    with pytest.raises(TypeError):
+        Store()
+
+
+def test_iter_containers_streams_the_same_records(store):
+    store.replace_all([_container("c1", "A", [_product("p1", "X", ["u1"])]), _container("c2", "B")])
+    it = store.iter_containers()
+    first = next(it)
+    # zapis w trakcie iteracji nie blokuje się na otwartym kursorze / blokadzie magazynu
+    store.update_container("c2", {"name": "B2"})
+    assert [first, *it][0] == store.list_containers()[0]
+    assert [c["id"] for c in store.iter_containers()] == ["c1", "c2"]
+
+
+def test_store_transaction_rollback(store):
+    store.insert_container(_container("c1", "A"))
+    with pytest.raises(RuntimeError):
+        with store.transaction() as data:
+            data.append(_container("c2", "B"))
+            raise RuntimeError("boom")
+    with store.transaction(commit=False) as data:
+        data.clear()
+    assert [c["id"] for c in store.list_containers()] == ["c1"]
+    with store.transaction() as data:
+        data.append(_container("c2", "B", [_product("p1", "Stół", ["http://f"])]))
+    assert store.get_container("c2")["products"][0]["files"] == ["http://f"]
+
+
+def test_bulk_write_keeps_order_and_content(store):
+    store.replace_all([_container(f"c{i}", f"K{i}", [_product(f"p{i}a", "A"), _product(f"p{i}b", "B", ["u"])])
+                       for i in range(4)])
+    with store.transaction() as data:
+        data.pop(1)                                        # usunięcie
+        data.insert(0, _container("new", "Nowy"))          # wstawienie na początek
+        data[1]["products"].reverse()                      # zmiana kolejności produktów
+        data[2]["products"][1]["files"] = ["u", "v"]       # nowy załącznik
+        data[3]["name"] = "Zmieniony"
+    expected = [("new", []), ("c0", ["p0b", "p0a"]), ("c2", ["p2a", "p2b"]), ("c3", ["p3a", "p3b"])]
+    out = store.list_containers()
+    assert [(c["id"], [p["id"] for p in c["products"]]) for c in out] == expected
+    assert out[2]["products"][1]["files"] == ["u", "v"] and out[3]["name"] == "Zmieniony"
+    assert [c["revision"] for c in out] == [1, 1, 1, 2]
+
+
+def test_sqlite_bulk_write_touches_only_changed_rows(tmp_path):
+    store = SqliteStore(str(tmp_path / "store.sqlite3"))
+    store.replace_all([_container(f"c{i}", f"K{i}", [_product(f"p{i}", "P", ["u"])]) for i in range(50)])
+    statements = []
+    store._conn().set_trace_callback(statements.append)
+    with store.transaction() as data:
+        data[7]["products"][0]["totalPrice"] = "99"
+    writes = [s for s in statements if s.split()[0] in ("INSERT", "UPDATE", "DELETE")]
+    assert len(writes) == 1 and writes[0].startswith("UPDATE products")
+    assert store.get_container("c7")["products"][0]["totalPrice"] == "99"
+
+
+def test_sqlite_store_shared_between_instances(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    a, b = SqliteStore(path), SqliteStore(path)
+    a.insert_container(_container("c1", "Wspólny"))
+    b.add_product("c1", _product("p1", "Krzesło"))
+    assert a.get_container("c1")["products"][0]["name"] == "Krzesło"
+    assert a._conn().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_store_revisions_and_compare_and_set(store):
+    created = store.insert_container(_container("c1", "A", [_product("p1", "Lampa")]))
+    assert created["revision"] == 1 and created["products"][0]["revision"] == 1
+
+    updated = store.update_container("c1", {"name": "B"}, expected_revision=1)
+    assert updated["revision"] == 2
+    with pytest.raises(RevisionConflict) as exc:
+        store.update_container("c1", {"name": "C"}, expected_revision=1)
+    assert exc.value.current == 2
+    assert store.get_container("c1")["name"] == "B"
+
+    _, saved = store.update_product("c1", "p1", _product("p1", "Lampa LED"), expected_revision=1)
+    assert saved["revision"] == 2
+    with pytest.raises(RevisionConflict):
+        store.delete_product("c1", "p1", expected_revision=1)
+    _, merged = store.merge_product_files("c1", "p1", ["http://a", "http://a"])
+    assert merged["files"] == ["http://a"] and merged["revision"] == 3
+
+    # Operacje zbiorcze podbijają rewizję tylko zmienionych rekordów
+    store.insert_container(_container("c2", "Bez zmian"))
+    with store.transaction() as data:
+        data[0]["name"] = "Zbiorczo"
+    c1, c2 = store.list_containers()
+    assert (c1["revision"], c2["revision"], c1["products"][0]["revision"]) == (3, 1, 3)